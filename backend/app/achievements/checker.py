@@ -1,114 +1,173 @@
-"""Achievement checker — runs after user actions, returns newly unlocked achievements."""
-from sqlalchemy import select, func
+"""Achievement engine — per-user counters updated by events, rules evaluated in memory.
+
+Each achievement in definitions.py names a "counter" and unlocks once that
+counter reaches its "target" (1 if none is set). Counters live in the
+achievement_counters table, one row per (user, counter):
+
+- record() is called on the events (chat started, user message saved,
+  first rating of a chat, dice rolled) and bumps one row in the caller's
+  transaction. Rows only exist for users that have been initialised; until
+  then the event is a no-op and the backfill counts it.
+- The first check for a user (per counter) backfills the counter from the
+  real tables once, so existing users and counters added later for new
+  achievements start at the right value.
+- check_achievements() evaluates every rule against the cached counters
+  and unlocked set, so a message costs one counter update and no reads;
+  the DB is only touched again when something unlocks.
+
+Counters only go up: deleting a chat does not take progress back.
+"""
+import time
+from datetime import datetime
+
+from sqlalchemy import select, func, text as sa_text
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db.models import UserAchievement, Chat, Message, MessageRole
+from app.db.models import UserAchievement, Chat, Message, MessageRole, gen_uuid
 from app.achievements.definitions import ACHIEVEMENTS
 
+# Per-user state cache: user_id -> (counters, unlocked ids, monotonic ts)
+_state: dict[str, tuple[dict[str, int], set[str], float]] = {}
+_STATE_TTL = 300  # seconds
+_STATE_MAX_ENTRIES = 10000
 
-async def _has(db: AsyncSession, user_id: str, achievement_id: str) -> bool:
+_RECORD_SQL = sa_text("""
+    UPDATE achievement_counters SET value = value + :delta
+    WHERE user_id = :uid AND counter = :counter
+    RETURNING value
+""")
+
+_UNLOCK_SQL = sa_text("""
+    INSERT INTO user_achievements (id, user_id, achievement_id, achieved_at)
+    VALUES (:id, :uid, :aid, :now)
+    ON CONFLICT (user_id, achievement_id) DO NOTHING
+    RETURNING id
+""")
+
+
+async def _count_chats(db: AsyncSession, user_id: str) -> int:
+    return (await db.execute(
+        select(func.count()).select_from(Chat).where(Chat.user_id == user_id)
+    )).scalar() or 0
+
+
+async def _count_messages(db: AsyncSession, user_id: str) -> int:
+    return (await db.execute(
+        select(func.count()).select_from(Message)
+        .join(Chat, Message.chat_id == Chat.id)
+        .where(Chat.user_id == user_id, Message.role == MessageRole.user)
+    )).scalar() or 0
+
+
+async def _count_ratings(db: AsyncSession, user_id: str) -> int:
+    return (await db.execute(
+        select(func.count()).select_from(Chat)
+        .where(Chat.user_id == user_id, Chat.rating.isnot(None))
+    )).scalar() or 0
+
+
+async def _count_dice_rolls(db: AsyncSession, user_id: str) -> int:
+    return (await db.execute(
+        select(func.count()).select_from(Message)
+        .join(Chat, Message.chat_id == Chat.id)
+        .where(Chat.user_id == user_id, Message.dice_rolls.isnot(None))
+    )).scalar() or 0
+
+
+# Counter name -> backfill from the real tables (used once per user and counter)
+COUNTERS = {
+    "chats": _count_chats,
+    "messages": _count_messages,
+    "ratings": _count_ratings,
+    "dice_rolls": _count_dice_rolls,
+}
+
+
+def _store(user_id: str, counters: dict[str, int], unlocked: set[str]):
+    now = time.monotonic()
+    if len(_state) >= _STATE_MAX_ENTRIES:
+        expired = [k for k, v in _state.items() if now - v[2] >= _STATE_TTL]
+        for k in expired:
+            _state.pop(k, None)
+        if len(_state) >= _STATE_MAX_ENTRIES:
+            _state.clear()
+    _state[user_id] = (counters, unlocked, now)
+
+
+async def _load(db: AsyncSession, user_id: str) -> tuple[dict[str, int], set[str]]:
+    """Counters and unlocked achievement IDs for a user (cached, backfilled on first use)."""
+    cached = _state.get(user_id)
+    if cached and time.monotonic() - cached[2] < _STATE_TTL:
+        return cached[0], cached[1]
+
+    rows = await db.execute(
+        sa_text("SELECT counter, value FROM achievement_counters WHERE user_id = :uid"),
+        {"uid": user_id},
+    )
+    counters = {name: value for name, value in rows.all()}
     result = await db.execute(
-        select(UserAchievement.id).where(
-            UserAchievement.user_id == user_id,
-            UserAchievement.achievement_id == achievement_id,
-        )
+        select(UserAchievement.achievement_id).where(UserAchievement.user_id == user_id)
     )
-    return result.scalar() is not None
+    unlocked = set(result.scalars().all())
+
+    missing = [name for name in COUNTERS if name not in counters]
+    for name in missing:
+        counters[name] = await COUNTERS[name](db, user_id)
+        await db.execute(
+            sa_text("""
+                INSERT INTO achievement_counters (user_id, counter, value) VALUES (:uid, :counter, :value)
+                ON CONFLICT (user_id, counter) DO NOTHING
+            """),
+            {"uid": user_id, "counter": name, "value": counters[name]},
+        )
+    if missing:
+        await db.commit()
+
+    _store(user_id, counters, unlocked)
+    return counters, unlocked
+
+
+async def record(db: AsyncSession, user_id: str, counter: str, delta: int = 1):
+    """Bump a progress counter inside the caller's transaction (caller commits)."""
+    result = await db.execute(_RECORD_SQL, {"uid": user_id, "counter": counter, "delta": delta})
+    value = result.scalar_one_or_none()
+    cached = _state.get(user_id)
+    if value is not None and cached:
+        cached[0][counter] = value
 
 
 async def _unlock(db: AsyncSession, user_id: str, achievement_id: str) -> bool:
     """Unlock achievement if not already unlocked. Returns True if newly unlocked."""
-    if await _has(db, user_id, achievement_id):
-        return False
-    db.add(UserAchievement(user_id=user_id, achievement_id=achievement_id))
-    await db.flush()
-    # Award XP for achievement
-    try:
-        from app.users.xp import award_xp
-        await award_xp(user_id, 50)
-    except Exception:
-        pass
-    return True
+    result = await db.execute(
+        _UNLOCK_SQL,
+        {"id": gen_uuid(), "uid": user_id, "aid": achievement_id, "now": datetime.utcnow()},
+    )
+    return result.scalar_one_or_none() is not None
 
 
 async def check_achievements(db: AsyncSession, user_id: str, trigger: str = "message") -> list[str]:
     """Check and unlock achievements for user. Returns list of newly unlocked achievement IDs.
 
-    trigger: "message" | "rating" | "regenerate"
+    trigger: "message" | "rating" | "regenerate" (informational — every rule
+    is evaluated, in memory, against the user's counters).
     """
+    counters, unlocked = await _load(db, user_id)
     newly_unlocked = []
-
-    # first_adventure: has at least 1 chat
-    if not await _has(db, user_id, "first_adventure"):
-        chat_count = (await db.execute(
-            select(func.count()).select_from(Chat).where(Chat.user_id == user_id)
-        )).scalar() or 0
-        if chat_count >= 1:
-            if await _unlock(db, user_id, "first_adventure"):
-                newly_unlocked.append("first_adventure")
-
-    # five_adventures: 5 distinct chats
-    if not await _has(db, user_id, "five_adventures"):
-        chat_count = (await db.execute(
-            select(func.count()).select_from(Chat).where(Chat.user_id == user_id)
-        )).scalar() or 0
-        if chat_count >= 5:
-            if await _unlock(db, user_id, "five_adventures"):
-                newly_unlocked.append("five_adventures")
-
-    # bookworm: 100 user messages
-    if not await _has(db, user_id, "bookworm"):
-        msg_count = (await db.execute(
-            select(func.count()).select_from(Message)
-            .join(Chat, Message.chat_id == Chat.id)
-            .where(Chat.user_id == user_id, Message.role == MessageRole.user)
-        )).scalar() or 0
-        if msg_count >= 100:
-            if await _unlock(db, user_id, "bookworm"):
-                newly_unlocked.append("bookworm")
-
-    # storyteller: 500 user messages
-    if not await _has(db, user_id, "storyteller"):
-        if "bookworm" in newly_unlocked or await _has(db, user_id, "bookworm"):
-            msg_count = (await db.execute(
-                select(func.count()).select_from(Message)
-                .join(Chat, Message.chat_id == Chat.id)
-                .where(Chat.user_id == user_id, Message.role == MessageRole.user)
-            )).scalar() or 0
-            if msg_count >= 500:
-                if await _unlock(db, user_id, "storyteller"):
-                    newly_unlocked.append("storyteller")
-
-    # first_rating / five_ratings — only check on rating trigger
-    if trigger == "rating":
-        rating_count = (await db.execute(
-            select(func.count()).select_from(Chat)
-            .where(Chat.user_id == user_id, Chat.rating.isnot(None))
-        )).scalar() or 0
-        if rating_count >= 1 and not await _has(db, user_id, "first_rating"):
-            if await _unlock(db, user_id, "first_rating"):
-                newly_unlocked.append("first_rating")
-        if rating_count >= 5 and not await _has(db, user_id, "five_ratings"):
-            if await _unlock(db, user_id, "five_ratings"):
-                newly_unlocked.append("five_ratings")
-
-    # dice_roller: 20 messages with dice_rolls
-    if trigger == "message" and not await _has(db, user_id, "dice_roller"):
-        dice_count = (await db.execute(
-            select(func.count()).select_from(Message)
-            .join(Chat, Message.chat_id == Chat.id)
-            .where(Chat.user_id == user_id, Message.dice_rolls.isnot(None))
-        )).scalar() or 0
-        if dice_count >= 20:
-            if await _unlock(db, user_id, "dice_roller"):
-                newly_unlocked.append("dice_roller")
-
-    # fate_rewriter: tracked via is_regenerate messages count
-    # We check regenerations by counting assistant messages that have is_regenerate=True
-    # Since we don't track this separately, we'll check if user has enough regenerated messages
-    # This is approximated: we skip for now and track via frontend counter in future
-
-    await db.commit()
+    for aid, ach in ACHIEVEMENTS.items():
+        counter = ach.get("counter")
+        if not counter or aid in unlocked or counters.get(counter, 0) < ach.get("target", 1):
+            continue
+        if await _unlock(db, user_id, aid):
+            newly_unlocked.append(aid)
+        unlocked.add(aid)
+    if newly_unlocked:
+        await db.commit()
+        # Award XP for achievements (after the commit, not while holding the transaction)
+        try:
+            from app.users.xp import award_xp
+            await award_xp(user_id, 50 * len(newly_unlocked))
+        except Exception:
+            pass
     return newly_unlocked
 
 
@@ -123,36 +182,9 @@ async def get_user_achievements(db: AsyncSession, user_id: str) -> list[dict]:
 
 async def get_user_progress(db: AsyncSession, user_id: str) -> dict[str, int]:
     """Get current progress values for multi-step achievements."""
-    progress = {}
-
-    # Chat count
-    chat_count = (await db.execute(
-        select(func.count()).select_from(Chat).where(Chat.user_id == user_id)
-    )).scalar() or 0
-    progress["five_adventures"] = chat_count
-
-    # Message count
-    msg_count = (await db.execute(
-        select(func.count()).select_from(Message)
-        .join(Chat, Message.chat_id == Chat.id)
-        .where(Chat.user_id == user_id, Message.role == MessageRole.user)
-    )).scalar() or 0
-    progress["bookworm"] = min(msg_count, 100)
-    progress["storyteller"] = min(msg_count, 500)
-
-    # Rating count
-    rating_count = (await db.execute(
-        select(func.count()).select_from(Chat)
-        .where(Chat.user_id == user_id, Chat.rating.isnot(None))
-    )).scalar() or 0
-    progress["five_ratings"] = rating_count
-
-    # Dice rolls
-    dice_count = (await db.execute(
-        select(func.count()).select_from(Message)
-        .join(Chat, Message.chat_id == Chat.id)
-        .where(Chat.user_id == user_id, Message.dice_rolls.isnot(None))
-    )).scalar() or 0
-    progress["dice_roller"] = min(dice_count, 20)
-
-    return progress
+    counters, _ = await _load(db, user_id)
+    return {
+        aid: min(counters.get(ach["counter"], 0), ach["target"])
+        for aid, ach in ACHIEVEMENTS.items()
+        if ach.get("counter") and ach.get("target")
+    }
@@ -1,7 +1,12 @@
-"""Predefined achievement definitions with i18n labels."""
+"""Predefined achievement definitions with i18n labels.
+
+"counter" is the progress counter the achievement is unlocked by (see
+checker.COUNTERS) and "target" the value it needs (default 1).
+"""
 
 ACHIEVEMENTS: dict[str, dict] = {
     "first_adventure": {
+        "counter": "chats",
         "icon": "sword",
         "labels": {
             "en": {"name": "First Steps", "desc": "Start your first adventure"},
@@ -14,6 +19,7 @@ ACHIEVEMENTS: dict[str, dict] = {
         },
     },
     "five_adventures": {
+        "counter": "chats",
         "icon": "map",
         "labels": {
             "en": {"name": "Explorer", "desc": "Start 5 different adventures"},
@@ -27,6 +33,7 @@ ACHIEVEMENTS: dict[str, dict] = {
         "target": 5,
     },
     "first_rating": {
+        "counter": "ratings",
         "icon": "star",
         "labels": {
             "en": {"name": "Critic", "desc": "Rate your first adventure"},
@@ -39,6 +46,7 @@ ACHIEVEMENTS: dict[str, dict] = {
         },
     },
     "five_ratings": {
+        "counter": "ratings",
         "icon": "stars",
         "labels": {
             "en": {"name": "Connoisseur", "desc": "Rate 5 adventures"},
@@ -52,6 +60,7 @@ ACHIEVEMENTS: dict[str, dict] = {
         "target": 5,
     },
     "bookworm": {
+        "counter": "messages",
         "icon": "book",
         "labels": {
             "en": {"name": "Bookworm", "desc": "Send 100 messages"},
@@ -65,6 +74,7 @@ ACHIEVEMENTS: dict[str, dict] = {
         "target": 100,
     },
     "storyteller": {
+        "counter": "messages",
         "icon": "feather",
         "labels": {
             "en": {"name": "Storyteller", "desc": "Send 500 messages"},
@@ -78,6 +88,7 @@ ACHIEVEMENTS: dict[str, dict] = {
         "target": 500,
     },
     "dice_roller": {
+        "counter": "dice_rolls",
         "icon": "dice",
         "labels": {
             "en": {"name": "Dice Roller", "desc": "Roll dice 20 times"},
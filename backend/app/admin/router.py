@@ -8,9 +8,9 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.auth.middleware import get_current_user
 from app.db.session import get_db
 from app.db.models import Character, PromptTemplate, User
-from app.chat.prompt_builder import get_all_keys, load_overrides, invalidate_cache
-from app.db.session import engine
+from app.chat.prompt_builder import get_all_keys, load_overrides
 from app.config import settings
+from app.utils import admin_settings
 
 if settings.is_fiction_mode:
     from app.admin.seed_data_fiction import SEED_STORIES as SEED_CHARACTERS
@@ -37,43 +37,15 @@ class PromptUpdateBody(BaseModel):
 
 # ── Admin settings (stored in prompt_templates as setting.*) ──────────
 
-_SETTING_DEFAULTS: dict[str, str] = {
-    "setting.notify_registration": "true",
-    "setting.notify_errors": "true",
-    "setting.paid_mode": "false",
-    "setting.cost_mode": "quality",  # quality | balanced | economy
-    "setting.daily_message_limit": "1000",
-    "setting.max_personas": "5",
-    "setting.anon_message_limit": "20",
-    "setting.provider_enabled.openrouter": "true",
-    "setting.provider_enabled.groq": "true",
-    "setting.provider_enabled.cerebras": "true",
-    "setting.provider_enabled.together": "true",
-    "setting.provider_enabled.openai": "true",
-    "setting.provider_enabled.claude": "true",
-    "setting.provider_enabled.deepseek": "true",
-    "setting.provider_enabled.gemini": "true",
-    "setting.provider_enabled.qwen": "true",
-}
-
-
 @router.get("/settings")
 async def get_admin_settings(
     user=Depends(require_admin),
     db: AsyncSession = Depends(get_db),
 ):
     """Return admin settings (key-value)."""
-    result = await db.execute(
-        select(PromptTemplate).where(PromptTemplate.key.like("setting.%"))
-    )
-    overrides = {row.key: row.value for row in result.scalars().all()}
-    settings_out = {}
-    for key, default_val in _SETTING_DEFAULTS.items():
-        short_key = key.removeprefix("setting.")
-        settings_out[short_key] = overrides.get(key, default_val)
-    # Sync provider disabled state from DB on settings load
-    await _sync_provider_disabled(db)
-    return settings_out
+    # Re-read from DB (also syncs provider disabled state)
+    await admin_settings.load(fresh=True)
+    return admin_settings.all_raw()
 
 
 @router.put("/settings/{key:path}")
@@ -85,7 +57,7 @@ async def update_admin_setting(
 ):
     """Update an admin setting."""
     full_key = f"setting.{key}"
-    if full_key not in _SETTING_DEFAULTS:
+    if key not in admin_settings.DEFAULTS:
         raise HTTPException(status_code=404, detail="Unknown setting")
     existing = await db.execute(select(PromptTemplate).where(PromptTemplate.key == full_key))
     row = existing.scalar_one_or_none()
@@ -96,31 +68,60 @@ async def update_admin_setting(
         row = PromptTemplate(key=full_key, value=body.value)
         db.add(row)
     await db.commit()
+    # Reload every worker (provider admin-disabled set included)
+    await admin_settings.publish()
 
     # Handle provider enable/disable
-    if key.startswith("provider_enabled."):
-        provider_name = key.removeprefix("provider_enabled.")
+    if key.startswith("provider_enabled.") and body.value == "true":
         from app.llm import model_cooldown
-        if body.value == "true":
-            model_cooldown.clear_provider_blacklist(provider_name)
-        # Sync admin-disabled set from DB
-        await _sync_provider_disabled(db)
+        model_cooldown.clear_provider_blacklist(key.removeprefix("provider_enabled."))
 
     return {"key": key, "value": body.value}
 
 
-async def _sync_provider_disabled(db: AsyncSession) -> None:
-    """Read provider_enabled.* settings from DB and sync to model_cooldown."""
-    from app.llm import model_cooldown
-    result = await db.execute(
-        select(PromptTemplate).where(PromptTemplate.key.like("setting.provider_enabled.%"))
-    )
-    disabled = set()
-    for row in result.scalars().all():
-        provider_name = row.key.removeprefix("setting.provider_enabled.")
-        if row.value != "true":
-            disabled.add(provider_name)
-    model_cooldown.set_admin_disabled(disabled)
+@router.get("/provider-scoreboard")
+async def get_provider_scoreboard(user=Depends(require_admin)):
+    """Live per-provider/per-model latency and reliability, plus the resulting auto order."""
+    from app.llm import provider_stats
+
+    def ranked(order_str: str) -> list[str]:
+        return provider_stats.rank_providers([p.strip() for p in order_str.split(",") if p.strip()])
+
+    return {
+        "adaptive": settings.adaptive_provider_order,
+        "hedged": settings.hedged_auto,
+        "auto_order": ranked(settings.auto_provider_order),
+        "auto_order_paid": ranked(settings.auto_provider_order_paid),
+        "scoreboard": provider_stats.get_scoreboard(),
+    }
+
+
+@router.get("/summarizer-stats")
+async def get_summarizer_stats(user=Depends(require_admin)):
+    """Chat summarizer queue depth, lag and run counters (this worker)."""
+    from app.chat import summarizer
+    return summarizer.get_metrics()
+
+
+@router.get("/counter-stats")
+async def get_counter_stats(user=Depends(require_admin)):
+    """Write-behind counter aggregator: pending deltas and flushes (this worker)."""
+    from app.chat import counters
+    return counters.get_stats()
+
+
+@router.get("/translation-progress")
+async def get_translation_progress(user=Depends(require_admin)):
+    """Offline translation pipeline: pending / failed jobs per language."""
+    from app.characters import translation_jobs
+    return await translation_jobs.get_progress()
+
+
+@router.get("/seo-cache-stats")
+async def get_seo_cache_stats(user=Depends(require_admin)):
+    """Prerender HTML cache hits / renders (this worker)."""
+    from app.seo import render_cache
+    return render_cache.get_stats()
 
 
 @router.get("/provider-status")
@@ -129,7 +130,7 @@ async def get_provider_status(
     db: AsyncSession = Depends(get_db),
 ):
     """Return status of all LLM providers (enabled, blacklisted, configured)."""
-    from app.llm import model_cooldown
+    from app.llm import model_cooldown, cache_stats
     from app.llm.registry import get_available_providers
 
     configured = get_available_providers()
@@ -158,7 +159,7 @@ async def get_provider_status(
             "blacklist_reason": bl["reason"] if bl else None,
         })
 
-    return {"providers": providers, "blacklisted": blacklisted}
+    return {"providers": providers, "blacklisted": blacklisted, "prompt_cache": cache_stats.get_stats()}
 
 
 @router.get("/prompts")
@@ -167,7 +168,7 @@ async def list_prompts(
     db: AsyncSession = Depends(get_db),
 ):
     """Return all prompt keys with defaults and overrides."""
-    await load_overrides(engine)
+    await load_overrides()
     keys = get_all_keys()
     # Enrich with updated_at from DB
     result = await db.execute(select(PromptTemplate))
@@ -195,7 +196,7 @@ async def update_prompt(
         row = PromptTemplate(key=key, value=body.value)
         db.add(row)
     await db.commit()
-    invalidate_cache()
+    await admin_settings.publish()
     return {"key": key, "status": "saved"}
 
 
@@ -208,7 +209,7 @@ async def reset_prompt(
     """Delete override, resetting to default."""
     await db.execute(delete(PromptTemplate).where(PromptTemplate.key == key))
     await db.commit()
-    invalidate_cache()
+    await admin_settings.publish()
     return {"key": key, "status": "reset"}
 
 
@@ -255,13 +256,9 @@ async def import_seed_characters(
     # Copy seed avatars to uploads dir if available (with thumbnails)
     import uuid as uuid_mod
     from pathlib import Path
-    from PIL import Image
-    from app.config import settings
-    from app.uploads.router import _save_with_thumb
+    from app.uploads import images
 
     seed_avatars_dir = Path(__file__).parent / "seed_avatars"
-    avatars_dest = Path(settings.upload_dir) / "avatars"
-    avatars_dest.mkdir(parents=True, exist_ok=True)
 
     import random
 
@@ -272,8 +269,7 @@ async def import_seed_characters(
         src = seed_avatars_dir / f"{i:02d}.webp"
         if src.exists():
             filename = f"{uuid_mod.uuid4().hex}.webp"
-            img = Image.open(src)
-            _save_with_thumb(img, avatars_dest, filename)
+            await images.process_avatar(src, filename)
             avatar_url = f"/api/uploads/avatars/{filename}"
 
         char = Character(
@@ -319,75 +315,13 @@ async def import_seed_characters(
 
     await db.commit()
 
-    # Fire-and-forget: warmup translations for all imported characters
-    asyncio.create_task(_warmup_seed_translations())
+    # Queue translations of the imported characters into all languages
+    from app.characters import translation_jobs
+    asyncio.create_task(translation_jobs.backfill())
 
     return {"imported": len(SEED_CHARACTERS)}
 
 
-async def _warmup_seed_translations():
-    """Background task: translate all seed characters into all target languages."""
-    import logging
-    _log = logging.getLogger(__name__)
-    target_languages = ["en", "es", "ru", "fr", "de", "pt", "it"]
-
-    try:
-        from app.db.session import async_session
-        from app.characters.translation import ensure_translations
-        from sqlalchemy.orm import selectinload
-
-        _log.info("Warmup translations: starting...")
-
-        async with async_session() as db:
-            result = await db.execute(
-                select(Character)
-                .options(selectinload(Character.creator))
-                .where(Character.is_public == True)
-            )
-            characters = list(result.scalars().all())
-
-            # Pass 1: card fields (name, tagline, tags) — batched
-            for lang in target_languages:
-                need = [c for c in characters if (c.original_language or "ru") != lang]
-                uncached = [c for c in need if not (c.translations or {}).get(lang)]
-                if not uncached:
-                    continue
-                BATCH = 15
-                for i in range(0, len(uncached), BATCH):
-                    batch = uncached[i:i + BATCH]
-                    try:
-                        await ensure_translations(batch, lang, include_descriptions=False, cached_only=False)
-                    except Exception as e:
-                        _log.warning(f"Card translation [{lang}] batch failed: {e}")
-                    await asyncio.sleep(2)
-
-            # Pass 2: descriptions — one character at a time
-            for lang in target_languages:
-                # Re-read fresh translations
-                result2 = await db.execute(
-                    select(Character)
-                    .options(selectinload(Character.creator))
-                    .where(Character.is_public == True)
-                )
-                fresh = list(result2.scalars().all())
-                need = [c for c in fresh if (c.original_language or "ru") != lang]
-                need_desc = [
-                    c for c in need
-                    if not (c.translations or {}).get(lang, {}).get("personality")
-                    and getattr(c, "personality", None)
-                ]
-                for c in need_desc:
-                    try:
-                        await ensure_translations([c], lang, include_descriptions=True, cached_only=False)
-                    except Exception as e:
-                        _log.warning(f"Desc translation [{lang}] {c.name} failed: {e}")
-                    await asyncio.sleep(3)
-
-        _log.info("Warmup translations: done!")
-    except Exception as e:
-        _log.error(f"Warmup translations failed: {e}")
-
-
 @router.post("/generate-slugs")
 async def generate_character_slugs(
     regenerate: bool = False,
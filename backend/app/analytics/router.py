@@ -17,7 +17,7 @@ from app.db.session import get_db
 router = APIRouter(prefix="/api", tags=["analytics"])
 
 # Rate limit: 60 pageview pings per minute per IP
-_pageview_limiter = RateLimiter(max_requests=60, window_seconds=60)
+_pageview_limiter = RateLimiter(max_requests=60, window_seconds=60, shared=False)
 
 
 @router.post("/analytics/pageview", status_code=204)
@@ -32,7 +32,7 @@ async def track_pageview(
         return
 
     ip = get_client_ip(request)
-    if not _pageview_limiter.check(f"pv:{ip}"):
+    if not await _pageview_limiter.check(f"pv:{ip}"):
         return  # silently drop if rate limited
 
     user_agent = request.headers.get("user-agent")
@@ -1,34 +1,133 @@
-"""Simple in-memory rate limiter. No external dependencies."""
+"""Rate limiting (GCRA) with an in-process or shared database backend.
+
+Each limiter allows bursts of max_requests and refills one slot every
+window / max_requests seconds (generic cell rate algorithm). Per key only
+one float is stored — the "theoretical arrival time" (TAT) — and a key
+whose TAT has passed is in the same state as an unknown key, so idle keys
+are simply dropped:
+
+- memory (default): a dict per limiter; expired keys are swept once per
+  window, or earlier when the dict has doubled since the last sweep
+  (amortised O(1) per check).
+- database (RATE_LIMIT_BACKEND=database): one rate_limits row per key,
+  updated with a single atomic upsert, so limits hold across all uvicorn
+  workers. Expired rows are deleted every _DB_SWEEP_EVERY checks. If the
+  database is unreachable the limiter fails open.
+
+Limiters created with shared=False always stay in-process (high-volume,
+best-effort limits such as page-view tracking).
+"""
 import asyncio
+import logging
 import time
-from collections import defaultdict
 from fastapi import Request, HTTPException, status
+from sqlalchemy import text as sa_text
 
+from app.config import settings
 
-class RateLimiter:
-    def __init__(self, max_requests: int, window_seconds: int):
-        self.max_requests = max_requests
-        self.window = window_seconds
-        self._requests: dict[str, list[float]] = defaultdict(list)
+logger = logging.getLogger(__name__)
+
+_MIN_SWEEP_SIZE = 1024
+_DB_SWEEP_EVERY = 1000
 
-    def check(self, key: str) -> bool:
+_UPSERT_SQL = sa_text("""
+    INSERT INTO rate_limits (key, tat) VALUES (:key, :first_tat)
+    ON CONFLICT (key) DO UPDATE
+    SET tat = (CASE WHEN rate_limits.tat > :now THEN rate_limits.tat ELSE :now END) + :interval
+    WHERE (CASE WHEN rate_limits.tat > :now THEN rate_limits.tat ELSE :now END) - :now <= :tolerance
+    RETURNING tat
+""")
+
+
+class _MemoryStore:
+    def __init__(self, sweep_interval: float):
+        self._tat: dict[str, float] = {}
+        self._sweep_at = _MIN_SWEEP_SIZE
+        self._sweep_interval = sweep_interval
+        self._next_sweep = time.monotonic() + sweep_interval
+
+    def acquire(self, key: str, interval: float, tolerance: float) -> bool:
         now = time.monotonic()
-        cutoff = now - self.window
-        self._requests[key] = [t for t in self._requests[key] if t > cutoff]
-        if len(self._requests[key]) >= self.max_requests:
+        tat = max(self._tat.get(key, now), now)
+        if tat - now > tolerance:
             return False
-        self._requests[key].append(now)
+        self._tat[key] = tat + interval
+        if len(self._tat) >= self._sweep_at or now >= self._next_sweep:
+            self._sweep(now)
         return True
 
-    def wait_seconds(self, key: str) -> float:
+    def peek(self, key: str) -> float:
+        """Current TAT relative to now (<= 0: key is idle)."""
+        tat = self._tat.get(key)
+        return tat - time.monotonic() if tat is not None else 0.0
+
+    def _sweep(self, now: float) -> None:
+        self._tat = {k: t for k, t in self._tat.items() if t > now}
+        self._sweep_at = max(_MIN_SWEEP_SIZE, len(self._tat) * 2)
+        self._next_sweep = now + self._sweep_interval
+
+    def __len__(self) -> int:
+        return len(self._tat)
+
+
+class _DatabaseStore:
+    def __init__(self):
+        self._calls = 0
+
+    async def acquire(self, key: str, interval: float, tolerance: float) -> bool:
+        from app.db.session import engine
+        now = time.time()
+        self._calls += 1
+        try:
+            async with engine.begin() as conn:
+                row = await conn.execute(_UPSERT_SQL, {
+                    "key": key, "now": now, "first_tat": now + interval,
+                    "interval": interval, "tolerance": tolerance,
+                })
+                allowed = row.first() is not None
+                if self._calls % _DB_SWEEP_EVERY == 0:
+                    await conn.execute(sa_text("DELETE FROM rate_limits WHERE tat < :now"), {"now": now})
+            return allowed
+        except Exception as e:
+            logger.warning("Rate limit store unavailable, allowing request: %s", e)
+            return True
+
+    async def peek(self, key: str) -> float:
+        from app.db.session import engine
+        try:
+            async with engine.connect() as conn:
+                row = await conn.execute(sa_text("SELECT tat FROM rate_limits WHERE key = :key"), {"key": key})
+                tat = row.scalar_one_or_none()
+        except Exception:
+            return 0.0
+        return tat - time.time() if tat is not None else 0.0
+
+
+_db_store = _DatabaseStore()
+
+
+class RateLimiter:
+    def __init__(self, max_requests: int, window_seconds: int, shared: bool = True):
+        self.max_requests = max_requests
+        self.window = window_seconds
+        self.shared = shared
+        self._interval = window_seconds / max_requests
+        self._tolerance = window_seconds - self._interval
+        self._memory = _MemoryStore(sweep_interval=window_seconds)
+
+    def _use_db(self) -> bool:
+        return self.shared and settings.rate_limit_backend == "database"
+
+    async def check(self, key: str) -> bool:
+        """Record a request for key; False if it is over the limit."""
+        if self._use_db():
+            return await _db_store.acquire(key, self._interval, self._tolerance)
+        return self._memory.acquire(key, self._interval, self._tolerance)
+
+    async def wait_seconds(self, key: str) -> float:
         """Return seconds to wait before the next request is allowed, or 0."""
-        now = time.monotonic()
-        cutoff = now - self.window
-        self._requests[key] = [t for t in self._requests[key] if t > cutoff]
-        if len(self._requests[key]) < self.max_requests:
-            return 0
-        oldest = self._requests[key][0]
-        return max(0, oldest + self.window - now)
+        ahead = await _db_store.peek(key) if self._use_db() else self._memory.peek(key)
+        return max(0.0, ahead - self._tolerance)
 
 
 # 10 auth attempts per minute per IP
@@ -54,26 +153,26 @@ def get_client_ip(request: Request) -> str:
     return request.client.host if request.client else "unknown"
 
 
-def check_auth_rate(request: Request):
+async def check_auth_rate(request: Request):
     ip = get_client_ip(request)
-    if not auth_limiter.check(f"auth:{ip}"):
+    if not await auth_limiter.check(f"auth:{ip}"):
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
             detail="Too many requests. Try again later.",
         )
 
 
-def check_register_rate(request: Request):
+async def check_register_rate(request: Request):
     ip = get_client_ip(request)
-    if not register_limiter.check(f"reg:{ip}"):
+    if not await register_limiter.check(f"reg:{ip}"):
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
             detail="Too many registrations. Try again later.",
         )
 
 
-def check_message_rate(user_id: str):
-    if not message_limiter.check(f"msg:{user_id}"):
+async def check_message_rate(user_id: str):
+    if not await message_limiter.check(f"msg:{user_id}"):
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
             detail="Too many messages. Please wait a moment.",
@@ -82,28 +181,28 @@ def check_message_rate(user_id: str):
 
 async def check_message_interval(user_id: str):
     key = f"msg_int:{user_id}"
-    wait = message_interval_limiter.wait_seconds(key)
+    wait = await message_interval_limiter.wait_seconds(key)
     if wait > 0:
         await asyncio.sleep(min(wait + 0.1, 6))  # wait up to 6s, then proceed
-    message_interval_limiter.check(key)  # record the request
+    await message_interval_limiter.check(key)  # record the request
 
 
-def check_reset_rate(request: Request, email: str | None = None):
+async def check_reset_rate(request: Request, email: str | None = None):
     ip = get_client_ip(request)
     # Short window: 3 per 5 min per IP
-    if not reset_limiter.check(f"reset:{ip}"):
+    if not await reset_limiter.check(f"reset:{ip}"):
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
             detail="Too many requests. Try again later.",
         )
     # Long window: 10 per hour per IP (anti-enumeration)
-    if not reset_hourly_limiter.check(f"reset_h:{ip}"):
+    if not await reset_hourly_limiter.check(f"reset_h:{ip}"):
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
             detail="Too many requests. Try again later.",
         )
     # Per-email: 1 per 2 min (prevent spamming one mailbox)
-    if email and not reset_email_limiter.check(f"reset_e:{email}"):
+    if email and not await reset_email_limiter.check(f"reset_e:{email}"):
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
             detail="Too many requests. Try again later.",
@@ -91,19 +91,11 @@ def _generate_username() -> str:
 
 async def _notify_registration(email: str, username: str, method: str = "email") -> None:
     """Send registration notification to all admin emails if enabled."""
-    from app.db.session import engine as db_engine
-    from sqlalchemy.ext.asyncio import AsyncSession
-    from sqlalchemy import select, text
+    from app.utils import admin_settings
 
     try:
-        async with AsyncSession(db_engine) as session:
-            result = await session.execute(
-                text("SELECT value FROM prompt_templates WHERE key = 'setting.notify_registration'")
-            )
-            row = result.scalar_one_or_none()
-            enabled = (row or "true").lower() == "true"
-
-        if not enabled:
+        await admin_settings.ensure_fresh()
+        if not admin_settings.get("notify_registration"):
             return
 
         admin_list = settings.admin_emails
@@ -140,8 +132,8 @@ async def get_challenge():
 
 @router.post("/register")
 async def register(body: RegisterRequest, request: Request, db: AsyncSession = Depends(get_db)):
-    check_auth_rate(request)
-    check_register_rate(request)
+    await check_auth_rate(request)
+    await check_register_rate(request)
     await _bot_delay(request)
 
     # Honeypot — bots fill hidden fields
@@ -201,7 +193,7 @@ async def register(body: RegisterRequest, request: Request, db: AsyncSession = D
 
 @router.post("/login")
 async def login(body: LoginRequest, request: Request, db: AsyncSession = Depends(get_db)):
-    check_auth_rate(request)
+    await check_auth_rate(request)
     await _bot_delay(request)
     result = await db.execute(select(User).where(User.email == body.email))
     user = result.scalar_one_or_none()
@@ -233,7 +225,7 @@ async def forgot_password(
     db: AsyncSession = Depends(get_db),
 ):
     email = body.email.lower().strip()
-    check_reset_rate(request, email)
+    await check_reset_rate(request, email)
 
     result = await db.execute(select(User).where(User.email == email))
     user = result.scalar_one_or_none()
@@ -267,7 +259,7 @@ async def reset_password(
     request: Request,
     db: AsyncSession = Depends(get_db),
 ):
-    check_auth_rate(request)
+    await check_auth_rate(request)
 
     try:
         payload = jwt.decode(body.token, settings.jwt_secret, algorithms=["HS256"])
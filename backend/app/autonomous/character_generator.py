@@ -2,12 +2,10 @@
 
 import asyncio
 import base64
-import io
 import json
 import logging
 import random
 import uuid
-from pathlib import Path
 
 import httpx
 
@@ -359,9 +357,6 @@ async def _generate_avatar(avatar_prompt: str, appearance: str = "", gender: str
         return None
 
     filename = f"{uuid.uuid4().hex}.webp"
-    avatars_dir = Path(settings.upload_dir) / "avatars"
-    avatars_dir.mkdir(parents=True, exist_ok=True)
-    filepath = avatars_dir / filename
 
     prompts = _build_avatar_prompts(avatar_prompt, appearance, gender)
 
@@ -401,12 +396,10 @@ async def _generate_avatar(avatar_prompt: str, appearance: str = "", gender: str
         b64 = response.json()["data"][0]["b64_json"]
         img_bytes = base64.b64decode(b64)
 
-        from PIL import Image
-        img = Image.open(io.BytesIO(img_bytes))
-        img = img.resize((512, 512), Image.LANCZOS)
-        img.save(filepath, "WEBP", quality=85)
+        from app.uploads import images
+        await images.process_avatar(img_bytes, filename)
 
-        size_kb = filepath.stat().st_size // 1024
+        size_kb = (images.avatars_dir() / filename).stat().st_size // 1024
         logger.info("Avatar generated: %s (%dKB)", filename, size_kb)
         return filename
 
@@ -49,6 +49,7 @@ async def _check_paid_health() -> dict | None:
     from app.llm.base import LLMMessage, LLMConfig
 
     from app.llm.model_resolver import get_model as _get_model
+    from app.llm.provider_stats import StreamProbe
 
     test_msgs = [LLMMessage(role="user", content="Say hi")]
     issues = []
@@ -59,11 +60,15 @@ async def _check_paid_health() -> dict | None:
         except ValueError:
             continue
         config = LLMConfig(model=_get_model(name), temperature=0.1, max_tokens=10)
+        probe = StreamProbe(name)  # feeds the live provider scoreboard
         try:
             await asyncio.wait_for(prov.generate(test_msgs, config), timeout=20)
+            probe.succeeded(config.model)
         except asyncio.TimeoutError:
+            probe.failed(config.model)
             issues.append(f"{name}: TIMEOUT (>20s)")
         except Exception as e:
+            probe.failed(config.model)
             err = str(e)[:200]
             # Classify the error
             if "402" in err or "Insufficient" in err:
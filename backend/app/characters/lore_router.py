@@ -7,6 +7,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.auth.middleware import get_current_user
 from app.db.session import get_db
 from app.db.models import Character, LoreEntry
+from app.chat.lore_matcher import invalidate_lore
 from app.utils.sanitize import strip_html_tags
 
 router = APIRouter(prefix="/api/characters", tags=["lore"])
@@ -90,6 +91,7 @@ async def create_lore_entry(
     )
     db.add(entry)
     await db.commit()
+    invalidate_lore(character_id)
     await db.refresh(entry)
     return _serialize(entry)
 
@@ -121,6 +123,7 @@ async def update_lore_entry(
         entry.position = body.position
 
     await db.commit()
+    invalidate_lore(character_id)
     await db.refresh(entry)
     return _serialize(entry)
 
@@ -143,3 +146,4 @@ async def delete_lore_entry(
 
     await db.delete(entry)
     await db.commit()
+    invalidate_lore(character_id)
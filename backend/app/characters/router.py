@@ -208,9 +208,7 @@ async def browse_characters(
     is_admin = user.get("role") == "admin" if user else False
     characters = await service.list_public_characters(db, limit, offset, search, tag, gender=gender, user_id=user_id, language=language, exclude_tag=exclude_tag)
     total = await service.count_public_characters(db, search, tag, gender=gender, user_id=user_id, exclude_tag=exclude_tag)
-    if language:
-        from app.characters.translation import ensure_translations
-        await ensure_translations(characters, language)
+    # Translations: cached ones were applied by list_public_characters, the rest are queued
     return {"items": [character_to_dict(c, language=language, is_admin=is_admin) for c in characters], "total": total}
 
 
@@ -375,6 +373,8 @@ async def vote_character(
     character.vote_score = (character.vote_score or 0) + delta
 
     await db.commit()
+    from app.seo import render_cache
+    render_cache.invalidate_character(character_id, stale_only=True)
     return {"vote_score": character.vote_score, "user_vote": new_value}
 
 
@@ -528,6 +528,8 @@ async def create_character(
         character = await service.create_character(db, user["id"], body.model_dump())
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    from app.characters.translation_jobs import enqueue_character
+    await enqueue_character(character)
     return character_to_dict(character, is_admin=is_admin)
 
 
@@ -561,11 +563,10 @@ async def update_character(
     if not result:
         raise HTTPException(status_code=404, detail="Character not found or not yours")
 
-    # Trigger background translation for only the changed fields
+    # Queue translation of only the changed fields into all languages
     if changed_fields:
-        import asyncio
-        from app.characters.translation import translate_character_all_languages
-        asyncio.create_task(translate_character_all_languages(character_id, changed_fields=changed_fields))
+        from app.characters.translation_jobs import enqueue_character
+        await enqueue_character(result, changed_fields)
 
     return character_to_dict(result, is_admin=is_admin)
 
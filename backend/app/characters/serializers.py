@@ -1,3 +1,4 @@
+from app.chat import counters
 from app.db.models import Character
 
 
@@ -32,7 +33,7 @@ def character_to_dict(c: Character, language: str = None, is_admin: bool = False
         "tags": tr["tags"] if tr and "tags" in tr else ([t for t in c.tags.split(",") if t] if c.tags else []),
         "structured_tags": [t for t in (getattr(c, 'structured_tags', '') or '').split(",") if t],
         "is_public": c.is_public,
-        "chat_count": (c.chat_count or 0) + base_chat,
+        "chat_count": counters.character_chat_count(c.id, c.chat_count) + base_chat,
         "like_count": (c.like_count or 0) + base_like,
         "preferred_model": c.preferred_model,
         "max_tokens": getattr(c, 'max_tokens', None) or 2048,
@@ -54,6 +55,6 @@ def character_to_dict(c: Character, language: str = None, is_admin: bool = False
         d["avg_rating"] = rating_data.get("avg_rating")
         d["rating_count"] = rating_data.get("rating_count", 0)
     if is_admin:
-        d["real_chat_count"] = c.chat_count or 0
+        d["real_chat_count"] = counters.character_chat_count(c.id, c.chat_count)
         d["real_like_count"] = c.like_count or 0
     return d
@@ -2,6 +2,7 @@ from datetime import datetime
 from pathlib import Path
 from sqlalchemy import select, func, text, case
 from app.utils.sanitize import strip_html_tags
+from app.chat.prompt_builder import invalidate_character
 
 
 def _validate_avatar_url(url: str | None, field: str = "avatar_url") -> None:
@@ -268,6 +269,8 @@ async def create_character(db: AsyncSession, creator_id: str, data: dict):
     await db.flush()  # get character.id
     character.slug = await generate_unique_slug(db, data.get("name", "character"), character.id)
     await db.commit()
+    from app.seo.router import invalidate_sitemap
+    invalidate_sitemap()
     # Re-fetch with creator loaded
     return await get_character(db, character.id)
 
@@ -339,6 +342,11 @@ async def update_character(db: AsyncSession, character_id: str, creator_id: str,
     character.updated_at = datetime.utcnow()
 
     await db.commit()
+    invalidate_character(character.id)
+    from app.seo.router import invalidate_sitemap
+    from app.seo import render_cache
+    invalidate_sitemap()
+    render_cache.invalidate_character(character.id)
     return await get_character(db, character.id)
 
 
@@ -366,6 +374,11 @@ async def delete_character(db: AsyncSession, character_id: str, creator_id: str,
 
     await db.delete(character)
     await db.commit()
+    invalidate_character(character_id)
+    from app.seo.router import invalidate_sitemap
+    from app.seo import render_cache
+    invalidate_sitemap()
+    render_cache.invalidate_character(character_id)
     return True
 
 
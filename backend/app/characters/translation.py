@@ -4,6 +4,7 @@ import asyncio
 import json
 import logging
 import time
+from collections import deque
 
 from sqlalchemy import text
 
@@ -11,6 +12,7 @@ from app.db.session import engine as db_engine
 from app.llm.base import LLMMessage, LLMConfig
 from app.llm.registry import get_provider
 from app.autonomous.providers import get_autonomous_provider_order
+from app.utils.job_queue import JobQueue
 
 logger = logging.getLogger(__name__)
 
@@ -50,8 +52,8 @@ OUTPUT: Return ONLY a JSON array with the same structure. No markdown, no explan
 
 _TIMEOUT = 15.0  # seconds
 
-# Rate limit: max 20 translation API calls per minute (global)
-_translation_calls: list[float] = []
+# Rate limit: max 60 translation API calls per minute (global)
+_translation_calls: deque[float] = deque()
 _TRANSLATION_RATE_LIMIT = 60
 _TRANSLATION_RATE_WINDOW = 60.0  # seconds
 
@@ -61,13 +63,19 @@ def _check_translation_rate() -> bool:
     now = time.monotonic()
     # Remove old entries
     while _translation_calls and _translation_calls[0] < now - _TRANSLATION_RATE_WINDOW:
-        _translation_calls.pop(0)
+        _translation_calls.popleft()
     if len(_translation_calls) >= _TRANSLATION_RATE_LIMIT:
         return False
     _translation_calls.append(now)
     return True
 
 
+async def _wait_translation_rate():
+    """Wait for a slot under the rate limit (offline pipeline: defer, don't drop)."""
+    while not _check_translation_rate():
+        await asyncio.sleep(max(0.1, _translation_calls[0] + _TRANSLATION_RATE_WINDOW - time.monotonic()))
+
+
 async def translate_batch(
     characters: list[dict],
     target_language: str,
@@ -82,7 +90,14 @@ async def translate_batch(
     if not _check_translation_rate():
         logger.warning("Translation rate limit exceeded, skipping batch")
         return {}
+    return await _translate_cards(characters, target_language)
+
 
+async def _translate_cards(
+    characters: list[dict],
+    target_language: str,
+) -> dict[str, dict]:
+    """translate_batch() without the rate limit check."""
     lang_names = {"en": "English", "ru": "Russian", "es": "Spanish", "fr": "French",
                   "de": "German", "pt": "Brazilian Portuguese", "it": "Italian",
                   "ja": "Japanese", "zh": "Chinese", "ko": "Korean"}
@@ -226,6 +241,82 @@ async def translate_descriptions(
     return result
 
 
+TRANSLATE_FIELDS_BATCH_PROMPT = """You are a literary translator for a character roleplay chat application.
+
+INPUT: A JSON array of objects, each with "id" (return as-is), "field" (return as-is) and "text".
+
+Translate every "text" to {target_lang}.
+
+RULES:
+- Preserve the literary style, tone, and formatting exactly
+- Keep proper names transliterated (not translated): Алина → Alina, Кира → Kira
+- Keep title/epithet names translated: Тёмный Лорд → Dark Lord
+- Preserve all formatting: line breaks, em-dashes (—), *asterisks for thoughts*, paragraph spacing
+- Preserve template variables as-is: {{{{char}}}}, {{{{user}}}}
+- Translate naturally and fluently, not word-by-word
+
+OUTPUT: Return ONLY a JSON array with the same objects and translated "text". No markdown, no explanation."""
+
+
+async def translate_fields_batch(
+    items: list[dict],
+    target_language: str,
+    max_tokens: int = 4096,
+) -> dict[str, dict]:
+    """Translate description fields of several characters in one LLM call (no rate check).
+
+    items: [{"id": character_id, "field": "scenario", "text": ...}, ...]
+    Returns {character_id: {field: translated, ...}}; items missing from the
+    response are simply absent. Returns {} on any failure.
+    """
+    if not items:
+        return {}
+    lang_names = {"en": "English", "ru": "Russian", "es": "Spanish", "fr": "French",
+                  "de": "German", "pt": "Brazilian Portuguese", "it": "Italian",
+                  "ja": "Japanese", "zh": "Chinese", "ko": "Korean"}
+    lang_name = lang_names.get(target_language, target_language)
+    messages = [
+        LLMMessage(role="system", content=TRANSLATE_FIELDS_BATCH_PROMPT.format(target_lang=lang_name)),
+        LLMMessage(role="user", content=json.dumps(items, ensure_ascii=False)),
+    ]
+    config = LLMConfig(model="", temperature=0.3, max_tokens=max_tokens)
+    wanted = {(it["id"], it["field"]) for it in items}
+
+    for provider_name in get_autonomous_provider_order():
+        try:
+            provider = get_provider(provider_name)
+        except ValueError:
+            continue
+
+        try:
+            raw = await asyncio.wait_for(
+                provider.generate(messages, config),
+                timeout=_DESCRIPTION_TIMEOUT * 2,
+            )
+            text_clean = raw.strip()
+            if text_clean.startswith("```"):
+                text_clean = text_clean.split("\n", 1)[1] if "\n" in text_clean else text_clean[3:]
+                if text_clean.endswith("```"):
+                    text_clean = text_clean[:-3].strip()
+
+            result = json.loads(text_clean)
+            if not isinstance(result, list):
+                continue
+
+            out: dict[str, dict] = {}
+            for item in result:
+                if not isinstance(item, dict) or not item.get("text"):
+                    continue
+                if (item.get("id"), item.get("field")) in wanted:
+                    out.setdefault(item["id"], {})[item["field"]] = item["text"]
+            return out
+        except Exception as e:
+            logger.warning("Batch field translation via %s failed: %s", provider_name, str(e)[:100])
+            continue
+
+    return {}
+
+
 async def _save_translations(
     char_translations: dict[str, dict],
     target_language: str,
@@ -250,12 +341,14 @@ async def _save_translations(
             bindparam("data", type_=String),
             bindparam("cid", type_=String),
         )
+        params = [
+            {"lang": target_language, "data": json.dumps(tr, ensure_ascii=False), "cid": char_id}
+            for char_id, tr in char_translations.items()
+        ]
+        if not params:
+            return
         async with db_engine.begin() as conn:
-            for char_id, tr in char_translations.items():
-                await conn.execute(
-                    stmt,
-                    {"lang": target_language, "data": json.dumps(tr, ensure_ascii=False), "cid": char_id},
-                )
+            await conn.execute(stmt, params)  # executemany: one round trip per batch
     except Exception as e:
         logger.warning("Failed to save translations: %s", str(e)[:100])
 
@@ -292,14 +385,8 @@ async def ensure_translations(
                 need_desc_translation.append(c)
 
     if cached_only:
-        # Fire background task to fill cache for uncached characters
-        if need_card_translation:
-            asyncio.create_task(_background_translate_cards(
-                [{"id": c.id, "name": c.name, "tagline": c.tagline or "",
-                  "tags": [t for t in (c.tags or "").split(",") if t]}
-                 for c in need_card_translation],
-                target_language,
-            ))
+        # Queue uncached characters for background translation
+        request_translations(need_card_translation, target_language)
         return
 
     # 1) Translate card fields (name, tagline, tags) in batch
@@ -387,26 +474,87 @@ async def ensure_translations_nonblocking(
                     c._active_translations = tr
             asyncio.create_task(_save_translations(results, target_language))
 
-    # 2) Description fields in background (don't block response)
+    # 2) Description fields in background (don't block response), once per (character, language)
+    need_desc_translation = [c for c in need_desc_translation if (c.id, target_language) not in _desc_inflight]
     if need_desc_translation:
         char_ids_and_data = [
             (c.id, {f: getattr(c, f, None) for f in _DESCRIPTION_FIELDS if getattr(c, f, None)},
              getattr(c, '_active_translations', None) or {})
             for c in need_desc_translation
         ]
+        _desc_inflight.update((c.id, target_language) for c in need_desc_translation)
         asyncio.create_task(_background_translate_descriptions(
             char_ids_and_data, target_language
         ))
 
 
-async def _background_translate_cards(batch: list[dict], target_language: str):
-    """Background task: translate a batch of cards and save to DB."""
+# --- Background card translation queue (browse / prerender) ---
+#
+# Pages that must not wait on the LLM (browse, similar, SEO prerender) call
+# request_translations() for characters without a cached translation.
+# Requests are de-duplicated per (character, language) while queued or in
+# flight, collected for _CARD_BATCH_WINDOW so concurrent visitors share one
+# call, and flushed in batches of _CARD_BATCH_SIZE, most popular first.
+
+_CARD_BATCH_SIZE = 20  # cards per LLM call (fits max_tokens=2048)
+_CARD_BATCH_WINDOW = 0.5  # seconds to collect requests before a flush
+_MAX_PENDING_PER_LANG = 500
+
+_card_queue = JobQueue("translate", maxsize=50, workers=2, retries=0)
+_card_pending: dict[str, dict[str, tuple[int, dict]]] = {}  # lang -> {char_id: (priority, card)}
+_card_inflight: set[tuple[str, str]] = set()  # (char_id, lang)
+_card_scheduled: set[str] = set()  # languages with a flush queued or running
+_desc_inflight: set[tuple[str, str]] = set()  # (char_id, lang) description translations running
+
+
+def _card_payload(c) -> dict:
+    return {
+        "id": c.id,
+        "name": c.name,
+        "tagline": c.tagline or "",
+        "tags": [t for t in (c.tags or "").split(",") if t],
+    }
+
+
+def request_translations(characters, target_language: str):
+    """Queue card translations for characters (never blocks, duplicates are ignored)."""
+    pending = _card_pending.setdefault(target_language, {})
+    for c in characters:
+        if c.id in pending or (c.id, target_language) in _card_inflight:
+            continue
+        if len(pending) >= _MAX_PENDING_PER_LANG:
+            break  # the next page view asks again
+        pending[c.id] = (getattr(c, "chat_count", 0) or 0, _card_payload(c))
+    if pending and target_language not in _card_scheduled:
+        _card_scheduled.add(target_language)
+        if _card_queue.offer(_flush_cards, target_language) is None:
+            _card_scheduled.discard(target_language)
+
+
+async def _flush_cards(target_language: str):
+    """Translate the most popular pending cards of a language, then reschedule if more are left."""
     try:
-        results = await translate_batch(batch, target_language)
-        if results:
-            await _save_translations(results, target_language)
-    except Exception as e:
-        logger.warning("Background translation failed: %s", str(e)[:100])
+        await asyncio.sleep(_CARD_BATCH_WINDOW)
+        pending = _card_pending.get(target_language) or {}
+        ids = sorted(pending, key=lambda cid: pending[cid][0], reverse=True)[:_CARD_BATCH_SIZE]
+        batch = [pending.pop(cid)[1] for cid in ids]
+        if not batch:
+            return
+        _card_inflight.update((cid, target_language) for cid in ids)
+        try:
+            results = await translate_batch(batch, target_language)
+            if results:
+                await _save_translations(results, target_language)
+        except Exception as e:
+            logger.warning("Background translation failed: %s", str(e)[:100])
+        finally:
+            _card_inflight.difference_update((cid, target_language) for cid in ids)
+    finally:
+        _card_scheduled.discard(target_language)
+        if _card_pending.get(target_language):
+            _card_scheduled.add(target_language)
+            if _card_queue.offer(_flush_cards, target_language) is None:
+                _card_scheduled.discard(target_language)
 
 
 async def _background_translate_descriptions(
@@ -419,104 +567,26 @@ async def _background_translate_descriptions(
     lang_name = lang_names.get(target_language, target_language)
 
     to_save = {}
-    for char_id, fields, existing_card_tr in char_data:
-        try:
-            desc_result = {}
-            for field_name, field_text in fields.items():
-                if not _check_translation_rate():
-                    break
-                translated = await _translate_single_field(field_text, target_language, lang_name)
-                if translated:
-                    desc_result[field_name] = translated
-            if desc_result:
-                merged = {**existing_card_tr, **desc_result}
-                to_save[char_id] = merged
-        except Exception as e:
-            logger.warning("Background desc translation for %s failed: %s", char_id[:8], str(e)[:100])
-
-    if to_save:
-        await _save_translations(to_save, target_language)
+    try:
+        for char_id, fields, existing_card_tr in char_data:
+            try:
+                desc_result = {}
+                for field_name, field_text in fields.items():
+                    if not _check_translation_rate():
+                        break
+                    translated = await _translate_single_field(field_text, target_language, lang_name)
+                    if translated:
+                        desc_result[field_name] = translated
+                if desc_result:
+                    merged = {**existing_card_tr, **desc_result}
+                    to_save[char_id] = merged
+            except Exception as e:
+                logger.warning("Background desc translation for %s failed: %s", char_id[:8], str(e)[:100])
+
+        if to_save:
+            await _save_translations(to_save, target_language)
+    finally:
+        _desc_inflight.difference_update((char_id, target_language) for char_id, _, _ in char_data)
 
 
 ALL_LANGUAGES = ("en", "es", "ru", "fr", "de", "pt", "it")
-
-
-async def translate_character_all_languages(
-    character_id: str,
-    changed_fields: list[str] | None = None,
-):
-    """Background: translate changed fields of a character to all languages after edit.
-
-    If changed_fields is provided, only translates those specific fields.
-    Otherwise, translates all card + description fields.
-    Uses field-level merge so unchanged translations are preserved.
-    """
-    from sqlalchemy import select
-    from app.db.session import async_session as AsyncSessionLocal
-    from app.db.models import Character
-
-    _CARD_FIELDS = {"name", "tagline", "tags"}
-    _DESC_FIELDS = {"personality", "scenario", "appearance", "greeting_message"}
-
-    try:
-        async with AsyncSessionLocal() as db:
-            result = await db.execute(select(Character).where(Character.id == character_id))
-            character = result.scalar_one_or_none()
-            if not character:
-                return
-
-            orig = getattr(character, "original_language", None) or "ru"
-            target_langs = [lang for lang in ALL_LANGUAGES if lang != orig]
-
-            # Determine what to translate
-            if changed_fields:
-                need_card = bool(_CARD_FIELDS & set(changed_fields))
-                need_desc = [f for f in changed_fields if f in _DESC_FIELDS]
-            else:
-                need_card = True
-                need_desc = list(_DESC_FIELDS)
-
-            card_batch = [{
-                "id": character.id,
-                "name": character.name,
-                "tagline": character.tagline or "",
-                "tags": [t for t in (character.tags or "").split(",") if t],
-            }] if need_card else None
-
-            lang_names = {"en": "English", "ru": "Russian", "es": "Spanish", "fr": "French",
-                          "de": "German", "pt": "Brazilian Portuguese", "it": "Italian",
-                          "ja": "Japanese", "zh": "Chinese", "ko": "Korean"}
-
-            for target_lang in target_langs:
-                try:
-                    merged = {}
-
-                    # Translate card fields (name, tagline, tags) if any changed
-                    if card_batch:
-                        card_results = await translate_batch(card_batch, target_lang)
-                        card_tr = card_results.get(character.id, {}) if card_results else {}
-                        merged.update(card_tr)
-
-                    # Translate only changed description fields
-                    if need_desc:
-                        lang_name = lang_names.get(target_lang, target_lang)
-                        for field_name in need_desc:
-                            field_text = getattr(character, field_name, None)
-                            if field_text:
-                                if not _check_translation_rate():
-                                    break
-                                translated = await _translate_single_field(field_text, target_lang, lang_name)
-                                if translated:
-                                    merged[field_name] = translated
-
-                    if merged:
-                        await _save_translations({character.id: merged}, target_lang)
-
-                    logger.info("Translated character %s to %s (%d fields: %s)",
-                                character.id[:8], target_lang, len(merged),
-                                ",".join(merged.keys()) if merged else "none")
-                except Exception as e:
-                    logger.warning("Translation of %s to %s failed: %s", character.id[:8], target_lang, str(e)[:100])
-
-    except Exception as e:
-        logger.warning("translate_character_all_languages failed: %s", str(e)[:100])
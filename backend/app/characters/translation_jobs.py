@@ -0,0 +1,348 @@
+"""Offline translation pipeline: keeps characters warm in ALL_LANGUAGES.
+
+Browse, SEO prerender and chat prompts read characters.translations; this
+module fills it ahead of time instead of at first view:
+
+- enqueue_character() runs on character create / update and adds one
+  translation_jobs row per (character, language, field). Re-enqueueing a
+  pending field resets it, so a field edited while its job is running is
+  translated again with the new text.
+- backfill() runs nightly and enqueues every field missing from a public
+  character's translations (also catches results that failed to save).
+- The worker claims jobs of the most chatted characters first and packs
+  many characters into each LLM call within a token budget: card fields
+  (name, tagline, tags) as one JSON batch, description fields as one JSON
+  batch of texts (items the batch missed fall back to per-field calls).
+  Each round's results are saved with one bulk JSONB update per language.
+- Progress lives in the table: a restart resumes where it stopped, claims
+  expire after _CLAIM_TTL (crashed worker), failed jobs are retried up to
+  MAX_ATTEMPTS times. The pipeline waits for the global translation rate
+  limit instead of dropping work.
+
+get_progress() reports pending / failed jobs per language for the admin dashboard.
+"""
+import asyncio
+import json
+import logging
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, text as sa_text
+
+from app.characters import translation
+from app.characters.translation import ALL_LANGUAGES
+from app.db.models import Character
+from app.db.session import engine as db_engine
+from app.llm.tokenizer import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+CARD_FIELDS = ("name", "tagline", "tags")
+DESCRIPTION_FIELDS = translation._DESCRIPTION_FIELDS
+MAX_ATTEMPTS = 5
+BACKFILL_INTERVAL = timedelta(hours=24)
+_CLAIM_LIMIT = 200  # jobs (fields) claimed per round
+_CLAIM_TTL = timedelta(minutes=15)
+_IDLE_POLL = 60  # seconds between polls when there is nothing to do
+_BACKFILL_CHECK = 3600  # seconds between "is the nightly backfill due" checks
+_BACKFILL_PAGE = 500
+_CARD_BUDGET = 1000  # input tokens per card batch (output fits translate_batch's max_tokens=2048)
+_CARD_MAX_ITEMS = 25
+_DESC_BUDGET = 2500  # input tokens per description batch
+_DESC_MAX_TOKENS = 6144
+
+_wake: asyncio.Event | None = None
+_stats = {
+    "rounds": 0, "llm_calls": 0, "fields_translated": 0, "fields_failed": 0,
+    "last_round_at": None, "last_backfill_at": None, "last_backfill_enqueued": 0,
+}
+
+
+def _source(char, field: str) -> str:
+    return (getattr(char, field, None) or "").strip()
+
+
+async def _enqueue(rows: list[dict], reset: bool = True) -> int:
+    """Insert jobs; reset=True restarts jobs that are already pending (text changed)."""
+    if not rows:
+        return 0
+    now = datetime.utcnow()
+    on_conflict = (
+        "DO UPDATE SET attempts = 0, claimed_by = NULL, claimed_at = NULL, created_at = excluded.created_at"
+        if reset else "DO NOTHING"
+    )
+    async with db_engine.begin() as conn:
+        await conn.execute(
+            sa_text(f"""
+                INSERT INTO translation_jobs (character_id, language, field, attempts, created_at)
+                VALUES (:cid, :lang, :field, 0, :now)
+                ON CONFLICT (character_id, language, field) {on_conflict}
+            """),
+            [{**r, "now": now} for r in rows],
+        )
+    if _wake is not None:
+        _wake.set()
+    return len(rows)
+
+
+async def enqueue_character(character, fields: list[str] | None = None):
+    """Queue translation of a character's fields (all by default) into every other language."""
+    orig = getattr(character, "original_language", None) or "ru"
+    fields = [f for f in (fields or CARD_FIELDS + DESCRIPTION_FIELDS) if _source(character, f)]
+    rows = [
+        {"cid": character.id, "lang": lang, "field": f}
+        for lang in ALL_LANGUAGES if lang != orig
+        for f in fields
+    ]
+    try:
+        await _enqueue(rows)
+    except Exception as e:
+        logger.warning("Failed to enqueue translations for %s: %s", character.id[:8], str(e)[:100])
+
+
+async def backfill() -> int:
+    """Enqueue every field missing from public characters' translations. Returns jobs added."""
+    cols = [getattr(Character, f) for f in CARD_FIELDS + DESCRIPTION_FIELDS]
+    last_id = ""
+    added = 0
+    while True:
+        async with db_engine.connect() as conn:
+            page = (await conn.execute(
+                select(Character.id, Character.original_language, Character.translations, *cols)
+                .where(Character.is_public == True, Character.id > last_id)
+                .order_by(Character.id)
+                .limit(_BACKFILL_PAGE)
+            )).all()
+        if not page:
+            break
+        rows = []
+        for c in page:
+            orig = c.original_language or "ru"
+            fields = [f for f in CARD_FIELDS + DESCRIPTION_FIELDS if _source(c, f)]
+            for lang in ALL_LANGUAGES:
+                if lang == orig:
+                    continue
+                have = (c.translations or {}).get(lang) or {}
+                rows += [{"cid": c.id, "lang": lang, "field": f} for f in fields if not have.get(f)]
+        added += await _enqueue(rows, reset=False)
+        last_id = page[-1].id
+    _stats["last_backfill_at"] = datetime.utcnow().isoformat()
+    _stats["last_backfill_enqueued"] = added
+    logger.info("Translation backfill: %d jobs enqueued", added)
+    return added
+
+
+async def _claim(token: str) -> list[tuple[str, str, str]]:
+    """Claim up to _CLAIM_LIMIT jobs of one language, most chatted characters first.
+
+    The language is that of the most popular pending job; one language per
+    round keeps the LLM batches full.
+    """
+    now = datetime.utcnow()
+    stale = now - _CLAIM_TTL
+    claimable = "j.attempts < :max_attempts AND (j.claimed_at IS NULL OR j.claimed_at < :stale)"
+    params = {"max_attempts": MAX_ATTEMPTS, "stale": stale, "n": _CLAIM_LIMIT}
+    async with db_engine.begin() as conn:
+        candidates = (await conn.execute(
+            sa_text(f"""
+                SELECT j.character_id, j.language, j.field
+                FROM translation_jobs j JOIN characters c ON c.id = j.character_id
+                WHERE {claimable} AND j.language = (
+                    SELECT j.language FROM translation_jobs j JOIN characters c ON c.id = j.character_id
+                    WHERE {claimable}
+                    ORDER BY c.chat_count DESC, j.created_at
+                    LIMIT 1
+                )
+                ORDER BY c.chat_count DESC, j.created_at
+                LIMIT :n
+            """),
+            params,
+        )).all()
+        if not candidates:
+            return []
+        # Conditional claim: a job another worker claimed in the meantime is skipped
+        await conn.execute(
+            sa_text("""
+                UPDATE translation_jobs SET claimed_by = :token, claimed_at = :now
+                WHERE character_id = :cid AND language = :lang AND field = :field
+                  AND (claimed_at IS NULL OR claimed_at < :stale)
+            """),
+            [{"token": token, "now": now, "stale": stale, "cid": c, "lang": l, "field": f} for c, l, f in candidates],
+        )
+        claimed = (await conn.execute(
+            sa_text("SELECT character_id, language, field FROM translation_jobs WHERE claimed_by = :token"),
+            {"token": token},
+        )).all()
+    return [tuple(r) for r in claimed]
+
+
+def _pack(items: list[dict], budget: int, max_items: int) -> list[list[dict]]:
+    """Greedy packing into batches of at most budget (estimated) input tokens; oversize items go alone."""
+    batches, current, used = [], [], 0
+    for item in items:
+        cost = estimate_tokens(json.dumps(item, ensure_ascii=False))
+        if current and (used + cost > budget or len(current) >= max_items):
+            batches.append(current)
+            current, used = [], 0
+        current.append(item)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+async def _translate_language(lang: str, jobs: list[tuple[str, str]], chars: dict) -> dict[str, dict]:
+    """Translate claimed (character_id, field) jobs of one language. Returns {character_id: {field: value}}."""
+    results: dict[str, dict] = {}
+    card_fields: dict[str, set] = {}
+    desc_items = []
+    for cid, field in jobs:
+        c = chars.get(cid)
+        if c is None or not _source(c, field):
+            continue
+        if field in CARD_FIELDS:
+            card_fields.setdefault(cid, set()).add(field)
+        else:
+            desc_items.append({"id": cid, "field": field, "text": getattr(c, field)})
+
+    # Card fields: the whole card is translated together, only the requested fields are kept
+    cards = [translation._card_payload(chars[cid]) for cid in card_fields]
+    for batch in _pack(cards, _CARD_BUDGET, _CARD_MAX_ITEMS):
+        await translation._wait_translation_rate()
+        _stats["llm_calls"] += 1
+        out = await translation._translate_cards(batch, lang)
+        for cid, tr in out.items():
+            wanted = card_fields.get(cid) or set()
+            kept = {f: v for f, v in tr.items() if f in wanted and v}
+            if kept:
+                results.setdefault(cid, {}).update(kept)
+
+    # Description fields: many texts per call, per-field plain text for what a batch missed
+    lang_name = {"en": "English", "ru": "Russian", "es": "Spanish", "fr": "French",
+                 "de": "German", "pt": "Brazilian Portuguese", "it": "Italian"}.get(lang, lang)
+    for batch in _pack(desc_items, _DESC_BUDGET, 20):
+        out = {}
+        if len(batch) > 1:
+            await translation._wait_translation_rate()
+            _stats["llm_calls"] += 1
+            out = await translation.translate_fields_batch(batch, lang, max_tokens=_DESC_MAX_TOKENS)
+        for item in batch:
+            value = (out.get(item["id"]) or {}).get(item["field"])
+            if not value:
+                await translation._wait_translation_rate()
+                _stats["llm_calls"] += 1
+                value = await translation._translate_single_field(item["text"], lang, lang_name)
+            if value:
+                results.setdefault(item["id"], {})[item["field"]] = value
+    return results
+
+
+async def process_round() -> int:
+    """Claim, translate and save one round of jobs. Returns the number of jobs claimed."""
+    token = uuid.uuid4().hex
+    claimed = await _claim(token)
+    if not claimed:
+        return 0
+    _stats["rounds"] += 1
+    _stats["last_round_at"] = datetime.utcnow().isoformat()
+
+    ids = list({cid for cid, _, _ in claimed})
+    cols = [getattr(Character, f) for f in CARD_FIELDS + DESCRIPTION_FIELDS]
+    async with db_engine.connect() as conn:
+        chars = {r.id: r for r in (await conn.execute(
+            select(Character.id, *cols).where(Character.id.in_(ids))
+        )).all()}
+
+    by_lang: dict[str, list[tuple[str, str]]] = {}
+    for cid, lang, field in claimed:
+        by_lang.setdefault(lang, []).append((cid, field))
+
+    done, failed = [], []
+    for lang, jobs in by_lang.items():
+        try:
+            results = await _translate_language(lang, jobs, chars)
+        except Exception as e:
+            logger.warning("Translation round [%s] failed: %s", lang, str(e)[:100])
+            results = {}
+        if results:
+            await translation._save_translations(results, lang)
+        for cid, field in jobs:
+            c = chars.get(cid)
+            # Empty source text (or deleted character): nothing to translate
+            if field in (results.get(cid) or {}) or c is None or not _source(c, field):
+                done.append({"cid": cid, "lang": lang, "field": field, "token": token})
+            else:
+                failed.append({"cid": cid, "lang": lang, "field": field, "token": token})
+
+    # Only jobs still claimed by this round: a re-enqueue (edit) meanwhile keeps its job
+    where = "character_id = :cid AND language = :lang AND field = :field AND claimed_by = :token"
+    async with db_engine.begin() as conn:
+        if done:
+            await conn.execute(sa_text(f"DELETE FROM translation_jobs WHERE {where}"), done)
+        if failed:
+            await conn.execute(
+                sa_text(f"UPDATE translation_jobs SET attempts = attempts + 1, claimed_by = NULL, claimed_at = NULL WHERE {where}"),
+                failed,
+            )
+    _stats["fields_translated"] += len(done)
+    _stats["fields_failed"] += len(failed)
+    logger.info("Translation round: %d fields done, %d failed", len(done), len(failed))
+    return len(claimed)
+
+
+async def _maybe_backfill():
+    from app.autonomous.scheduler import _get_last_run, _set_last_run, _should_run
+    if _should_run(await _get_last_run("last_translation_backfill"), BACKFILL_INTERVAL):
+        await backfill()
+        await _set_last_run("last_translation_backfill")
+
+
+async def run():
+    """Nightly backfill + job worker loop. Call via asyncio.create_task() from lifespan."""
+    global _wake
+    _wake = asyncio.Event()
+    next_backfill_check = 0.0
+    loop = asyncio.get_running_loop()
+    while True:
+        if loop.time() >= next_backfill_check:
+            next_backfill_check = loop.time() + _BACKFILL_CHECK
+            try:
+                await _maybe_backfill()
+            except Exception:
+                logger.exception("Translation backfill failed")
+        try:
+            claimed = await process_round()
+        except Exception:
+            logger.exception("Translation round failed")
+            claimed = 0
+        if not claimed:
+            _wake.clear()
+            try:
+                await asyncio.wait_for(_wake.wait(), _IDLE_POLL)
+            except asyncio.TimeoutError:
+                pass
+
+
+async def get_progress() -> dict:
+    """Pending / in-progress / failed jobs per language, plus this worker's counters."""
+    now = datetime.utcnow()
+    async with db_engine.connect() as conn:
+        rows = (await conn.execute(
+            sa_text("""
+                SELECT language,
+                       SUM(CASE WHEN attempts < :max_attempts THEN 1 ELSE 0 END),
+                       SUM(CASE WHEN claimed_at IS NOT NULL AND claimed_at >= :stale THEN 1 ELSE 0 END),
+                       SUM(CASE WHEN attempts >= :max_attempts THEN 1 ELSE 0 END),
+                       COUNT(DISTINCT character_id)
+                FROM translation_jobs GROUP BY language ORDER BY language
+            """),
+            {"max_attempts": MAX_ATTEMPTS, "stale": now - _CLAIM_TTL},
+        )).all()
+    return {
+        "languages": {
+            lang: {"pending": int(pending or 0), "in_progress": int(active or 0),
+                   "failed": int(failed or 0), "characters": chars}
+            for lang, pending, active, failed, chars in rows
+        },
+        **_stats,
+    }
@@ -0,0 +1,219 @@
+"""Write-behind aggregation for hot character / user counters.
+
+characters.chat_count, characters.message_counts (per language) and
+users.message_count / chat_count used to be bumped with a single-row
+UPDATE per reply / new chat. A few viral characters serialized every
+reply on their row lock and bloated the table with dead tuples.
+
+Deltas are now summed in memory per (character, language) and per user
+and written by flush() — every FLUSH_INTERVAL, or as soon as
+FLUSH_THRESHOLD increments are pending — as one multi-row UPDATE per
+table (Postgres: UPDATE ... FROM (VALUES ...)). A failed flush puts its
+deltas back for the next one; lifespan shutdown flushes what is left.
+
+Counts read back from the DB lag by up to FLUSH_INTERVAL; the helpers
+below add this worker's pending (and in-flight) deltas for display.
+"""
+import asyncio
+import json
+import logging
+
+from sqlalchemy import text
+
+from app.db.session import engine
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 5.0  # seconds
+FLUSH_THRESHOLD = 500  # pending increments that trigger an early flush
+_CHUNK = 1000  # rows per multi-row UPDATE (bind-parameter limit)
+
+# character_id -> {"chats": n, "messages": {lang: n}} / user_id -> {"chats": n, "messages": n}
+_characters: dict[str, dict] = {}
+_users: dict[str, dict] = {}
+_pending = 0
+# Deltas taken by a flush that hasn't committed yet (still counted by readers)
+_flushing: tuple[dict, dict] = ({}, {})
+_wake = asyncio.Event()
+_lock = asyncio.Lock()
+_stats = {"increments": 0, "flushes": 0, "rows": 0, "failures": 0}
+
+
+def _bump(n: int = 1):
+    global _pending
+    _pending += n
+    _stats["increments"] += n
+    if _pending >= FLUSH_THRESHOLD:
+        _wake.set()
+
+
+def add_message(character_id: str, language: str, user_id: str | None = None):
+    """Count one assistant reply for a character (per language) and its user."""
+    lang = (language or "ru")[:10]  # safety limit
+    c = _characters.setdefault(character_id, {"chats": 0, "messages": {}})
+    c["messages"][lang] = c["messages"].get(lang, 0) + 1
+    if user_id:
+        u = _users.setdefault(user_id, {"chats": 0, "messages": 0})
+        u["messages"] += 1
+    _bump()
+
+
+def add_user_message(user_id: str):
+    """Count one message for a user only (no character reply, e.g. suggested replies)."""
+    u = _users.setdefault(user_id, {"chats": 0, "messages": 0})
+    u["messages"] += 1
+    _bump()
+
+
+def add_chat(character_id: str, user_id: str | None = None):
+    """Count a newly created chat for a character and its user."""
+    c = _characters.setdefault(character_id, {"chats": 0, "messages": {}})
+    c["chats"] += 1
+    if user_id:
+        u = _users.setdefault(user_id, {"chats": 0, "messages": 0})
+        u["chats"] += 1
+    _bump()
+
+
+# ── Reads: flushed value + pending deltas ─────────────────────
+
+
+def _deltas(store_idx: int, key: str) -> list[dict]:
+    live = (_characters, _users)[store_idx].get(key)
+    flushing = _flushing[store_idx].get(key)
+    return [d for d in (live, flushing) if d]
+
+
+def character_chat_count(character_id: str, flushed: int | None) -> int:
+    return (flushed or 0) + sum(d["chats"] for d in _deltas(0, character_id))
+
+
+def user_message_count(user_id: str, flushed: int | None) -> int:
+    return (flushed or 0) + sum(d["messages"] for d in _deltas(1, user_id))
+
+
+# ── Flush ─────────────────────────────────────────────────────
+
+
+def _merge(characters: dict, users: dict):
+    """Put deltas from a failed flush back into the pending maps."""
+    for cid, d in characters.items():
+        c = _characters.setdefault(cid, {"chats": 0, "messages": {}})
+        c["chats"] += d["chats"]
+        for lang, n in d["messages"].items():
+            c["messages"][lang] = c["messages"].get(lang, 0) + n
+    for uid, d in users.items():
+        u = _users.setdefault(uid, {"chats": 0, "messages": 0})
+        u["chats"] += d["chats"]
+        u["messages"] += d["messages"]
+
+
+async def _write_postgres(conn, characters: dict, users: dict):
+    # Sorted ids: concurrent flushes from other workers lock rows in the same order
+    cids, uids = sorted(characters), sorted(users)
+    for start in range(0, len(cids), _CHUNK):
+        params, rows = {}, []
+        for i, cid in enumerate(cids[start:start + _CHUNK]):
+            d = characters[cid]
+            rows.append(f"(CAST(:id{i} AS varchar), CAST(:c{i} AS integer), CAST(:m{i} AS jsonb))")
+            params.update({f"id{i}": cid, f"c{i}": d["chats"], f"m{i}": json.dumps(d["messages"])})
+        await conn.execute(text(f"""
+            UPDATE characters AS ch SET
+                chat_count = COALESCE(ch.chat_count, 0) + v.chats,
+                message_counts = COALESCE(ch.message_counts, '{{}}'::jsonb) || COALESCE((
+                    SELECT jsonb_object_agg(e.key, COALESCE((ch.message_counts->>e.key)::int, 0) + e.value::int)
+                    FROM jsonb_each_text(v.messages) AS e
+                ), '{{}}'::jsonb)
+            FROM (VALUES {", ".join(rows)}) AS v(id, chats, messages)
+            WHERE ch.id = v.id
+        """), params)
+    for start in range(0, len(uids), _CHUNK):
+        params, rows = {}, []
+        for i, uid in enumerate(uids[start:start + _CHUNK]):
+            d = users[uid]
+            rows.append(f"(CAST(:id{i} AS varchar), CAST(:c{i} AS integer), CAST(:m{i} AS integer))")
+            params.update({f"id{i}": uid, f"c{i}": d["chats"], f"m{i}": d["messages"]})
+        await conn.execute(text(f"""
+            UPDATE users AS u SET
+                chat_count = COALESCE(u.chat_count, 0) + v.chats,
+                message_count = COALESCE(u.message_count, 0) + v.messages
+            FROM (VALUES {", ".join(rows)}) AS v(id, chats, messages)
+            WHERE u.id = v.id
+        """), params)
+
+
+async def _write_generic(conn, characters: dict, users: dict):
+    """SQLite (dev): no UPDATE ... FROM VALUES on JSON — one executemany per counter."""
+    chats = [{"id": cid, "n": d["chats"]} for cid, d in characters.items() if d["chats"]]
+    if chats:
+        await conn.execute(
+            text("UPDATE characters SET chat_count = COALESCE(chat_count, 0) + :n WHERE id = :id"), chats
+        )
+    msgs = [
+        {"id": cid, "path": f'$."{lang}"', "n": n}
+        for cid, d in characters.items() for lang, n in d["messages"].items()
+    ]
+    if msgs:
+        await conn.execute(text("""
+            UPDATE characters SET message_counts = json_set(
+                COALESCE(message_counts, '{}'), :path,
+                COALESCE(json_extract(message_counts, :path), 0) + :n
+            ) WHERE id = :id
+        """), msgs)
+    if users:
+        await conn.execute(
+            text("""
+                UPDATE users SET chat_count = COALESCE(chat_count, 0) + :c,
+                    message_count = COALESCE(message_count, 0) + :m
+                WHERE id = :id
+            """),
+            [{"id": uid, "c": d["chats"], "m": d["messages"]} for uid, d in users.items()],
+        )
+
+
+async def flush() -> int:
+    """Write all pending deltas. Returns the number of rows updated (0 on failure — deltas are kept)."""
+    global _characters, _users, _pending, _flushing
+    async with _lock:
+        if not _characters and not _users:
+            return 0
+        characters, users = _characters, _users
+        _characters, _users, _pending = {}, {}, 0
+        _flushing = (characters, users)
+        try:
+            async with engine.begin() as conn:
+                if engine.dialect.name == "postgresql":
+                    await _write_postgres(conn, characters, users)
+                else:
+                    await _write_generic(conn, characters, users)
+        except Exception as e:
+            _stats["failures"] += 1
+            logger.warning("Counter flush failed (%d characters, %d users): %s", len(characters), len(users), str(e)[:200])
+            _merge(characters, users)
+            _pending += len(characters) + len(users)
+            return 0
+        except BaseException:
+            _merge(characters, users)  # cancelled (shutdown): the final flush writes them
+            _pending += len(characters) + len(users)
+            raise
+        finally:
+            _flushing = ({}, {})
+        rows = len(characters) + len(users)
+        _stats["flushes"] += 1
+        _stats["rows"] += rows
+        return rows
+
+
+async def run():
+    """Flush every FLUSH_INTERVAL, or early when FLUSH_THRESHOLD is reached (lifespan task)."""
+    while True:
+        try:
+            await asyncio.wait_for(_wake.wait(), FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _wake.clear()
+        await flush()
+
+
+def get_stats() -> dict:
+    return {**_stats, "pending": _pending, "pending_characters": len(_characters), "pending_users": len(_users)}
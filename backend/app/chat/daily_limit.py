@@ -3,19 +3,10 @@
 Tier system: anon/free/premium/admin with different limits.
 Cost mode: quality/balanced/economy controls provider ordering.
 """
-import time
-from datetime import datetime, timezone
-
 from fastapi import HTTPException
-from sqlalchemy import select, func, text as sa_text
-from sqlalchemy.ext.asyncio import AsyncSession
-
-from app.db.models import Message, Chat
-from app.db.session import engine as db_engine
 
-# Generic setting cache: key -> (value, timestamp)
-_setting_cache: dict[str, tuple[int, float]] = {}
-_CACHE_TTL = 60  # seconds
+from app.chat import usage
+from app.utils import admin_settings
 
 # ── Tier system ──────────────────────────────────────────────
 TIER_LIMITS = {
@@ -47,73 +38,28 @@ def cap_max_tokens(requested: int, tier: str) -> int:
     return min(requested, tier_max)
 
 
-# ── Cost mode cache ──────────────────────────────────────────
-_cost_mode_cache: tuple[str, float] = ("quality", 0.0)
+# ── Admin settings (utils/admin_settings.py registry) ────────
 
 
 async def get_cost_mode() -> str:
-    """Get cost_mode setting: quality | balanced | economy. Cached 60s."""
-    global _cost_mode_cache
-    now = time.monotonic()
-    if now - _cost_mode_cache[1] < _CACHE_TTL:
-        return _cost_mode_cache[0]
-    try:
-        async with db_engine.connect() as conn:
-            row = await conn.execute(
-                sa_text("SELECT value FROM prompt_templates WHERE key = 'setting.cost_mode'")
-            )
-            val = row.scalar_one_or_none() or "quality"
-    except Exception:
-        val = "quality"
-    if val not in ("quality", "balanced", "economy"):
-        val = "quality"
-    _cost_mode_cache = (val, now)
-    return val
-
-
-async def _get_setting_int(key: str, default: int) -> int:
-    """Read an integer admin setting with 60s cache."""
-    now = time.monotonic()
-    cached = _setting_cache.get(key)
-    if cached and now - cached[1] < _CACHE_TTL:
-        return cached[0]
-    try:
-        async with db_engine.connect() as conn:
-            row = await conn.execute(
-                sa_text("SELECT value FROM prompt_templates WHERE key = :key"),
-                {"key": f"setting.{key}"},
-            )
-            val = row.scalar_one_or_none()
-            result = int(val) if val else default
-    except Exception:
-        result = default
-    _setting_cache[key] = (result, now)
-    return result
+    """Get cost_mode setting: quality | balanced | economy."""
+    await admin_settings.ensure_fresh()
+    val = admin_settings.get("cost_mode")
+    return val if val in ("quality", "balanced", "economy") else "quality"
+
+
+async def _get_setting_int(key: str) -> int:
+    """Read an integer admin setting."""
+    await admin_settings.ensure_fresh()
+    return admin_settings.get(key)
 
 
 async def _get_daily_limit() -> int:
-    return await _get_setting_int("daily_message_limit", 1000)
+    return await _get_setting_int("daily_message_limit")
 
 
 async def get_max_personas() -> int:
-    return await _get_setting_int("max_personas", 5)
-
-
-async def _count_user_messages_today(user_id: str) -> int:
-    """Count user messages sent today (UTC) across all chats."""
-    today_start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
-    async with db_engine.connect() as conn:
-        result = await conn.execute(
-            sa_text("""
-                SELECT COUNT(*) FROM messages m
-                JOIN chats c ON m.chat_id = c.id
-                WHERE c.user_id = :uid
-                AND m.role = 'user'
-                AND m.created_at >= :today
-            """),
-            {"uid": user_id, "today": today_start},
-        )
-        return result.scalar() or 0
+    return await _get_setting_int("max_personas")
 
 
 async def check_daily_limit(user_id: str, user_role: str):
@@ -123,7 +69,7 @@ async def check_daily_limit(user_id: str, user_role: str):
     limit = await _get_daily_limit()
     if limit <= 0:
         return  # 0 = unlimited
-    count = await _count_user_messages_today(user_id)
+    count = await usage.count_user_today(user_id)
     if count >= limit:
         raise HTTPException(
             status_code=429,
@@ -134,5 +80,5 @@ async def check_daily_limit(user_id: str, user_role: str):
 async def get_daily_usage(user_id: str) -> dict:
     """Return {used, limit} for the current user today."""
     limit = await _get_daily_limit()
-    used = await _count_user_messages_today(user_id)
+    used = await usage.count_user_today(user_id)
     return {"used": used, "limit": limit}
@@ -0,0 +1,119 @@
+"""Lorebook (World Info) keyword matching.
+
+All keywords of a character's lorebook are compiled once into a single
+keyword trie (Aho-Corasick goto structure). Since keywords must begin at a
+word start, failure links aren't needed: a turn walks the trie from each
+word start of the recent-context text, a few dict lookups per word no matter
+how many entries or keywords the lorebook has.
+
+Keywords match at a word start ("castle" fires on "castles" but not on
+"sandcastle") — inflected Russian word endings still trigger their stem.
+
+Compiled matchers are cached per character and rebuilt when the lorebook
+changes (entries are compared by id/keywords/content/position/enabled).
+"""
+
+import re
+from collections import OrderedDict
+
+from app.llm.tokenizer import count_tokens
+
+_MATCHER_CACHE_MAX = 512
+_WORD_START = re.compile(r"(?<!\w)\S")
+_matchers: OrderedDict[str, tuple[tuple, "LoreMatcher"]] = OrderedDict()
+
+
+class LoreMatcher:
+    def __init__(self, lore_entries: list[dict]):
+        # Lower position = higher priority; stable for equal positions
+        entries = sorted(
+            (e for e in lore_entries if e.get("enabled", True)),
+            key=lambda e: e.get("position", 0) or 0,
+        )
+        self.contents = [e["content"] for e in entries]
+        self._tokens: list[int | None] = [None] * len(entries)
+
+        # Keyword trie: transitions per node, entry indices whose keyword ends at the node
+        goto: list[dict[str, int]] = [{}]
+        out: list[list[int]] = [[]]
+        for idx, entry in enumerate(entries):
+            for kw in (entry.get("keywords") or "").split(","):
+                kw = kw.strip().lower()
+                if not kw:
+                    continue
+                node = 0
+                for ch in kw:
+                    nxt = goto[node].get(ch)
+                    if nxt is None:
+                        nxt = len(goto)
+                        goto[node][ch] = nxt
+                        goto.append({})
+                        out.append([])
+                    node = nxt
+                if idx not in out[node]:
+                    out[node].append(idx)
+        self._goto = goto
+        self._out = out
+
+    def matched_indices(self, text: str) -> list[int]:
+        """Indices (priority order) of entries with at least one keyword in text."""
+        if not text or not self.contents:
+            return []
+        text = text.lower()
+        goto, out = self._goto, self._out
+        root = goto[0]
+        n = len(text)
+        hits: set[int] = set()
+        # Keywords only start at word starts, so the trie is walked from each
+        # of those instead of running a full automaton over every character
+        for m in _WORD_START.finditer(text):
+            i = m.start()
+            node = root.get(text[i])
+            while node is not None:
+                if out[node]:
+                    hits.update(out[node])
+                i += 1
+                if i >= n:
+                    break
+                node = goto[node].get(text[i])
+        return sorted(hits)
+
+    def match(self, text: str, token_budget: int | None = None) -> list[str]:
+        """Matched lore contents in priority order, limited to token_budget tokens."""
+        matched = []
+        used = 0
+        for idx in self.matched_indices(text):
+            if token_budget is not None:
+                tokens = self._tokens[idx]
+                if tokens is None:
+                    tokens = self._tokens[idx] = count_tokens(self.contents[idx])
+                if used + tokens > token_budget:
+                    continue  # a smaller lower-priority entry may still fit
+                used += tokens
+            matched.append(self.contents[idx])
+        return matched
+
+
+def get_matcher(character_id: str | None, lore_entries: list[dict]) -> LoreMatcher:
+    """Compiled matcher for a character's lorebook, rebuilt only when the lorebook changes."""
+    if not character_id:
+        return LoreMatcher(lore_entries)
+    fingerprint = tuple(
+        (e.get("id"), e.get("keywords"), e.get("content"), e.get("position"), e.get("enabled", True))
+        for e in lore_entries
+    )
+    cached = _matchers.get(character_id)
+    if cached is not None and cached[0] == fingerprint:
+        _matchers.move_to_end(character_id)
+        return cached[1]
+    matcher = LoreMatcher(lore_entries)
+    _matchers[character_id] = (fingerprint, matcher)
+    _matchers.move_to_end(character_id)
+    if len(_matchers) > _MATCHER_CACHE_MAX:
+        _matchers.popitem(last=False)
+    return matcher
+
+
+def invalidate_lore(character_id: str) -> None:
+    """Drop a character's compiled matcher (call after lorebook edits)."""
+    _matchers.pop(character_id, None)
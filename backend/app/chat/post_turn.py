@@ -0,0 +1,71 @@
+"""Post-turn bookkeeping, run on bounded background queues after `done`.
+
+The assistant message and the chat state derived from it (companion
+approval, dice rolls, encounter state) are committed in one transaction by
+service.save_assistant_turn() before the done frame is sent. What only
+feeds stats and rewards runs here, off the SSE critical path:
+
+- counters (character message_counts, users.message_count), batched by
+  the write-behind aggregator (see chat/counters.py);
+- XP and achievements on the bookkeeping queue (retried, back-pressure
+  when full);
+- the summarization request, coalesced per chat by the summarizer's own
+  queue (see chat/summarizer.py).
+
+rewards_frame() waits briefly for the XP / achievement results so the
+client can still show unlock and level-up toasts after `done`.
+"""
+
+import asyncio
+
+from app.achievements import checker as achievements
+from app.chat import counters
+from app.chat.streaming import sse
+from app.chat import summarizer
+from app.db.session import async_session
+from app.users.xp import award_xp
+from app.utils.job_queue import JobQueue
+
+MESSAGE_XP = 10
+REWARDS_WAIT = 3.0  # seconds the stream stays open for the rewards frame
+
+bookkeeping = JobQueue("post-turn", maxsize=1000, workers=4, retries=2)
+
+
+async def _check_achievements(user_id: str) -> list[str]:
+    async with async_session() as db:
+        return await achievements.check_achievements(db, user_id, trigger="message")
+
+
+async def submit_turn(chat_id: str, character_id: str, language: str, user_id: str | None) -> asyncio.Future | None:
+    """Queue a completed turn's bookkeeping. Returns a future of (achievements, xp) for registered users."""
+    counters.add_message(character_id, language, user_id)
+    summarizer.request_summary(chat_id)
+    if not user_id:
+        return None
+    ach = await bookkeeping.submit(_check_achievements, user_id)
+    xp = await bookkeeping.submit(award_xp, user_id, MESSAGE_XP)
+    return asyncio.gather(ach, xp, return_exceptions=True)
+
+
+async def rewards_frame(pending: asyncio.Future | None) -> str | None:
+    """SSE rewards frame once the turn's XP / achievements are in, or None (nothing new, or too slow)."""
+    if pending is None:
+        return None
+    try:
+        new_ach, xp = await asyncio.wait_for(asyncio.shield(pending), REWARDS_WAIT)
+    except asyncio.TimeoutError:
+        return None
+    data = {'type': 'rewards'}
+    if new_ach and not isinstance(new_ach, BaseException):
+        data['new_achievements'] = new_ach
+    if xp and not isinstance(xp, BaseException):
+        data['xp'] = xp
+    return sse(data) if len(data) > 1 else None
+
+
+async def drain(timeout: float = 10.0) -> None:
+    """Finish queued bookkeeping and write pending counters (lifespan shutdown)."""
+    await bookkeeping.drain(timeout)
+    await summarizer.drain()
+    await counters.flush()
@@ -1,11 +1,18 @@
 """Build system prompt for character roleplay — supports ru/en/es/fr/de/pt/it.
 
 Defaults live in code (_DEFAULTS). Admin can override any key via DB
-(prompt_templates table). Overrides are cached in-memory for 60 seconds.
+(prompt_templates table), read from the admin settings registry
+(utils/admin_settings.py).
+
+The static part of each prompt is compiled once per character/language/mode
+and cached (_segment_cache); only per-turn parts are spliced in per message.
 """
 
-import time
-from sqlalchemy import text
+import json
+from collections import OrderedDict
+
+from app.chat.lore_matcher import get_matcher
+from app.utils import admin_settings
 
 _DEFAULTS = {
     "ru": {
@@ -842,29 +849,42 @@ _DEFAULTS = {
 
 # --- Override cache ---
 _overrides: dict[str, str] = {}
-_overrides_ts: float = 0
-_CACHE_TTL = 60  # seconds
+_overrides_version: int = 0  # changes whenever overrides change; part of the segment cache key
+
+# --- Compiled prompt segment cache ---
+# (character id, updated_at, mode, language, rating, override version, fields) ->
+# (segments, uses_user_marker). Segments are pre-joined static text with _Slot
+# placeholders where per-turn parts (lore, user section, encounter state) go.
+_segment_cache: OrderedDict[tuple, tuple[tuple, bool]] = OrderedDict()
+_SEGMENT_CACHE_MAX = 1024
+
+_LORE_TOKEN_BUDGET = 1500  # max tokens of matched World Info injected per turn
+
+
+class _Slot:
+    """Placeholder for a per-turn part inside compiled prompt segments."""
+    __slots__ = ("name",)
+
+    def __init__(self, name: str):
+        self.name = name
 
 
-async def load_overrides(engine) -> None:
-    """Load prompt overrides from DB into in-memory cache (60s TTL)."""
-    global _overrides, _overrides_ts
-    now = time.monotonic()
-    if now - _overrides_ts < _CACHE_TTL:
-        return
-    try:
-        async with engine.connect() as conn:
-            result = await conn.execute(text("SELECT key, value FROM prompt_templates"))
-            _overrides = {row[0]: row[1] for row in result}
-    except Exception:
-        pass  # table might not exist yet; use defaults
-    _overrides_ts = now
+_SLOT_USER = _Slot("user")
+_SLOT_LORE = _Slot("lore")
+_SLOT_ENCOUNTER = _Slot("encounter")
+_SLOT_PLAYER_SETUP = _Slot("player_setup")
+_VOLATILE_SLOTS = (_SLOT_LORE, _SLOT_ENCOUNTER)  # change turn to turn; kept out of the cacheable prefix
+_USER_MARK = "\x00{{user}}\x00"  # {{user}} in character text, substituted per turn
 
 
-def invalidate_cache() -> None:
-    """Force reload on next build_system_prompt call."""
-    global _overrides_ts
-    _overrides_ts = 0
+async def load_overrides() -> None:
+    """Pick up the current prompt overrides from the admin settings registry."""
+    global _overrides, _overrides_version
+    await admin_settings.ensure_fresh()
+    overrides, version = admin_settings.prompt_overrides()
+    if version != _overrides_version:
+        _overrides, _overrides_version = overrides, version
+        _segment_cache.clear()
 
 
 def _get(lang: str, key: str) -> str:
@@ -890,19 +910,11 @@ def get_all_keys() -> list[dict]:
     return result
 
 
-def _match_lore_entries(lore_entries: list[dict], context_text: str) -> list[str]:
-    """Return lore content for entries whose keywords match the context text."""
+def _match_lore_entries(lore_entries: list[dict], context_text: str, character_id: str | None = None) -> list[str]:
+    """Return lore content for entries whose keywords match the context text (priority order, within budget)."""
     if not lore_entries or not context_text:
         return []
-    context_lower = context_text.lower()
-    matched = []
-    for entry in lore_entries:
-        if not entry.get("enabled", True):
-            continue
-        keywords = [kw.strip().lower() for kw in entry.get("keywords", "").split(",") if kw.strip()]
-        if any(kw in context_lower for kw in keywords):
-            matched.append(entry["content"])
-    return matched
+    return get_matcher(character_id, lore_entries).match(context_text, token_budget=_LORE_TOKEN_BUDGET)
 
 
 _FICTION_PROMPTS = {
@@ -1280,13 +1292,8 @@ _TUTOR_PROMPTS = {
 }
 
 
-async def _build_tutor_prompt(
-    character: dict,
-    user_name: str | None = None,
-    user_description: str | None = None,
-    language: str = "ru",
-) -> str:
-    """Build a tutor-specific system prompt (SFW Language Tutor mode)."""
+def _compile_tutor_prompt(character: dict, language: str = "ru") -> list:
+    """Tutor-specific system prompt segments (SFW Language Tutor mode)."""
     lang = language if language in _TUTOR_PROMPTS else "en"
     tp = _TUTOR_PROMPTS[lang]
     char_name = character["name"]
@@ -1303,15 +1310,21 @@ async def _build_tutor_prompt(
     parts.append(f"\n{tp['teaching_rules']}")
     parts.append(f"\n{tp['format_rules']}")
 
-    if user_name:
-        parts.append(f"\nThe user's name is {user_name}.")
-    if user_description:
-        parts.append(f"About the user: {user_description}")
+    parts.append(_SLOT_USER)
 
     if character.get("system_prompt_suffix"):
         parts.append(f"\n## Additional Instructions\n{character['system_prompt_suffix']}")
 
-    return "\n".join(parts)
+    return parts
+
+
+def _tutor_user_parts(lang: str, user_name: str | None, user_description: str | None) -> list[str]:
+    parts = []
+    if user_name:
+        parts.append(f"\nThe user's name is {user_name}.")
+    if user_description:
+        parts.append(f"About the user: {user_description}")
+    return parts
 
 
 def _build_companion_section(character: dict, char_name: str, lang: str) -> str | None:
@@ -1392,13 +1405,8 @@ def _build_companion_section(character: dict, char_name: str, lang: str) -> str
     return section
 
 
-async def _build_fiction_prompt(
-    character: dict,
-    user_name: str | None = None,
-    user_description: str | None = None,
-    language: str = "ru",
-) -> str:
-    """Build an interactive fiction system prompt (fiction mode)."""
+def _compile_fiction_prompt(character: dict, language: str = "ru") -> list:
+    """Interactive fiction system prompt segments (fiction mode)."""
     lang = language if language in _FICTION_PROMPTS else "en"
     fp = _FICTION_PROMPTS[lang]
     char_name = character["name"]
@@ -1479,19 +1487,7 @@ async def _build_fiction_prompt(
     parts.append(f"\n{fp['choices_rules']}")
     parts.append(f"\n{fp['format_rules']}")
 
-    if user_name:
-        reader_labels = {
-            "ru": f"\nИмя читателя: {user_name}.",
-            "en": f"\nThe reader's name is {user_name}.",
-            "es": f"\nEl nombre del lector es {user_name}.",
-            "fr": f"\nLe nom du lecteur est {user_name}.",
-            "de": f"\nDer Name des Lesers ist {user_name}.",
-            "pt": f"\nO nome do leitor e {user_name}.",
-            "it": f"\nIl nome del lettore e {user_name}.",
-        }
-        parts.append(reader_labels.get(lang, reader_labels["en"]))
-    if user_description:
-        parts.append(f"About the reader: {user_description}")
+    parts.append(_SLOT_USER)
 
     if character.get("system_prompt_suffix"):
         extra_header = {
@@ -1502,7 +1498,27 @@ async def _build_fiction_prompt(
         }
         parts.append(f"\n{extra_header.get(lang, extra_header['en'])}\n{character['system_prompt_suffix']}")
 
-    return "\n".join(parts)
+    return parts
+
+
+_READER_LABELS = {
+    "ru": "\nИмя читателя: {user_name}.",
+    "en": "\nThe reader's name is {user_name}.",
+    "es": "\nEl nombre del lector es {user_name}.",
+    "fr": "\nLe nom du lecteur est {user_name}.",
+    "de": "\nDer Name des Lesers ist {user_name}.",
+    "pt": "\nO nome do leitor e {user_name}.",
+    "it": "\nIl nome del lettore e {user_name}.",
+}
+
+
+def _fiction_user_parts(lang: str, user_name: str | None, user_description: str | None) -> list[str]:
+    parts = []
+    if user_name:
+        parts.append(_READER_LABELS.get(lang, _READER_LABELS["en"]).format(user_name=user_name))
+    if user_description:
+        parts.append(f"About the reader: {user_description}")
+    return parts
 
 
 # ── D&D Game Master prompts (7 languages) ──────────────────
@@ -1953,14 +1969,8 @@ _DND_PROMPTS = {
 }
 
 
-async def _build_dnd_prompt(
-    character: dict,
-    user_name: str | None = None,
-    user_description: str | None = None,
-    language: str = "en",
-    encounter_state: dict | None = None,
-) -> str:
-    """Build a D&D Game Master system prompt."""
+def _compile_dnd_prompt(character: dict, language: str = "en") -> list:
+    """D&D Game Master system prompt segments."""
     lang = language if language in _DND_PROMPTS else "en"
     dp = _DND_PROMPTS[lang]
     char_name = character["name"]
@@ -2030,64 +2040,44 @@ async def _build_dnd_prompt(
     parts.append(f"\n{dp['choices_rules']}")
     parts.append(f"\n{dp['format_rules']}")
 
-    # Character creation guidance (only when player has no character set up)
-    if not user_name and not user_description and "character_creation" in dp:
-        parts.append(f"\n{dp['character_creation']}")
-
-    # Inject encounter state if active
-    if encounter_state:
-        parts.append(f"\n## Current Encounter State\n```json\n{__import__('json').dumps(encounter_state, indent=2)}\n```")
-
-    if user_name:
-        parts.append(f"\nThe player's character name is {user_name}.")
-    if user_description:
-        parts.append(f"Player character: {user_description}")
+    # Character creation guidance, encounter state, player — all per-chat
+    parts.append(_SLOT_PLAYER_SETUP)
+    parts.append(_SLOT_ENCOUNTER)
+    parts.append(_SLOT_USER)
 
     if character.get("system_prompt_suffix"):
         parts.append(f"\n## Additional Instructions\n{character['system_prompt_suffix']}")
 
-    return "\n".join(parts)
+    return parts
 
 
-async def build_system_prompt(
-    character: dict,
-    user_name: str | None = None,
-    user_description: str | None = None,
-    language: str = "ru",
-    engine=None,
-    lore_entries: list[dict] | None = None,
-    context_text: str = "",
-    site_mode: str = "nsfw",
-    campaign_id: str | None = None,
-    encounter_state: dict | None = None,
-) -> str:
-    # DnD mode: campaign chat OR character with 'dnd' tag
-    tags = [t.strip() for t in (character.get("tags", "") or "").split(",")]
-    is_dnd = bool(campaign_id) or "dnd" in tags
-    if is_dnd:
-        return await _build_dnd_prompt(
-            character, user_name, user_description, language, encounter_state,
-        )
+def _dnd_player_setup_parts(lang: str, user_name: str | None, user_description: str | None) -> list[str]:
+    # Character creation guidance (only when player has no character set up)
+    dp = _DND_PROMPTS[lang if lang in _DND_PROMPTS else "en"]
+    if not user_name and not user_description and "character_creation" in dp:
+        return [f"\n{dp['character_creation']}"]
+    return []
 
-    # Tutor mode: use simplified educational prompts
-    if site_mode == "sfw":
-        return await _build_tutor_prompt(character, user_name, user_description, language)
 
-    # Fiction mode: interactive storytelling prompts
-    if site_mode == "fiction":
-        return await _build_fiction_prompt(character, user_name, user_description, language)
+def _dnd_user_parts(lang: str, user_name: str | None, user_description: str | None) -> list[str]:
+    parts = []
+    if user_name:
+        parts.append(f"\nThe player's character name is {user_name}.")
+    if user_description:
+        parts.append(f"Player character: {user_description}")
+    return parts
 
-    if engine:
-        await load_overrides(engine)
 
+def _compile_rp_prompt(character: dict, language: str = "ru") -> list:
+    """Roleplay (nsfw mode) system prompt segments; uses admin overrides via _get()."""
     lang = language if language in _DEFAULTS else "en"
     parts = []
 
-    # Template variable replacement for all character text fields
+    # Template variable replacement for all character text fields.
+    # {{user}} becomes a marker so the compiled prompt is shared across users.
     char_name = character["name"]
-    u_name = user_name or "User"
     def tpl(text: str) -> str:
-        return text.replace("{{char}}", char_name).replace("{{user}}", u_name)
+        return text.replace("{{char}}", char_name).replace("{{user}}", _USER_MARK)
 
     parts.append(_get(lang, "intro").format(name=char_name))
     parts.append(f"\n{_get(lang, 'personality')}\n{tpl(character['personality'])}")
@@ -2121,12 +2111,8 @@ async def build_system_prompt(
     if character.get("scenario"):
         parts.append(f"\n{_get(lang, 'scenario')}\n{tpl(character['scenario'])}")
 
-    # Inject matched lore entries (World Info)
-    if lore_entries:
-        matched_lore = _match_lore_entries(lore_entries, context_text)
-        if matched_lore:
-            lore_header = {"ru": "## Мир и лор", "en": "## World Info", "es": "## Información del mundo", "fr": "## Informations sur le monde", "de": "## Weltinformationen", "pt": "## Informações do Mundo", "it": "## Informazioni sul Mondo"}
-            parts.append(f"\n{lore_header.get(lang, lore_header['en'])}\n" + "\n".join(matched_lore))
+    # Matched lore entries (World Info)
+    parts.append(_SLOT_LORE)
 
     if character.get("example_dialogues"):
         parts.append(f"\n{_get(lang, 'examples')}\n{tpl(character['example_dialogues'])}")
@@ -2146,11 +2132,7 @@ async def build_system_prompt(
     if character.get("system_prompt_suffix"):
         parts.append(f"\n{_get(lang, 'extra_instructions')}\n{tpl(character['system_prompt_suffix'])}")
 
-    if user_name:
-        user_lines = _get(lang, 'user_name_line').format(user_name=user_name)
-        if user_description:
-            user_lines += "\n" + _get(lang, 'user_description_line').format(user_description=user_description)
-        parts.append(f"\n{_get(lang, 'user_section')}\n{user_lines}")
+    parts.append(_SLOT_USER)
 
     length_keys = {
         "short": "length_short",
@@ -2169,4 +2151,128 @@ async def build_system_prompt(
         + _get(lang, "rules")
     )
 
-    return "\n".join(parts)
+    return parts
+
+
+def _rp_user_parts(lang: str, user_name: str | None, user_description: str | None) -> list[str]:
+    if not user_name:
+        return []
+    lang = lang if lang in _DEFAULTS else "en"
+    user_lines = _get(lang, 'user_name_line').format(user_name=user_name)
+    if user_description:
+        user_lines += "\n" + _get(lang, 'user_description_line').format(user_description=user_description)
+    return [f"\n{_get(lang, 'user_section')}\n{user_lines}"]
+
+
+_LORE_HEADER = {"ru": "## Мир и лор", "en": "## World Info", "es": "## Información del mundo", "fr": "## Informations sur le monde", "de": "## Weltinformationen", "pt": "## Informações do Mundo", "it": "## Informazioni sul Mondo"}
+
+# mode -> (compile static segments, user section parts)
+_PROMPT_MODES = {
+    "dnd": (_compile_dnd_prompt, _dnd_user_parts),
+    "sfw": (_compile_tutor_prompt, _tutor_user_parts),
+    "fiction": (_compile_fiction_prompt, _fiction_user_parts),
+    "nsfw": (_compile_rp_prompt, _rp_user_parts),
+}
+
+
+def _get_compiled(character: dict, mode: str, language: str) -> tuple[tuple, bool]:
+    """Compiled (segments, uses_user_marker) for a character, cached when it has id + updated_at."""
+    key = None
+    if character.get("id") and character.get("updated_at"):
+        key = (
+            character["id"], str(character["updated_at"]), mode, language,
+            character.get("content_rating"), _overrides_version if mode == "nsfw" else 0,
+            tuple(character),  # group chat passes a reduced field set
+        )
+        hit = _segment_cache.get(key)
+        if hit is not None:
+            _segment_cache.move_to_end(key)
+            return hit
+
+    # Merge consecutive static parts so rendering is a short join
+    segments: list = []
+    run: list[str] = []
+    for part in _PROMPT_MODES[mode][0](character, language):
+        if isinstance(part, _Slot):
+            if run:
+                segments.append("\n".join(run))
+                run = []
+            segments.append(part)
+        else:
+            run.append(part)
+    if run:
+        segments.append("\n".join(run))
+    compiled = (tuple(segments), any(isinstance(seg, str) and _USER_MARK in seg for seg in segments))
+
+    if key is not None:
+        _segment_cache[key] = compiled
+        if len(_segment_cache) > _SEGMENT_CACHE_MAX:
+            _segment_cache.popitem(last=False)
+    return compiled
+
+
+def invalidate_character(character_id: str) -> None:
+    """Drop compiled prompts for a character (call after edit/delete)."""
+    for key in [k for k in _segment_cache if k[0] == character_id]:
+        _segment_cache.pop(key, None)
+
+
+async def build_system_prompt(
+    character: dict,
+    user_name: str | None = None,
+    user_description: str | None = None,
+    language: str = "ru",
+    engine=None,
+    lore_entries: list[dict] | None = None,
+    context_text: str = "",
+    site_mode: str = "nsfw",
+    campaign_id: str | None = None,
+    encounter_state: dict | None = None,
+    volatile: list[str] | None = None,
+) -> str:
+    """Render the system prompt for one turn.
+
+    If `volatile` is a list, per-turn slots (matched lore, encounter state) are
+    appended to it instead of being spliced in, so the returned prompt is a
+    stable prefix that provider prompt caches can reuse across turns.
+    """
+    # DnD mode: campaign chat OR character with 'dnd' tag
+    tags = [t.strip() for t in (character.get("tags", "") or "").split(",")]
+    is_dnd = bool(campaign_id) or "dnd" in tags
+    if is_dnd:
+        mode = "dnd"
+    elif site_mode in ("sfw", "fiction"):
+        # Tutor mode: simplified educational prompts; fiction: interactive storytelling
+        mode = site_mode
+    else:
+        mode = "nsfw"
+        if engine:
+            await load_overrides()
+
+    segments, uses_user = _get_compiled(character, mode, language)
+
+    # Per-turn slots spliced into the compiled static segments
+    slots: dict = {_SLOT_USER: _PROMPT_MODES[mode][1](language, user_name, user_description)}
+    if mode == "dnd":
+        slots[_SLOT_PLAYER_SETUP] = _dnd_player_setup_parts(language, user_name, user_description)
+        if encounter_state:
+            slots[_SLOT_ENCOUNTER] = [f"\n## Current Encounter State\n```json\n{json.dumps(encounter_state, indent=2)}\n```"]
+    elif mode == "nsfw" and lore_entries:
+        matched_lore = _match_lore_entries(lore_entries, context_text, character.get("id"))
+        if matched_lore:
+            lang = language if language in _DEFAULTS else "en"
+            slots[_SLOT_LORE] = [f"\n{_LORE_HEADER.get(lang, _LORE_HEADER['en'])}\n" + "\n".join(matched_lore)]
+
+    out: list[str] = []
+    for seg in segments:
+        if isinstance(seg, _Slot):
+            if volatile is not None and seg in _VOLATILE_SLOTS:
+                volatile.extend(part.lstrip("\n") for part in slots.get(seg, ()))
+            else:
+                out.extend(slots.get(seg, ()))
+        else:
+            out.append(seg)
+    prompt = "\n".join(out)
+    if uses_user:
+        prompt = prompt.replace(_USER_MARK, user_name or "User")
+    return prompt
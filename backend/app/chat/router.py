@@ -1,25 +1,30 @@
 import json
-import time as _time
 from datetime import datetime
 from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import StreamingResponse
 from starlette.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, text as sa_text
+from sqlalchemy import select
 from app.auth.middleware import get_current_user, get_current_user_optional
 from app.db.session import get_db
 from app.chat.schemas import CreateChatRequest, SendMessageRequest
 from app.chat import service
 from app.chat.anon import get_anon_user_id, check_anon_limit, get_anon_remaining, get_anon_message_limit
-from app.db.models import User, Persona, Message, Chat
-from app.llm.base import LLMConfig, LLMMessage
-from app.llm.registry import get_provider
+from app.db.models import Chat
+from app.llm.base import LLMConfig, LLMMessage, capture_usage, captured_usage
+from app.llm.registry import get_provider, get_context_length
+from app.llm.tokenizer import count_tokens, count_message_tokens
 from app.config import settings
 from app.auth.rate_limit import check_message_rate, check_message_interval
 from app.chat.daily_limit import check_daily_limit, get_daily_usage, get_cost_mode, get_user_tier, get_tier_limits, cap_max_tokens
-from app.chat.summarizer import maybe_summarize
+from app.chat import counters, post_turn
+from app.achievements import checker as achievements
+from app.chat.streaming import ContentRejected, race_gated, sse, stream_frames, stream_gated
+from app.llm import provider_stats
+from app.utils import admin_settings
 import re as _re
 import asyncio as _asyncio
+import functools
 from app.llm import model_cooldown as _model_cooldown
 from app.llm import model_resolver as _model_resolver
 from app.llm.thinking_filter import has_mixed_languages as _has_mixed_langs
@@ -103,29 +108,6 @@ def _strip_state_blocks(text: str) -> str:
     return _STATE_PATTERN.sub('', text).strip()
 
 
-async def _update_encounter_state(db, chat_id: str, new_state: dict):
-    """Merge new encounter state into chat's encounter_state JSONB."""
-    from app.db.models import Chat
-    from sqlalchemy import select
-    result = await db.execute(select(Chat).where(Chat.id == chat_id))
-    chat = result.scalar_one_or_none()
-    if not chat:
-        return
-    current = chat.encounter_state or {}
-    current.update(new_state)
-    chat.encounter_state = current
-    await db.commit()
-
-
-async def _save_dice_on_message(db: AsyncSession, msg_id: str, dice_rolls: list):
-    """Persist dice roll results on the assistant message for next-turn injection."""
-    result = await db.execute(select(Message).where(Message.id == msg_id))
-    msg = result.scalar_one_or_none()
-    if msg:
-        msg.dice_rolls = dice_rolls
-        await db.commit()
-
-
 # ── Companion approval parsing ─────────────────────────────
 _APPROVAL_PATTERN = _re.compile(r'\[APPROVAL\s*([+-]\d)\]', _re.IGNORECASE)
 
@@ -163,17 +145,24 @@ def _parse_and_strip_suggestions(text: str) -> tuple[str, list[str] | None]:
     return cleaned.rstrip(), suggestions[:6]
 
 
-async def _update_companion_approval(db, chat_id: str, delta: int):
-    """Update companion_approval on chat, clamped to [-3, +3]."""
-    if delta == 0:
-        return
-    result = await db.execute(select(Chat).where(Chat.id == chat_id))
-    chat = result.scalar_one_or_none()
-    if not chat:
-        return
-    current = getattr(chat, 'companion_approval', 0) or 0
-    chat.companion_approval = max(-3, min(3, current + delta))
-    await db.commit()
+def _postprocess_response(text: str, *, approval: bool, choices: bool, dnd: bool) -> tuple[str, dict]:
+    """Strip control tags from a finished response and collect their payloads.
+
+    Returns (cleaned_text, extras) — extras may hold approval_delta, suggestions,
+    choices, dice_rolls and encounter_state.
+    """
+    extras: dict = {}
+    # Every control tag is bracketed — plain prose skips the tag regexes entirely
+    if "[" in text:
+        if approval:
+            text, extras["approval_delta"] = _parse_and_strip_approval(text)
+        text, extras["suggestions"] = _parse_and_strip_suggestions(text)
+        if dnd:
+            extras["dice_rolls"] = _parse_dice_rolls(text)
+            extras["encounter_state"] = _parse_encounter_state(text)
+    if choices:
+        extras["choices"] = _parse_choices(text)
+    return text, extras
 
 
 # ── Provider-specific prompt hints ────────────────────────────
@@ -416,23 +405,9 @@ def _get_provider_hint(provider_name: str, content_rating: str, language: str, c
     return text
 
 
-# ── Paid mode cache (60s TTL) ─────────────────────────────────
-_paid_mode_cache: tuple[bool, float] = (False, 0.0)
-_PAID_CACHE_TTL = 60
-
-
 async def _is_paid_mode(db: AsyncSession) -> bool:
-    global _paid_mode_cache
-    now = _time.monotonic()
-    if now - _paid_mode_cache[1] < _PAID_CACHE_TTL:
-        return _paid_mode_cache[0]
-    try:
-        row = await db.execute(sa_text("SELECT value FROM prompt_templates WHERE key = 'setting.paid_mode'"))
-        val = (row.scalar_one_or_none() or "false").lower() == "true"
-    except Exception:
-        val = False
-    _paid_mode_cache = (val, now)
-    return val
+    await admin_settings.ensure_fresh()
+    return admin_settings.get("paid_mode")
 
 _GENERIC_ERROR_RU = "Ошибка генерации ответа. Попробуйте позже."
 _MODERATION_KEYWORDS = ("data_inspection_failed", "content_policy", "content_filter", "moderation", "safety system")
@@ -522,9 +497,34 @@ def _dedup_response(text: str) -> str:
     return text
 
 
-def _estimate_prompt_tokens(messages) -> int:
-    """Estimate prompt tokens from LLM messages (rough: chars / 4)."""
-    return sum(len(m.content) for m in messages) // 4
+# Hedged auto mode: the p95 TTFT of the provider being waited on is clamped to this range
+_HEDGE_DELAY_MIN = 1.0
+_HEDGE_DELAY_MAX = 10.0
+
+
+def _hedge_delay(provider: str) -> float:
+    return provider_stats.hedge_delay(provider, settings.hedge_delay, _HEDGE_DELAY_MIN, _HEDGE_DELAY_MAX)
+
+
+def _model_label(prov, config: LLMConfig) -> str:
+    return getattr(prov, 'last_model_used', '') or config.model or ''
+
+
+async def _probed_stream(pname: str, prov, msgs: list[LLMMessage], config: LLMConfig, is_rejected, collected: list[str]):
+    """stream_gated() for one provider attempt, reported to the provider scoreboard."""
+    probe = provider_stats.StreamProbe(pname)
+    try:
+        async for frame in stream_gated(prov.generate_stream(msgs, config), is_rejected, collected, probe.first_token):
+            yield frame
+    except Exception as e:
+        probe.failed(_model_label(prov, config), refusal=isinstance(e, ContentRejected))
+        raise
+    probe.succeeded(_model_label(prov, config), count_tokens("".join(collected), config.model))
+
+
+def _estimate_prompt_tokens(messages, model: str | None = None) -> int:
+    """Prompt tokens of LLM messages, counted with the local tokenizer."""
+    return count_message_tokens(messages, model)
 
 
 def _user_error(err: str, is_admin: bool) -> str:
@@ -753,31 +753,21 @@ async def generate_persona_reply(
     # Check daily limit (counts toward usage)
     await check_daily_limit(user["id"], user.get("role", "user"))
 
-    chat = await service.get_chat(db, chat_id, user["id"])
-    if not chat:
+    ctx = await service.load_chat_context(db, chat_id, user_id=user["id"], with_lore=False)
+    if not ctx:
         raise HTTPException(status_code=404, detail="Chat not found")
+    chat = ctx.chat
 
     persona_name = getattr(chat, 'persona_name', None)
     if not persona_name:
         raise HTTPException(status_code=400, detail="No persona attached to this chat")
 
     persona_desc = getattr(chat, 'persona_description', None) or ""
-    character_name = chat.character.name if chat.character else "Character"
-
-    # Get recent messages for context
-    msgs_result = await db.execute(
-        select(Message)
-        .where(Message.chat_id == chat_id)
-        .order_by(Message.created_at.desc())
-        .limit(10)
-    )
-    recent_msgs = list(msgs_result.scalars().all())
-    recent_msgs.reverse()
+    character_name = ctx.character.name
 
-    # Detect language from recent messages
-    user_obj = await db.execute(select(User).where(User.id == user["id"]))
-    user_obj = user_obj.scalar_one_or_none()
-    language = user_obj.language if user_obj else "ru"
+    # Recent messages for context
+    recent_msgs = ctx.recent[-10:]
+    language = ctx.user_language or "ru"
 
     lang_instructions = {
         "ru": "Напиши ответ на русском языке.",
@@ -839,33 +829,12 @@ async def generate_persona_reply(
     if not generated_text:
         raise HTTPException(status_code=500, detail="Generation failed")
 
-    # Increment user message count (counts toward daily limit)
-    if user_obj:
-        user_obj.message_count = (user_obj.message_count or 0) + 1
-        await db.commit()
+    # Increment user message count
+    counters.add_user_message(user["id"])
 
     return {"content": generated_text.strip()}
 
 
-async def _append_to_message(db: AsyncSession, message_id: str, appended_text: str, model_used: str, est_prompt: int, est_completion: int):
-    """Append text to an existing assistant message (for continue feature)."""
-    from datetime import datetime
-    result = await db.execute(select(Message).where(Message.id == message_id))
-    msg = result.scalar_one_or_none()
-    if not msg:
-        return
-    msg.content = (msg.content or "") + appended_text
-    msg.token_count = len(msg.content) // 4
-    msg.model_used = model_used
-    msg.prompt_tokens = (msg.prompt_tokens or 0) + (est_prompt or 0)
-    msg.completion_tokens = (msg.completion_tokens or 0) + (est_completion or 0)
-    chat_result = await db.execute(select(Chat).where(Chat.id == msg.chat_id))
-    chat_obj = chat_result.scalar_one_or_none()
-    if chat_obj:
-        chat_obj.updated_at = datetime.utcnow()
-    await db.commit()
-
-
 @router.post("/{chat_id}/rate")
 async def rate_adventure(
     chat_id: str,
@@ -886,16 +855,19 @@ async def rate_adventure(
     if chat.user_id != user.get("id"):
         raise HTTPException(403, "Not your chat")
 
+    if chat.rating is None:
+        await achievements.record(db, user["id"], "ratings")
     chat.rating = rating
     if not chat.completed_at:
         chat.completed_at = datetime.utcnow()
     await db.commit()
+    from app.seo import render_cache
+    render_cache.invalidate_character(chat.character_id, stale_only=True)
 
     # Check achievements
     new_achievements = []
     try:
-        from app.achievements.checker import check_achievements
-        new_achievements = await check_achievements(db, user["id"], trigger="rating")
+        new_achievements = await achievements.check_achievements(db, user["id"], trigger="rating")
     except Exception:
         pass
 
@@ -920,27 +892,38 @@ async def send_message(
 ):
     anon_session_id = None
     anon_remaining = None
+    tier = get_user_tier(user)
+    # Context budget (respect tier limits); packed to the model's window later via fit_to_context
+    ctx_max_tokens = body.context_limit or service.DEFAULT_CONTEXT_TOKENS
+    ctx_max_messages = get_tier_limits(tier)["max_context_messages"] or service.MAX_CONTEXT_MESSAGES
 
     if user:
-        check_message_rate(user["id"])
+        await check_message_rate(user["id"])
         if not body.is_regenerate and not body.is_continue:
             await check_message_interval(user["id"])
         await check_daily_limit(user["id"], user.get("role", "user"))
-        chat = await service.get_chat(db, chat_id, user_id=user["id"])
+        ctx = await service.load_chat_context(
+            db, chat_id, user_id=user["id"],
+            max_tokens=ctx_max_tokens, max_messages=ctx_max_messages,
+        )
     else:
         anon_session_id = request.headers.get("x-anon-session")
         if not anon_session_id:
             raise HTTPException(status_code=401, detail="Authentication required")
-        check_message_rate(f"anon:{anon_session_id}")
+        await check_message_rate(f"anon:{anon_session_id}")
         if not body.is_regenerate and not body.is_continue:
             await check_message_interval(f"anon:{anon_session_id}")
         anon_remaining = await check_anon_limit(anon_session_id)  # raises 403 if exceeded
-        chat = await service.get_chat(db, chat_id, anon_session_id=anon_session_id)
+        ctx = await service.load_chat_context(
+            db, chat_id, anon_session_id=anon_session_id,
+            max_tokens=ctx_max_tokens, max_messages=ctx_max_messages,
+        )
 
-    if not chat:
+    if not ctx:
         raise HTTPException(status_code=404, detail="Chat not found")
 
-    character = chat.character
+    chat = ctx.chat
+    character = ctx.character
 
     # If model override requested, persist it on the chat
     if body.model and body.model != chat.model_used:
@@ -955,42 +938,35 @@ async def send_message(
 
     # Handle "continue" — append to last assistant message
     continue_msg_id = None
+    last_msg = ctx.last_message
     if body.is_continue:
-        last_msgs, _ = await service.get_chat_messages(db, chat_id, limit=1)
-        if last_msgs and last_msgs[0].role.value == "assistant":
-            continue_msg_id = last_msgs[0].id
+        if last_msg and last_msg.role.value == "assistant":
+            continue_msg_id = last_msg.id
         # Create a virtual user message (not saved to DB) for the response
         user_msg = type('FakeMsg', (), {'id': 'continue'})()
     else:
         # Dedup: skip saving if last message is the same user text (e.g. page reload after error)
-        last_msgs, _ = await service.get_chat_messages(db, chat_id, limit=1)
-        if last_msgs and last_msgs[0].role.value == "user" and last_msgs[0].content == body.content:
-            user_msg = last_msgs[0]
+        if last_msg and last_msg.role.value == "user" and last_msg.content == body.content:
+            user_msg = last_msg
         else:
             user_msg = await service.save_message(db, chat_id, "user", body.content)
+            ctx.add_message(user_msg)
 
     is_admin = user.get("role") == "admin" if user else False
-    tier = get_user_tier(user)
 
     # Get user display name and language for system prompt
     if user:
-        user_result = await db.execute(select(User).where(User.id == user["id"]))
-        user_obj = user_result.scalar_one_or_none()
-        language = body.language or (user_obj.language if user_obj else None) or "ru"
-        user_name = getattr(chat, 'persona_name', None) or (user_obj.display_name if user_obj else None)
+        language = body.language or ctx.user_language or "ru"
+        user_name = getattr(chat, 'persona_name', None) or ctx.user_display_name
         user_description = getattr(chat, 'persona_description', None)
     else:
         language = body.language or "en"
         user_name = None
         user_description = None
 
-    # Build context (respect tier limits)
-    tier_ctx_limit = get_tier_limits(tier)["max_context_messages"]
     messages = await service.build_conversation_messages(
         db, chat_id, character, user_name=user_name, user_description=user_description,
-        language=language, context_limit=body.context_limit,
-        max_context_messages=tier_ctx_limit,
-        site_mode=settings.site_mode,
+        language=language, site_mode=settings.site_mode, ctx=ctx,
     )
 
     # For "continue": add instruction to continue from where the model left off
@@ -1063,6 +1039,75 @@ async def send_message(
 
     user_id_for_increment = user["id"] if user else None
 
+    def is_rejected(text: str) -> bool:
+        return _is_refusal_response(text) or _has_mixed_langs(text, language)
+
+    def provider_messages(pname: str, config: LLMConfig) -> list[LLMMessage]:
+        """Conversation + provider hint, packed to the provider's context window."""
+        # Provider-specific hint (Grok: stay in character; Mistral: literary prose)
+        hint = _get_provider_hint(pname, content_rating, language, character.name, _resp_length)
+        prov_msgs = messages + [LLMMessage(role="system", content=hint)] if hint else messages
+        return service.fit_to_context(
+            prov_msgs, get_context_length(pname, config.model, nsfw=content_rating == "nsfw"),
+            config.max_tokens, config.model,
+        )
+
+    async def finish(text: str, actual_model: str, sent_msgs: list[LLMMessage], config: LLMConfig):
+        """Post-process a completed response, persist it and yield the SSE done frame.
+
+        done goes out as soon as the reply is committed; counters, XP and
+        achievements run on the post-turn queue and follow as a rewards frame.
+        """
+        try:
+            text, extras = _postprocess_response(
+                _dedup_response(text), approval=companion_approval_enabled,
+                choices=settings.is_fiction_mode, dnd=is_dnd,
+            )
+            # Provider-reported usage when the stream had one (Claude, OpenAI, DeepSeek, OpenRouter), else estimates
+            usage = captured_usage(config)
+            if usage and usage.prompt_tokens:
+                est_prompt, est_completion = usage.prompt_tokens, usage.completion_tokens
+            else:
+                est_prompt = _estimate_prompt_tokens(sent_msgs, config.model)
+                est_completion = count_tokens(text, config.model)
+            approval_delta = extras.get("approval_delta", 0)
+            saved_msg_id = await service.save_assistant_turn(
+                db, chat_id, text, model_used=actual_model,
+                prompt_tokens=est_prompt, completion_tokens=est_completion,
+                append_to=continue_msg_id, approval_delta=approval_delta,
+                dice_rolls=extras.get("dice_rolls"), encounter_state=extras.get("encounter_state"),
+                user_id=user_id_for_increment,
+            )
+        except Exception as e:
+            yield sse({'type': 'error', 'content': _user_error(str(e), is_admin), 'user_message_id': user_msg.id})
+            return
+        done_data = {
+            'type': 'done', 'message_id': saved_msg_id, 'user_message_id': user_msg.id,
+            'model_used': actual_model, 'truncated': est_completion >= capped_max_tokens * 0.85,
+        }
+        if approval_delta:
+            done_data['companion_approval_delta'] = approval_delta
+        if extras.get("choices"):
+            done_data['choices'] = extras["choices"]
+        if extras.get("suggestions"):
+            done_data['suggestions'] = extras["suggestions"]
+        if extras.get("dice_rolls"):
+            done_data['dice_rolls'] = extras["dice_rolls"]
+        if extras.get("encounter_state"):
+            done_data['encounter_state'] = extras["encounter_state"]
+        if anon_session_id and anon_remaining is not None:
+            done_data['anon_messages_left'] = anon_remaining - 1
+        yield sse(done_data)
+
+        try:
+            pending = await post_turn.submit_turn(chat_id, character.id, language, user_id_for_increment)
+            rewards = await post_turn.rewards_frame(pending)
+        except Exception:
+            return  # reply is saved; bookkeeping is best-effort
+        if rewards:
+            yield rewards
+
+
     if is_auto:
         cost_mode = await get_cost_mode()
         tier_limits = get_tier_limits(tier)
@@ -1084,6 +1129,9 @@ async def send_message(
         # Skip NSFW-blocked providers (e.g. Claude) when content is NSFW
         if content_rating == "nsfw":
             auto_order = [p for p in auto_order if p not in _NSFW_BLOCKED_PROVIDERS]
+        # Fastest / most reliable first by live TTFT and success rate (within the filtered list)
+        if settings.adaptive_provider_order:
+            auto_order = provider_stats.rank_providers(auto_order)
         # Companion chats: prefer providers that support repetition penalties
         # Groq/Grok/Mistral/Cerebras ignore penalties → deprioritize them
         if has_companion:
@@ -1092,403 +1140,152 @@ async def send_message(
             bad = [p for p in auto_order if p in _NO_PENALTY_PROVIDERS]
             auto_order = good + bad
 
-        async def event_stream():
-            errors: list[str] = []
+        def auto_attempt(pname: str):
+            """(provider, config, messages) for an auto-mode candidate, or None if not configured."""
+            try:
+                prov = get_provider(pname)
+            except ValueError:
+                return None  # provider not configured
+            use_flex = cost_mode != "economy" and pname == "groq"
+            config = LLMConfig(model=_model_resolver.get_model(pname), use_flex=use_flex, **base_config)
+            return prov, config, provider_messages(pname, config)
+
+        def attempt_failed(pname: str, prov, config: LLMConfig, e: Exception, errors: list[str]) -> None:
+            if isinstance(e, ContentRejected):
+                actual_m = getattr(prov, 'last_model_used', '') or ''
+                errors.append(f"{pname}:{actual_m}: content refusal or language bleed")
+                return
+            _model_cooldown.handle_402_if_applicable(pname, e)
+            # Auto-fix model 404 in auto-mode (fire-and-forget, next provider will handle this request)
+            if _model_resolver.is_404_error(e) and pname in _model_resolver.FIXABLE_PROVIDERS:
+                _asyncio.create_task(_model_resolver.resolve_model_404(pname, config.model))
+            errors.append(f"{pname}: {e}")
+
+        async def race_auto(errors: list[str]):
+            """Hedged start over auto_order: (pname, provider, config, messages, probe, head, rest) of the winner, or None."""
+            attempts = {}
             for pname in auto_order:
-                try:
-                    prov = get_provider(pname)
-                except ValueError:
-                    continue  # provider not configured
-                use_flex = cost_mode != "economy" and pname == "groq"
-                config = LLMConfig(model=_model_resolver.get_model(pname), use_flex=use_flex, **base_config)
-                full_response: list[str] = []
-                buffered: list[str] = []
-                buffer_flushed = False
-                is_refusal = False
-                # Inject provider-specific hint (Grok: stay in character; Mistral: literary prose)
-                hint = _get_provider_hint(pname, content_rating, language, character.name, _resp_length)
-                prov_msgs = messages + [LLMMessage(role="system", content=hint)] if hint else messages
-                try:
-                    async for chunk in prov.generate_stream(prov_msgs, config):
-                        full_response.append(chunk)
-                        if not buffer_flushed:
-                            buffered.append(chunk)
-                            buf_text = "".join(buffered)
-                            if len(buf_text) >= 200:
-                                # Check buffered text for refusal or language bleed
-                                if _is_refusal_response(buf_text):
-                                    is_refusal = True
-                                    break
-                                if _has_mixed_langs(buf_text, language):
-                                    is_refusal = True
-                                    break
-                                # Flush buffer
-                                for b in buffered:
-                                    yield f"data: {json.dumps({'type': 'token', 'content': b})}\n\n"
-                                buffer_flushed = True
-                        else:
-                            yield f"data: {json.dumps({'type': 'token', 'content': chunk})}\n\n"
+                attempt = auto_attempt(pname)
+                if attempt:
+                    attempts[pname] = attempt
+            names = list(attempts)
+            probes = {n: provider_stats.StreamProbe(n) for n in names}
+
+            def racer_failed(n: str, e: Exception) -> None:
+                prov, config, _ = attempts[n]
+                probes[n].failed(_model_label(prov, config), refusal=isinstance(e, ContentRejected))
+                attempt_failed(n, prov, config, e, errors)
+
+            won = await race_gated(
+                [(n, functools.partial(attempts[n][0].generate_stream, attempts[n][2], attempts[n][1])) for n in names],
+                is_rejected,
+                _hedge_delay,
+                max_parallel=settings.hedge_max_parallel,
+                on_first=lambda n, _ttft: probes[n].first_token(),
+                on_error=racer_failed,
+                on_cancel=lambda n, _elapsed: probes[n].cancelled(),
+            )
+            if won is None:
+                return None
+            idx, head, rest = won
+            return (names[idx], *attempts[names[idx]], probes[names[idx]], head, rest)
 
-                    if is_refusal:
-                        actual_m = getattr(prov, 'last_model_used', '') or ''
-                        errors.append(f"{pname}:{actual_m}: content refusal or language bleed")
+        async def event_stream():
+            capture_usage()
+            errors: list[str] = []
+            if settings.hedged_auto:
+                won = await race_auto(errors)
+                if won:
+                    pname, prov, config, prov_msgs, probe, head, rest = won
+                    raw: list[str] = []
+                    try:
+                        async for frame in stream_frames(rest, head, raw):
+                            yield frame
+                    except Exception as e:
+                        probe.failed(_model_label(prov, config))
+                        attempt_failed(pname, prov, config, e, errors)
+                    else:
+                        probe.succeeded(_model_label(prov, config), count_tokens("".join(raw), config.model))
+                        actual_model = f"{pname}:{getattr(prov, 'last_model_used', '') or ''}"
+                        async for frame in finish("".join(raw), actual_model, prov_msgs, config):
+                            yield frame
+                        return
+            else:
+                for pname in auto_order:
+                    attempt = auto_attempt(pname)
+                    if not attempt:
+                        continue
+                    prov, config, prov_msgs = attempt
+                    raw = []
+                    try:
+                        async for frame in _probed_stream(pname, prov, prov_msgs, config, is_rejected, raw):
+                            yield frame
+                    except Exception as e:
+                        attempt_failed(pname, prov, config, e, errors)
                         continue
-
-                    # Check short responses that finished before buffer flush
-                    complete_text = _dedup_response("".join(full_response))
-                    if not buffer_flushed:
-                        if _is_refusal_response(complete_text) or _has_mixed_langs(complete_text, language):
-                            actual_m = getattr(prov, 'last_model_used', '') or ''
-                            errors.append(f"{pname}:{actual_m}: content refusal or language bleed")
-                            continue
-                        # Flush remaining buffer
-                        for b in buffered:
-                            yield f"data: {json.dumps({'type': 'token', 'content': b})}\n\n"
-
-                    # Parse companion approval tags before saving (fiction/DnD only)
-                    approval_delta = 0
-                    if companion_approval_enabled:
-                        complete_text, approval_delta = _parse_and_strip_approval(complete_text)
-                    # Parse suggested replies
-                    complete_text, suggestions = _parse_and_strip_suggestions(complete_text)
-
                     actual_model = f"{pname}:{getattr(prov, 'last_model_used', '') or ''}"
-                    est_prompt = _estimate_prompt_tokens(messages)
-                    est_completion = len(complete_text) // 4
-                    truncated = est_completion >= capped_max_tokens * 0.85
-
-                    if continue_msg_id:
-                        # Append to existing assistant message
-                        await _append_to_message(db, continue_msg_id, complete_text, actual_model, est_prompt, est_completion)
-                        saved_msg_id = continue_msg_id
-                    else:
-                        saved_msg = await service.save_message(
-                            db, chat_id, "assistant", complete_text, model_used=actual_model,
-                            prompt_tokens=est_prompt, completion_tokens=est_completion,
-                        )
-                        saved_msg_id = saved_msg.id
-                    # Update companion approval if changed
-                    if approval_delta:
-                        await _update_companion_approval(db, chat_id, approval_delta)
-                    await service.increment_message_count(character.id, language, user_id_for_increment)
-                    _asyncio.create_task(maybe_summarize(chat_id))
-                    done_data = {'type': 'done', 'message_id': saved_msg_id, 'user_message_id': user_msg.id, 'model_used': actual_model, 'truncated': truncated}
-                    if companion_approval_enabled and approval_delta:
-                        done_data['companion_approval_delta'] = approval_delta
-                    if settings.is_fiction_mode:
-                        choices = _parse_choices(complete_text)
-                        if choices:
-                            done_data['choices'] = choices
-                    if suggestions:
-                        done_data['suggestions'] = suggestions
-                    # Parse dice rolls and encounter state for DnD chats
-                    if is_dnd:
-                        dice_rolls = _parse_dice_rolls(complete_text)
-                        if dice_rolls:
-                            done_data['dice_rolls'] = dice_rolls
-                            await _save_dice_on_message(db, saved_msg_id, dice_rolls)
-                        enc_state = _parse_encounter_state(complete_text)
-                        if enc_state:
-                            await _update_encounter_state(db, chat_id, enc_state)
-                            done_data['encounter_state'] = enc_state
-                    if anon_session_id and anon_remaining is not None:
-                        done_data['anon_messages_left'] = anon_remaining - 1
-                    if user_id_for_increment and not anon_session_id:
-                        try:
-                            from app.achievements.checker import check_achievements as _ach_check
-                            _new_ach = await _ach_check(db, user_id_for_increment, trigger="message")
-                            if _new_ach:
-                                done_data['new_achievements'] = _new_ach
-                        except Exception:
-                            pass
-                        try:
-                            from app.users.xp import award_xp as _award_xp
-                            done_data['xp'] = await _award_xp(user_id_for_increment, 10)
-                        except Exception:
-                            pass
-                    yield f"data: {json.dumps(done_data)}\n\n"
+                    async for frame in finish("".join(raw), actual_model, prov_msgs, config):
+                        yield frame
                     return
-                except Exception as e:
-                    _model_cooldown.handle_402_if_applicable(pname, e)
-                    # Auto-fix model 404 in auto-mode (fire-and-forget, next provider will handle this request)
-                    if _model_resolver.is_404_error(e) and pname in _model_resolver.FIXABLE_PROVIDERS:
-                        _asyncio.create_task(_model_resolver.resolve_model_404(pname, config.model))
-                    errors.append(f"{pname}: {e}")
-                    continue
             full_err = 'Все провайдеры недоступны:\n' + '\n'.join(errors)
-            yield f"data: {json.dumps({'type': 'error', 'content': _user_error(full_err, is_admin), 'user_message_id': user_msg.id})}\n\n"
+            yield sse({'type': 'error', 'content': _user_error(full_err, is_admin), 'user_message_id': user_msg.id})
     else:
         provider = get_provider(provider_name)
         config = LLMConfig(model=model_id, **base_config)
-        # Inject provider-specific hint (Grok: stay in character; Mistral: literary prose)
-        hint = _get_provider_hint(provider_name, content_rating, language, character.name, _resp_length)
-        if hint:
-            messages = messages + [LLMMessage(role="system", content=hint)]
+        prov_msgs = provider_messages(provider_name, config)
 
         async def event_stream():
-            full_response = []
-            buffered: list[str] = []
-            buffer_flushed = False
-            is_refusal = False
+            capture_usage()
+            raw: list[str] = []
             try:
-                async for chunk in provider.generate_stream(messages, config):
-                    full_response.append(chunk)
-                    if not buffer_flushed:
-                        buffered.append(chunk)
-                        buf_text = "".join(buffered)
-                        if len(buf_text) >= 200:
-                            if _is_refusal_response(buf_text) or _has_mixed_langs(buf_text, language):
-                                is_refusal = True
-                                break
-                            for b in buffered:
-                                yield f"data: {json.dumps({'type': 'token', 'content': b})}\n\n"
-                            buffer_flushed = True
-                    else:
-                        yield f"data: {json.dumps({'type': 'token', 'content': chunk})}\n\n"
-
-                complete_text = _dedup_response("".join(full_response))
-                if not buffer_flushed and not is_refusal:
-                    if _is_refusal_response(complete_text) or _has_mixed_langs(complete_text, language):
-                        is_refusal = True
-
-                if is_refusal:
-                    # Try auto-fallback on refusal (use paid order if paid mode)
-                    paid = await _is_paid_mode(db)
-                    fb_str = settings.auto_provider_order_paid if paid else settings.auto_provider_order
-                    fallback_order = [p.strip() for p in fb_str.split(",") if p.strip() and p.strip() != provider_name]
-                    for fb_name in fallback_order:
-                        try:
-                            fb_prov = get_provider(fb_name)
-                        except ValueError:
-                            continue
-                        fb_config = LLMConfig(model=_model_resolver.get_model(fb_name), **base_config)
-                        fb_hint = _get_provider_hint(fb_name, content_rating, language, character.name, _resp_length)
-                        fb_msgs = messages + [LLMMessage(role="system", content=fb_hint)] if fb_hint else messages
-                        try:
-                            fb_response: list[str] = []
-                            async for chunk in fb_prov.generate_stream(fb_msgs, fb_config):
-                                fb_response.append(chunk)
-                                yield f"data: {json.dumps({'type': 'token', 'content': chunk})}\n\n"
-                            fb_text = "".join(fb_response)
-                            if _is_refusal_response(fb_text) or _has_mixed_langs(fb_text, language):
-                                continue
-                            # Parse companion approval tags (fiction/DnD only)
-                            fb_approval_delta = 0
-                            if companion_approval_enabled:
-                                fb_text, fb_approval_delta = _parse_and_strip_approval(fb_text)
-                            fb_text, fb_suggestions = _parse_and_strip_suggestions(fb_text)
-                            actual_model = f"{fb_name}:{getattr(fb_prov, 'last_model_used', '') or ''}"
-                            est_prompt = _estimate_prompt_tokens(messages)
-                            est_completion = len(fb_text) // 4
-                            fb_truncated = est_completion >= capped_max_tokens * 0.85
-                            if continue_msg_id:
-                                await _append_to_message(db, continue_msg_id, fb_text, actual_model, est_prompt, est_completion)
-                                fb_saved_id = continue_msg_id
-                            else:
-                                saved_msg = await service.save_message(
-                                    db, chat_id, "assistant", fb_text, model_used=actual_model,
-                                    prompt_tokens=est_prompt, completion_tokens=est_completion,
-                                )
-                                fb_saved_id = saved_msg.id
-                            if fb_approval_delta:
-                                await _update_companion_approval(db, chat_id, fb_approval_delta)
-                            await service.increment_message_count(character.id, language, user_id_for_increment)
-                            _asyncio.create_task(maybe_summarize(chat_id))
-                            done_data = {'type': 'done', 'message_id': fb_saved_id, 'user_message_id': user_msg.id, 'model_used': actual_model, 'truncated': fb_truncated}
-                            if companion_approval_enabled and fb_approval_delta:
-                                done_data['companion_approval_delta'] = fb_approval_delta
-                            if settings.is_fiction_mode:
-                                fb_choices = _parse_choices(fb_text)
-                                if fb_choices:
-                                    done_data['choices'] = fb_choices
-                            if fb_suggestions:
-                                done_data['suggestions'] = fb_suggestions
-                            if is_dnd:
-                                fb_dice = _parse_dice_rolls(fb_text)
-                                if fb_dice:
-                                    done_data['dice_rolls'] = fb_dice
-                                    await _save_dice_on_message(db, fb_saved_id, fb_dice)
-                                fb_enc = _parse_encounter_state(fb_text)
-                                if fb_enc:
-                                    await _update_encounter_state(db, chat_id, fb_enc)
-                                    done_data['encounter_state'] = fb_enc
-                            if anon_session_id and anon_remaining is not None:
-                                done_data['anon_messages_left'] = anon_remaining - 1
-                            if user_id_for_increment and not anon_session_id:
-                                try:
-                                    from app.achievements.checker import check_achievements as _ach_check
-                                    _new_ach = await _ach_check(db, user_id_for_increment, trigger="message")
-                                    if _new_ach:
-                                        done_data['new_achievements'] = _new_ach
-                                except Exception:
-                                    pass
-                                try:
-                                    from app.users.xp import award_xp as _award_xp
-                                    done_data['xp'] = await _award_xp(user_id_for_increment, 10)
-                                except Exception:
-                                    pass
-                            yield f"data: {json.dumps(done_data)}\n\n"
-                            return
-                        except Exception:
-                            continue
-                    # All fallbacks failed or refused too
-                    yield f"data: {json.dumps({'type': 'error', 'content': 'Модель отказала в генерации. Попробуйте другую модель.', 'user_message_id': user_msg.id})}\n\n"
-                    return
-
-                if not buffer_flushed:
-                    for b in buffered:
-                        yield f"data: {json.dumps({'type': 'token', 'content': b})}\n\n"
-
-                # Parse companion approval tags before saving (fiction/DnD only)
-                approval_delta = 0
-                if companion_approval_enabled:
-                    complete_text, approval_delta = _parse_and_strip_approval(complete_text)
-                # Parse suggested replies
-                complete_text, suggestions = _parse_and_strip_suggestions(complete_text)
-
-                actual_model = f"{provider_name}:{getattr(provider, 'last_model_used', model_id) or model_id}"
-                est_prompt = _estimate_prompt_tokens(messages)
-                est_completion = len(complete_text) // 4
-                truncated = est_completion >= capped_max_tokens * 0.85
-                if continue_msg_id:
-                    await _append_to_message(db, continue_msg_id, complete_text, actual_model, est_prompt, est_completion)
-                    saved_msg_id = continue_msg_id
-                else:
-                    saved_msg = await service.save_message(
-                        db, chat_id, "assistant", complete_text, model_used=actual_model,
-                        prompt_tokens=est_prompt, completion_tokens=est_completion,
-                    )
-                    saved_msg_id = saved_msg.id
-                # Update companion approval if changed
-                if approval_delta:
-                    await _update_companion_approval(db, chat_id, approval_delta)
-                await service.increment_message_count(character.id, language, user_id_for_increment)
-                _asyncio.create_task(maybe_summarize(chat_id))
-                done_data = {'type': 'done', 'message_id': saved_msg_id, 'user_message_id': user_msg.id, 'model_used': actual_model, 'truncated': truncated}
-                if companion_approval_enabled and approval_delta:
-                    done_data['companion_approval_delta'] = approval_delta
-                if settings.is_fiction_mode:
-                    choices = _parse_choices(complete_text)
-                    if choices:
-                        done_data['choices'] = choices
-                if suggestions:
-                    done_data['suggestions'] = suggestions
-                if is_dnd:
-                    dice_rolls = _parse_dice_rolls(complete_text)
-                    if dice_rolls:
-                        done_data['dice_rolls'] = dice_rolls
-                        await _save_dice_on_message(db, saved_msg_id, dice_rolls)
-                    enc_state = _parse_encounter_state(complete_text)
-                    if enc_state:
-                        await _update_encounter_state(db, chat_id, enc_state)
-                        done_data['encounter_state'] = enc_state
-                if anon_session_id and anon_remaining is not None:
-                    done_data['anon_messages_left'] = anon_remaining - 1
-                if user_id_for_increment and not anon_session_id:
+                async for frame in _probed_stream(provider_name, provider, prov_msgs, config, is_rejected, raw):
+                    yield frame
+            except ContentRejected:
+                # Try auto-fallback on refusal (use paid order if paid mode)
+                paid = await _is_paid_mode(db)
+                fb_str = settings.auto_provider_order_paid if paid else settings.auto_provider_order
+                fallback_order = [p.strip() for p in fb_str.split(",") if p.strip() and p.strip() != provider_name]
+                for fb_name in fallback_order:
                     try:
-                        from app.achievements.checker import check_achievements as _ach_check
-                        _new_ach = await _ach_check(db, user_id_for_increment, trigger="message")
-                        if _new_ach:
-                            done_data['new_achievements'] = _new_ach
-                    except Exception:
-                        pass
+                        fb_prov = get_provider(fb_name)
+                    except ValueError:
+                        continue
+                    fb_config = LLMConfig(model=_model_resolver.get_model(fb_name), **base_config)
+                    fb_msgs = provider_messages(fb_name, fb_config)
+                    fb_raw: list[str] = []
                     try:
-                        from app.users.xp import award_xp as _award_xp
-                        done_data['xp'] = await _award_xp(user_id_for_increment, 10)
+                        async for frame in _probed_stream(fb_name, fb_prov, fb_msgs, fb_config, is_rejected, fb_raw):
+                            yield frame
                     except Exception:
-                        pass
-                yield f"data: {json.dumps(done_data)}\n\n"
+                        continue
+                    actual_model = f"{fb_name}:{getattr(fb_prov, 'last_model_used', '') or ''}"
+                    async for frame in finish("".join(fb_raw), actual_model, fb_msgs, fb_config):
+                        yield frame
+                    return
+                # All fallbacks failed or refused too
+                yield sse({'type': 'error', 'content': 'Модель отказала в генерации. Попробуйте другую модель.', 'user_message_id': user_msg.id})
+                return
             except Exception as e:
                 # Auto-fix model 404: resolve new model and retry once
                 if _model_resolver.is_404_error(e) and provider_name in _model_resolver.FIXABLE_PROVIDERS:
                     new_model = await _model_resolver.resolve_model_404(provider_name, config.model)
                     if new_model:
+                        retry_config = LLMConfig(model=new_model, **base_config)
+                        r_raw: list[str] = []
                         try:
-                            retry_config = LLMConfig(model=new_model, **base_config)
-                            r_response: list[str] = []
-                            r_buffered: list[str] = []
-                            r_buf_flushed = False
-                            r_refusal = False
-                            async for chunk in provider.generate_stream(messages, retry_config):
-                                r_response.append(chunk)
-                                if not r_buf_flushed:
-                                    r_buffered.append(chunk)
-                                    if len("".join(r_buffered)) >= 200:
-                                        r_buf_text = "".join(r_buffered)
-                                        if _is_refusal_response(r_buf_text) or _has_mixed_langs(r_buf_text, language):
-                                            r_refusal = True
-                                            break
-                                        for b in r_buffered:
-                                            yield f"data: {json.dumps({'type': 'token', 'content': b})}\n\n"
-                                        r_buf_flushed = True
-                                else:
-                                    yield f"data: {json.dumps({'type': 'token', 'content': chunk})}\n\n"
-                            r_text = "".join(r_response)
-                            if not r_buf_flushed and not r_refusal:
-                                if _is_refusal_response(r_text) or _has_mixed_langs(r_text, language):
-                                    r_refusal = True
-                            if r_refusal:
-                                raise RuntimeError("Retry model also refused")
-                            if not r_buf_flushed:
-                                for b in r_buffered:
-                                    yield f"data: {json.dumps({'type': 'token', 'content': b})}\n\n"
-                            # Parse companion approval tags (fiction/DnD only)
-                            r_approval_delta = 0
-                            if companion_approval_enabled:
-                                r_text, r_approval_delta = _parse_and_strip_approval(r_text)
-                            r_text, r_suggestions = _parse_and_strip_suggestions(r_text)
-                            r_model = f"{provider_name}:{new_model}"
-                            est_p = _estimate_prompt_tokens(messages)
-                            est_c = len(r_text) // 4
-                            r_truncated = est_c >= capped_max_tokens * 0.85
-                            if continue_msg_id:
-                                await _append_to_message(db, continue_msg_id, r_text, r_model, est_p, est_c)
-                                r_msg_id = continue_msg_id
-                            else:
-                                r_msg = await service.save_message(db, chat_id, "assistant", r_text, model_used=r_model, prompt_tokens=est_p, completion_tokens=est_c)
-                                r_msg_id = r_msg.id
-                            if r_approval_delta:
-                                await _update_companion_approval(db, chat_id, r_approval_delta)
-                            await service.increment_message_count(character.id, language, user_id_for_increment)
-                            _asyncio.create_task(maybe_summarize(chat_id))
-                            r_done = {'type': 'done', 'message_id': r_msg_id, 'user_message_id': user_msg.id, 'model_used': r_model, 'truncated': r_truncated}
-                            if companion_approval_enabled and r_approval_delta:
-                                r_done['companion_approval_delta'] = r_approval_delta
-                            if settings.is_fiction_mode:
-                                r_choices = _parse_choices(r_text)
-                                if r_choices:
-                                    r_done['choices'] = r_choices
-                            if r_suggestions:
-                                r_done['suggestions'] = r_suggestions
-                            if is_dnd:
-                                r_dice = _parse_dice_rolls(r_text)
-                                if r_dice:
-                                    r_done['dice_rolls'] = r_dice
-                                    await _save_dice_on_message(db, r_msg_id, r_dice)
-                                r_enc = _parse_encounter_state(r_text)
-                                if r_enc:
-                                    await _update_encounter_state(db, chat_id, r_enc)
-                                    r_done['encounter_state'] = r_enc
-                            if anon_session_id and anon_remaining is not None:
-                                r_done['anon_messages_left'] = anon_remaining - 1
-                            if user_id_for_increment and not anon_session_id:
-                                try:
-                                    from app.achievements.checker import check_achievements as _ach_check
-                                    _new_ach = await _ach_check(db, user_id_for_increment, trigger="message")
-                                    if _new_ach:
-                                        r_done['new_achievements'] = _new_ach
-                                except Exception:
-                                    pass
-                                try:
-                                    from app.users.xp import award_xp as _award_xp
-                                    r_done['xp'] = await _award_xp(user_id_for_increment, 10)
-                                except Exception:
-                                    pass
-                            yield f"data: {json.dumps(r_done)}\n\n"
-                            return
+                            async for frame in _probed_stream(provider_name, provider, prov_msgs, retry_config, is_rejected, r_raw):
+                                yield frame
                         except Exception:
-                            pass  # fall through to error below
+                            pass  # retry failed or refused too — fall through to error below
+                        else:
+                            async for frame in finish("".join(r_raw), f"{provider_name}:{new_model}", prov_msgs, retry_config):
+                                yield frame
+                            return
                 _model_cooldown.handle_402_if_applicable(provider_name, e)
-                yield f"data: {json.dumps({'type': 'error', 'content': _user_error(str(e), is_admin), 'user_message_id': user_msg.id})}\n\n"
+                yield sse({'type': 'error', 'content': _user_error(str(e), is_admin), 'user_message_id': user_msg.id})
+                return
+            actual_model = f"{provider_name}:{getattr(provider, 'last_model_used', model_id) or model_id}"
+            async for frame in finish("".join(raw), actual_model, prov_msgs, config):
+                yield frame
 
     return StreamingResponse(event_stream(), media_type="text/event-stream")
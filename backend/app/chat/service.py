@@ -1,14 +1,26 @@
+import time
+from dataclasses import dataclass
 from datetime import datetime
-from sqlalchemy import select, text
+from sqlalchemy import select, text, func, or_, and_
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
-from app.db.models import Chat, Message, Character, User, Persona, MessageRole, LoreEntry
+from sqlalchemy.orm import selectinload, joinedload
+from app.db.models import Chat, Message, Character, User, Persona, MessageRole
 from app.chat.prompt_builder import build_system_prompt
+from app.chat import counters, usage
+from app.achievements import checker as achievements
 from app.db.session import engine as db_engine
 from app.llm.base import LLMMessage
+from app.llm.tokenizer import count_tokens, count_message_tokens
+from app.config import settings
 
 MAX_CONTEXT_MESSAGES = 50
-DEFAULT_CONTEXT_TOKENS = 24000  # ~6k real tokens; Russian text needs ~4 chars/token
+DEFAULT_CONTEXT_TOKENS = 6000  # history budget in real tokens (see app.llm.tokenizer); the old 24000-char budget; also capped per model
+_TAIL_BATCH_SIZE = 20  # rows per round trip when loading the context window
+
+# Per-chat message count cache: chat_id -> (count, monotonic ts)
+_msg_count_cache: dict[str, tuple[int, float]] = {}
+_MSG_COUNT_TTL = 300  # seconds
+_MSG_COUNT_MAX_ENTRIES = 10000
 
 # Post-history reminder — injected AFTER chat history, closest to generation point.
 # Short (~50 tokens) reinforcement of key rules. Most effective position per SillyTavern research.
@@ -938,20 +950,16 @@ async def get_or_create_chat(
         chat_id=chat.id,
         role=MessageRole.assistant,
         content=greeting_text,
-        token_count=len(greeting_text) // 4,
+        token_count=count_tokens(greeting_text),
     )
     db.add(greeting)
 
-    character.chat_count = (character.chat_count or 0) + 1
-
-    # Increment user chat count (skip for anonymous)
     if not anon_session_id:
-        user_result = await db.execute(select(User).where(User.id == user_id))
-        user_obj = user_result.scalar_one_or_none()
-        if user_obj:
-            user_obj.chat_count = (user_obj.chat_count or 0) + 1
+        await achievements.record(db, user_id, "chats")
 
     await db.commit()
+    # chat_count for the character and user (skip for anonymous): write-behind, see chat/counters.py
+    counters.add_chat(character_id, None if anon_session_id else user_id)
 
     # Re-fetch with relationships loaded
     result = await db.execute(
@@ -982,6 +990,105 @@ async def get_chat(db: AsyncSession, chat_id: str, user_id: str | None = None, a
     return result.scalar_one_or_none()
 
 
+@dataclass
+class ChatContext:
+    """Everything one chat turn needs, loaded by load_chat_context()."""
+    chat: Chat
+    character: Character
+    user_display_name: str | None
+    user_language: str | None
+    lore_entries: list[dict]
+    window: list[Message]  # sliding window for the prompt, oldest first
+    recent: list[Message]  # newest batch regardless of budget, oldest first
+    message_count: int
+    max_tokens: int
+    max_messages: int
+
+    @property
+    def last_message(self) -> Message | None:
+        return self.recent[-1] if self.recent else None
+
+    def add_message(self, msg: Message):
+        """Append a message saved after the snapshot was taken, keeping the window in budget."""
+        self.recent.append(msg)
+        self.window.append(msg)
+        self.message_count += 1
+        total = sum(m.token_count or count_tokens(m.content) for m in self.window)
+        while self.window and (total > self.max_tokens or len(self.window) > self.max_messages):
+            dropped = self.window.pop(0)
+            total -= dropped.token_count or count_tokens(dropped.content)
+
+
+async def load_chat_context(
+    db: AsyncSession,
+    chat_id: str,
+    user_id: str | None = None,
+    anon_session_id: str | None = None,
+    max_tokens: int = DEFAULT_CONTEXT_TOKENS,
+    max_messages: int = MAX_CONTEXT_MESSAGES,
+    with_lore: bool = True,
+) -> ChatContext | None:
+    """Snapshot of a chat for one turn in two round trips.
+
+    1. chat + character + persona + enabled lore + owner name/language
+       (+ message count when not cached) in one joined SELECT
+    2. the message tail window (usually a single batch)
+
+    Ownership is enforced like get_chat() when user_id / anon_session_id is
+    given; internal callers may pass neither. Returns None if not found.
+    """
+    char_load = joinedload(Chat.character)
+    if with_lore:
+        char_load = char_load.joinedload(Character.enabled_lore_entries)
+    cols = [Chat, User.display_name, User.language]
+    cached = _msg_count_cache.get(chat_id)
+    count_cached = bool(cached and time.monotonic() - cached[1] < _MSG_COUNT_TTL)
+    if not count_cached:
+        cols.append(
+            select(func.count()).select_from(Message)
+            .where(Message.chat_id == Chat.id)
+            .scalar_subquery()
+        )
+    q = (
+        select(*cols)
+        .outerjoin(User, User.id == Chat.user_id)
+        .options(char_load, joinedload(Chat.persona))
+        .where(Chat.id == chat_id)
+    )
+    if anon_session_id:
+        q = q.where(Chat.anon_session_id == anon_session_id)
+    elif user_id:
+        q = q.where(Chat.user_id == user_id)
+    row = (await db.execute(q)).unique().one_or_none()
+    if not row or not row[0].character:
+        return None
+    chat = row[0]
+    if count_cached:
+        message_count = cached[0]
+    else:
+        message_count = row[3] or 0
+        _store_message_count(chat_id, message_count)
+
+    lore_entries = [
+        {"id": e.id, "keywords": e.keywords, "content": e.content, "enabled": e.enabled, "position": e.position}
+        for e in chat.character.enabled_lore_entries
+    ] if with_lore else []
+
+    window, recent = await get_context_tail(db, chat_id, max_tokens, max_messages)
+    return ChatContext(
+        chat=chat,
+        character=chat.character,
+        user_display_name=row[1],
+        user_language=row[2],
+        lore_entries=lore_entries,
+        window=window,
+        recent=recent,
+        message_count=message_count,
+        max_tokens=max_tokens,
+        max_messages=max_messages,
+    )
+
+
 async def get_chat_messages(db: AsyncSession, chat_id: str, limit: int = 0, before_id: str | None = None):
     """Get messages for a chat. If limit > 0, return paginated (last N messages).
 
@@ -1005,12 +1112,89 @@ async def get_chat_messages(db: AsyncSession, chat_id: str, limit: int = 0, befo
         msgs.reverse()
         return msgs, has_more
 
-    # No limit — return all (used by build_conversation_messages)
+    # No limit — return all
     q = q.order_by(Message.created_at.asc())
     result = await db.execute(q)
     return result.scalars().all(), False
 
 
+async def get_context_tail(
+    db: AsyncSession, chat_id: str, max_tokens: int, max_messages: int,
+) -> tuple[list[Message], list[Message]]:
+    """Load only the newest messages that fit into the context budget.
+
+    Walks backwards in batches of _TAIL_BATCH_SIZE (keyset on created_at, id)
+    and stops once either the token or the message budget is filled, so the
+    cost is bounded by the window size, not by chat length.
+
+    Returns (window, recent), both oldest-first. `window` is the sliding
+    window for the prompt; `recent` is the newest fetched batch regardless
+    of budget (for lore matching and last user/assistant lookups).
+    """
+    window: list[Message] = []
+    recent: list[Message] = []
+    total_tokens = 0
+    cursor: tuple[datetime, str] | None = None
+    while True:
+        q = select(Message).where(Message.chat_id == chat_id)
+        if cursor:
+            q = q.where(or_(
+                Message.created_at < cursor[0],
+                and_(Message.created_at == cursor[0], Message.id < cursor[1]),
+            ))
+        q = q.order_by(Message.created_at.desc(), Message.id.desc()).limit(_TAIL_BATCH_SIZE)
+        batch = list((await db.execute(q)).scalars().all())
+        if not recent:
+            recent = batch[::-1]
+        for msg in batch:
+            est_tokens = msg.token_count or count_tokens(msg.content)
+            if total_tokens + est_tokens > max_tokens or len(window) >= max_messages:
+                window.reverse()
+                return window, recent
+            window.append(msg)
+            total_tokens += est_tokens
+        if len(batch) < _TAIL_BATCH_SIZE:
+            break
+        cursor = (batch[-1].created_at, batch[-1].id)
+    window.reverse()
+    return window, recent
+
+
+async def get_message_count(db: AsyncSession, chat_id: str) -> int:
+    """Number of messages in a chat, cached per chat (kept current by save/delete)."""
+    now = time.monotonic()
+    cached = _msg_count_cache.get(chat_id)
+    if cached and now - cached[1] < _MSG_COUNT_TTL:
+        return cached[0]
+    result = await db.execute(
+        select(func.count()).select_from(Message).where(Message.chat_id == chat_id)
+    )
+    count = result.scalar() or 0
+    _store_message_count(chat_id, count)
+    return count
+
+
+def _store_message_count(chat_id: str, count: int):
+    now = time.monotonic()
+    if len(_msg_count_cache) >= _MSG_COUNT_MAX_ENTRIES:
+        expired = [k for k, v in _msg_count_cache.items() if now - v[1] >= _MSG_COUNT_TTL]
+        for k in expired:
+            _msg_count_cache.pop(k, None)
+        if len(_msg_count_cache) >= _MSG_COUNT_MAX_ENTRIES:
+            _msg_count_cache.clear()
+    _msg_count_cache[chat_id] = (count, now)
+
+
+def _bump_message_count(chat_id: str, delta: int = 1):
+    cached = _msg_count_cache.get(chat_id)
+    if cached:
+        _msg_count_cache[chat_id] = (max(cached[0] + delta, 0), cached[1])
+
+
+def invalidate_message_count(chat_id: str):
+    _msg_count_cache.pop(chat_id, None)
+
+
 async def list_user_chats(db: AsyncSession, user_id: str):
     result = await db.execute(
         select(Chat)
@@ -1043,7 +1227,7 @@ async def save_message(
         chat_id=chat_id,
         role=MessageRole(role),
         content=content,
-        token_count=len(content) // 4,
+        token_count=count_tokens(content),
         model_used=model_used,
         prompt_tokens=prompt_tokens,
         completion_tokens=completion_tokens,
@@ -1056,11 +1240,77 @@ async def save_message(
     if chat:
         chat.updated_at = datetime.utcnow()
 
+    # Daily / anonymous limit counter and achievement progress, committed together with the message
+    bumped = None
+    if chat and role == "user":
+        bumped = await usage.bump(db, chat.user_id, chat.anon_session_id)
+        if not chat.anon_session_id:
+            await achievements.record(db, chat.user_id, "messages")
+
     await db.commit()
     await db.refresh(msg)
+    _bump_message_count(chat_id)
+    if bumped:
+        usage.remember(bumped)
     return msg
 
 
+async def save_assistant_turn(
+    db: AsyncSession, chat_id: str, content: str,
+    model_used: str | None = None,
+    prompt_tokens: int | None = None,
+    completion_tokens: int | None = None,
+    append_to: str | None = None,
+    approval_delta: int = 0,
+    dice_rolls: list | None = None,
+    encounter_state: dict | None = None,
+    user_id: str | None = None,
+) -> str:
+    """Persist an assistant reply and the chat state derived from it in one transaction.
+
+    append_to: existing assistant message ID to extend (continue) instead of
+    inserting a new message. Returns the message ID.
+    """
+    if append_to:
+        result = await db.execute(select(Message).where(Message.id == append_to))
+        msg = result.scalar_one_or_none()
+        if msg:
+            msg.content = (msg.content or "") + content
+            msg.token_count = count_tokens(msg.content)
+            msg.model_used = model_used
+            msg.prompt_tokens = (msg.prompt_tokens or 0) + (prompt_tokens or 0)
+            msg.completion_tokens = (msg.completion_tokens or 0) + (completion_tokens or 0)
+    else:
+        msg = Message(
+            chat_id=chat_id,
+            role=MessageRole.assistant,
+            content=content,
+            token_count=count_tokens(content),
+            model_used=model_used,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+        )
+        db.add(msg)
+    if msg and dice_rolls:
+        if user_id and msg.dice_rolls is None:
+            await achievements.record(db, user_id, "dice_rolls")
+        msg.dice_rolls = dice_rolls
+
+    result = await db.execute(select(Chat).where(Chat.id == chat_id))
+    chat = result.scalar_one_or_none()
+    if chat:
+        chat.updated_at = datetime.utcnow()
+        if approval_delta:
+            chat.companion_approval = max(-3, min(3, (chat.companion_approval or 0) + approval_delta))
+        if encounter_state:
+            chat.encounter_state = {**(chat.encounter_state or {}), **encounter_state}
+
+    await db.commit()
+    if not append_to:
+        _bump_message_count(chat_id)
+    return msg.id if msg else append_to
+
+
 async def clear_chat_messages(db: AsyncSession, chat_id: str, user_id: str):
     """Delete all messages except the first one (greeting)."""
     result = await db.execute(
@@ -1085,6 +1335,7 @@ async def clear_chat_messages(db: AsyncSession, chat_id: str, user_id: str):
 
     chat.updated_at = datetime.utcnow()
     await db.commit()
+    invalidate_message_count(chat_id)
     return True
 
 
@@ -1124,28 +1375,31 @@ async def delete_message(db: AsyncSession, chat_id: str, message_id: str, user_i
         {"chat_id": chat_id, "ts": msg.created_at},
     )
     await db.commit()
+    invalidate_message_count(chat_id)
     return del_result.rowcount
 
 
-async def increment_message_count(character_id: str, language: str, user_id: str | None = None):
-    """Atomically increment message_counts->{language} for a character and user message_count."""
-    lang = language[:10]  # safety limit
-    async with db_engine.begin() as conn:
-        await conn.execute(
-            text("""
-                UPDATE characters SET message_counts = jsonb_set(
-                    COALESCE(message_counts, '{}'),
-                    ARRAY[:lang],
-                    to_jsonb(COALESCE((message_counts->>:lang)::int, 0) + 1)
-                ) WHERE id = :cid
-            """),
-            {"lang": lang, "cid": character_id},
-        )
-        if user_id:
-            await conn.execute(
-                text("UPDATE users SET message_count = COALESCE(message_count, 0) + 1 WHERE id = :uid"),
-                {"uid": user_id},
-            )
+def fit_to_context(
+    messages: list[LLMMessage],
+    context_length: int,
+    reserve_tokens: int,
+    model: str | None = None,
+) -> list[LLMMessage]:
+    """Drop the oldest history turns until the prompt plus reserve_tokens of
+    output fits the model's context window. System messages and the newest
+    turn are always kept."""
+    budget = context_length - reserve_tokens
+    total = count_message_tokens(messages, model)
+    if total <= budget:
+        return messages
+    history = [i for i, m in enumerate(messages) if m.role != "system"][:-1]
+    dropped: set[int] = set()
+    for i in history:
+        if total <= budget:
+            break
+        dropped.add(i)
+        total -= count_tokens(messages[i].content, model) + 4
+    return [m for i, m in enumerate(messages) if i not in dropped]
 
 
 async def build_conversation_messages(
@@ -1158,8 +1412,16 @@ async def build_conversation_messages(
     context_limit: int | None = None,
     max_context_messages: int | None = None,
     site_mode: str = "nsfw",
+    ctx: ChatContext | None = None,
 ) -> list[LLMMessage]:
+    """Assemble the full LLM message list for the next turn.
+
+    Pass a ChatContext from load_chat_context() to reuse the caller's
+    snapshot; otherwise one is loaded here (no ownership check).
+    """
     char_dict = {
+        "id": character.id,
+        "updated_at": character.updated_at,  # with id: compiled prompt cache key
         "name": character.name,
         "personality": character.personality,
         "scenario": character.scenario,
@@ -1182,58 +1444,50 @@ async def build_conversation_messages(
         "structured_tags": [t for t in (getattr(character, 'structured_tags', '') or '').split(",") if t],
         "tags": getattr(character, 'tags', '') or '',
     }
-    messages_data, _ = await get_chat_messages(db, chat_id)  # all messages, no limit
+    if ctx is None:
+        ctx = await load_chat_context(
+            db, chat_id,
+            max_tokens=context_limit or DEFAULT_CONTEXT_TOKENS,
+            max_messages=max_context_messages or MAX_CONTEXT_MESSAGES,
+        )
+        if ctx is None:
+            raise ValueError(f"Chat {chat_id} not found")
+
+    # Bounded tail window — cost stays flat no matter how long the chat is
+    window, recent_msgs = ctx.window, ctx.recent
+    msg_count = ctx.message_count
 
     # Check if this chat is part of a campaign (DnD mode)
-    chat_result_obj = await db.execute(select(Chat).where(Chat.id == chat_id))
-    chat_obj = chat_result_obj.scalar_one_or_none()
-    campaign_id = getattr(chat_obj, 'campaign_id', None) if chat_obj else None
-    encounter_state = getattr(chat_obj, 'encounter_state', None) if chat_obj else None
-
-    # Load lore entries for this character
-    lore_result = await db.execute(
-        select(LoreEntry)
-        .where(LoreEntry.character_id == character.id, LoreEntry.enabled == True)  # noqa: E712
-        .order_by(LoreEntry.position)
-    )
-    lore_entries = [
-        {"keywords": e.keywords, "content": e.content, "enabled": e.enabled}
-        for e in lore_result.scalars().all()
-    ]
+    chat_obj = ctx.chat
+    campaign_id = getattr(chat_obj, 'campaign_id', None)
+    encounter_state = getattr(chat_obj, 'encounter_state', None)
+    lore_entries = ctx.lore_entries
 
     # Build context text from recent messages for lore keyword matching
-    recent_texts = [m.content for m in messages_data[-10:]]  # last 10 messages
+    recent_texts = [m.content for m in recent_msgs[-10:]]  # last 10 messages
     context_text = " ".join(recent_texts)
 
+    # Cache-aware layout: keep per-turn lore/encounter out of the system prompt so
+    # the character prefix stays byte-identical across turns (provider prompt caching)
+    volatile: list[str] | None = [] if settings.cache_aware_prompts else None
     system_prompt = await build_system_prompt(
         char_dict, user_name=user_name, user_description=user_description,
         language=language, engine=db_engine,
         lore_entries=lore_entries, context_text=context_text,
         site_mode=site_mode,
         campaign_id=campaign_id, encounter_state=encounter_state,
+        volatile=volatile,
     )
 
-    # context_limit is in "real" tokens; multiply by ~4 for char-based estimation
-    max_tokens = (context_limit * 4) if context_limit else DEFAULT_CONTEXT_TOKENS
-
-    # Sliding window
-    messages: list[LLMMessage] = []
-    total_tokens = 0
-    for msg in reversed(messages_data):
-        est_tokens = msg.token_count or len(msg.content) // 4
-        if total_tokens + est_tokens > max_tokens:
-            break
-        messages.insert(0, LLMMessage(role=msg.role.value if hasattr(msg.role, 'value') else msg.role, content=msg.content))
-        total_tokens += est_tokens
-
-    effective_max = max_context_messages or MAX_CONTEXT_MESSAGES
-    messages = messages[-effective_max:]
+    messages: list[LLMMessage] = [
+        LLMMessage(role=msg.role.value if hasattr(msg.role, 'value') else msg.role, content=msg.content)
+        for msg in window
+    ]
 
-    result_list = [LLMMessage(role="system", content=system_prompt)]
+    result_list = [LLMMessage(role="system", content=system_prompt, cache=True)]
 
     # Inject chat summary if available (memory of older messages)
-    chat_result = await db.execute(select(Chat.summary).where(Chat.id == chat_id))
-    summary = chat_result.scalar_one_or_none()
+    summary = chat_obj.summary
     if summary:
         summary_labels = {
             "ru": "[Краткое содержание предыдущего разговора]",
@@ -1245,17 +1499,17 @@ async def build_conversation_messages(
             "it": "[Riassunto della conversazione precedente]",
         }
         label = summary_labels.get(language, summary_labels["en"])
-        result_list.append(LLMMessage(role="system", content=f"{label}\n{summary}"))
+        # Changes only when the summarizer runs — second cache breakpoint
+        result_list.append(LLMMessage(role="system", content=f"{label}\n{summary}", cache=True))
 
     # Post-history reminder (closest to generation = strongest reinforcement)
     # Campaign chats use DnD post-history regardless of site_mode
     tags_str = char_dict.get("tags", "")
     is_dnd = bool(campaign_id) or "dnd" in [t.strip() for t in tags_str.split(",")]
-    msg_count = len(messages_data)
 
     # Extract last assistant message text for anti-echo injection
     last_assistant_text = ""
-    for msg in reversed(messages_data):
+    for msg in reversed(recent_msgs):
         role_val = msg.role.value if hasattr(msg.role, 'value') else msg.role
         if role_val == "assistant":
             last_assistant_text = msg.content or ""
@@ -1263,7 +1517,7 @@ async def build_conversation_messages(
 
     # Extract last user message text for short-input detection
     last_user_text = ""
-    for msg in reversed(messages_data):
+    for msg in reversed(recent_msgs):
         role_val = msg.role.value if hasattr(msg.role, 'value') else msg.role
         if role_val == "user":
             last_user_text = msg.content or ""
@@ -1350,7 +1604,7 @@ async def build_conversation_messages(
                 comp_parts.append(_MEMORY_TPL.get(language, _MEMORY_TPL["en"]).format(comp=comp_name))
 
             # 4. Approval tracking for companion attitude shifts
-            comp_approval = getattr(chat_obj, 'companion_approval', 0) if chat_obj else 0
+            comp_approval = getattr(chat_obj, 'companion_approval', 0) or 0
             _APPROVAL_TRACK = {
                 "ru": (
                     "ОТСЛЕЖИВАНИЕ ОТНОШЕНИЯ: Если действие игрока изменило бы отношение {comp}, добавь в КОНЦЕ ответа (после всего текста) ОДИН тег:\n"
@@ -1397,9 +1651,9 @@ async def build_conversation_messages(
     all_messages = result_list + messages
 
     # Inject previous dice results for DnD chats (before post-history)
-    if is_dnd and messages_data:
+    if is_dnd and recent_msgs:
         # Find the last assistant message — only inject if it has dice_rolls
-        for msg in reversed(messages_data):
+        for msg in reversed(recent_msgs):
             if (hasattr(msg.role, 'value') and msg.role.value or msg.role) == "assistant":
                 if getattr(msg, 'dice_rolls', None):
                     all_messages.append(LLMMessage(
@@ -1411,5 +1665,7 @@ async def build_conversation_messages(
     # Companion gets its own system message (separate attention slot)
     if comp_system_msg:
         all_messages.append(comp_system_msg)
+    if volatile:
+        all_messages.append(LLMMessage(role="system", content="\n".join(volatile)))
     all_messages.append(LLMMessage(role="system", content=reminder))
     return all_messages
@@ -0,0 +1,272 @@
+"""SSE streaming engine for chat responses.
+
+One code path for every provider stream in send_message (auto mode,
+explicit provider, refusal fallback, 404 retry):
+
+- The first GATE_CHARS characters are held back and checked once for a
+  refusal / language bleed. A rejected stream raises ContentRejected before
+  anything reached the client, so the caller can try another provider.
+- After the gate, tokens are coalesced into SSE frames: a frame goes out
+  once FLUSH_CHARS characters are pending or FLUSH_INTERVAL seconds have
+  passed since the last one, even if the provider goes quiet (a pump task
+  reads the stream so a timed-out wait doesn't cancel it). Providers emit
+  1-4 character chunks, so this cuts json.dumps calls and socket writes by
+  an order of magnitude under many concurrent streams.
+- race_gated() is the hedged variant for auto mode: the next provider
+  starts in parallel when the current one is slow to its first token, and
+  the first stream to pass the gate wins (the others are cancelled).
+"""
+
+import asyncio
+import json
+import time
+from typing import AsyncIterator, Callable
+
+GATE_CHARS = 200  # held back for the refusal / language check
+FLUSH_CHARS = 48
+FLUSH_INTERVAL = 0.05  # seconds
+
+
+class ContentRejected(Exception):
+    """Stream failed the refusal / language gate (nothing was sent)."""
+
+
+def sse(data: dict) -> str:
+    return f"data: {json.dumps(data)}\n\n"
+
+
+def _token_frame(parts: list[str]) -> str:
+    return sse({"type": "token", "content": "".join(parts)})
+
+
+async def open_gated(
+    chunks: AsyncIterator[str],
+    is_rejected: Callable[[str], bool],
+    on_first: Callable[[], None] | None = None,
+) -> list[str]:
+    """Read the first GATE_CHARS characters of a stream and check them.
+
+    Returns the held-back chunks (the stream can be read on from there) or
+    raises ContentRejected. on_first is called when the first chunk arrives.
+    """
+    head: list[str] = []
+    head_len = 0
+    async for chunk in chunks:
+        if not chunk:
+            continue
+        if not head and on_first:
+            on_first()
+        head.append(chunk)
+        head_len += len(chunk)
+        if head_len >= GATE_CHARS:
+            break
+    # Short responses end before reaching the gate — the whole text is checked
+    if is_rejected("".join(head)):
+        raise ContentRejected()
+    return head
+
+
+async def _pump(chunks: AsyncIterator[str], queue: asyncio.Queue) -> None:
+    """Read a stream in its own task: chunks, then None at the end (or the exception)."""
+    try:
+        async for chunk in chunks:
+            queue.put_nowait(chunk)
+        queue.put_nowait(None)
+    except Exception as e:
+        queue.put_nowait(e)
+
+
+async def stream_frames(
+    chunks: AsyncIterator[str],
+    head: list[str],
+    collected: list[str],
+) -> AsyncIterator[str]:
+    """Yield coalesced SSE token frames: the gated head, then the rest of the stream.
+
+    The stream is read by a _pump task, so waiting for the next chunk can
+    time out without cancelling the provider: text pending for
+    FLUSH_INTERVAL goes out even while the provider is quiet.
+    """
+    collected.extend(head)
+    pending = list(head)
+    pending_len = sum(len(c) for c in head)
+    queue: asyncio.Queue = asyncio.Queue()
+    pump = asyncio.create_task(_pump(chunks, queue))
+    last_flush = time.monotonic()
+    try:
+        while True:
+            if pending_len >= FLUSH_CHARS or (pending and time.monotonic() - last_flush >= FLUSH_INTERVAL):
+                yield _token_frame(pending)
+                pending = []
+                pending_len = 0
+                last_flush = time.monotonic()
+            if pending:
+                try:
+                    item = await asyncio.wait_for(queue.get(), FLUSH_INTERVAL - (time.monotonic() - last_flush))
+                except asyncio.TimeoutError:
+                    continue  # flushed at the top of the loop
+            else:
+                item = await queue.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            if item:
+                collected.append(item)
+                pending.append(item)
+                pending_len += len(item)
+        if pending:
+            yield _token_frame(pending)
+    finally:
+        pump.cancel()  # no-op once finished; stops the provider if the client went away
+        await asyncio.gather(pump, return_exceptions=True)
+
+
+async def stream_gated(
+    chunks: AsyncIterator[str],
+    is_rejected: Callable[[str], bool],
+    collected: list[str],
+    on_first: Callable[[], None] | None = None,
+) -> AsyncIterator[str]:
+    """Yield SSE token frames for a provider stream; raw chunks are appended to `collected`."""
+    try:
+        head = await open_gated(chunks, is_rejected, on_first)
+        async for frame in stream_frames(chunks, head, collected):
+            yield frame
+    finally:
+        await _close(chunks)  # release the provider connection on rejection / early exit
+
+
+async def _close(chunks: AsyncIterator[str]) -> None:
+    aclose = getattr(chunks, "aclose", None)
+    if aclose:
+        try:
+            await aclose()
+        except Exception:
+            pass
+
+
+async def _race_runner(
+    chunks: AsyncIterator[str],
+    is_rejected: Callable[[str], bool],
+    on_first: Callable[[], None],
+    gate: asyncio.Future,
+    tail: asyncio.Queue,
+) -> None:
+    """Drive one racer's stream in its own task: resolve gate with the head, then pump the rest into tail."""
+    try:
+        head = await open_gated(chunks, is_rejected, on_first)
+        gate.set_result(head)
+        async for chunk in chunks:
+            tail.put_nowait(chunk)
+        tail.put_nowait(None)
+    except Exception as e:
+        if not gate.done():
+            gate.set_exception(e)
+        else:
+            tail.put_nowait(e)
+    finally:
+        await _close(chunks)
+
+
+async def _drain(runner: asyncio.Task, tail: asyncio.Queue) -> AsyncIterator[str]:
+    try:
+        while True:
+            item = await tail.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        runner.cancel()  # no-op once finished; stops the provider if the client went away
+
+
+async def race_gated(
+    racers: list[tuple[str, Callable[[], AsyncIterator[str]]]],
+    is_rejected: Callable[[str], bool],
+    hedge_delay: Callable[[str], float],
+    max_parallel: int = 2,
+    on_first: Callable[[str, float], None] | None = None,
+    on_error: Callable[[str, Exception], None] | None = None,
+    on_cancel: Callable[[str, float], None] | None = None,
+) -> tuple[int, list[str], AsyncIterator[str]] | None:
+    """Hedged start over an ordered list of (name, open_stream) racers.
+
+    Racer i+1 starts when racer i fails or hasn't produced a first token
+    within hedge_delay(name_i) seconds (at most max_parallel at once). The
+    first racer to pass the gate wins: returns (index, head, rest) to be
+    continued with stream_frames(); all other streams are cancelled.
+    Returns None if every racer failed or was rejected.
+
+    Callbacks: on_first(name, ttft), on_error(name, exc) for failures and
+    rejections, on_cancel(name, elapsed) for losers stopped before their
+    first token.
+    """
+    gates: dict[asyncio.Future, int] = {}
+    runners: dict[int, tuple[asyncio.Task, asyncio.Queue]] = {}
+    started_at: dict[int, float] = {}
+    first_seen: set[int] = set()
+    next_idx = 0
+    loop = asyncio.get_running_loop()
+
+    def launch() -> None:
+        nonlocal next_idx
+        i = next_idx
+        next_idx += 1
+        name, open_stream = racers[i]
+        started_at[i] = time.monotonic()
+
+        def first() -> None:
+            first_seen.add(i)
+            if on_first:
+                on_first(name, time.monotonic() - started_at[i])
+
+        gate = loop.create_future()
+        tail: asyncio.Queue = asyncio.Queue()
+        runner = asyncio.create_task(_race_runner(open_stream(), is_rejected, first, gate, tail))
+        gates[gate] = i
+        runners[i] = (runner, tail)
+
+    if not racers:
+        return None
+    launch()
+    winner = None
+    try:
+        while gates:
+            timeout = None
+            newest = next_idx - 1
+            if next_idx < len(racers) and len(gates) < max_parallel and newest not in first_seen:
+                deadline = started_at[newest] + hedge_delay(racers[newest][0])
+                timeout = max(0.0, deadline - time.monotonic())
+            done, _ = await asyncio.wait(gates, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                if newest not in first_seen:
+                    launch()  # newest racer is slow to its first token — hedge
+                continue
+            for gate in sorted(done, key=lambda g: gates[g]):
+                i = gates.pop(gate)
+                exc = gate.exception()
+                if exc is None and winner is None:
+                    runner, tail = runners.pop(i)
+                    winner = (i, gate.result(), _drain(runner, tail))
+                elif exc is not None and on_error:
+                    on_error(racers[i][0], exc)
+            if winner is not None:
+                return winner
+            if next_idx < len(racers) and len(gates) < max_parallel:
+                launch()  # a racer failed or was rejected — start the next right away
+        return None
+    finally:
+        for gate in gates:
+            if gate.done() and not gate.cancelled():
+                gate.exception()  # retrieved — a loser that failed during shutdown
+        now = time.monotonic()
+        for i, (runner, _) in runners.items():
+            if not runner.done():
+                runner.cancel()
+                if on_cancel and i not in first_seen:
+                    on_cancel(racers[i][0], now - started_at[i])
+        pending = [runner for runner, _ in runners.values()]
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
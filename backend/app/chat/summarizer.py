@@ -1,18 +1,36 @@
 """Auto-summarize older chat messages when context grows large.
 
-Runs as fire-and-forget after each assistant response.
-Uses cheap/fast LLM providers (groq → cerebras → openrouter).
+Requested after each assistant response (request_summary); runs on a
+small background queue. Uses cheap/fast LLM providers (groq → cerebras →
+openrouter).
+
+- Single-flight per chat: a chat is queued at most once, and a request that
+  arrives while its run is in flight only marks it for one more run
+  afterwards (debounce — bursts of replies cost one run).
+- Incremental: each run reads only the messages after summary_up_to_id
+  (keyset on created_at, id), at most KEEP_RECENT + MAX_BATCH rows. A
+  longer backlog is worked off over consecutive runs.
+- Hierarchical rolling summary (chats.summary_state): each batch becomes a
+  short chunk summary; once there are more than MAX_CHUNKS chunks, the
+  older ones are folded into the top-level summary. Every LLM call sees a
+  bounded input, however long the chat. chats.summary holds the rendered
+  text (top + chunks) that goes into the prompt.
+- The cursor is advanced with a compare-and-set, so a concurrent run in
+  another worker can't overwrite a newer summary.
+
+get_metrics() reports queue depth and lag for the admin dashboard.
 """
 import asyncio
 import logging
+import time
 
-from sqlalchemy import select, func, text as sa_text
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, or_, and_
 
 from app.db.models import Chat, Message
-from app.db.session import async_session, engine as db_engine
+from app.db.session import async_session
 from app.llm.base import LLMMessage, LLMConfig
 from app.llm.registry import get_provider
+from app.utils.job_queue import JobQueue
 
 logger = logging.getLogger("summarizer")
 
@@ -20,6 +38,12 @@ logger = logging.getLogger("summarizer")
 SUMMARIZE_THRESHOLD = 25
 # Keep the most recent N messages unsummarized (always in context)
 KEEP_RECENT = 15
+# Minimum new messages per run (the first run happens at SUMMARIZE_THRESHOLD)
+MIN_NEW = SUMMARIZE_THRESHOLD - KEEP_RECENT
+# Maximum messages summarized per run
+MAX_BATCH = 40
+# Chunk summaries kept before the older ones are folded into the top summary
+MAX_CHUNKS = 4
 # Providers to try (fast + cheap)
 _SUMMARY_PROVIDERS = ("groq", "cerebras", "openrouter")
 _TIMEOUT = 30.0
@@ -34,27 +58,49 @@ _SUMMARY_PROMPT = """Summarize the following roleplay conversation concisely. Pr
 
 IMPORTANT: The summary MUST end with a clear statement of where the characters currently are and what they are doing.
 
-Write in the same language as the conversation. Be concise (200-500 words max).
+Write in the same language as the conversation. Be concise ({words} words max).
 Do NOT add commentary — just the summary.
 
 Conversation:
 {conversation}"""
 
+_FOLD_PROMPT = """Merge the following consecutive summaries of one roleplay conversation (oldest first) into a single summary. Keep:
+- Key plot points and events in chronological order
+- Character relationships and dynamics
+- Important decisions, agreements and unresolved threads
+- Where the characters were at the end
+
+Write in the same language as the summaries. Be concise (200-500 words max).
+Do NOT add commentary — just the summary.
+
+Summaries:
+{summaries}"""
+
+_queue = JobQueue("summarize", maxsize=200, workers=2, retries=0)
+_pending: dict[str, float] = {}  # chat_id -> monotonic time requested (queued, not started)
+_inflight: set[str] = set()
+_rerun: set[str] = set()
+_stats = {
+    "requested": 0, "coalesced": 0, "dropped": 0, "runs": 0, "summarized_messages": 0,
+    "llm_calls": 0, "folds": 0, "failures": 0, "conflicts": 0,
+    "last_lag_ms": None, "max_lag_ms": 0,
+}
 
-async def _generate_summary(messages_text: str) -> str | None:
+
+async def _generate(prompt: str, system: str, max_tokens: int) -> str | None:
     """Generate a summary via LLM."""
-    prompt = _SUMMARY_PROMPT.format(conversation=messages_text)
     llm_messages = [
-        LLMMessage(role="system", content="You are a concise summarizer of roleplay conversations."),
+        LLMMessage(role="system", content=system),
         LLMMessage(role="user", content=prompt),
     ]
-    config = LLMConfig(model="", temperature=0.3, max_tokens=1024)
+    config = LLMConfig(model="", temperature=0.3, max_tokens=max_tokens)
 
     for provider_name in _SUMMARY_PROVIDERS:
         try:
             provider = get_provider(provider_name)
         except ValueError:
             continue
+        _stats["llm_calls"] += 1
         try:
             result = await asyncio.wait_for(
                 provider.generate(llm_messages, config),
@@ -69,82 +115,135 @@ async def _generate_summary(messages_text: str) -> str | None:
     return None
 
 
-async def maybe_summarize(chat_id: str):
-    """Check if chat needs summarization, and if so, summarize older messages.
-
-    Must run in its own session since this is fire-and-forget.
-    """
+async def _summarize_chunk(messages: list[Message]) -> str | None:
+    parts = []
+    for m in messages:
+        role_label = "User" if (m.role.value if hasattr(m.role, 'value') else m.role) == "user" else "Character"
+        parts.append(f"{role_label}: {m.content[:500]}")  # truncate long messages
+    prompt = _SUMMARY_PROMPT.format(words="100-250", conversation="\n".join(parts))
+    return await _generate(prompt, "You are a concise summarizer of roleplay conversations.", 512)
+
+
+async def _fold(summaries: list[str]) -> str | None:
+    _stats["folds"] += 1
+    prompt = _FOLD_PROMPT.format(summaries="\n\n".join(f"[{i + 1}]\n{s}" for i, s in enumerate(summaries)))
+    return await _generate(prompt, "You are a concise summarizer of roleplay conversations.", 1024)
+
+
+def render_summary(state: dict) -> str:
+    """Prompt text for a summary state: top-level summary, then the newer chunks."""
+    return "\n\n".join(p for p in [state.get("top") or ""] + list(state.get("chunks") or []) if p)
+
+
+async def _messages_after(db, chat_id: str, cursor_id: str | None, limit: int) -> list[Message]:
+    """Up to limit messages after the cursor message, oldest first (keyset on created_at, id)."""
+    q = select(Message).where(Message.chat_id == chat_id)
+    if cursor_id:
+        cursor_at = (await db.execute(
+            select(Message.created_at).where(Message.id == cursor_id)
+        )).scalar_one_or_none()
+        if cursor_at is not None:  # cursor message deleted -> start over
+            q = q.where(or_(
+                Message.created_at > cursor_at,
+                and_(Message.created_at == cursor_at, Message.id > cursor_id),
+            ))
+    q = q.order_by(Message.created_at.asc(), Message.id.asc()).limit(limit)
+    return list((await db.execute(q)).scalars().all())
+
+
+async def _summarize_once(chat_id: str) -> bool:
+    """Summarize the next batch of a chat. Returns True if a backlog remains."""
+    async with async_session() as db:
+        row = (await db.execute(
+            select(Chat.summary, Chat.summary_state, Chat.summary_up_to_id).where(Chat.id == chat_id)
+        )).one_or_none()
+        if not row:
+            return False
+        summary, state, cursor_id = row
+        limit = KEEP_RECENT + MAX_BATCH
+        msgs = await _messages_after(db, chat_id, cursor_id, limit)
+    new_messages = msgs[:-KEEP_RECENT]
+    if len(new_messages) < MIN_NEW:
+        return False
+
+    # Chats summarized before summary_state existed: their summary becomes the top level
+    state = dict(state) if state else {"top": summary or "", "chunks": []}
+    chunk = await _summarize_chunk(new_messages)
+    if not chunk:
+        _stats["failures"] += 1
+        return False
+    chunks = list(state.get("chunks") or []) + [chunk]
+    top = state.get("top") or ""
+    if len(chunks) > MAX_CHUNKS:
+        folded = await _fold(([top] if top else []) + chunks[:-1])
+        if folded:
+            top, chunks = folded, chunks[-1:]
+    new_state = {"top": top, "chunks": chunks}
+
+    cursor_match = Chat.summary_up_to_id == cursor_id if cursor_id else Chat.summary_up_to_id.is_(None)
+    async with async_session() as db:
+        result = await db.execute(
+            update(Chat)
+            .where(Chat.id == chat_id, cursor_match)
+            .values(summary=render_summary(new_state), summary_state=new_state, summary_up_to_id=new_messages[-1].id)
+        )
+        await db.commit()
+    if result.rowcount == 0:
+        _stats["conflicts"] += 1
+        return False
+    _stats["summarized_messages"] += len(new_messages)
+    logger.info("Summarized chat %s: %d messages → %d chunks", chat_id[:8], len(new_messages), len(chunks))
+    return len(msgs) == limit
+
+
+async def _run(chat_id: str):
+    requested_at = _pending.pop(chat_id, None)
+    if requested_at is not None:
+        lag_ms = round((time.monotonic() - requested_at) * 1000)
+        _stats["last_lag_ms"] = lag_ms
+        _stats["max_lag_ms"] = max(_stats["max_lag_ms"], lag_ms)
+    _inflight.add(chat_id)
+    _stats["runs"] += 1
+    backlog = False
     try:
-        async with async_session() as db:
-            # Count messages
-            count_result = await db.execute(
-                select(func.count()).select_from(Message).where(Message.chat_id == chat_id)
-            )
-            total = count_result.scalar() or 0
-
-            if total < SUMMARIZE_THRESHOLD:
-                return
-
-            # Get the chat
-            chat_result = await db.execute(select(Chat).where(Chat.id == chat_id))
-            chat = chat_result.scalar_one_or_none()
-            if not chat:
-                return
-
-            # Get all messages ordered by time
-            msgs_result = await db.execute(
-                select(Message)
-                .where(Message.chat_id == chat_id)
-                .order_by(Message.created_at.asc())
-            )
-            all_msgs = list(msgs_result.scalars().all())
-
-            if len(all_msgs) < SUMMARIZE_THRESHOLD:
-                return
-
-            # Messages to summarize: everything except the last KEEP_RECENT
-            to_summarize = all_msgs[:-KEEP_RECENT]
-
-            # If we already have a summary, only summarize new messages since then
-            if chat.summary_up_to_id:
-                start_idx = 0
-                for i, m in enumerate(to_summarize):
-                    if m.id == chat.summary_up_to_id:
-                        start_idx = i + 1
-                        break
-                new_messages = to_summarize[start_idx:]
-                if len(new_messages) < 10:
-                    return  # Not enough new messages to re-summarize
-            else:
-                new_messages = to_summarize
-
-            if not new_messages:
-                return
-
-            # Build text to summarize
-            existing_summary = chat.summary or ""
-            conversation_parts = []
-            if existing_summary:
-                conversation_parts.append(f"[Previous summary]\n{existing_summary}\n\n[New messages]")
-            for m in new_messages:
-                role_label = "User" if (m.role.value if hasattr(m.role, 'value') else m.role) == "user" else "Character"
-                conversation_parts.append(f"{role_label}: {m.content[:500]}")  # truncate long messages
-
-            conversation_text = "\n".join(conversation_parts)
-
-            # Generate summary
-            summary = await _generate_summary(conversation_text)
-            if not summary:
-                return
-
-            # Update chat with new summary
-            last_summarized_id = to_summarize[-1].id
-            async with db_engine.begin() as conn:
-                await conn.execute(
-                    sa_text("UPDATE chats SET summary = :summary, summary_up_to_id = :up_to WHERE id = :cid"),
-                    {"summary": summary, "up_to": last_summarized_id, "cid": chat_id},
-                )
-            logger.info("Summarized chat %s: %d messages → %d chars", chat_id[:8], len(new_messages), len(summary))
-
+        backlog = await _summarize_once(chat_id)
     except Exception as e:
+        _stats["failures"] += 1
         logger.warning("Summarization failed for chat %s: %s", chat_id[:8], str(e)[:200])
+    finally:
+        _inflight.discard(chat_id)
+    if backlog or chat_id in _rerun:
+        _rerun.discard(chat_id)
+        request_summary(chat_id)
+
+
+def request_summary(chat_id: str):
+    """Ask for a chat to be summarized if it has enough new messages (coalesced, never blocks)."""
+    _stats["requested"] += 1
+    if chat_id in _pending:
+        _stats["coalesced"] += 1
+        return
+    if chat_id in _inflight:
+        _stats["coalesced"] += 1
+        _rerun.add(chat_id)
+        return
+    _pending[chat_id] = time.monotonic()
+    if _queue.offer(_run, chat_id) is None:
+        _pending.pop(chat_id, None)
+        _stats["dropped"] += 1  # the next reply asks again
+
+
+def get_metrics() -> dict:
+    """Queue depth, lag and counters (per worker)."""
+    now = time.monotonic()
+    return {
+        **_stats,
+        "queue_depth": len(_pending),
+        "in_flight": len(_inflight),
+        "oldest_pending_s": round(now - min(_pending.values()), 1) if _pending else 0.0,
+    }
+
+
+async def drain(timeout: float = 0) -> None:
+    """Stop the summary workers (lifespan shutdown); queued summaries are retried on later replies."""
+    await _queue.drain(timeout)
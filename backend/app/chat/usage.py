@@ -0,0 +1,159 @@
+"""Incremental message usage counters for the daily and anonymous limits.
+
+save_message() bumps a usage_counters row in the same transaction that
+inserts a user message, so a limit check is one primary-key lookup (or a
+cache hit) instead of a COUNT(*) over messages JOIN chats that grows with
+the user's history:
+
+- ("user:<user_id>", "YYYY-MM-DD"): user messages sent that UTC day. A new
+  day starts a new row, so rollover needs no reset job.
+- ("anon:<session_id>", "total"): user messages sent by a guest session.
+
+Each worker caches counts for _CACHE_TTL seconds; its own bumps update the
+cache with the value returned by the upsert, bumps from other workers show
+up when the entry expires.
+
+reconcile() runs at startup and every RECONCILE_INTERVAL seconds. It
+recounts today's messages per user and the messages of recently active
+guest sessions, raises counters that are behind (messages saved before the
+counter existed or outside save_message) and deletes past days. Counters
+never go down, so deleting a chat does not give quota back.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text as sa_text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.session import engine as db_engine
+
+logger = logging.getLogger(__name__)
+
+ANON_DAY = "total"
+RECONCILE_INTERVAL = 3600  # seconds
+_ANON_ACTIVE_DAYS = 2  # guest sessions with chat activity this recent are reconciled
+
+# Count cache: key -> (day, count, monotonic ts)
+_cache: dict[str, tuple[str, int, float]] = {}
+_CACHE_TTL = 30  # seconds
+_CACHE_MAX_ENTRIES = 10000
+
+_BUMP_SQL = sa_text("""
+    INSERT INTO usage_counters (key, day, count) VALUES (:key, :day, 1)
+    ON CONFLICT (key, day) DO UPDATE SET count = usage_counters.count + 1
+    RETURNING count
+""")
+
+_RECONCILE_USERS_SQL = sa_text("""
+    INSERT INTO usage_counters (key, day, count)
+    SELECT 'user:' || c.user_id, :day, COUNT(*) FROM messages m
+    JOIN chats c ON m.chat_id = c.id
+    WHERE c.anon_session_id IS NULL
+    AND m.role = 'user'
+    AND m.created_at >= :today
+    GROUP BY c.user_id
+    ON CONFLICT (key, day) DO UPDATE SET count = excluded.count
+    WHERE excluded.count > usage_counters.count
+""")
+
+_RECONCILE_ANON_SQL = sa_text("""
+    INSERT INTO usage_counters (key, day, count)
+    SELECT 'anon:' || c.anon_session_id, :day, COUNT(*) FROM messages m
+    JOIN chats c ON m.chat_id = c.id
+    WHERE c.anon_session_id IN (
+        SELECT anon_session_id FROM chats
+        WHERE anon_session_id IS NOT NULL AND updated_at >= :since
+    )
+    AND m.role = 'user'
+    GROUP BY c.anon_session_id
+    ON CONFLICT (key, day) DO UPDATE SET count = excluded.count
+    WHERE excluded.count > usage_counters.count
+""")
+
+
+def _today() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+def _store(key: str, day: str, count: int):
+    now = time.monotonic()
+    if len(_cache) >= _CACHE_MAX_ENTRIES:
+        expired = [k for k, v in _cache.items() if now - v[2] >= _CACHE_TTL]
+        for k in expired:
+            _cache.pop(k, None)
+        if len(_cache) >= _CACHE_MAX_ENTRIES:
+            _cache.clear()
+    _cache[key] = (day, count, now)
+
+
+async def _get(key: str, day: str) -> int:
+    cached = _cache.get(key)
+    if cached and cached[0] == day and time.monotonic() - cached[2] < _CACHE_TTL:
+        return cached[1]
+    try:
+        async with db_engine.connect() as conn:
+            row = await conn.execute(
+                sa_text("SELECT count FROM usage_counters WHERE key = :key AND day = :day"),
+                {"key": key, "day": day},
+            )
+            count = row.scalar_one_or_none() or 0
+    except Exception as e:
+        logger.warning("Usage counter lookup failed for %s: %s", key, e)
+        return 0
+    _store(key, day, count)
+    return count
+
+
+async def count_user_today(user_id: str) -> int:
+    """User messages sent today (UTC) across all chats."""
+    return await _get(f"user:{user_id}", _today())
+
+
+async def count_anon(session_id: str) -> int:
+    """User messages sent by an anonymous session."""
+    return await _get(f"anon:{session_id}", ANON_DAY)
+
+
+async def bump(db: AsyncSession, user_id: str, anon_session_id: str | None) -> tuple[str, str, int]:
+    """Count one user message inside the caller's transaction.
+
+    Returns (key, day, new count); pass it to remember() after the commit.
+    """
+    if anon_session_id:
+        key, day = f"anon:{anon_session_id}", ANON_DAY
+    else:
+        key, day = f"user:{user_id}", _today()
+    result = await db.execute(_BUMP_SQL, {"key": key, "day": day})
+    return key, day, result.scalar_one()
+
+
+def remember(bumped: tuple[str, str, int]):
+    """Cache a committed count returned by bump()."""
+    _store(*bumped)
+
+
+async def reconcile():
+    """Raise counters to the real message counts and drop past days."""
+    now = datetime.now(timezone.utc)
+    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+    since = (now - timedelta(days=_ANON_ACTIVE_DAYS)).replace(tzinfo=None)
+    async with db_engine.begin() as conn:
+        await conn.execute(_RECONCILE_USERS_SQL, {"day": now.strftime("%Y-%m-%d"), "today": today_start})
+        await conn.execute(_RECONCILE_ANON_SQL, {"day": ANON_DAY, "since": since})
+        await conn.execute(
+            sa_text("DELETE FROM usage_counters WHERE day < :day AND day <> :anon"),
+            {"day": now.strftime("%Y-%m-%d"), "anon": ANON_DAY},
+        )
+    _cache.clear()
+
+
+async def run_reconciler():
+    """Reconcile now and then every RECONCILE_INTERVAL. Call via asyncio.create_task() from lifespan."""
+    while True:
+        try:
+            await reconcile()
+        except Exception:
+            logger.exception("Usage counter reconcile failed")
+        await asyncio.sleep(RECONCILE_INTERVAL)
@@ -0,0 +1,232 @@
+"""Versioned schema migrations, run by init_db() after create_all.
+
+Each entry in MIGRATIONS is (version, name, statements). Applied versions
+are recorded in schema_migrations, so a boot with an up-to-date schema
+costs one SELECT instead of re-running every ALTER.
+
+- Version 1 is the baseline: the statements init_db used to run on every
+  boot. They stay tolerant (each in its own transaction, errors ignored)
+  because older databases got them piecemeal and SQLite lacks
+  ADD COLUMN IF NOT EXISTS.
+- Later versions are strict: a failing statement stops the run, the
+  version is not recorded and is retried on the next boot.
+- On Postgres, CREATE INDEX runs CONCURRENTLY (outside a transaction) so
+  big tables stay writable, and a session advisory lock lets only one
+  worker migrate; the others start without waiting. A failed concurrent
+  build leaves an INVALID index that IF NOT EXISTS would skip, so such an
+  index is dropped and rebuilt, and an index that is still invalid after
+  the build fails the migration.
+
+Indexes added here are also declared on the models, so a fresh database
+gets them from create_all and the migration is a no-op.
+"""
+import logging
+import re
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+_LOCK_KEY = 724_311_001  # pg_advisory_lock key for the migration runner
+
+_BASELINE = [
+    "ALTER TABLE characters ADD COLUMN IF NOT EXISTS max_tokens INTEGER DEFAULT 2048",
+    "ALTER TABLE characters ADD COLUMN IF NOT EXISTS response_length VARCHAR DEFAULT 'long'",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS language VARCHAR DEFAULT 'ru'",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS role VARCHAR DEFAULT 'user'",
+    "ALTER TABLE messages ADD COLUMN IF NOT EXISTS model_used VARCHAR",
+    "ALTER TABLE characters ADD COLUMN IF NOT EXISTS appearance TEXT",
+    "ALTER TABLE characters ADD COLUMN IF NOT EXISTS structured_tags VARCHAR DEFAULT ''",
+    "ALTER TABLE chats ADD COLUMN IF NOT EXISTS persona_id VARCHAR REFERENCES personas(id) ON DELETE SET NULL",
+    "ALTER TABLE characters ADD COLUMN IF NOT EXISTS message_counts JSONB DEFAULT '{}'",
+    "ALTER TABLE characters ADD COLUMN IF NOT EXISTS original_language VARCHAR DEFAULT 'ru'",
+    "ALTER TABLE characters ADD COLUMN IF NOT EXISTS translations JSONB DEFAULT '{}'",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS message_count INTEGER DEFAULT 0",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS chat_count INTEGER DEFAULT 0",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS is_banned BOOLEAN DEFAULT FALSE",
+    "ALTER TABLE characters ADD COLUMN IF NOT EXISTS base_chat_count JSONB DEFAULT '{}'",
+    "ALTER TABLE characters ADD COLUMN IF NOT EXISTS base_like_count JSONB DEFAULT '{}'",
+    "ALTER TABLE users ALTER COLUMN password_hash DROP NOT NULL",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS oauth_provider VARCHAR",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS oauth_id VARCHAR",
+    "ALTER TABLE characters ADD COLUMN IF NOT EXISTS slug VARCHAR UNIQUE",
+    # Indexes for character browse performance
+    "CREATE INDEX IF NOT EXISTS idx_characters_public_created ON characters (is_public, created_at DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_characters_creator ON characters (creator_id)",
+    "CREATE INDEX IF NOT EXISTS idx_characters_public_chatcount ON characters (is_public, chat_count DESC)",
+    "ALTER TABLE page_views ADD COLUMN IF NOT EXISTS country VARCHAR(2)",
+    # Indexes for analytics
+    "CREATE INDEX IF NOT EXISTS idx_pageviews_created ON page_views (created_at DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_pageviews_ip_date ON page_views (ip_hash, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_pageviews_path ON page_views (path)",
+    # Voting, forking, highlights
+    "ALTER TABLE characters ADD COLUMN IF NOT EXISTS vote_score INTEGER DEFAULT 0",
+    "ALTER TABLE characters ADD COLUMN IF NOT EXISTS fork_count INTEGER DEFAULT 0",
+    "ALTER TABLE characters ADD COLUMN IF NOT EXISTS forked_from_id VARCHAR REFERENCES characters(id) ON DELETE SET NULL",
+    "ALTER TABLE characters ADD COLUMN IF NOT EXISTS highlights JSONB DEFAULT '[]'",
+    # Indexes for relations
+    "CREATE INDEX IF NOT EXISTS idx_character_relations_char ON character_relations (character_id)",
+    "CREATE INDEX IF NOT EXISTS idx_votes_character ON votes (character_id)",
+    # Chat memory / summarization
+    "ALTER TABLE chats ADD COLUMN IF NOT EXISTS summary TEXT",
+    "ALTER TABLE chats ADD COLUMN IF NOT EXISTS summary_up_to_id VARCHAR",
+    "ALTER TABLE chats ADD COLUMN IF NOT EXISTS summary_state JSONB",
+    # Persona snapshot in chat
+    "ALTER TABLE chats ADD COLUMN IF NOT EXISTS persona_name VARCHAR(50)",
+    "ALTER TABLE chats ADD COLUMN IF NOT EXISTS persona_description TEXT",
+    # Anonymous guest chat
+    "ALTER TABLE chats ADD COLUMN IF NOT EXISTS anon_session_id VARCHAR",
+    "CREATE INDEX IF NOT EXISTS idx_chats_anon_session ON chats (anon_session_id) WHERE anon_session_id IS NOT NULL",
+    # FR/DE language support for character relations
+    "ALTER TABLE character_relations ADD COLUMN IF NOT EXISTS label_fr VARCHAR",
+    "ALTER TABLE character_relations ADD COLUMN IF NOT EXISTS label_de VARCHAR",
+    # Analytics: OS and bot detection
+    "ALTER TABLE page_views ADD COLUMN IF NOT EXISTS os VARCHAR(20)",
+    "ALTER TABLE page_views ADD COLUMN IF NOT EXISTS is_bot BOOLEAN DEFAULT FALSE",
+    # Slug: per-user unique (drop old global unique, add composite)
+    "DROP INDEX IF EXISTS ix_characters_slug",
+    "ALTER TABLE characters DROP CONSTRAINT IF EXISTS characters_slug_key",
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_characters_creator_slug ON characters (creator_id, slug)",
+    # Speech pattern field
+    "ALTER TABLE characters ADD COLUMN IF NOT EXISTS speech_pattern TEXT",
+    # Persona slug (user-editable)
+    "ALTER TABLE personas ADD COLUMN IF NOT EXISTS slug VARCHAR",
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_personas_user_slug ON personas (user_id, slug)",
+    # Token tracking on messages
+    "ALTER TABLE messages ADD COLUMN IF NOT EXISTS prompt_tokens INTEGER",
+    "ALTER TABLE messages ADD COLUMN IF NOT EXISTS completion_tokens INTEGER",
+    # User tier system
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS tier VARCHAR DEFAULT 'free'",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS tokens_used_today INTEGER DEFAULT 0",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS tokens_used_month INTEGER DEFAULT 0",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS tokens_reset_date TIMESTAMP",
+    # DnD/Campaign support
+    "ALTER TABLE chats ADD COLUMN IF NOT EXISTS campaign_id VARCHAR",
+    "ALTER TABLE chats ADD COLUMN IF NOT EXISTS encounter_state JSONB",
+    "ALTER TABLE messages ADD COLUMN IF NOT EXISTS dice_rolls JSONB",
+    # Adventure ratings
+    "ALTER TABLE chats ADD COLUMN IF NOT EXISTS rating SMALLINT",
+    "ALTER TABLE chats ADD COLUMN IF NOT EXISTS completed_at TIMESTAMP",
+    # XP / Leveling system
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS xp_total INTEGER DEFAULT 0",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS level INTEGER DEFAULT 1",
+    # Character depth: backstory, hidden layers, inner conflict
+    "ALTER TABLE characters ADD COLUMN IF NOT EXISTS backstory TEXT",
+    "ALTER TABLE characters ADD COLUMN IF NOT EXISTS hidden_layers TEXT",
+    "ALTER TABLE characters ADD COLUMN IF NOT EXISTS inner_conflict TEXT",
+    # Companion NPC
+    "ALTER TABLE characters ADD COLUMN IF NOT EXISTS companion_name VARCHAR(100)",
+    "ALTER TABLE characters ADD COLUMN IF NOT EXISTS companion_role VARCHAR(50)",
+    "ALTER TABLE characters ADD COLUMN IF NOT EXISTS companion_personality TEXT",
+    "ALTER TABLE characters ADD COLUMN IF NOT EXISTS companion_appearance TEXT",
+    # Companion avatar
+    "ALTER TABLE characters ADD COLUMN IF NOT EXISTS companion_avatar_url VARCHAR(2000)",
+    # Companion speech & backstory
+    "ALTER TABLE characters ADD COLUMN IF NOT EXISTS companion_speech_pattern TEXT",
+    "ALTER TABLE characters ADD COLUMN IF NOT EXISTS companion_backstory TEXT",
+    # Companion approval on chats (-3 to +3)
+    "ALTER TABLE chats ADD COLUMN IF NOT EXISTS companion_approval SMALLINT DEFAULT 0",
+    # Context tail window: newest-first scan per chat
+    "CREATE INDEX IF NOT EXISTS idx_messages_chat_created ON messages (chat_id, created_at DESC, id DESC)",
+]
+
+MIGRATIONS: list[tuple[int, str, list[str]]] = [
+    (1, "baseline", _BASELINE),
+    (2, "hot-path indexes for messages and chats", [
+        # get_chat_messages / context tail / summarizer keyset (declared before, not on old databases)
+        "CREATE INDEX IF NOT EXISTS idx_messages_chat_created ON messages (chat_id, created_at DESC, id DESC)",
+        # usage reconciler: today's messages
+        "CREATE INDEX IF NOT EXISTS idx_messages_created ON messages (created_at)",
+        # list_user_chats, per-user chat counts, achievement / usage joins
+        "CREATE INDEX IF NOT EXISTS idx_chats_user_updated ON chats (user_id, updated_at DESC)",
+        # get_or_create_chat
+        "CREATE INDEX IF NOT EXISTS idx_chats_user_character ON chats (user_id, character_id)",
+        # character delete cascade, per-character chat lookups
+        "CREATE INDEX IF NOT EXISTS idx_chats_character ON chats (character_id)",
+        "CREATE INDEX IF NOT EXISTS idx_group_chats_user_updated ON group_chats (user_id, updated_at DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_group_messages_chat_created ON group_messages (group_chat_id, created_at DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_lore_entries_character ON lore_entries (character_id)",
+    ]),
+]
+
+_TOLERANT = {1}
+
+
+_INDEX_NAME = re.compile(r"CREATE INDEX IF NOT EXISTS (\w+)")
+
+
+async def _index_valid(conn, name: str) -> bool | None:
+    """pg_index.indisvalid for an index, or None if it doesn't exist."""
+    return (await conn.execute(
+        text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"), {"name": name},
+    )).scalar()
+
+
+async def _execute(engine, sql: str) -> None:
+    if engine.dialect.name == "postgresql" and sql.startswith("CREATE INDEX "):
+        name = _INDEX_NAME.match(sql)
+        sql = sql.replace("CREATE INDEX ", "CREATE INDEX CONCURRENTLY ", 1)
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            if name and await _index_valid(conn, name.group(1)) is False:
+                logger.warning("Rebuilding invalid index %s", name.group(1))
+                await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name.group(1)}"))
+            await conn.execute(text(sql))
+            if name and await _index_valid(conn, name.group(1)) is False:
+                raise RuntimeError(f"index {name.group(1)} is invalid after CREATE INDEX CONCURRENTLY")
+        return
+    async with engine.begin() as conn:
+        await conn.execute(text(sql))
+
+
+async def _apply(engine, version: int, name: str, statements: list[str]) -> bool:
+    for sql in statements:
+        try:
+            await _execute(engine, sql)
+        except Exception as e:
+            if version in _TOLERANT:
+                continue  # column already exists or DB doesn't support IF NOT EXISTS
+            logger.warning("Migration %d (%s) failed, retried on next start: %s | %s", version, name, str(e)[:200], sql[:120])
+            return False
+    async with engine.begin() as conn:
+        await conn.execute(
+            text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, CURRENT_TIMESTAMP)"),
+            {"v": version, "n": name},
+        )
+    logger.info("Applied migration %d: %s", version, name)
+    return True
+
+
+async def run_migrations(engine) -> None:
+    """Apply the migrations not yet recorded in schema_migrations."""
+    try:
+        async with engine.connect() as conn:
+            applied = set((await conn.execute(text("SELECT version FROM schema_migrations"))).scalars())
+    except Exception as e:
+        logger.warning("Cannot read schema_migrations, skipping migrations: %s", str(e)[:200])
+        return
+    pending = [m for m in MIGRATIONS if m[0] not in applied]
+    if not pending:
+        return
+
+    lock_conn = None
+    if engine.dialect.name == "postgresql":
+        lock_conn = await engine.connect()
+        locked = (await lock_conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": _LOCK_KEY})).scalar()
+        await lock_conn.commit()  # session-level lock; an open transaction would block CREATE INDEX CONCURRENTLY
+        if not locked:
+            await lock_conn.close()
+            logger.info("Another worker is running migrations")
+            return
+    try:
+        if lock_conn is not None:  # re-check: the lock holder before us may have applied them
+            applied = set((await lock_conn.execute(text("SELECT version FROM schema_migrations"))).scalars())
+            await lock_conn.commit()
+            pending = [m for m in pending if m[0] not in applied]
+        for version, name, statements in pending:
+            if not await _apply(engine, version, name, statements):
+                break
+    finally:
+        if lock_conn is not None:
+            await lock_conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": _LOCK_KEY})
+            await lock_conn.close()
@@ -1,6 +1,6 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import String, Text, Boolean, Integer, SmallInteger, DateTime, ForeignKey, Enum as SAEnum, UniqueConstraint
+from sqlalchemy import String, Text, Boolean, Integer, SmallInteger, Float, DateTime, ForeignKey, Enum as SAEnum, UniqueConstraint, Index, desc
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 import enum
@@ -121,6 +121,12 @@ class Character(Base):
     creator: Mapped["User"] = relationship(back_populates="characters")
     chats: Mapped[list["Chat"]] = relationship(back_populates="character", cascade="all, delete-orphan")
     forked_from: Mapped["Character | None"] = relationship(remote_side="Character.id", foreign_keys=[forked_from_id])
+    # Enabled lore only, in injection order — eager-loaded by the chat context snapshot
+    enabled_lore_entries: Mapped[list["LoreEntry"]] = relationship(
+        primaryjoin="and_(Character.id == LoreEntry.character_id, LoreEntry.enabled == True)",
+        order_by="LoreEntry.position",
+        viewonly=True,
+    )
 
 
 class Persona(Base):
@@ -143,6 +149,12 @@ class Persona(Base):
 
 class Chat(Base):
     __tablename__ = "chats"
+    # Hot-path indexes (existing databases get them from migration 2, see db/migrations.py)
+    __table_args__ = (
+        Index("idx_chats_user_updated", "user_id", desc("updated_at")),
+        Index("idx_chats_user_character", "user_id", "character_id"),
+        Index("idx_chats_character", "character_id"),
+    )
 
     id: Mapped[str] = mapped_column(String, primary_key=True, default=gen_uuid)
     user_id: Mapped[str] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
@@ -154,6 +166,7 @@ class Chat(Base):
     model_used: Mapped[str | None] = mapped_column(String, nullable=True)
     summary: Mapped[str | None] = mapped_column(Text, nullable=True)  # LLM-generated summary of older messages
     summary_up_to_id: Mapped[str | None] = mapped_column(String, nullable=True)  # last message ID included in summary
+    summary_state: Mapped[dict | None] = mapped_column(JSONB, nullable=True)  # {"top": str, "chunks": [str]}, see chat/summarizer.py
     anon_session_id: Mapped[str | None] = mapped_column(String, nullable=True)  # anonymous guest session
     campaign_id: Mapped[str | None] = mapped_column(ForeignKey("campaigns.id", ondelete="SET NULL"), nullable=True)
     encounter_state: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
@@ -172,6 +185,10 @@ class Chat(Base):
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        Index("idx_messages_chat_created", "chat_id", desc("created_at"), desc("id")),
+        Index("idx_messages_created", "created_at"),
+    )
 
     id: Mapped[str] = mapped_column(String, primary_key=True, default=gen_uuid)
     chat_id: Mapped[str] = mapped_column(ForeignKey("chats.id", ondelete="CASCADE"))
@@ -257,6 +274,45 @@ class PromptTemplate(Base):
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
 
+class RateLimit(Base):
+    """Shared rate limiter state (RATE_LIMIT_BACKEND=database), see auth/rate_limit.py."""
+    __tablename__ = "rate_limits"
+
+    key: Mapped[str] = mapped_column(String, primary_key=True)  # "msg:<user_id>", "auth:<ip>"
+    tat: Mapped[float] = mapped_column(Float, nullable=False)  # GCRA theoretical arrival time, unix seconds
+
+
+class UsageCounter(Base):
+    """Incremental message counters for daily / anonymous limits, see chat/usage.py."""
+    __tablename__ = "usage_counters"
+
+    key: Mapped[str] = mapped_column(String, primary_key=True)  # "user:<user_id>", "anon:<session_id>"
+    day: Mapped[str] = mapped_column(String, primary_key=True)  # UTC "YYYY-MM-DD", or "total" for anon sessions
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class SchemaMigration(Base):
+    """Applied schema migration versions, see db/migrations.py."""
+    __tablename__ = "schema_migrations"
+
+    version: Mapped[int] = mapped_column(Integer, primary_key=True)
+    name: Mapped[str] = mapped_column(String, nullable=False)
+    applied_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+class TranslationJob(Base):
+    """Pending translation of one character field into one language, see characters/translation_jobs.py."""
+    __tablename__ = "translation_jobs"
+
+    character_id: Mapped[str] = mapped_column(ForeignKey("characters.id", ondelete="CASCADE"), primary_key=True)
+    language: Mapped[str] = mapped_column(String(10), primary_key=True)
+    field: Mapped[str] = mapped_column(String(30), primary_key=True)  # "name", "tagline", "tags", "scenario", ...
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    claimed_by: Mapped[str | None] = mapped_column(String, nullable=True)  # worker token while in progress
+    claimed_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
 class Vote(Base):
     __tablename__ = "votes"
 
@@ -283,6 +339,9 @@ class CharacterRelation(Base):
 
 class GroupChat(Base):
     __tablename__ = "group_chats"
+    __table_args__ = (
+        Index("idx_group_chats_user_updated", "user_id", desc("updated_at")),
+    )
 
     id: Mapped[str] = mapped_column(String, primary_key=True, default=gen_uuid)
     user_id: Mapped[str] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
@@ -308,6 +367,9 @@ class GroupChatMember(Base):
 
 class GroupMessage(Base):
     __tablename__ = "group_messages"
+    __table_args__ = (
+        Index("idx_group_messages_chat_created", "group_chat_id", desc("created_at")),
+    )
 
     id: Mapped[str] = mapped_column(String, primary_key=True, default=gen_uuid)
     group_chat_id: Mapped[str] = mapped_column(ForeignKey("group_chats.id", ondelete="CASCADE"))
@@ -322,6 +384,9 @@ class GroupMessage(Base):
 
 class LoreEntry(Base):
     __tablename__ = "lore_entries"
+    __table_args__ = (
+        Index("idx_lore_entries_character", "character_id"),
+    )
 
     id: Mapped[str] = mapped_column(String, primary_key=True, default=gen_uuid)
     character_id: Mapped[str] = mapped_column(ForeignKey("characters.id", ondelete="CASCADE"))
@@ -344,6 +409,15 @@ class UserAchievement(Base):
     achieved_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
 
+class AchievementCounter(Base):
+    """Per-user achievement progress counters, see achievements/checker.py."""
+    __tablename__ = "achievement_counters"
+
+    user_id: Mapped[str] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    counter: Mapped[str] = mapped_column(String(50), primary_key=True)  # "messages", "chats", ...
+    value: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
 class PageView(Base):
     __tablename__ = "page_views"
 
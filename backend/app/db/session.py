@@ -1,5 +1,4 @@
 import ssl
-from sqlalchemy import text
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from app.config import settings
 from app.db.models import Base
@@ -35,111 +34,9 @@ async def init_db():
         print(f"Warning: Could not initialize DB tables: {e}")
         print("The app will still start — tables may already exist.")
 
-    # Run migrations in separate transactions (PostgreSQL aborts entire
-    # transaction on error, so each ALTER needs its own transaction)
-    migrations = [
-        "ALTER TABLE characters ADD COLUMN IF NOT EXISTS max_tokens INTEGER DEFAULT 2048",
-        "ALTER TABLE characters ADD COLUMN IF NOT EXISTS response_length VARCHAR DEFAULT 'long'",
-        "ALTER TABLE users ADD COLUMN IF NOT EXISTS language VARCHAR DEFAULT 'ru'",
-        "ALTER TABLE users ADD COLUMN IF NOT EXISTS role VARCHAR DEFAULT 'user'",
-        "ALTER TABLE messages ADD COLUMN IF NOT EXISTS model_used VARCHAR",
-        "ALTER TABLE characters ADD COLUMN IF NOT EXISTS appearance TEXT",
-        "ALTER TABLE characters ADD COLUMN IF NOT EXISTS structured_tags VARCHAR DEFAULT ''",
-        "ALTER TABLE chats ADD COLUMN IF NOT EXISTS persona_id VARCHAR REFERENCES personas(id) ON DELETE SET NULL",
-        "ALTER TABLE characters ADD COLUMN IF NOT EXISTS message_counts JSONB DEFAULT '{}'",
-        "ALTER TABLE characters ADD COLUMN IF NOT EXISTS original_language VARCHAR DEFAULT 'ru'",
-        "ALTER TABLE characters ADD COLUMN IF NOT EXISTS translations JSONB DEFAULT '{}'",
-        "ALTER TABLE users ADD COLUMN IF NOT EXISTS message_count INTEGER DEFAULT 0",
-        "ALTER TABLE users ADD COLUMN IF NOT EXISTS chat_count INTEGER DEFAULT 0",
-        "ALTER TABLE users ADD COLUMN IF NOT EXISTS is_banned BOOLEAN DEFAULT FALSE",
-        "ALTER TABLE characters ADD COLUMN IF NOT EXISTS base_chat_count JSONB DEFAULT '{}'",
-        "ALTER TABLE characters ADD COLUMN IF NOT EXISTS base_like_count JSONB DEFAULT '{}'",
-        "ALTER TABLE users ALTER COLUMN password_hash DROP NOT NULL",
-        "ALTER TABLE users ADD COLUMN IF NOT EXISTS oauth_provider VARCHAR",
-        "ALTER TABLE users ADD COLUMN IF NOT EXISTS oauth_id VARCHAR",
-        "ALTER TABLE characters ADD COLUMN IF NOT EXISTS slug VARCHAR UNIQUE",
-        # Indexes for character browse performance
-        "CREATE INDEX IF NOT EXISTS idx_characters_public_created ON characters (is_public, created_at DESC)",
-        "CREATE INDEX IF NOT EXISTS idx_characters_creator ON characters (creator_id)",
-        "CREATE INDEX IF NOT EXISTS idx_characters_public_chatcount ON characters (is_public, chat_count DESC)",
-        "ALTER TABLE page_views ADD COLUMN IF NOT EXISTS country VARCHAR(2)",
-        # Indexes for analytics
-        "CREATE INDEX IF NOT EXISTS idx_pageviews_created ON page_views (created_at DESC)",
-        "CREATE INDEX IF NOT EXISTS idx_pageviews_ip_date ON page_views (ip_hash, created_at)",
-        "CREATE INDEX IF NOT EXISTS idx_pageviews_path ON page_views (path)",
-        # Voting, forking, highlights
-        "ALTER TABLE characters ADD COLUMN IF NOT EXISTS vote_score INTEGER DEFAULT 0",
-        "ALTER TABLE characters ADD COLUMN IF NOT EXISTS fork_count INTEGER DEFAULT 0",
-        "ALTER TABLE characters ADD COLUMN IF NOT EXISTS forked_from_id VARCHAR REFERENCES characters(id) ON DELETE SET NULL",
-        "ALTER TABLE characters ADD COLUMN IF NOT EXISTS highlights JSONB DEFAULT '[]'",
-        # Indexes for relations
-        "CREATE INDEX IF NOT EXISTS idx_character_relations_char ON character_relations (character_id)",
-        "CREATE INDEX IF NOT EXISTS idx_votes_character ON votes (character_id)",
-        # Chat memory / summarization
-        "ALTER TABLE chats ADD COLUMN IF NOT EXISTS summary TEXT",
-        "ALTER TABLE chats ADD COLUMN IF NOT EXISTS summary_up_to_id VARCHAR",
-        # Persona snapshot in chat
-        "ALTER TABLE chats ADD COLUMN IF NOT EXISTS persona_name VARCHAR(50)",
-        "ALTER TABLE chats ADD COLUMN IF NOT EXISTS persona_description TEXT",
-        # Anonymous guest chat
-        "ALTER TABLE chats ADD COLUMN IF NOT EXISTS anon_session_id VARCHAR",
-        "CREATE INDEX IF NOT EXISTS idx_chats_anon_session ON chats (anon_session_id) WHERE anon_session_id IS NOT NULL",
-        # FR/DE language support for character relations
-        "ALTER TABLE character_relations ADD COLUMN IF NOT EXISTS label_fr VARCHAR",
-        "ALTER TABLE character_relations ADD COLUMN IF NOT EXISTS label_de VARCHAR",
-        # Analytics: OS and bot detection
-        "ALTER TABLE page_views ADD COLUMN IF NOT EXISTS os VARCHAR(20)",
-        "ALTER TABLE page_views ADD COLUMN IF NOT EXISTS is_bot BOOLEAN DEFAULT FALSE",
-        # Slug: per-user unique (drop old global unique, add composite)
-        "DROP INDEX IF EXISTS ix_characters_slug",
-        "ALTER TABLE characters DROP CONSTRAINT IF EXISTS characters_slug_key",
-        "CREATE UNIQUE INDEX IF NOT EXISTS uq_characters_creator_slug ON characters (creator_id, slug)",
-        # Speech pattern field
-        "ALTER TABLE characters ADD COLUMN IF NOT EXISTS speech_pattern TEXT",
-        # Persona slug (user-editable)
-        "ALTER TABLE personas ADD COLUMN IF NOT EXISTS slug VARCHAR",
-        "CREATE UNIQUE INDEX IF NOT EXISTS uq_personas_user_slug ON personas (user_id, slug)",
-        # Token tracking on messages
-        "ALTER TABLE messages ADD COLUMN IF NOT EXISTS prompt_tokens INTEGER",
-        "ALTER TABLE messages ADD COLUMN IF NOT EXISTS completion_tokens INTEGER",
-        # User tier system
-        "ALTER TABLE users ADD COLUMN IF NOT EXISTS tier VARCHAR DEFAULT 'free'",
-        "ALTER TABLE users ADD COLUMN IF NOT EXISTS tokens_used_today INTEGER DEFAULT 0",
-        "ALTER TABLE users ADD COLUMN IF NOT EXISTS tokens_used_month INTEGER DEFAULT 0",
-        "ALTER TABLE users ADD COLUMN IF NOT EXISTS tokens_reset_date TIMESTAMP",
-        # DnD/Campaign support
-        "ALTER TABLE chats ADD COLUMN IF NOT EXISTS campaign_id VARCHAR",
-        "ALTER TABLE chats ADD COLUMN IF NOT EXISTS encounter_state JSONB",
-        "ALTER TABLE messages ADD COLUMN IF NOT EXISTS dice_rolls JSONB",
-        # Adventure ratings
-        "ALTER TABLE chats ADD COLUMN IF NOT EXISTS rating SMALLINT",
-        "ALTER TABLE chats ADD COLUMN IF NOT EXISTS completed_at TIMESTAMP",
-        # XP / Leveling system
-        "ALTER TABLE users ADD COLUMN IF NOT EXISTS xp_total INTEGER DEFAULT 0",
-        "ALTER TABLE users ADD COLUMN IF NOT EXISTS level INTEGER DEFAULT 1",
-        # Character depth: backstory, hidden layers, inner conflict
-        "ALTER TABLE characters ADD COLUMN IF NOT EXISTS backstory TEXT",
-        "ALTER TABLE characters ADD COLUMN IF NOT EXISTS hidden_layers TEXT",
-        "ALTER TABLE characters ADD COLUMN IF NOT EXISTS inner_conflict TEXT",
-        # Companion NPC
-        "ALTER TABLE characters ADD COLUMN IF NOT EXISTS companion_name VARCHAR(100)",
-        "ALTER TABLE characters ADD COLUMN IF NOT EXISTS companion_role VARCHAR(50)",
-        "ALTER TABLE characters ADD COLUMN IF NOT EXISTS companion_personality TEXT",
-        "ALTER TABLE characters ADD COLUMN IF NOT EXISTS companion_appearance TEXT",
-        # Companion avatar
-        "ALTER TABLE characters ADD COLUMN IF NOT EXISTS companion_avatar_url VARCHAR(2000)",
-        # Companion speech & backstory
-        "ALTER TABLE characters ADD COLUMN IF NOT EXISTS companion_speech_pattern TEXT",
-        "ALTER TABLE characters ADD COLUMN IF NOT EXISTS companion_backstory TEXT",
-        # Companion approval on chats (-3 to +3)
-        "ALTER TABLE chats ADD COLUMN IF NOT EXISTS companion_approval SMALLINT DEFAULT 0",
-    ]
-    for sql in migrations:
-        try:
-            async with engine.begin() as conn:
-                await conn.execute(text(sql))
-        except Exception:
-            pass  # column already exists or DB doesn't support IF NOT EXISTS
+    # Versioned migrations: only versions not yet recorded in schema_migrations run
+    from app.db.migrations import run_migrations
+    await run_migrations(engine)
 
 
 async def get_db() -> AsyncSession:
@@ -6,6 +6,7 @@ from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
+from app.achievements import checker as achievements
 from app.auth.middleware import get_current_user
 from app.db.session import get_db
 from app.db.models import Campaign, CampaignSession, Chat, Character, DiceRoll
@@ -66,6 +67,7 @@ async def create_campaign(
         number=1,
     )
     db.add(session)
+    await achievements.record(db, user["id"], "chats")
     await db.commit()
 
     return {
@@ -239,6 +241,7 @@ async def create_session(
         number=next_number,
     )
     db.add(session)
+    await achievements.record(db, user["id"], "chats")
     await db.commit()
 
     # Award XP for starting a new session
@@ -1,13 +1,25 @@
-"""Group chat router: 1 user + 2-5 AI characters."""
+"""Group chat router: 1 user + 2-5 AI characters.
+
+Every member's system prompt (cached across turns) and the shared context
+are prepared before streaming starts. By default a turn is reactive: each
+speaker is generated after the previous reply and sees it. Pipelined turns
+(GROUP_CHAT_PIPELINED, or reactive=false in the request) start the next
+speaker's generation while the current one streams and buffer its output,
+trading in-turn reactions for latency. SSE frames always go out one speaker
+after another.
+"""
+import asyncio
 import json
+import uuid
+from collections import OrderedDict
 from datetime import datetime
 
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from sqlalchemy import select
+from sqlalchemy import select, text
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import selectinload, joinedload
 
 from app.auth.middleware import get_current_user
 from app.db.session import get_db, engine as db_engine
@@ -18,12 +30,71 @@ from app.config import settings
 from app.chat.prompt_builder import build_system_prompt
 from app.chat.service import _get_post_history
 from app.chat.daily_limit import check_daily_limit
+from app.utils import admin_settings
 
 router = APIRouter(prefix="/api/group-chats", tags=["group-chat"])
 
 MAX_MEMBERS = 3
 MIN_MEMBERS = 2
 MAX_CONTEXT_MESSAGES = 30
+PIPELINE_AHEAD = 1  # speakers generating ahead of the one being streamed (non-reactive turns)
+
+# (group chat, character, updated_at, language, other members, prompt overrides version) -> system prompt
+_prefix_cache: OrderedDict[tuple, str] = OrderedDict()
+_PREFIX_CACHE_MAX = 512
+
+_GROUP_CONTEXT_TEMPLATES = {
+    "ru": (
+        "\n\n## Групповой чат"
+        "\nЭто ГРУППОВОЙ ЧАТ. Другие персонажи: {others}."
+        "\nОтвечай ТОЛЬКО как {name} — не пиши за других персонажей и не продолжай их текст."
+        "\nСообщения других персонажей помечены [Имя]: — это НЕ твои реплики."
+        "\nОтвет СТРОГО 1-2 абзаца, НЕ длиннее. Реагируй на сказанное другими."
+        "\nПиши ТОЛЬКО на русском языке. Не вставляй английские слова."
+    ),
+    "en": (
+        "\n\n## Group Chat"
+        "\nThis is a GROUP CHAT. Other characters present: {others}."
+        "\nRespond ONLY as {name} — do not write for other characters or continue their text."
+        "\nMessages from other characters are marked [Name]: — these are NOT your lines."
+        "\nSTRICTLY 1-2 paragraphs, NO longer. React to what others said."
+    ),
+    "es": (
+        "\n\n## Chat Grupal"
+        "\nEste es un CHAT GRUPAL. Otros personajes: {others}."
+        "\nResponde SOLO como {name} — no escribas por otros personajes ni continúes su texto."
+        "\nLos mensajes de otros personajes están marcados [Nombre]: — NO son tus líneas."
+        "\nESTRICTAMENTE 1-2 párrafos, NO más. Reacciona a lo dicho por otros."
+    ),
+    "fr": (
+        "\n\n## Chat de Groupe"
+        "\nCeci est un CHAT DE GROUPE. Autres personnages : {others}."
+        "\nRéponds UNIQUEMENT en tant que {name} — n'écris pas pour d'autres personnages."
+        "\nLes messages des autres personnages sont marqués [Nom] : — ce ne sont PAS tes répliques."
+        "\nSTRICTEMENT 1-2 paragraphes, PAS plus. Réagis à ce que les autres ont dit."
+    ),
+    "de": (
+        "\n\n## Gruppenchat"
+        "\nDies ist ein GRUPPENCHAT. Andere Charaktere: {others}."
+        "\nAntworte NUR als {name} — schreibe nicht für andere Charaktere."
+        "\nNachrichten anderer Charaktere sind mit [Name]: markiert — das sind NICHT deine Zeilen."
+        "\nSTRIKT 1-2 Absätze, NICHT länger. Reagiere auf das Gesagte."
+    ),
+    "pt": (
+        "\n\n## Chat em Grupo"
+        "\nEste é um CHAT EM GRUPO. Outros personagens: {others}."
+        "\nResponda APENAS como {name} — não escreva por outros personagens."
+        "\nMensagens de outros personagens são marcadas [Nome]: — NÃO são suas falas."
+        "\nESTRITAMENTE 1-2 parágrafos, NÃO mais. Reaja ao que os outros disseram."
+    ),
+    "it": (
+        "\n\n## Chat di Gruppo"
+        "\nQuesta è una CHAT DI GRUPPO. Altri personaggi: {others}."
+        "\nRispondi SOLO come {name} — non scrivere per altri personaggi."
+        "\nI messaggi degli altri personaggi sono contrassegnati [Nome]: — NON sono le tue battute."
+        "\nRIGOROSAMENTE 1-2 paragrafi, NON di più. Reagisci a ciò che gli altri hanno detto."
+    ),
+}
 
 
 class CreateGroupChatRequest(BaseModel):
@@ -34,6 +105,7 @@ class CreateGroupChatRequest(BaseModel):
 class SendGroupMessageRequest(BaseModel):
     content: str = Field(max_length=20000)
     language: str | None = Field(default=None, max_length=10)
+    reactive: bool | None = None  # None = not settings.group_chat_pipelined
 
 
 def _member_to_dict(m: GroupChatMember) -> dict:
@@ -172,6 +244,110 @@ async def delete_group_chat(
     await db.commit()
 
 
+def _char_dict(character: Character) -> dict:
+    return {
+        "id": character.id,
+        "updated_at": character.updated_at,
+        "name": character.name,
+        "personality": character.personality,
+        "scenario": character.scenario,
+        "greeting_message": character.greeting_message,
+        "example_dialogues": character.example_dialogues,
+        "content_rating": character.content_rating.value if character.content_rating else "sfw",
+        "system_prompt_suffix": character.system_prompt_suffix,
+        "response_length": getattr(character, 'response_length', None) or "medium",
+        "appearance": getattr(character, 'appearance', None),
+        "structured_tags": [t for t in (getattr(character, 'structured_tags', '') or '').split(",") if t],
+    }
+
+
+async def _member_prefix(gc_id: str, character: Character, other_names: list[str], language: str) -> str:
+    """System prompt + group instructions for one member, cached across turns."""
+    await admin_settings.ensure_fresh()
+    key = (
+        gc_id, character.id, str(character.updated_at), language,
+        tuple(other_names), admin_settings.prompt_overrides()[1],
+    )
+    hit = _prefix_cache.get(key)
+    if hit is not None:
+        _prefix_cache.move_to_end(key)
+        return hit
+
+    lang_key = language if language in _GROUP_CONTEXT_TEMPLATES else "en"
+    group_context = _GROUP_CONTEXT_TEMPLATES[lang_key].format(
+        others=", ".join(other_names), name=character.name,
+    )
+    prefix = await build_system_prompt(_char_dict(character), language=language, engine=db_engine) + group_context
+    _prefix_cache[key] = prefix
+    if len(_prefix_cache) > _PREFIX_CACHE_MAX:
+        _prefix_cache.popitem(last=False)
+    return prefix
+
+
+def _member_messages(
+    prefix: str, character: Character, context: list[tuple], names: dict[str, str], gc_id: str, language: str,
+) -> list[LLMMessage]:
+    """Conversation for one member. context: (role, character_id, content) oldest first.
+
+    The member's own messages are assistant turns; other characters' are user
+    turns prefixed with [Name].
+    """
+    llm_msgs = [LLMMessage(role="system", content=prefix)]
+    last_own = ""
+    for role, char_id, content in context:
+        if role == "user":
+            llm_msgs.append(LLMMessage(role="user", content=content))
+        elif char_id == character.id:
+            llm_msgs.append(LLMMessage(role="assistant", content=content))
+            last_own = content or ""
+        else:
+            other = names.get(char_id)
+            llm_msgs.append(LLMMessage(role="user", content=f"[{other}]: {content}" if other else content))
+
+    # Post-history reminder (closest to generation = strongest effect), with the last own reply for anti-echo
+    reminder = _get_post_history(language, str(gc_id), len(llm_msgs), last_assistant_text=last_own).format(name=character.name)
+    llm_msgs.append(LLMMessage(role="system", content=reminder))
+    return llm_msgs
+
+
+async def _generate(llm_msgs: list[LLMMessage], config: LLMConfig, auto_order: list[str], out: asyncio.Queue):
+    """Generate one member's reply into out: ("token", chunk)..., then ("done", text, model) or ("error",)."""
+    for pname in auto_order:
+        try:
+            prov = get_provider(pname)
+        except ValueError:
+            continue
+        full_response: list[str] = []
+        try:
+            async for chunk in prov.generate_stream(llm_msgs, config):
+                full_response.append(chunk)
+                out.put_nowait(("token", chunk))
+        except Exception:
+            continue
+        out.put_nowait(("done", "".join(full_response), f"{pname}:{getattr(prov, 'last_model_used', '') or ''}"))
+        return
+    out.put_nowait(("error",))
+
+
+async def _drain(queue: asyncio.Queue):
+    """Yield a member's queue items up to done/error; tokens already buffered go out joined as one."""
+    parts: list[str] = []
+    while True:
+        if queue.empty():
+            if parts:
+                yield ("token", "".join(parts))
+                parts = []
+            item = await queue.get()
+        else:
+            item = queue.get_nowait()
+        if item[0] != "token":
+            if parts:
+                yield ("token", "".join(parts))
+            yield item
+            return
+        parts.append(item[1])
+
+
 @router.post("/{chat_id}/message")
 async def send_group_message(
     chat_id: str,
@@ -179,21 +355,34 @@ async def send_group_message(
     user=Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    """User sends a message, then each character responds in sequence via SSE."""
+    """User sends a message, then each character responds in turn via SSE."""
     await check_daily_limit(user["id"], user.get("role", "user"))
 
+    # Chat + members + characters in one round trip
     result = await db.execute(
         select(GroupChat)
-        .options(selectinload(GroupChat.members).selectinload(GroupChatMember.character))
+        .options(joinedload(GroupChat.members).joinedload(GroupChatMember.character))
         .where(GroupChat.id == chat_id, GroupChat.user_id == user["id"])
     )
-    gc = result.scalar_one_or_none()
+    gc = result.unique().scalar_one_or_none()
     if not gc:
         raise HTTPException(status_code=404, detail="Group chat not found")
 
     language = body.language or "ru"
 
-    # Save user message
+    # Get recent context messages (the new user message is appended below)
+    ctx_result = await db.execute(
+        select(GroupMessage)
+        .where(GroupMessage.group_chat_id == chat_id)
+        .order_by(GroupMessage.created_at.desc())
+        .limit(MAX_CONTEXT_MESSAGES - 1)
+    )
+    context = [
+        (m.role.value if hasattr(m.role, 'value') else m.role, m.character_id, m.content)
+        for m in reversed(ctx_result.scalars().all())
+    ]
+
+    # Save user message (id/created_at are client-side defaults, no refresh needed)
     user_msg = GroupMessage(
         group_chat_id=chat_id,
         character_id=None,
@@ -203,191 +392,67 @@ async def send_group_message(
     db.add(user_msg)
     gc.updated_at = datetime.utcnow()
     await db.commit()
-    await db.refresh(user_msg)
-
-    # Sort members by position
-    members = sorted(gc.members, key=lambda m: m.position)
+    context.append(("user", None, body.content))
 
-    # Get recent context messages
-    ctx_result = await db.execute(
-        select(GroupMessage)
-        .where(GroupMessage.group_chat_id == chat_id)
-        .order_by(GroupMessage.created_at.desc())
-        .limit(MAX_CONTEXT_MESSAGES)
-    )
-    context_msgs = list(ctx_result.scalars().all())
-    context_msgs.reverse()
+    # Speakers in position order, each member's prompt prepared before streaming starts
+    speakers = [m.character for m in sorted(gc.members, key=lambda m: m.position) if m.character]
+    names = {c.id: c.name for c in speakers}
+    prefixes = await asyncio.gather(*(
+        _member_prefix(chat_id, c, [o.name for o in speakers if o.id != c.id], language) for c in speakers
+    ))
 
     # Auto fallback provider order
     auto_order = [p.strip() for p in settings.auto_provider_order.split(",") if p.strip()]
+    config = LLMConfig(model="", temperature=0.8, max_tokens=600)
+    reactive = body.reactive if body.reactive is not None else not settings.group_chat_pipelined
 
     async def event_stream():
         # First, send user message confirmation
         yield f"data: {json.dumps({'type': 'user_saved', 'message_id': user_msg.id})}\n\n"
 
-        for member in members:
-            character = member.character
-            if not character:
-                continue
-
-            # Build system prompt for this character
-            char_dict = {
-                "name": character.name,
-                "personality": character.personality,
-                "scenario": character.scenario,
-                "greeting_message": character.greeting_message,
-                "example_dialogues": character.example_dialogues,
-                "content_rating": character.content_rating.value if character.content_rating else "sfw",
-                "system_prompt_suffix": character.system_prompt_suffix,
-                "response_length": getattr(character, 'response_length', None) or "medium",
-                "appearance": getattr(character, 'appearance', None),
-                "structured_tags": [t for t in (getattr(character, 'structured_tags', '') or '').split(",") if t],
-            }
-
-            # Build group-aware system prompt addition
-            other_names = [m.character.name for m in members if m.character and m.character.id != character.id]
-            _group_context_templates = {
-                "ru": (
-                    "\n\n## Групповой чат"
-                    "\nЭто ГРУППОВОЙ ЧАТ. Другие персонажи: {others}."
-                    "\nОтвечай ТОЛЬКО как {name} — не пиши за других персонажей и не продолжай их текст."
-                    "\nСообщения других персонажей помечены [Имя]: — это НЕ твои реплики."
-                    "\nОтвет СТРОГО 1-2 абзаца, НЕ длиннее. Реагируй на сказанное другими."
-                    "\nПиши ТОЛЬКО на русском языке. Не вставляй английские слова."
-                ),
-                "en": (
-                    "\n\n## Group Chat"
-                    "\nThis is a GROUP CHAT. Other characters present: {others}."
-                    "\nRespond ONLY as {name} — do not write for other characters or continue their text."
-                    "\nMessages from other characters are marked [Name]: — these are NOT your lines."
-                    "\nSTRICTLY 1-2 paragraphs, NO longer. React to what others said."
-                ),
-                "es": (
-                    "\n\n## Chat Grupal"
-                    "\nEste es un CHAT GRUPAL. Otros personajes: {others}."
-                    "\nResponde SOLO como {name} — no escribas por otros personajes ni continúes su texto."
-                    "\nLos mensajes de otros personajes están marcados [Nombre]: — NO son tus líneas."
-                    "\nESTRICTAMENTE 1-2 párrafos, NO más. Reacciona a lo dicho por otros."
-                ),
-                "fr": (
-                    "\n\n## Chat de Groupe"
-                    "\nCeci est un CHAT DE GROUPE. Autres personnages : {others}."
-                    "\nRéponds UNIQUEMENT en tant que {name} — n'écris pas pour d'autres personnages."
-                    "\nLes messages des autres personnages sont marqués [Nom] : — ce ne sont PAS tes répliques."
-                    "\nSTRICTEMENT 1-2 paragraphes, PAS plus. Réagis à ce que les autres ont dit."
-                ),
-                "de": (
-                    "\n\n## Gruppenchat"
-                    "\nDies ist ein GRUPPENCHAT. Andere Charaktere: {others}."
-                    "\nAntworte NUR als {name} — schreibe nicht für andere Charaktere."
-                    "\nNachrichten anderer Charaktere sind mit [Name]: markiert — das sind NICHT deine Zeilen."
-                    "\nSTRIKT 1-2 Absätze, NICHT länger. Reagiere auf das Gesagte."
-                ),
-                "pt": (
-                    "\n\n## Chat em Grupo"
-                    "\nEste é um CHAT EM GRUPO. Outros personagens: {others}."
-                    "\nResponda APENAS como {name} — não escreva por outros personagens."
-                    "\nMensagens de outros personagens são marcadas [Nome]: — NÃO são suas falas."
-                    "\nESTRITAMENTE 1-2 parágrafos, NÃO mais. Reaja ao que os outros disseram."
-                ),
-                "it": (
-                    "\n\n## Chat di Gruppo"
-                    "\nQuesta è una CHAT DI GRUPPO. Altri personaggi: {others}."
-                    "\nRispondi SOLO come {name} — non scrivere per altri personaggi."
-                    "\nI messaggi degli altri personaggi sono contrassegnati [Nome]: — NON sono le tue battute."
-                    "\nRIGOROSAMENTE 1-2 paragrafi, NON di più. Reagisci a ciò che gli altri hanno detto."
-                ),
-            }
-            lang_key = language if language in _group_context_templates else "en"
-            group_context = _group_context_templates[lang_key].format(
-                others=", ".join(other_names), name=character.name,
-            )
-
-            system_prompt = await build_system_prompt(
-                char_dict, language=language, engine=db_engine,
-            )
-            system_prompt += group_context
-
-            # Build conversation messages for this character
-            # Key: current character's messages = assistant, other characters = user with [Name] prefix
-            llm_msgs = [LLMMessage(role="system", content=system_prompt)]
-            for msg in context_msgs:
-                role_val = msg.role.value if hasattr(msg.role, 'value') else msg.role
-                if role_val == "user":
-                    llm_msgs.append(LLMMessage(role="user", content=msg.content))
-                elif getattr(msg, 'character_id', None) == character.id:
-                    # This character's own previous messages
-                    llm_msgs.append(LLMMessage(role="assistant", content=msg.content))
-                else:
-                    # Other character's message — present as user with name prefix
-                    other_char_name = None
-                    for m in members:
-                        if m.character and m.character.id == getattr(msg, 'character_id', None):
-                            other_char_name = m.character.name
-                            break
-                    prefix = f"[{other_char_name}]: " if other_char_name else ""
-                    llm_msgs.append(LLMMessage(role="user", content=f"{prefix}{msg.content}"))
-
-            # Post-history reminder (closest to generation = strongest effect)
-            # Find last assistant text from this character for anti-echo
-            _last_asst = ""
-            for _cm in reversed(context_msgs):
-                _r = _cm.role.value if hasattr(_cm.role, 'value') else _cm.role
-                if _r == "assistant" and getattr(_cm, 'character_id', None) == character.id:
-                    _last_asst = _cm.content or ""
-                    break
-            reminder = _get_post_history(language, str(gc.id), len(llm_msgs), last_assistant_text=_last_asst).format(name=character.name)
-            llm_msgs.append(LLMMessage(role="system", content=reminder))
-
-            config = LLMConfig(model="", temperature=0.8, max_tokens=600)
-
-            # Signal which character is about to respond
-            yield f"data: {json.dumps({'type': 'character_start', 'character_id': character.id, 'character_name': character.name})}\n\n"
-
-            # Try providers
-            success = False
-            full_response: list[str] = []
-            actual_model = ""
-
-            for pname in auto_order:
-                try:
-                    prov = get_provider(pname)
-                except ValueError:
-                    continue
-                try:
-                    async for chunk in prov.generate_stream(llm_msgs, config):
-                        full_response.append(chunk)
-                        yield f"data: {json.dumps({'type': 'token', 'content': chunk, 'character_id': character.id})}\n\n"
-
-                    complete_text = "".join(full_response)
-                    actual_model = f"{pname}:{getattr(prov, 'last_model_used', '') or ''}"
-
-                    # Save assistant message
-                    async with db_engine.begin() as conn:
-                        from sqlalchemy import text as sa_text
-                        import uuid
+        queues = [asyncio.Queue() for _ in speakers]
+        tasks: dict[int, asyncio.Task] = {}
+
+        def start(i: int):
+            # A speaker sees every reply finished before its generation starts
+            if i < len(speakers) and i not in tasks:
+                llm_msgs = _member_messages(prefixes[i], speakers[i], context, names, chat_id, language)
+                tasks[i] = asyncio.create_task(_generate(llm_msgs, config, auto_order, queues[i]))
+
+        try:
+            for i, character in enumerate(speakers):
+                start(i)
+                if not reactive:
+                    for ahead in range(i + 1, i + 1 + PIPELINE_AHEAD):
+                        start(ahead)
+
+                # Signal which character is about to respond
+                yield f"data: {json.dumps({'type': 'character_start', 'character_id': character.id, 'character_name': character.name})}\n\n"
+
+                async for item in _drain(queues[i]):
+                    if item[0] == "token":
+                        yield f"data: {json.dumps({'type': 'token', 'content': item[1], 'character_id': character.id})}\n\n"
+                    elif item[0] == "done":
+                        _, complete_text, actual_model = item
+                        # Saved in speaker order, so created_at follows the turn order
                         msg_id = str(uuid.uuid4())
-                        await conn.execute(sa_text(
-                            "INSERT INTO group_messages (id, group_chat_id, character_id, role, content, model_used, created_at) "
-                            "VALUES (:id, :gcid, :cid, 'assistant', :content, :model, NOW())"
-                        ), {"id": msg_id, "gcid": chat_id, "cid": character.id, "content": complete_text, "model": actual_model})
-
-                    yield f"data: {json.dumps({'type': 'character_done', 'character_id': character.id, 'message_id': msg_id, 'model_used': actual_model})}\n\n"
-                    success = True
-
-                    # Add to context for next character
-                    context_msgs.append(type('Msg', (), {
-                        'role': MessageRole.assistant, 'content': complete_text,
-                        'character_id': character.id, 'id': msg_id,
-                    })())
-                    break
-                except Exception:
-                    full_response.clear()
-                    continue
-
-            if not success:
-                yield f"data: {json.dumps({'type': 'character_error', 'character_id': character.id, 'content': 'Generation failed'})}\n\n"
-
-        yield f"data: {json.dumps({'type': 'all_done'})}\n\n"
+                        async with db_engine.begin() as conn:
+                            await conn.execute(text(
+                                "INSERT INTO group_messages (id, group_chat_id, character_id, role, content, model_used, created_at) "
+                                "VALUES (:id, :gcid, :cid, 'assistant', :content, :model, :created_at)"
+                            ), {"id": msg_id, "gcid": chat_id, "cid": character.id, "content": complete_text,
+                                "model": actual_model, "created_at": datetime.utcnow()})
+
+                        yield f"data: {json.dumps({'type': 'character_done', 'character_id': character.id, 'message_id': msg_id, 'model_used': actual_model})}\n\n"
+                        # Add to context for the speakers not started yet
+                        context.append(("assistant", character.id, complete_text))
+                    else:
+                        yield f"data: {json.dumps({'type': 'character_error', 'character_id': character.id, 'content': 'Generation failed'})}\n\n"
+
+            yield f"data: {json.dumps({'type': 'all_done'})}\n\n"
+        finally:
+            # Client gone or turn over: stop speculative generations
+            for task in tasks.values():
+                task.cancel()
 
     return StreamingResponse(event_stream(), media_type="text/event-stream")
@@ -1,34 +1,54 @@
+import time
 from typing import AsyncIterator
-import httpx
 import anthropic
-from app.llm.base import BaseLLMProvider, LLMMessage, LLMConfig, LLMResult
+from app.llm.base import BaseLLMProvider, LLMMessage, LLMConfig, LLMResult, report_usage
+from app.llm import cache_stats, http_pool
 
 DEFAULT_MODEL = "claude-sonnet-4-6"
+MAX_CACHE_BREAKPOINTS = 4  # Anthropic rejects requests with more cache_control blocks
 
 
 class AnthropicProvider(BaseLLMProvider):
     def __init__(self, api_key: str, proxy_url: str | None = None):
-        kwargs: dict = {"api_key": api_key}
-        if proxy_url:
-            kwargs["http_client"] = httpx.AsyncClient(proxy=proxy_url)
-        self.client = anthropic.AsyncAnthropic(**kwargs)
+        self.client = anthropic.AsyncAnthropic(
+            api_key=api_key,
+            http_client=http_pool.get_client("https://api.anthropic.com", proxy_url, sdk=anthropic),
+        )
 
     @staticmethod
     def _prepare(messages: list[LLMMessage]) -> tuple[list[dict], list[dict]]:
-        """Split messages into system content blocks (with cache_control) and API messages."""
+        """Split messages into system content blocks and API messages.
+
+        cache_control goes only on messages flagged cache=True (the stable
+        character prefix), not on volatile per-turn system messages.
+        """
         system_blocks: list[dict] = []
         api_messages: list[dict] = []
+        breakpoints = 0
         for msg in messages:
             if msg.role == "system":
-                system_blocks.append({
-                    "type": "text",
-                    "text": msg.content,
-                    "cache_control": {"type": "ephemeral"},
-                })
+                block = {"type": "text", "text": msg.content}
+                if msg.cache and breakpoints < MAX_CACHE_BREAKPOINTS:
+                    block["cache_control"] = {"type": "ephemeral"}
+                    breakpoints += 1
+                system_blocks.append(block)
             else:
                 api_messages.append({"role": msg.role, "content": msg.content})
         return system_blocks, api_messages
 
+    @staticmethod
+    def _usage(usage, model: str, content: str = "") -> LLMResult:
+        # Anthropic's input_tokens excludes cache reads/writes — fold them back in
+        cache_read = getattr(usage, "cache_read_input_tokens", 0) or 0
+        cache_write = getattr(usage, "cache_creation_input_tokens", 0) or 0
+        return LLMResult(
+            content=content,
+            prompt_tokens=(getattr(usage, "input_tokens", 0) or 0) + cache_read + cache_write,
+            completion_tokens=getattr(usage, "output_tokens", 0) or 0,
+            model=model,
+            cached_tokens=cache_read,
+        )
+
     async def generate_stream(
         self,
         messages: list[LLMMessage],
@@ -51,9 +71,17 @@ class AnthropicProvider(BaseLLMProvider):
         else:
             kwargs["temperature"] = config.temperature
 
+        start = time.monotonic()
+        ttft = None
         async with self.client.messages.stream(**kwargs) as stream:
             async for text in stream.text_stream:
+                if ttft is None:
+                    ttft = time.monotonic() - start
                 yield text
+            final = await stream.get_final_message()
+        usage_result = self._usage(getattr(final, "usage", None), model)
+        report_usage(config, usage_result)
+        cache_stats.record("claude", usage_result, ttft)
 
     async def generate(
         self,
@@ -86,10 +114,6 @@ class AnthropicProvider(BaseLLMProvider):
             kwargs["temperature"] = config.temperature
 
         response = await self.client.messages.create(**kwargs)
-        usage = getattr(response, "usage", None)
-        return LLMResult(
-            content=response.content[0].text,
-            prompt_tokens=getattr(usage, "input_tokens", 0) or 0,
-            completion_tokens=getattr(usage, "output_tokens", 0) or 0,
-            model=config.model or DEFAULT_MODEL,
-        )
+        result = self._usage(getattr(response, "usage", None), model, response.content[0].text)
+        cache_stats.record("claude", result)
+        return result
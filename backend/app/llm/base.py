@@ -1,3 +1,4 @@
+import contextvars
 from abc import ABC, abstractmethod
 from typing import AsyncIterator
 from dataclasses import dataclass
@@ -7,6 +8,7 @@ from dataclasses import dataclass
 class LLMMessage:
     role: str  # "system" | "user" | "assistant"
     content: str
+    cache: bool = False  # ends a stable prefix — providers may place a prompt-cache breakpoint here
 
 
 @dataclass
@@ -29,6 +31,38 @@ class LLMResult:
     prompt_tokens: int = 0
     completion_tokens: int = 0
     model: str = ""
+    cached_tokens: int = 0  # prompt tokens served from the provider's prefix cache
+
+
+# Usage of completed streams for the code consuming them (providers are shared singletons)
+_stream_usage: contextvars.ContextVar[list[tuple["LLMConfig", LLMResult]] | None] = contextvars.ContextVar(
+    "llm_stream_usage", default=None,
+)
+
+
+def capture_usage() -> None:
+    """Collect the usage of provider streams consumed from here on (this task and tasks it starts).
+
+    generate_stream can only yield text, so providers that get token usage
+    from the API hand it over with report_usage() when a stream completes;
+    the caller reads it back with captured_usage(config) for that call.
+    """
+    _stream_usage.set([])
+
+
+def report_usage(config: "LLMConfig", usage: LLMResult) -> None:
+    """Hand a completed stream's usage to the caller that called capture_usage(), if any."""
+    sink = _stream_usage.get()
+    if sink is not None:
+        sink.append((config, usage))
+
+
+def captured_usage(config: "LLMConfig") -> LLMResult | None:
+    """Usage reported for the stream started with this config (each call gets its own LLMConfig)."""
+    for reported, usage in reversed(_stream_usage.get() or ()):
+        if reported is config:
+            return usage
+    return None
 
 
 class BaseLLMProvider(ABC):
@@ -0,0 +1,62 @@
+"""Per-provider prompt-cache statistics (in-memory, per worker).
+
+Providers that report cached prompt tokens (Anthropic, OpenAI, DeepSeek,
+OpenRouter) record every completed request here, together with time to
+first token. Admin provider-status shows hit rate and TTFT for cache hits
+vs misses, which is how we measure what the cache-aware prompt layout buys.
+"""
+
+from app.llm.base import LLMResult
+
+_stats: dict[str, dict] = {}
+
+
+def record(provider: str, usage: LLMResult, ttft: float | None = None) -> None:
+    """Record usage of one completed request. ttft in seconds (streaming only)."""
+    s = _stats.get(provider)
+    if s is None:
+        s = _stats[provider] = {
+            "requests": 0, "hits": 0, "prompt_tokens": 0, "cached_tokens": 0,
+            "ttft_hit_sum": 0.0, "ttft_hit_n": 0, "ttft_miss_sum": 0.0, "ttft_miss_n": 0,
+        }
+    hit = usage.cached_tokens > 0
+    s["requests"] += 1
+    s["hits"] += hit
+    s["prompt_tokens"] += usage.prompt_tokens
+    s["cached_tokens"] += usage.cached_tokens
+    if ttft is not None:
+        if hit:
+            s["ttft_hit_sum"] += ttft
+            s["ttft_hit_n"] += 1
+        else:
+            s["ttft_miss_sum"] += ttft
+            s["ttft_miss_n"] += 1
+
+
+def get_stats() -> dict[str, dict]:
+    """Return {provider: {requests, hit_rate, cached_token_ratio, ttft_hit_ms, ttft_miss_ms}}."""
+    out = {}
+    for provider, s in _stats.items():
+        out[provider] = {
+            "requests": s["requests"],
+            "hit_rate": round(s["hits"] / s["requests"], 3) if s["requests"] else 0.0,
+            "cached_token_ratio": round(s["cached_tokens"] / s["prompt_tokens"], 3) if s["prompt_tokens"] else 0.0,
+            "ttft_hit_ms": round(s["ttft_hit_sum"] / s["ttft_hit_n"] * 1000) if s["ttft_hit_n"] else None,
+            "ttft_miss_ms": round(s["ttft_miss_sum"] / s["ttft_miss_n"] * 1000) if s["ttft_miss_n"] else None,
+        }
+    return out
+
+
+def openai_cached_tokens(usage) -> int:
+    """Cached prompt tokens from an OpenAI-compatible usage object.
+
+    OpenAI/OpenRouter report usage.prompt_tokens_details.cached_tokens,
+    DeepSeek reports usage.prompt_cache_hit_tokens.
+    """
+    if usage is None:
+        return 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) if details is not None else None
+    if not cached:
+        cached = getattr(usage, "prompt_cache_hit_tokens", None)
+    return cached or 0
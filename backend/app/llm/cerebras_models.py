@@ -24,6 +24,15 @@ EXCLUDE_IDS = {"llama3.1-8b"}
 # Min quality to include in auto-fallback
 MIN_QUALITY_FOR_FALLBACK = 6
 
+# Context windows on our Cerebras plan (tokens) — the API doesn't report them,
+# and free-tier caps are below the models' native windows
+CONTEXT_LENGTHS: dict[str, int] = {
+    "qwen-3-235b-a22b-instruct-2507": 65536,
+    "zai-glm-4.7": 65536,
+    "gpt-oss-120b": 65536,
+}
+DEFAULT_CONTEXT_LENGTH = 8192
+
 # Cache
 _cached_models: list[dict] = []
 _cache_time: float = 0
@@ -40,7 +49,10 @@ FALLBACK_MODELS = [
 def _build_model_entry(model_id: str, owned_by: str = "") -> dict:
     quality = QUALITY_SCORES.get(model_id, 5)
     name = model_id.replace("-", " ").title()
-    return {"id": model_id, "name": name, "quality": quality, "nsfw": model_id not in NSFW_BLOCKED, "note": owned_by}
+    return {
+        "id": model_id, "name": name, "quality": quality, "nsfw": model_id not in NSFW_BLOCKED, "note": owned_by,
+        "context": CONTEXT_LENGTHS.get(model_id, DEFAULT_CONTEXT_LENGTH),
+    }
 
 
 async def refresh_models(client) -> list[dict]:
@@ -85,5 +97,9 @@ def find_model_by_id(model_id: str) -> dict | None:
     return None
 
 
+def get_context_length(model_id: str) -> int:
+    return CONTEXT_LENGTHS.get(model_id, DEFAULT_CONTEXT_LENGTH)
+
+
 def is_cache_stale() -> bool:
     return not _cached_models or (time.monotonic() - _cache_time) > CACHE_TTL
@@ -1,8 +1,10 @@
 import asyncio
+import time
 from typing import AsyncIterator
-import httpx
+import openai
 from openai import AsyncOpenAI
-from app.llm.base import BaseLLMProvider, LLMMessage, LLMConfig, LLMResult
+from app.llm.base import BaseLLMProvider, LLMMessage, LLMConfig, LLMResult, report_usage
+from app.llm import cache_stats, http_pool
 
 TIMEOUT = 60  # DeepSeek-reasoner can be slow
 
@@ -14,8 +16,7 @@ class DeepSeekProvider(BaseLLMProvider):
             "base_url": "https://api.deepseek.com/v1",
             "timeout": TIMEOUT,
         }
-        if proxy_url:
-            kwargs["http_client"] = httpx.AsyncClient(proxy=proxy_url, timeout=TIMEOUT)
+        kwargs["http_client"] = http_pool.get_client("https://api.deepseek.com", proxy_url, sdk=openai)
         self.client = AsyncOpenAI(**kwargs)
 
     async def generate_stream(
@@ -35,13 +36,31 @@ class DeepSeekProvider(BaseLLMProvider):
             frequency_penalty=config.frequency_penalty,
             presence_penalty=config.presence_penalty,
             stream=True,
+            stream_options={"include_usage": True},
         )
+        start = time.monotonic()
+        ttft = None
+        usage = None
         async for chunk in stream:
+            if chunk.usage:
+                usage = chunk.usage
             delta = chunk.choices[0].delta if chunk.choices else None
             if delta:
                 text = delta.content or getattr(delta, "reasoning_content", None)
                 if text:
+                    if ttft is None:
+                        ttft = time.monotonic() - start
                     yield text
+        if usage is not None:
+            usage_result = LLMResult(
+                content="",
+                prompt_tokens=usage.prompt_tokens or 0,
+                completion_tokens=usage.completion_tokens or 0,
+                model=model,
+                cached_tokens=cache_stats.openai_cached_tokens(usage),
+            )
+            report_usage(config, usage_result)
+            cache_stats.record("deepseek", usage_result, ttft)
 
     async def generate(
         self,
@@ -77,9 +96,12 @@ class DeepSeekProvider(BaseLLMProvider):
         if not content:
             raise RuntimeError("DeepSeek returned empty response")
         usage = getattr(response, "usage", None)
-        return LLMResult(
+        result = LLMResult(
             content=content,
             prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
             completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
             model=config.model or "deepseek-chat",
+            cached_tokens=cache_stats.openai_cached_tokens(usage),
         )
+        cache_stats.record("deepseek", result)
+        return result
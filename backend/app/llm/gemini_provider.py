@@ -2,6 +2,7 @@ from typing import AsyncIterator
 from google import genai
 from google.genai import types
 from app.llm.base import BaseLLMProvider, LLMMessage, LLMConfig, LLMResult
+from app.llm import http_pool
 
 
 _SAFETY_OFF = [
@@ -14,7 +15,13 @@ _SAFETY_OFF = [
 
 class GeminiProvider(BaseLLMProvider):
     def __init__(self, api_key: str, proxy_url: str | None = None):
-        self.client = genai.Client(api_key=api_key)
+        try:
+            http_options = types.HttpOptions(
+                httpx_async_client=http_pool.get_client("https://generativelanguage.googleapis.com", proxy_url),
+            )
+        except Exception:
+            http_options = None  # older google-genai without shared-client support
+        self.client = genai.Client(api_key=api_key, http_options=http_options)
 
     async def generate_stream(
         self,
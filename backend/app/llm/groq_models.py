@@ -28,6 +28,9 @@ EXCLUDE_IDS = {"groq/compound", "groq/compound-mini", "openai/gpt-oss-safeguard-
 # Min quality to include in auto-fallback (skip 8B and similar tiny models)
 MIN_QUALITY_FOR_FALLBACK = 6
 
+# Context window when the API doesn't report one (tokens)
+DEFAULT_CONTEXT_LENGTH = 8192
+
 # Cache
 _cached_models: list[dict] = []
 _cache_time: float = 0
@@ -35,10 +38,10 @@ CACHE_TTL = 3600  # 1 hour
 
 # Fallback if API unavailable
 FALLBACK_MODELS = [
-    {"id": "llama-3.3-70b-versatile", "name": "Llama 3.3 70B", "quality": 9, "nsfw": True, "note": ""},
-    {"id": "moonshotai/kimi-k2-instruct-0905", "name": "Kimi K2 0905", "quality": 8, "nsfw": True, "note": ""},
-    {"id": "openai/gpt-oss-120b", "name": "GPT-OSS 120B", "quality": 6, "nsfw": False, "note": ""},
-    {"id": "openai/gpt-oss-20b", "name": "GPT-OSS 20B", "quality": 5, "nsfw": False, "note": ""},
+    {"id": "llama-3.3-70b-versatile", "name": "Llama 3.3 70B", "quality": 9, "nsfw": True, "note": "", "context": 131072},
+    {"id": "moonshotai/kimi-k2-instruct-0905", "name": "Kimi K2 0905", "quality": 8, "nsfw": True, "note": "", "context": 262144},
+    {"id": "openai/gpt-oss-120b", "name": "GPT-OSS 120B", "quality": 6, "nsfw": False, "note": "", "context": 131072},
+    {"id": "openai/gpt-oss-20b", "name": "GPT-OSS 20B", "quality": 5, "nsfw": False, "note": "", "context": 131072},
 ]
 
 
@@ -50,12 +53,15 @@ def _should_include(model_id: str) -> bool:
     return model_id not in EXCLUDE_IDS
 
 
-def _build_model_entry(model_id: str, owned_by: str = "") -> dict:
+def _build_model_entry(model_id: str, owned_by: str = "", context: int | None = None) -> dict:
     quality = QUALITY_SCORES.get(model_id, 5)
     # Pretty name: "openai/gpt-oss-120b" → "GPT-OSS 120B"
     short = model_id.split("/")[-1] if "/" in model_id else model_id
     name = short.replace("-", " ").title()
-    return {"id": model_id, "name": name, "quality": quality, "nsfw": model_id not in NSFW_BLOCKED, "note": owned_by}
+    return {
+        "id": model_id, "name": name, "quality": quality, "nsfw": model_id not in NSFW_BLOCKED, "note": owned_by,
+        "context": context or DEFAULT_CONTEXT_LENGTH,
+    }
 
 
 async def refresh_models(client) -> list[dict]:
@@ -66,7 +72,7 @@ async def refresh_models(client) -> list[dict]:
         models = []
         for m in response.data:
             if _should_include(m.id):
-                models.append(_build_model_entry(m.id, getattr(m, "owned_by", "")))
+                models.append(_build_model_entry(m.id, getattr(m, "owned_by", ""), getattr(m, "context_window", None)))
         if models:
             models.sort(key=lambda x: x["quality"], reverse=True)
             _cached_models = models
@@ -100,5 +106,10 @@ def find_model_by_id(model_id: str) -> dict | None:
     return None
 
 
+def get_context_length(model_id: str) -> int:
+    m = find_model_by_id(model_id)
+    return m.get("context", DEFAULT_CONTEXT_LENGTH) if m else DEFAULT_CONTEXT_LENGTH
+
+
 def is_cache_stale() -> bool:
     return not _cached_models or (time.monotonic() - _cache_time) > CACHE_TTL
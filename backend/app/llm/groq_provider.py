@@ -1,10 +1,10 @@
 from typing import AsyncIterator
-import httpx
+import openai
 from openai import AsyncOpenAI
 from app.llm.base import BaseLLMProvider, LLMMessage, LLMConfig, LLMResult
 from app.llm.thinking_filter import ThinkingFilter, strip_thinking, has_foreign_chars
 from app.llm.groq_models import get_fallback_models, refresh_models, is_cache_stale
-from app.llm import model_cooldown
+from app.llm import model_cooldown, http_pool
 
 TIMEOUT = 25
 PROVIDER = "groq"
@@ -17,8 +17,7 @@ class GroqProvider(BaseLLMProvider):
             "base_url": "https://api.groq.com/openai/v1",
             "timeout": TIMEOUT,
         }
-        if proxy_url:
-            kwargs["http_client"] = httpx.AsyncClient(proxy=proxy_url, timeout=TIMEOUT)
+        kwargs["http_client"] = http_pool.get_client("https://api.groq.com", proxy_url, sdk=openai)
         self.client = AsyncOpenAI(**kwargs)
 
     async def ensure_models_loaded(self):
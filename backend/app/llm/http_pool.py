@@ -0,0 +1,142 @@
+"""Shared, pooled HTTP clients for LLM providers.
+
+One httpx.AsyncClient per API origin (and proxy), shared by every provider
+and SDK that talks to that host, instead of a fresh client per provider
+instance:
+
+- keep-alive connections with a per-host connection limit (one pool per
+  origin) and a long idle expiry, so a chat request reuses a warm TLS
+  connection instead of paying a handshake in its time-to-first-token;
+- HTTP/2 when the optional `h2` package is installed (httpx[http2]);
+- a small DNS cache in front of the connection backend (new connections
+  only — TLS still verifies against the original hostname);
+- warm_up() opens a connection to every origin at startup, close_all()
+  closes them in lifespan shutdown.
+
+Timeouts stay per provider: the SDKs pass their own timeout per request.
+Recent openai/anthropic SDKs are built on the httpx2 fork and reject plain
+httpx clients, so pass sdk= and the client is built from the httpx flavour
+that SDK actually uses.
+"""
+
+import asyncio
+import logging
+import socket
+import sys
+import time
+from types import ModuleType
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+MAX_CONNECTIONS_PER_HOST = 100
+MAX_KEEPALIVE_PER_HOST = 20
+KEEPALIVE_EXPIRY = 90  # seconds an idle connection is kept open
+DEFAULT_TIMEOUT = (60.0, 10.0)  # read/write/pool, connect
+DNS_TTL = 300  # seconds
+WARM_UP_TIMEOUT = 5
+
+try:
+    import h2  # noqa: F401
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+_clients: dict[tuple[str, str, str | None], httpx.AsyncClient] = {}
+_dns_cache: dict[tuple[str, int], tuple[str, float]] = {}
+
+
+class _CachingResolverBackend:
+    """Resolve hostnames through a TTL cache, then connect via the wrapped httpcore backend."""
+
+    def __init__(self, backend):
+        self._backend = backend
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        address = await _resolve(host, port)
+        try:
+            return await self._backend.connect_tcp(address, port, timeout, local_address, socket_options)
+        except Exception:
+            _dns_cache.pop((host, port), None)  # host may have moved — re-resolve next time
+            raise
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return await self._backend.connect_unix_socket(path, timeout, socket_options)
+
+    async def sleep(self, seconds: float) -> None:
+        await self._backend.sleep(seconds)
+
+
+def _httpx_for(sdk: ModuleType | None) -> ModuleType:
+    """The httpx-compatible package an SDK builds on (httpx or httpx2)."""
+    base = getattr(sdk, "DefaultAsyncHttpxClient", None)
+    if base is None:
+        return httpx
+    for cls in base.__mro__[1:]:
+        if cls.__name__ == "AsyncClient":
+            return sys.modules[cls.__module__.split(".")[0]]
+    return httpx
+
+
+async def _resolve(host: str, port: int) -> str:
+    now = time.monotonic()
+    cached = _dns_cache.get((host, port))
+    if cached and cached[1] > now:
+        return cached[0]
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except OSError:
+        return host  # let the backend raise a proper connect error
+    if not infos:
+        return host
+    address = infos[0][4][0]
+    _dns_cache[(host, port)] = (address, now + DNS_TTL)
+    return address
+
+
+def get_client(origin: str, proxy_url: str | None = None, sdk: ModuleType | None = None):
+    """Shared client for an API origin (e.g. "https://api.groq.com"), usable by the given SDK module."""
+    hx = _httpx_for(sdk)
+    key = (hx.__name__, origin, proxy_url)
+    client = _clients.get(key)
+    if client is None or client.is_closed:
+        transport = hx.AsyncHTTPTransport(
+            http2=HTTP2,
+            proxy=proxy_url,
+            limits=hx.Limits(
+                max_connections=MAX_CONNECTIONS_PER_HOST,
+                max_keepalive_connections=MAX_KEEPALIVE_PER_HOST,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+        )
+        pool = getattr(transport, "_pool", None)
+        backend = getattr(pool, "_network_backend", None)
+        if backend is not None:
+            pool._network_backend = _CachingResolverBackend(backend)
+        timeout = hx.Timeout(DEFAULT_TIMEOUT[0], connect=DEFAULT_TIMEOUT[1])
+        client = hx.AsyncClient(transport=transport, timeout=timeout, follow_redirects=True)
+        _clients[key] = client
+    return client
+
+
+async def warm_up() -> None:
+    """Open one connection per origin (TLS handshake done before the first chat)."""
+    async def _touch(origin: str, client) -> None:
+        try:
+            await client.head(origin, timeout=WARM_UP_TIMEOUT)
+        except Exception as e:
+            logger.debug("Warm-up of %s failed: %s", origin, e)
+
+    await asyncio.gather(*(_touch(origin, c) for (_, origin, _), c in list(_clients.items())))
+
+
+async def close_all() -> None:
+    """Close every pooled client (lifespan shutdown)."""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        try:
+            await client.aclose()
+        except Exception:
+            pass
@@ -1,8 +1,9 @@
 import asyncio
 from typing import AsyncIterator
-import httpx
+import openai
 from openai import AsyncOpenAI
 from app.llm.base import BaseLLMProvider, LLMMessage, LLMConfig, LLMResult
+from app.llm import http_pool
 
 TIMEOUT = 60
 
@@ -16,8 +17,7 @@ class MistralProvider(BaseLLMProvider):
             "base_url": "https://api.mistral.ai/v1",
             "timeout": TIMEOUT,
         }
-        if proxy_url:
-            kwargs["http_client"] = httpx.AsyncClient(proxy=proxy_url, timeout=TIMEOUT)
+        kwargs["http_client"] = http_pool.get_client("https://api.mistral.ai", proxy_url, sdk=openai)
         self.client = AsyncOpenAI(**kwargs)
 
     async def generate_stream(
@@ -0,0 +1,159 @@
+"""Deterministic mock provider for offline load tests (MOCK_LLM).
+
+Streams canned English prose at a configurable time to first token and
+tokens/sec, with injectable failures drawn from a seeded RNG:
+
+- refusal:   a short refusal (send_message's refusal gate rejects it)
+- not_found: an error with status_code 404 ("model not found")
+- payment:   an error with status_code 402 (blacklists the provider, as a
+             real 402 does)
+- timeout:   no first token for timeout_after seconds, then TimeoutError
+
+Configured by a spec string, e.g.
+  MOCK_LLM="ttft=0.6,tps=45,tokens=250,refusal=0.02,not_found=0.01,payment=0,timeout=0.01,timeout_after=25,seed=1"
+Registered as provider "mock" (model "mock" or auto order "mock").
+Never enabled in production — see config.py.
+"""
+
+import asyncio
+import hashlib
+import random
+from typing import AsyncIterator
+
+from app.llm.base import BaseLLMProvider, LLMMessage, LLMConfig, LLMResult
+
+PROVIDER = "mock"
+DEFAULT_MODEL = "mock-1"
+
+DEFAULTS: dict[str, float] = {
+    "ttft": 0.6,  # seconds
+    "jitter": 0.2,  # +-fraction of ttft / per-token delay
+    "tps": 45.0,  # tokens per second
+    "tokens": 250,  # tokens per reply
+    "refusal": 0.0,  # probabilities per call
+    "not_found": 0.0,
+    "payment": 0.0,
+    "timeout": 0.0,
+    "timeout_after": 25.0,  # seconds (real providers: TIMEOUT = 25)
+    "seed": 1,
+}
+
+_SENTENCES = (
+    "The rain hammered the old tavern roof while the fire cracked in the hearth.",
+    "She leaned closer, her voice dropping to a conspiratorial whisper.",
+    "Somewhere beyond the shutters a cart rattled over the cobblestones.",
+    "He turned the silver coin over in his fingers, weighing every word.",
+    "A slow smile spread across her face as she considered the offer.",
+    "The lantern flickered, throwing long shadows across the wooden table.",
+    "For a moment neither of them spoke, and the silence felt heavy.",
+    "Outside, the wind carried the distant sound of bells from the harbor.",
+    "She tapped the map twice, right where the old road met the river.",
+    "His laugh was warm and unguarded, the first honest thing all evening.",
+)
+_REFUSAL = "I'm sorry, but I can't help with that request."
+
+
+class MockAPIError(Exception):
+    """Provider-style HTTP error (str() matches the OpenAI SDK's "Error code: N - ...")."""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"Error code: {status_code} - {message}")
+        self.status_code = status_code
+
+
+def parse_spec(spec: str) -> dict[str, float]:
+    """"key=value,..." -> DEFAULTS with overrides (unknown keys raise ValueError)."""
+    params = dict(DEFAULTS)
+    for part in spec.split(","):
+        if not part.strip() or "=" not in part:
+            continue
+        key, value = (s.strip() for s in part.split("=", 1))
+        if key not in DEFAULTS:
+            raise ValueError(f"Unknown MOCK_LLM parameter '{key}'. Known: {', '.join(DEFAULTS)}")
+        params[key] = float(value)
+    return params
+
+
+class MockProvider(BaseLLMProvider):
+    def __init__(self, spec: str = ""):
+        self.params = parse_spec(spec)
+        self._rng = random.Random(int(self.params["seed"]))
+        self.last_model_used = DEFAULT_MODEL
+        self.calls = 0
+        self.faults: dict[str, int] = {k: 0 for k in ("refusal", "not_found", "payment", "timeout")}
+
+    def _draw_fault(self) -> str | None:
+        roll = self._rng.random()
+        for kind in ("refusal", "not_found", "payment", "timeout"):
+            roll -= self.params[kind]
+            if roll < 0:
+                self.faults[kind] += 1
+                return kind
+        return None
+
+    def _jittered(self, seconds: float) -> float:
+        j = self.params["jitter"]
+        return max(0.0, seconds * (1 + self._rng.uniform(-j, j)))
+
+    def _reply_tokens(self, messages: list[LLMMessage]) -> list[str]:
+        """Same conversation -> same reply (seeded by the last user message)."""
+        last = next((m.content for m in reversed(messages) if m.role == "user"), "")
+        digest = hashlib.sha256(f"{self.params['seed']}:{last}".encode()).digest()
+        rng = random.Random(digest)
+        words: list[str] = []
+        while len(words) < self.params["tokens"]:
+            words.extend(rng.choice(_SENTENCES).split())
+        words = words[:int(self.params["tokens"])]
+        return [w + " " for w in words[:-1]] + words[-1:]
+
+    async def _open(self, config: LLMConfig) -> str | None:
+        """Wait out TTFT (or the timeout) and raise injected errors; returns 'refusal' or None."""
+        self.calls += 1
+        self.last_model_used = config.model or DEFAULT_MODEL
+        fault = self._draw_fault()
+        if fault == "timeout":
+            await asyncio.sleep(self.params["timeout_after"])
+            raise TimeoutError("Request timed out.")
+        await asyncio.sleep(self._jittered(self.params["ttft"]))
+        if fault == "not_found":
+            raise MockAPIError(404, f"The model `{self.last_model_used}` does not exist or is not found")
+        if fault == "payment":
+            raise MockAPIError(402, "Insufficient balance")
+        return fault
+
+    async def generate_stream(
+        self,
+        messages: list[LLMMessage],
+        config: LLMConfig,
+    ) -> AsyncIterator[str]:
+        if await self._open(config) == "refusal":
+            yield _REFUSAL
+            return
+        delay = 1 / self.params["tps"] if self.params["tps"] > 0 else 0.0
+        for token in self._reply_tokens(messages):
+            yield token
+            await asyncio.sleep(self._jittered(delay))
+
+    async def generate(
+        self,
+        messages: list[LLMMessage],
+        config: LLMConfig,
+    ) -> str:
+        return (await self.generate_with_usage(messages, config)).content
+
+    async def generate_with_usage(
+        self,
+        messages: list[LLMMessage],
+        config: LLMConfig,
+    ) -> LLMResult:
+        if await self._open(config) == "refusal":
+            return LLMResult(content=_REFUSAL, model=self.last_model_used)
+        tokens = self._reply_tokens(messages)
+        if self.params["tps"] > 0:
+            await asyncio.sleep(len(tokens) / self.params["tps"])
+        return LLMResult(
+            content="".join(tokens),
+            prompt_tokens=sum(len(m.content) for m in messages) // 4,
+            completion_tokens=len(tokens),
+            model=self.last_model_used,
+        )
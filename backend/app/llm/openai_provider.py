@@ -1,15 +1,17 @@
+import time
 from typing import AsyncIterator
-import httpx
+import openai
 from openai import AsyncOpenAI
-from app.llm.base import BaseLLMProvider, LLMMessage, LLMConfig, LLMResult
+from app.llm.base import BaseLLMProvider, LLMMessage, LLMConfig, LLMResult, report_usage
+from app.llm import cache_stats, http_pool
 
 
 class OpenAIProvider(BaseLLMProvider):
     def __init__(self, api_key: str, proxy_url: str | None = None):
-        kwargs: dict = {"api_key": api_key}
-        if proxy_url:
-            kwargs["http_client"] = httpx.AsyncClient(proxy=proxy_url)
-        self.client = AsyncOpenAI(**kwargs)
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            http_client=http_pool.get_client("https://api.openai.com", proxy_url, sdk=openai),
+        )
 
     async def generate_stream(
         self,
@@ -28,11 +30,29 @@ class OpenAIProvider(BaseLLMProvider):
             frequency_penalty=config.frequency_penalty,
             presence_penalty=config.presence_penalty,
             stream=True,
+            stream_options={"include_usage": True},
         )
+        start = time.monotonic()
+        ttft = None
+        usage = None
         async for chunk in stream:
-            delta = chunk.choices[0].delta
-            if delta.content:
+            if chunk.usage:
+                usage = chunk.usage  # final chunk, empty choices
+            delta = chunk.choices[0].delta if chunk.choices else None
+            if delta and delta.content:
+                if ttft is None:
+                    ttft = time.monotonic() - start
                 yield delta.content
+        if usage is not None:
+            usage_result = LLMResult(
+                content="",
+                prompt_tokens=usage.prompt_tokens or 0,
+                completion_tokens=usage.completion_tokens or 0,
+                model=model,
+                cached_tokens=cache_stats.openai_cached_tokens(usage),
+            )
+            report_usage(config, usage_result)
+            cache_stats.record("openai", usage_result, ttft)
 
     async def generate(
         self,
@@ -59,9 +79,12 @@ class OpenAIProvider(BaseLLMProvider):
             presence_penalty=config.presence_penalty,
         )
         usage = getattr(response, "usage", None)
-        return LLMResult(
+        result = LLMResult(
             content=response.choices[0].message.content,
             prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
             completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
             model=config.model or "gpt-4o",
+            cached_tokens=cache_stats.openai_cached_tokens(usage),
         )
+        cache_stats.record("openai", result)
+        return result
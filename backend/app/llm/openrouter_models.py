@@ -2,8 +2,11 @@
 
 Quality reflects both capability AND reliability.
 Models with unstable providers get lower scores.
+"context" is the free endpoint's context window in tokens.
 """
 
+DEFAULT_CONTEXT_LENGTH = 8192
+
 OPENROUTER_FREE_MODELS = [
     {
         "id": "nousresearch/hermes-3-llama-3.1-405b:free",
@@ -11,6 +14,7 @@ OPENROUTER_FREE_MODELS = [
         "quality": 9,
         "nsfw": True,
         "note": "лучшая для RP, Venice нестабилен",
+        "context": 131072,
     },
     {
         "id": "cognitivecomputations/dolphin-mistral-24b-venice-edition:free",
@@ -18,6 +22,7 @@ OPENROUTER_FREE_MODELS = [
         "quality": 8,
         "nsfw": True,
         "note": "без цензуры, Venice edition",
+        "context": 32768,
     },
     {
         "id": "meta-llama/llama-3.3-70b-instruct:free",
@@ -25,6 +30,7 @@ OPENROUTER_FREE_MODELS = [
         "quality": 8,
         "nsfw": True,
         "note": "хорошая для RP, Venice нестабилен",
+        "context": 65536,
     },
     {
         "id": "mistralai/mistral-small-3.1-24b-instruct:free",
@@ -32,6 +38,7 @@ OPENROUTER_FREE_MODELS = [
         "quality": 7,
         "nsfw": True,
         "note": "стабильная, Mistral инфра",
+        "context": 96000,
     },
     {
         "id": "google/gemma-3-27b-it:free",
@@ -39,6 +46,7 @@ OPENROUTER_FREE_MODELS = [
         "quality": 7,
         "nsfw": False,  # Google safety filters block NSFW
         "note": "стабильная, но слабый RP на русском",
+        "context": 96000,
     },
     {
         "id": "google/gemma-3-12b-it:free",
@@ -46,6 +54,7 @@ OPENROUTER_FREE_MODELS = [
         "quality": 6,
         "nsfw": False,  # Google safety filters block NSFW
         "note": "стабильная, быстрая",
+        "context": 32768,
     },
     {
         "id": "openai/gpt-oss-120b:free",
@@ -53,6 +62,7 @@ OPENROUTER_FREE_MODELS = [
         "quality": 7,
         "nsfw": False,  # strict content moderation
         "note": "стабильная, строгая модерация",
+        "context": 131072,
     },
     {
         "id": "qwen/qwen3-next-80b-a3b-instruct:free",
@@ -60,6 +70,7 @@ OPENROUTER_FREE_MODELS = [
         "quality": 7,
         "nsfw": True,
         "note": "80B MoE (3B active), новая",
+        "context": 262144,
     },
     {
         "id": "stepfun/step-3.5-flash:free",
@@ -67,6 +78,7 @@ OPENROUTER_FREE_MODELS = [
         "quality": 6,
         "nsfw": True,
         "note": "StepFun, быстрая",
+        "context": 256000,
     },
     {
         "id": "z-ai/glm-4.5-air:free",
@@ -74,6 +86,7 @@ OPENROUTER_FREE_MODELS = [
         "quality": 6,
         "nsfw": True,
         "note": "Zhipu AI",
+        "context": 131072,
     },
     {
         "id": "deepseek/deepseek-r1-0528:free",
@@ -81,6 +94,7 @@ OPENROUTER_FREE_MODELS = [
         "quality": 5,
         "nsfw": False,  # DeepSeek has content moderation
         "note": "умная, но медленная (>30с)",
+        "context": 163840,
     },
     {
         "id": "nvidia/nemotron-nano-9b-v2:free",
@@ -88,6 +102,7 @@ OPENROUTER_FREE_MODELS = [
         "quality": 0,
         "nsfw": True,
         "note": "thinking-модель, мешает языки — исключена из auto-fallback",
+        "context": 128000,
     },
     {
         "id": "qwen/qwen3-4b:free",
@@ -95,6 +110,7 @@ OPENROUTER_FREE_MODELS = [
         "quality": 4,
         "nsfw": True,
         "note": "маленькая, Venice нестабилен",
+        "context": 40960,
     },
     {
         "id": "meta-llama/llama-3.2-3b-instruct:free",
@@ -102,6 +118,7 @@ OPENROUTER_FREE_MODELS = [
         "quality": 3,
         "nsfw": True,
         "note": "маленькая, Venice нестабилен",
+        "context": 131072,
     },
 ]
 
@@ -144,6 +161,11 @@ def get_fallback_models(limit: int = 3, nsfw: bool = False) -> list[str]:
     return result
 
 
+def get_context_length(model_id: str) -> int:
+    m = find_model_by_id(model_id)
+    return m.get("context", DEFAULT_CONTEXT_LENGTH) if m else DEFAULT_CONTEXT_LENGTH
+
+
 def find_model_by_id(model_id: str) -> dict | None:
     """Find model info by ID."""
     for m in OPENROUTER_FREE_MODELS:
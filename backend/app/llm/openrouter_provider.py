@@ -1,17 +1,22 @@
 import asyncio
+import time
 from typing import AsyncIterator
-import httpx
+import openai
 from openai import AsyncOpenAI
-from app.llm.base import BaseLLMProvider, LLMMessage, LLMConfig, LLMResult
+from app.llm.base import BaseLLMProvider, LLMMessage, LLMConfig, LLMResult, report_usage
 from app.llm.openrouter_models import get_fallback_models
 from app.llm.thinking_filter import ThinkingFilter, strip_thinking
-from app.llm import model_cooldown
+from app.llm import model_cooldown, cache_stats, http_pool
 
 PER_MODEL_TIMEOUT = 25  # seconds per model attempt
 
 # Models that don't support system role — merge into first user message
 NO_SYSTEM_ROLE = {"google/gemma-3-27b-it:free", "google/gemma-3-12b-it:free", "google/gemma-3-4b-it:free"}
 
+# Upstreams that need explicit cache_control breakpoints (others cache prefixes automatically)
+CACHE_CONTROL_PREFIXES = ("anthropic/", "google/gemini")
+MAX_CACHE_BREAKPOINTS = 4
+
 
 class OpenRouterProvider(BaseLLMProvider):
     def __init__(self, api_key: str, proxy_url: str | None = None):
@@ -20,12 +25,23 @@ class OpenRouterProvider(BaseLLMProvider):
             "base_url": "https://openrouter.ai/api/v1",
             "timeout": PER_MODEL_TIMEOUT,
         }
-        if proxy_url:
-            kwargs["http_client"] = httpx.AsyncClient(proxy=proxy_url, timeout=PER_MODEL_TIMEOUT)
+        kwargs["http_client"] = http_pool.get_client("https://openrouter.ai", proxy_url, sdk=openai)
         self.client = AsyncOpenAI(**kwargs)
 
     @staticmethod
     def _prepare_messages(messages: list[LLMMessage], model: str) -> list[dict]:
+        if model.startswith(CACHE_CONTROL_PREFIXES):
+            api_messages = []
+            breakpoints = 0
+            for m in messages:
+                if m.cache and breakpoints < MAX_CACHE_BREAKPOINTS:
+                    breakpoints += 1
+                    api_messages.append({"role": m.role, "content": [
+                        {"type": "text", "text": m.content, "cache_control": {"type": "ephemeral"}},
+                    ]})
+                else:
+                    api_messages.append({"role": m.role, "content": m.content})
+            return api_messages
         api_messages = [{"role": m.role, "content": m.content} for m in messages]
         if model in NO_SYSTEM_ROLE:
             system_parts = [m["content"] for m in api_messages if m["role"] == "system"]
@@ -61,19 +77,37 @@ class OpenRouterProvider(BaseLLMProvider):
                     frequency_penalty=config.frequency_penalty,
                     presence_penalty=config.presence_penalty,
                     stream=True,
+                    stream_options={"include_usage": True},
                     extra_body=extra or None,
                 )
                 has_content = False
                 thinking_filter = ThinkingFilter()
+                start = time.monotonic()
+                ttft = None
+                usage = None
                 async for chunk in stream:
+                    if chunk.usage:
+                        usage = chunk.usage
                     delta = chunk.choices[0].delta if chunk.choices else None
                     if delta and delta.content:
                         clean = thinking_filter.process(delta.content)
                         if clean:
+                            if ttft is None:
+                                ttft = time.monotonic() - start
                             has_content = True
                             yield clean
                 if not has_content:
                     raise RuntimeError("Модель вернула пустой ответ")
+                if usage is not None:
+                    usage_result = LLMResult(
+                        content="",
+                        prompt_tokens=usage.prompt_tokens or 0,
+                        completion_tokens=usage.completion_tokens or 0,
+                        model=model,
+                        cached_tokens=cache_stats.openai_cached_tokens(usage),
+                    )
+                    report_usage(config, usage_result)
+                    cache_stats.record("openrouter", usage_result, ttft)
                 return
             except Exception as e:
                 model_cooldown.handle_402_if_applicable("openrouter", e)
@@ -136,12 +170,15 @@ class OpenRouterProvider(BaseLLMProvider):
                 if not content:
                     raise RuntimeError("Модель вернула пустой ответ")
                 usage = getattr(response, "usage", None)
-                return LLMResult(
+                result = LLMResult(
                     content=strip_thinking(content),
                     prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
                     completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
                     model=model,
+                    cached_tokens=cache_stats.openai_cached_tokens(usage),
                 )
+                cache_stats.record("openrouter", result)
+                return result
             except asyncio.TimeoutError:
                 model_cooldown.mark_failed("openrouter", model)
                 errors.append((model.split("/")[-1].replace(":free", ""), "таймаут"))
@@ -0,0 +1,183 @@
+"""Per-provider / per-model live health scoreboard (in-memory, per worker).
+
+Every chat stream (and the model monitor's health probes) reports here via
+StreamProbe: time to first token, generation speed and the outcome (ok,
+error, refusal / language bleed). Each provider has an aggregate entry
+(model "") plus one entry per model it actually served.
+
+- TTFT is a bucketed histogram; counts are halved once an entry reaches
+  _DECAY_AT samples, so it follows recent behaviour (free-tier latency
+  drifts over the day) without storing individual samples.
+- Outcome counts decay the same way after _OUTCOME_DECAY_AT attempts.
+- Tokens/sec is an exponential moving average.
+
+Auto mode ranks its (cost_mode / NSFW filtered) provider list by expected
+time to a usable first token: p50 TTFT divided by the smoothed success
+rate. Hedged auto mode waits for the p95 TTFT before racing the next one.
+"""
+
+import bisect
+import time
+
+# Bucket upper bounds, seconds (last bucket catches everything slower)
+TTFT_BUCKETS = (0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 4.0, 6.0, 8.0, 12.0, 20.0, 30.0, 60.0)
+_DECAY_AT = 1000
+_OUTCOME_DECAY_AT = 200
+_MIN_SAMPLES = 20  # fewer TTFT samples than this -> prior / caller's default
+_TPS_ALPHA = 0.2
+_TPS_MIN_SECONDS = 0.1  # shorter generations give meaningless rates
+
+# Priors for providers without enough data — they keep their configured position
+_PRIOR_TTFT = 2.0
+_PRIOR_SUCCESS = 0.9
+_PRIOR_WEIGHT = 5
+
+_board: dict[tuple[str, str], dict] = {}
+
+
+def _entry(provider: str, model: str = "") -> dict:
+    key = (provider, model)
+    entry = _board.get(key)
+    if entry is None:
+        entry = _board[key] = {
+            "ttft": [0.0] * (len(TTFT_BUCKETS) + 1),
+            "ok": 0.0, "errors": 0.0, "refusals": 0.0,
+            "tps": None,
+        }
+    return entry
+
+
+def _add_ttft(entry: dict, seconds: float) -> None:
+    hist = entry["ttft"]
+    hist[bisect.bisect_left(TTFT_BUCKETS, seconds)] += 1
+    if sum(hist) >= _DECAY_AT:
+        entry["ttft"] = [c / 2 for c in hist]
+
+
+def _add_outcome(entry: dict, outcome: str) -> None:
+    entry[outcome] += 1
+    if entry["ok"] + entry["errors"] + entry["refusals"] >= _OUTCOME_DECAY_AT:
+        for k in ("ok", "errors", "refusals"):
+            entry[k] /= 2
+
+
+def record_ttft(provider: str, seconds: float, model: str = "") -> None:
+    """Record one time-to-first-token observation."""
+    _add_ttft(_entry(provider), seconds)
+    if model:
+        _add_ttft(_entry(provider, model), seconds)
+
+
+def record_outcome(
+    provider: str, model: str, outcome: str,
+    completion_tokens: int = 0, gen_seconds: float = 0.0,
+) -> None:
+    """Record an attempt: outcome is "ok", "errors" or "refusals"."""
+    for entry in (_entry(provider), _entry(provider, model)) if model else (_entry(provider),):
+        _add_outcome(entry, outcome)
+        if outcome == "ok" and completion_tokens > 0 and gen_seconds >= _TPS_MIN_SECONDS:
+            tps = completion_tokens / gen_seconds
+            entry["tps"] = tps if entry["tps"] is None else entry["tps"] + _TPS_ALPHA * (tps - entry["tps"])
+
+
+def _percentile(hist: list[float], q: float) -> float | None:
+    total = sum(hist)
+    if total < _MIN_SAMPLES:
+        return None
+    target = total * q
+    cumulative = 0.0
+    for i, count in enumerate(hist):
+        cumulative += count
+        if cumulative >= target:
+            return TTFT_BUCKETS[min(i, len(TTFT_BUCKETS) - 1)]
+    return TTFT_BUCKETS[-1]
+
+
+def ttft_percentile(provider: str, q: float, model: str = "") -> float | None:
+    """Upper bucket bound at quantile q (0-1), or None without enough samples."""
+    entry = _board.get((provider, model))
+    return _percentile(entry["ttft"], q) if entry else None
+
+
+def hedge_delay(provider: str, default: float, lo: float, hi: float) -> float:
+    """Seconds to wait for provider's first token before hedging (p95 TTFT, clamped)."""
+    p95 = ttft_percentile(provider, 0.95)
+    if p95 is None:
+        return default
+    return max(lo, min(hi, p95))
+
+
+def success_rate(provider: str, model: str = "") -> float:
+    """Smoothed share of attempts that produced a usable response."""
+    entry = _board.get((provider, model))
+    ok = entry["ok"] if entry else 0.0
+    attempts = ok + (entry["errors"] + entry["refusals"] if entry else 0.0)
+    return (ok + _PRIOR_SUCCESS * _PRIOR_WEIGHT) / (attempts + _PRIOR_WEIGHT)
+
+
+def expected_cost(provider: str) -> float:
+    """Expected seconds to a usable first token (lower is better)."""
+    p50 = ttft_percentile(provider, 0.5)
+    return (p50 if p50 is not None else _PRIOR_TTFT) / max(success_rate(provider), 0.01)
+
+
+def rank_providers(order: list[str]) -> list[str]:
+    """Reorder providers by expected_cost (stable: ties keep the configured order)."""
+    return sorted(order, key=expected_cost)
+
+
+def get_scoreboard() -> list[dict]:
+    """Scoreboard rows (provider aggregate rows have model "")."""
+    rows = []
+    for (provider, model), entry in sorted(_board.items()):
+        p50 = _percentile(entry["ttft"], 0.5)
+        p95 = _percentile(entry["ttft"], 0.95)
+        attempts = entry["ok"] + entry["errors"] + entry["refusals"]
+        rows.append({
+            "provider": provider,
+            "model": model,
+            "ttft_samples": int(sum(entry["ttft"])),
+            "ttft_p50_ms": round(p50 * 1000) if p50 is not None else None,
+            "ttft_p95_ms": round(p95 * 1000) if p95 is not None else None,
+            "tokens_per_sec": round(entry["tps"], 1) if entry["tps"] is not None else None,
+            "attempts": int(attempts),
+            "error_rate": round(entry["errors"] / attempts, 3) if attempts else None,
+            "refusal_rate": round(entry["refusals"] / attempts, 3) if attempts else None,
+            "expected_cost_s": round(expected_cost(provider), 2) if not model else None,
+        })
+    return rows
+
+
+class StreamProbe:
+    """Times one provider attempt and reports it to the scoreboard.
+
+    Call first_token() when the first chunk arrives (usable as stream_gated's
+    on_first), then exactly one of succeeded() / failed() / cancelled().
+    """
+
+    def __init__(self, provider: str):
+        self.provider = provider
+        self.started = time.monotonic()
+        self.first_at: float | None = None
+
+    def first_token(self) -> None:
+        if self.first_at is None:
+            self.first_at = time.monotonic()
+            record_ttft(self.provider, self.first_at - self.started)
+
+    def succeeded(self, model: str = "", completion_tokens: int = 0) -> None:
+        now = time.monotonic()
+        if self.first_at is None:  # non-streaming call: the whole response is the first token
+            self.first_at = now
+            record_ttft(self.provider, now - self.started)
+        if model:
+            _add_ttft(_entry(self.provider, model), self.first_at - self.started)
+        record_outcome(self.provider, model, "ok", completion_tokens, now - self.first_at)
+
+    def failed(self, model: str = "", refusal: bool = False) -> None:
+        record_outcome(self.provider, model, "refusals" if refusal else "errors")
+
+    def cancelled(self) -> None:
+        """Lost a hedged race: before its first token, the wait so far is a lower bound on TTFT."""
+        if self.first_at is None:
+            record_ttft(self.provider, time.monotonic() - self.started)
@@ -1,7 +1,8 @@
 from typing import AsyncIterator
-import httpx
+import openai
 from openai import AsyncOpenAI, BadRequestError
 from app.llm.base import BaseLLMProvider, LLMMessage, LLMConfig, LLMResult
+from app.llm import http_pool
 from app.llm.thinking_filter import strip_thinking
 
 CONTENT_MODERATION_MSG = "Qwen отклонил запрос из-за модерации контента. Попробуйте переформулировать сообщение или используйте другую модель (DeepSeek, OpenRouter)."
@@ -16,8 +17,7 @@ class QwenProvider(BaseLLMProvider):
             "base_url": "https://dashscope-intl.aliyuncs.com/compatible-mode/v1",
             "timeout": TIMEOUT,
         }
-        if proxy_url:
-            kwargs["http_client"] = httpx.AsyncClient(proxy=proxy_url, timeout=TIMEOUT)
+        kwargs["http_client"] = http_pool.get_client("https://dashscope-intl.aliyuncs.com", proxy_url, sdk=openai)
         self.client = AsyncOpenAI(**kwargs)
 
     async def generate_stream(
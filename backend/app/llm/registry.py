@@ -10,10 +10,34 @@ from app.llm.anthropic_provider import AnthropicProvider
 from app.llm.together_provider import TogetherProvider
 from app.llm.xai_provider import XAIProvider
 from app.llm.mistral_provider import MistralProvider
-from app.llm import model_cooldown
+from app.llm.mock_provider import MockProvider
+from app.llm import model_cooldown, http_pool
+from app.llm import groq_models, cerebras_models, together_models, openrouter_models
 
 _providers: dict[str, BaseLLMProvider] = {}
 
+# Providers with per-model registries (*_models.py) that know context windows
+_MODEL_REGISTRIES = {
+    "groq": groq_models,
+    "cerebras": cerebras_models,
+    "together": together_models,
+    "openrouter": openrouter_models,
+}
+
+# Context windows (tokens) of the single-model providers' default models
+PROVIDER_CONTEXT_LENGTHS: dict[str, int] = {
+    "openai": 128000,
+    "claude": 200000,
+    "haiku": 200000,
+    "deepseek": 65536,
+    "gemini": 1048576,
+    "qwen": 131072,
+    "grok": 131072,
+    "mistral": 131072,
+    "mock": 131072,
+}
+DEFAULT_CONTEXT_LENGTH = 8192
+
 
 def init_providers(
     openai_key: str | None,
@@ -28,6 +52,7 @@ def init_providers(
     xai_key: str | None = None,
     mistral_key: str | None = None,
     proxy_url: str | None = None,
+    mock_llm: str | None = None,
 ):
     if anthropic_key:
         _providers["claude"] = AnthropicProvider(api_key=anthropic_key, proxy_url=proxy_url)
@@ -51,6 +76,20 @@ def init_providers(
         _providers["grok"] = XAIProvider(api_key=xai_key, proxy_url=proxy_url)
     if mistral_key:
         _providers["mistral"] = MistralProvider(api_key=mistral_key, proxy_url=proxy_url)
+    if mock_llm:
+        # Offline load tests (scripts/load_test.py); never set in production
+        _providers["mock"] = MockProvider(mock_llm)
+
+
+async def warm_up_providers() -> None:
+    """Pre-open pooled connections to every configured provider (TLS done before the first chat)."""
+    await http_pool.warm_up()
+
+
+async def close_providers() -> None:
+    """Close the shared provider HTTP clients (lifespan shutdown)."""
+    await http_pool.close_all()
+    _providers.clear()
 
 
 def get_provider(name: str) -> BaseLLMProvider:
@@ -66,3 +105,18 @@ def get_provider(name: str) -> BaseLLMProvider:
 
 def get_available_providers() -> list[str]:
     return list(_providers.keys())
+
+
+def get_context_length(provider: str, model_id: str = "", nsfw: bool = False) -> int:
+    """Context window (tokens) for a provider/model.
+
+    Empty model_id means the provider picks from its fallback list, so the
+    smallest window among those candidates is returned.
+    """
+    registry = _MODEL_REGISTRIES.get(provider)
+    if registry is None:
+        return PROVIDER_CONTEXT_LENGTHS.get(provider, DEFAULT_CONTEXT_LENGTH)
+    if model_id:
+        return registry.get_context_length(model_id)
+    candidates = registry.get_fallback_models(limit=5, nsfw=nsfw)
+    return min((registry.get_context_length(m) for m in candidates), default=registry.DEFAULT_CONTEXT_LENGTH)
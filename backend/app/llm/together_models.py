@@ -33,6 +33,9 @@ INCLUDE_TYPES = {"chat", "language"}
 # Min quality to include in auto-fallback
 MIN_QUALITY_FOR_FALLBACK = 6
 
+# Context window when the API doesn't report one (tokens)
+DEFAULT_CONTEXT_LENGTH = 8192
+
 # Cache
 _cached_models: list[dict] = []
 _cache_time: float = 0
@@ -40,11 +43,11 @@ CACHE_TTL = 3600  # 1 hour
 
 # Fallback if API unavailable
 FALLBACK_MODELS = [
-    {"id": "meta-llama/Llama-3.3-70B-Instruct-Turbo", "name": "Llama 3.3 70B Turbo", "quality": 9, "nsfw": True, "note": ""},
-    {"id": "meta-llama/Llama-4-Maverick-17B-128E-Instruct-FP8", "name": "Llama 4 Maverick", "quality": 8, "nsfw": True, "note": ""},
-    {"id": "Qwen/Qwen3-32B", "name": "Qwen 3 32B", "quality": 7, "nsfw": True, "note": ""},
-    {"id": "meta-llama/Llama-4-Scout-17B-16E-Instruct", "name": "Llama 4 Scout", "quality": 7, "nsfw": True, "note": ""},
-    {"id": "deepseek-ai/DeepSeek-V3", "name": "DeepSeek V3", "quality": 6, "nsfw": True, "note": ""},
+    {"id": "meta-llama/Llama-3.3-70B-Instruct-Turbo", "name": "Llama 3.3 70B Turbo", "quality": 9, "nsfw": True, "note": "", "context": 131072},
+    {"id": "meta-llama/Llama-4-Maverick-17B-128E-Instruct-FP8", "name": "Llama 4 Maverick", "quality": 8, "nsfw": True, "note": "", "context": 131072},
+    {"id": "Qwen/Qwen3-32B", "name": "Qwen 3 32B", "quality": 7, "nsfw": True, "note": "", "context": 40960},
+    {"id": "meta-llama/Llama-4-Scout-17B-16E-Instruct", "name": "Llama 4 Scout", "quality": 7, "nsfw": True, "note": "", "context": 131072},
+    {"id": "deepseek-ai/DeepSeek-V3", "name": "DeepSeek V3", "quality": 6, "nsfw": True, "note": "", "context": 131072},
 ]
 
 
@@ -56,12 +59,15 @@ def _should_include(model_id: str) -> bool:
     return model_id not in EXCLUDE_IDS
 
 
-def _build_model_entry(model_id: str, owned_by: str = "") -> dict:
+def _build_model_entry(model_id: str, owned_by: str = "", context: int | None = None) -> dict:
     quality = QUALITY_SCORES.get(model_id, 5)
     # Pretty name: "meta-llama/Llama-3.3-70B-Instruct-Turbo" → "Llama 3.3 70B Instruct Turbo"
     short = model_id.split("/")[-1] if "/" in model_id else model_id
     name = short.replace("-", " ").title()
-    return {"id": model_id, "name": name, "quality": quality, "nsfw": model_id not in NSFW_BLOCKED, "note": owned_by}
+    return {
+        "id": model_id, "name": name, "quality": quality, "nsfw": model_id not in NSFW_BLOCKED, "note": owned_by,
+        "context": context or DEFAULT_CONTEXT_LENGTH,
+    }
 
 
 async def refresh_models(client) -> list[dict]:
@@ -89,7 +95,7 @@ async def refresh_models(client) -> list[dict]:
             if model_type and model_type not in INCLUDE_TYPES:
                 continue
             if _should_include(model_id):
-                models.append(_build_model_entry(model_id, owned_by))
+                models.append(_build_model_entry(model_id, owned_by, m.get("context_length")))
         if models:
             models.sort(key=lambda x: x["quality"], reverse=True)
             _cached_models = models
@@ -123,5 +129,10 @@ def find_model_by_id(model_id: str) -> dict | None:
     return None
 
 
+def get_context_length(model_id: str) -> int:
+    m = find_model_by_id(model_id)
+    return m.get("context", DEFAULT_CONTEXT_LENGTH) if m else DEFAULT_CONTEXT_LENGTH
+
+
 def is_cache_stale() -> bool:
     return not _cached_models or (time.monotonic() - _cache_time) > CACHE_TTL
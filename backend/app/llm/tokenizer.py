@@ -0,0 +1,122 @@
+"""Local token counting for context budgeting.
+
+Tokenizers are pluggable per model family and loaded lazily on first use.
+The built-in families use tiktoken BPE files (o200k for current OpenAI
+models, cl100k as the closest match for Llama 3 / Qwen / Mistral style
+vocabularies). If tiktoken is missing or its BPE file can't be loaded
+(no network on first start), counting falls back to a script-aware
+estimate — Cyrillic and other non-ASCII text packs far fewer characters
+per token than English, so plain chars / 4 undercounts Russian chats.
+
+Call preload() off the event loop at startup so the first request never
+waits on a BPE download.
+"""
+
+import logging
+import threading
+from functools import lru_cache
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FAMILY = "cl100k"
+
+# Family -> loader returning a count function. Loaders may raise; the family then uses the estimate.
+_loaders: dict[str, Callable[[], Callable[[str], int]]] = {}
+_counters: dict[str, Callable[[str], int] | None] = {}
+_load_lock = threading.Lock()
+
+# Model id prefix -> family (first match wins, checked on the lowercased id without vendor path)
+_FAMILY_RULES: list[tuple[str, str]] = [
+    ("gpt-4o", "o200k"),
+    ("gpt-4.1", "o200k"),
+    ("gpt-5", "o200k"),
+    ("gpt-oss", "o200k"),
+    ("o1", "o200k"),
+    ("o3", "o200k"),
+    ("o4", "o200k"),
+]
+
+
+def register_tokenizer(family: str, loader: Callable[[], Callable[[str], int]]) -> None:
+    """Register (or replace) a tokenizer family. loader() is called once, lazily."""
+    _loaders[family] = loader
+    _counters.pop(family, None)
+    _count_cached.cache_clear()
+
+
+def _tiktoken_loader(encoding: str) -> Callable[[], Callable[[str], int]]:
+    def load() -> Callable[[str], int]:
+        import tiktoken
+        enc = tiktoken.get_encoding(encoding)
+        return lambda text: len(enc.encode(text, disallowed_special=()))
+    return load
+
+
+def family_for_model(model: str | None) -> str:
+    if model:
+        m = model.lower().split("/")[-1]
+        for needle, family in _FAMILY_RULES:
+            if m.startswith(needle):
+                return family
+    return DEFAULT_FAMILY
+
+
+def estimate_tokens(text: str) -> int:
+    """Script-aware estimate: ~4 chars/token for ASCII, ~2.5 for everything else."""
+    if not text:
+        return 0
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return int(ascii_chars / 4 + (len(text) - ascii_chars) / 2.5) + 1
+
+
+def _get_counter(family: str, wait: bool = False) -> Callable[[str], int] | None:
+    if family in _counters:
+        return _counters[family]
+    # Another thread (preload) is loading — estimate instead of blocking the caller
+    if not _load_lock.acquire(blocking=wait):
+        return None
+    try:
+        if family in _counters:
+            return _counters[family]
+        counter = None
+        loader = _loaders.get(family)
+        if loader:
+            try:
+                counter = loader()
+            except Exception as e:
+                logger.warning(f"Tokenizer '{family}' unavailable, using estimate: {e}")
+        _counters[family] = counter  # failures are remembered — no retry per call
+        return counter
+    finally:
+        _load_lock.release()
+
+
+@lru_cache(maxsize=8192)
+def _count_cached(text: str, family: str) -> int:
+    return _counters[family](text)
+
+
+def count_tokens(text: str, model: str | None = None) -> int:
+    """Token count of text for the given model (default family if unknown)."""
+    if not text:
+        return 0
+    family = family_for_model(model)
+    if _get_counter(family) is None:
+        return estimate_tokens(text)
+    return _count_cached(text, family)
+
+
+def count_message_tokens(messages, model: str | None = None) -> int:
+    """Prompt tokens of an LLMMessage list, incl. ~4 tokens of chat-format overhead per message."""
+    return sum(count_tokens(m.content, model) + 4 for m in messages)
+
+
+def preload() -> None:
+    """Load the built-in tokenizers (blocking — run in a thread)."""
+    for family in list(_loaders):
+        _get_counter(family, wait=True)
+
+
+register_tokenizer("cl100k", _tiktoken_loader("cl100k_base"))
+register_tokenizer("o200k", _tiktoken_loader("o200k_base"))
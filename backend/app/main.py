@@ -7,13 +7,13 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.sessions import SessionMiddleware
 from app.config import settings
-from app.llm.registry import init_providers
+from app.llm.registry import init_providers, warm_up_providers, close_providers
 from app.db.session import init_db
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Set proxy env vars so all httpx clients (Gemini, etc.) pick them up
+    # Set proxy env vars so ad-hoc httpx clients pick them up (LLM providers get it via llm/http_pool.py)
     if settings.proxy_url:
         os.environ["HTTP_PROXY"] = settings.proxy_url
         os.environ["HTTPS_PROXY"] = settings.proxy_url
@@ -25,6 +25,9 @@ async def lifespan(app: FastAPI):
     import asyncio
     from app.analytics.collector import refresh_geoip_db
     asyncio.get_event_loop().run_in_executor(None, refresh_geoip_db)
+    # Load tokenizer BPE files off the event loop (may download on first start)
+    from app.llm.tokenizer import preload as preload_tokenizers
+    asyncio.get_event_loop().run_in_executor(None, preload_tokenizers)
 
     await init_db()
     init_providers(
@@ -40,12 +43,33 @@ async def lifespan(app: FastAPI):
         xai_key=settings.xai_api_key,
         mistral_key=settings.mistral_api_key,
         proxy_url=settings.proxy_url,
+        mock_llm=settings.mock_llm,
     )
+    # Open pooled provider connections in the background (startup isn't blocked on slow hosts)
+    warm_up_task = asyncio.create_task(warm_up_providers())
 
     # Load persisted model overrides (auto-fixed 404s)
     from app.llm.model_resolver import load_from_db as _load_model_overrides
     await _load_model_overrides()
 
+    # Admin settings + prompt overrides: loaded once, kept current via LISTEN/NOTIFY or version poll
+    from app.utils import admin_settings
+    await admin_settings.load()
+    settings_task = asyncio.create_task(admin_settings.watch())
+
+    # Usage counters for daily / anonymous limits: catch up with the messages table, then hourly
+    from app.chat.usage import run_reconciler
+    usage_task = asyncio.create_task(run_reconciler())
+    # Write-behind chat / message counters (flushed again after post_turn.drain on shutdown)
+    from app.chat import counters
+    counters_task = asyncio.create_task(counters.run())
+
+    # Offline character translation: jobs from create/update, nightly backfill
+    translation_task = None
+    if settings.translation_pipeline:
+        from app.characters import translation_jobs
+        translation_task = asyncio.create_task(translation_jobs.run())
+
     # Install error notification handler (emails admins on ERROR/CRITICAL)
     import logging
     from app.utils.error_notifier import handler as error_handler
@@ -66,6 +90,17 @@ async def lifespan(app: FastAPI):
     await error_handler._do_flush()
     if scheduler_task:
         scheduler_task.cancel()
+    warm_up_task.cancel()
+    usage_task.cancel()
+    counters_task.cancel()
+    settings_task.cancel()
+    if translation_task:
+        translation_task.cancel()
+    from app.chat import post_turn
+    await post_turn.drain()
+    from app.uploads import images
+    images.shutdown()
+    await close_providers()
 
 
 app = FastAPI(title=settings.site_name, lifespan=lifespan)
@@ -160,32 +195,43 @@ if settings.is_fiction_mode:
     from app.game.router import router as game_router
     app.include_router(game_router)
 
-# Auto-generate missing thumbnails on demand
-from fastapi.responses import Response as _Response
+# Avatars: file sent by the server (no read into memory), cached as immutable
+# (filenames are random and never reused), missing thumbnails generated on demand
+from fastapi import Request as _Request
+from fastapi.responses import FileResponse as _FileResponse, Response as _Response
+
+_AVATAR_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
 
 @app.get("/api/uploads/avatars/{filename}")
-async def _avatar_thumb_fallback(filename: str):
-    """If a _thumb.webp is requested but missing, generate it from the full-size avatar."""
-    avatars_dir = Path(settings.upload_dir) / "avatars"
-    file_path = avatars_dir / filename
-    if file_path.exists():
-        return _Response(content=file_path.read_bytes(), media_type="image/webp")
-    # Auto-generate thumb from full-size if missing
-    if filename.endswith("_thumb.webp"):
-        full_name = filename.replace("_thumb.webp", ".webp")
-        full_path = avatars_dir / full_name
-        if full_path.exists():
-            from PIL import Image as _Img
-            from io import BytesIO as _BIO
-            img = _Img.open(full_path)
-            img.thumbnail((160, 160), _Img.LANCZOS)
-            buf = _BIO()
-            img.save(buf, "WEBP", quality=80)
-            data = buf.getvalue()
-            file_path.write_bytes(data)
-            return _Response(content=data, media_type="image/webp")
+async def _serve_avatar(filename: str, request: _Request):
+    """Serve an avatar; a missing _thumb.webp is generated from the full-size avatar (off the event loop)."""
     from fastapi import HTTPException as _Exc
-    raise _Exc(status_code=404, detail="Not found")
+    from app.uploads import images
+    if "/" in filename or "\\" in filename or filename.startswith("."):
+        raise _Exc(status_code=404, detail="Not found")
+    file_path = images.avatars_dir() / filename
+    if not file_path.is_file() and filename.endswith(f"{images.THUMB_SUFFIX}.webp"):
+        try:
+            file_path = await images.ensure_thumb(filename) or file_path
+        except images.ImageBusy:
+            raise _Exc(status_code=503, detail="Image processing busy, try again")
+        except Exception:
+            raise _Exc(status_code=404, detail="Not found")
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        raise _Exc(status_code=404, detail="Not found")
+    response = _FileResponse(file_path, media_type="image/webp", stat_result=stat,
+                             headers={"Cache-Control": _AVATAR_CACHE_CONTROL})
+    # FileResponse sets ETag / Last-Modified but doesn't answer conditional requests
+    etag = response.headers["etag"]
+    if_none_match = request.headers.get("if-none-match")
+    if (if_none_match and etag in [t.strip() for t in if_none_match.split(",")]) or (
+        not if_none_match and request.headers.get("if-modified-since") == response.headers["last-modified"]
+    ):
+        return _Response(status_code=304, headers={"ETag": etag, "Cache-Control": _AVATAR_CACHE_CONTROL})
+    return response
 
 # Serve uploaded files (avatars etc.) — must be after routers
 # Create directory before mounting (StaticFiles checks at import time)
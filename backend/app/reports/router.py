@@ -32,7 +32,7 @@ async def create_report(
     db: AsyncSession = Depends(get_db),
 ):
     # Rate limit
-    if not report_limiter.check(f"report:{user['id']}"):
+    if not await report_limiter.check(f"report:{user['id']}"):
         raise HTTPException(status_code=429, detail="Too many reports. Try again later.")
 
     # Check character exists
@@ -1,3 +1,4 @@
+from app.chat import counters
 from app.config import settings
 from app.db.models import Character
 
@@ -14,7 +15,7 @@ def character_jsonld(c: Character, language: str = "en", vote_count: int = 0, ra
 
     lang = language or "en"
     # Real counts only — no inflated base_chat_count (avoid suspicious numbers)
-    chat_count = c.chat_count or 0
+    chat_count = counters.character_chat_count(c.id, c.chat_count)
 
     avatar = c.avatar_url
     if avatar and avatar.startswith("/"):
@@ -0,0 +1,132 @@
+"""Rendered-HTML cache for the SEO prerender endpoints.
+
+Pages are keyed by (page, slug, lang, site_mode) and kept in a per-worker
+LRU of _MAX_ENTRIES:
+
+- fresh for FRESH_TTL: served from memory, no DB or template work;
+- stale up to STALE_TTL: served from memory while one background task
+  re-renders it (stale-while-revalidate);
+- older, or missing: rendered inline, once per key however many crawlers
+  ask at the same time (single-flight).
+
+Every cached page has a strong ETag (hash of the body), so a conditional
+GET that matches gets a bodyless 304. Character pages are tagged with the
+character id: invalidate_character() drops them on edit / delete, or only
+marks them stale on a vote or rating (aggregate numbers may lag one
+refresh). Other workers pick changes up within FRESH_TTL.
+
+Only 200s are cached: 404s for made-up slugs would fill the LRU and, with
+no character id, could never be invalidated. Callers pass a lang already
+normalized to the supported set, for the same reason.
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from app.config import settings
+from app.db.session import async_session
+
+logger = logging.getLogger(__name__)
+
+FRESH_TTL = 600  # seconds
+STALE_TTL = 86400  # seconds
+_MAX_ENTRIES = 5000
+
+# key -> (body, status, etag, rendered_at monotonic, character_id)
+_cache: OrderedDict[tuple, tuple[bytes, int, str, float, str | None]] = OrderedDict()
+_inflight: dict[tuple, asyncio.Task] = {}
+_stats = {"hits": 0, "stale_hits": 0, "misses": 0, "not_modified": 0, "renders": 0}
+
+
+def _response(entry, request: Request) -> Response:
+    body, status, etag, _, _ = entry
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if status == 200 and if_none_match and etag in [t.strip() for t in if_none_match.split(",")]:
+        _stats["not_modified"] += 1
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, status_code=status, media_type="text/html", headers=headers)
+
+
+async def _render_once(key: tuple, render):
+    _stats["renders"] += 1
+    try:
+        async with async_session() as db:
+            result = await render(db)
+        response, character_id = result if isinstance(result, tuple) else (result, None)
+        if response.status_code != 200:
+            return response  # redirects and 404s are not cached
+        body = bytes(response.body)
+        etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+        entry = (body, response.status_code, etag, time.monotonic(), character_id)
+        _cache[key] = entry
+        _cache.move_to_end(key)
+        if len(_cache) > _MAX_ENTRIES:
+            _cache.popitem(last=False)
+        return entry
+    finally:
+        _inflight.pop(key, None)
+
+
+async def _render(key: tuple, render):
+    """Run render(db) once per key; returns the cache entry, or a response that is not cached (redirects, 404s).
+
+    The render runs in its own task, so a client that disconnects only stops
+    waiting — it doesn't cancel the render for the others.
+    """
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(_render_once(key, render))
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())  # no "never retrieved" warning if all waiters left
+        _inflight[key] = task
+    return await asyncio.shield(task)
+
+
+async def _refresh(key: tuple, render):
+    try:
+        await _render(key, render)
+    except Exception as e:
+        logger.warning("Background re-render of %s failed: %s", key, str(e)[:100])
+
+
+async def serve(request: Request, page: str, slug: str, lang: str, render) -> Response:
+    """Serve a prerendered page from the cache, rendering it with render(db) when needed.
+
+    render(db) returns the page response, or (response, character_id) for
+    pages that depend on one character.
+    """
+    key = (page, slug, lang, settings.site_mode)
+    entry = _cache.get(key)
+    if entry is not None:
+        age = time.monotonic() - entry[3]
+        if age < FRESH_TTL:
+            _stats["hits"] += 1
+            _cache.move_to_end(key)
+            return _response(entry, request)
+        if age < STALE_TTL:
+            _stats["stale_hits"] += 1
+            if key not in _inflight:
+                asyncio.create_task(_refresh(key, render))
+            return _response(entry, request)
+    _stats["misses"] += 1
+    result = await _render(key, render)
+    return _response(result, request) if isinstance(result, tuple) else result
+
+
+def invalidate_character(character_id: str, stale_only: bool = False) -> None:
+    """Drop a character's cached pages (edit, delete), or with stale_only mark them for re-render (votes, ratings)."""
+    for key, entry in [(k, v) for k, v in _cache.items() if v[4] == character_id]:
+        if stale_only:
+            body, status, etag, _, cid = entry
+            _cache[key] = (body, status, etag, time.monotonic() - FRESH_TTL, cid)
+        else:
+            _cache.pop(key, None)
+
+
+def get_stats() -> dict:
+    return {**_stats, "entries": len(_cache)}
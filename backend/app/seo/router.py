@@ -1,13 +1,17 @@
+import hashlib
 import json
-from datetime import datetime
-from fastapi import APIRouter, Depends, Query
-from fastapi.responses import HTMLResponse, Response
-from sqlalchemy import select, func
+import time
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
+from sqlalchemy import select, func, or_, and_
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 from app.db.session import get_db
 from app.db.models import Character, Vote
 from app.config import settings
+from app.seo import render_cache
 from app.seo.jsonld import (
     character_jsonld, website_jsonld, software_application_jsonld,
     faq_jsonld, breadcrumb_jsonld, collection_jsonld, SITE_URL, SITE_NAME,
@@ -22,6 +26,12 @@ router = APIRouter(prefix="/api/seo", tags=["seo"])
 
 LANGS = ["en", "es", "ru", "fr", "de", "pt", "it"]
 
+
+def _page_lang(lang: str) -> str:
+    """Unknown ?lang= values render (and are cached) as English."""
+    return lang if lang in LANGS else "en"
+
+
 # Tag slug → search values (match characters in any language)
 TAG_PAGES = [
     {
@@ -170,10 +180,15 @@ def _hreflang_tags(path: str) -> str:
 
 @router.get("/c/{slug}", response_class=HTMLResponse)
 async def prerender_character(
+    request: Request,
     slug: str,
     lang: str = Query("en"),
-    db: AsyncSession = Depends(get_db),
 ):
+    lang = _page_lang(lang)
+    return await render_cache.serve(request, "character", slug, lang, lambda db: _render_character(db, slug, lang))
+
+
+async def _render_character(db: AsyncSession, slug: str, lang: str):
     result = await db.execute(
         select(Character)
         .options(selectinload(Character.creator))
@@ -200,6 +215,9 @@ async def prerender_character(
     tr = (character.translations or {}).get(lang)
     if tr:
         character._active_translations = tr
+    elif (character.original_language or "ru") != lang:
+        from app.characters.translation import request_translations
+        request_translations([character], lang)
 
     name = _escape(tr["name"] if tr and "name" in tr else character.name)
     tagline = _escape(tr["tagline"] if tr and "tagline" in tr else (character.tagline or ""))
@@ -345,15 +363,20 @@ async def prerender_character(
 {body_html}
 </body>
 </html>"""
-    return HTMLResponse(html)
+    return HTMLResponse(html), character.id
 
 
 @router.get("/tags/{slug}", response_class=HTMLResponse)
 async def prerender_tag(
+    request: Request,
     slug: str,
     lang: str = Query("en"),
-    db: AsyncSession = Depends(get_db),
 ):
+    lang = _page_lang(lang)
+    return await render_cache.serve(request, "tag", slug, lang, lambda db: _render_tag(db, slug, lang))
+
+
+async def _render_tag(db: AsyncSession, slug: str, lang: str):
     tag_config = next((t for t in TAG_PAGES if t["slug"] == slug), None)
     if not tag_config:
         return HTMLResponse("<html><body><h1>Not Found</h1></body></html>", status_code=404)
@@ -434,7 +457,12 @@ async def prerender_tag(
 
 
 @router.get("/faq", response_class=HTMLResponse)
-async def prerender_faq(lang: str = Query("en")):
+async def prerender_faq(request: Request, lang: str = Query("en")):
+    lang = _page_lang(lang)
+    return await render_cache.serve(request, "faq", "", lang, lambda db: _render_faq(lang))
+
+
+async def _render_faq(lang: str):
     # Fiction-mode FAQ (GrimQuill — interactive fiction & D&D)
     _faq_fiction = {
         "en": [
@@ -713,7 +741,12 @@ async def prerender_faq(lang: str = Query("en")):
 
 
 @router.get("/about", response_class=HTMLResponse)
-async def prerender_about(lang: str = Query("en")):
+async def prerender_about(request: Request, lang: str = Query("en")):
+    lang = _page_lang(lang)
+    return await render_cache.serve(request, "about", "", lang, lambda db: _render_about(lang))
+
+
+async def _render_about(lang: str):
     _titles = {"en": "About SweetSin", "es": "Acerca de SweetSin", "ru": "О SweetSin", "fr": "À propos de SweetSin", "de": "Über SweetSin", "pt": "Sobre o SweetSin", "it": "Informazioni su SweetSin"}
     _titles_fiction = {"en": "About GrimQuill", "es": "Acerca de GrimQuill", "ru": "О GrimQuill", "fr": "À propos de GrimQuill", "de": "Über GrimQuill", "pt": "Sobre o GrimQuill", "it": "Informazioni su GrimQuill"}
     _descriptions = {
@@ -769,7 +802,12 @@ async def prerender_about(lang: str = Query("en")):
 
 
 @router.get("/terms", response_class=HTMLResponse)
-async def prerender_terms(lang: str = Query("en")):
+async def prerender_terms(request: Request, lang: str = Query("en")):
+    lang = _page_lang(lang)
+    return await render_cache.serve(request, "terms", "", lang, lambda db: _render_terms(lang))
+
+
+async def _render_terms(lang: str):
     _titles = {"en": "Terms of Service", "es": "Términos de servicio", "ru": "Условия использования", "fr": "Conditions d'utilisation", "de": "Nutzungsbedingungen", "pt": "Termos de Uso", "it": "Termini di servizio"}
     _descriptions = {
         "en": "Terms of Service for SweetSin — AI character chat platform. Eligibility, user content rules, acceptable use, and disclaimers.",
@@ -819,7 +857,12 @@ async def prerender_terms(lang: str = Query("en")):
 
 
 @router.get("/privacy", response_class=HTMLResponse)
-async def prerender_privacy(lang: str = Query("en")):
+async def prerender_privacy(request: Request, lang: str = Query("en")):
+    lang = _page_lang(lang)
+    return await render_cache.serve(request, "privacy", "", lang, lambda db: _render_privacy(lang))
+
+
+async def _render_privacy(lang: str):
     _titles = {"en": "Privacy Policy", "es": "Política de privacidad", "ru": "Политика конфиденциальности", "fr": "Politique de confidentialité", "de": "Datenschutzrichtlinie", "pt": "Política de Privacidade", "it": "Informativa sulla privacy"}
     _descriptions = {
         "en": "Privacy Policy for SweetSin — how we collect, use, and protect your data. Your conversations are private.",
@@ -869,10 +912,12 @@ async def prerender_privacy(lang: str = Query("en")):
 
 
 @router.get("/home", response_class=HTMLResponse)
-async def prerender_home(
-    lang: str = Query("en"),
-    db: AsyncSession = Depends(get_db),
-):
+async def prerender_home(request: Request, lang: str = Query("en")):
+    lang = _page_lang(lang)
+    return await render_cache.serve(request, "home", "", lang, lambda db: _render_home(db, lang))
+
+
+async def _render_home(db: AsyncSession, lang: str):
     result = await db.execute(
         select(Character)
         .where(Character.is_public == True, Character.slug.isnot(None))
@@ -960,11 +1005,13 @@ async def prerender_home(
 
 
 @router.get("/campaigns", response_class=HTMLResponse)
-async def prerender_campaigns(
-    lang: str = Query("en"),
-    db: AsyncSession = Depends(get_db),
-):
+async def prerender_campaigns(request: Request, lang: str = Query("en")):
     """Prerender campaigns/adventures page for bots (fiction mode)."""
+    lang = _page_lang(lang)
+    return await render_cache.serve(request, "campaigns", "", lang, lambda db: _render_campaigns(db, lang))
+
+
+async def _render_campaigns(db: AsyncSession, lang: str):
     # Query DnD-tagged characters (adventures)
     result = await db.execute(
         select(Character)
@@ -1030,109 +1077,253 @@ async def prerender_campaigns(
     return HTMLResponse(html)
 
 
-# Sitemap cache (regenerated every 2 hours)
-_sitemap_cache: str = ""
-_sitemap_cache_time: float = 0
-_SITEMAP_TTL = 7200  # 2 hours
+# Sitemap: /sitemap.xml is a sitemap index of child sitemaps:
+# /sitemaps/pages.xml (static and tag pages) and /sitemaps/<lang>-<n>.xml
+# (SITEMAP_SLICE characters in one language, in creation order so existing
+# slices stay put as the catalogue grows; a delete, unpublish or quality-gate
+# drop shifts every later slice by one). Child sitemaps are streamed from
+# keyset-paged queries, so memory does not grow with the catalogue.
+# Responses carry an ETag / Last-Modified derived from each slice's row
+# count, newest updated_at and first / last (created_at, id) — the bounds
+# change when rows shift between slices — and conditional GETs get 304. The slice
+# metadata is cached for _SITEMAP_META_TTL and dropped by invalidate_sitemap()
+# when a character changes.
+SITEMAP_SLICE = 5000  # characters per child sitemap (one language: well under the 50k URL limit)
+_SITEMAP_PAGE = 500  # rows per query while streaming
+_SITEMAP_META_TTL = 600  # seconds
+_sitemap_meta: tuple[float, list[tuple[int, datetime | None, str]]] | None = None  # (ts, [(count, max updated_at, bounds)] per slice)
+
+_URLSET_OPEN = """<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"
+        xmlns:xhtml="http://www.w3.org/1999/xhtml"
+        xmlns:image="http://www.google.com/schemas/sitemap-image/1.1">
+"""
 
 
-@router.api_route("/sitemap.xml", methods=["GET", "HEAD"])
-async def sitemap(db: AsyncSession = Depends(get_db)):
-    import time as _time
+def invalidate_sitemap():
+    """Drop cached sitemap slice metadata (call when a character is created, updated or deleted)."""
+    global _sitemap_meta
+    _sitemap_meta = None
 
-    global _sitemap_cache, _sitemap_cache_time
-    if _sitemap_cache and (_time.monotonic() - _sitemap_cache_time) < _SITEMAP_TTL:
-        return Response(content=_sitemap_cache, media_type="application/xml")
 
+def _sitemap_filter():
     # Quality gate: only include characters with substantial content
+    return (
+        Character.is_public == True,
+        Character.slug.isnot(None),
+        (func.length(func.coalesce(Character.scenario, ""))
+         + func.length(func.coalesce(Character.personality, ""))) >= 100,
+    )
+
+
+async def _sitemap_slices(db: AsyncSession) -> list[tuple[int, datetime | None, str]]:
+    """(character count, newest updated_at, first/last (created_at, id)) per slice of SITEMAP_SLICE characters."""
+    global _sitemap_meta
+    if _sitemap_meta and (time.monotonic() - _sitemap_meta[0]) < _SITEMAP_META_TTL:
+        return _sitemap_meta[1]
+    rn = func.row_number().over(order_by=(Character.created_at, Character.id)) - 1
+    ranked = (
+        select(rn.label("rn"), Character.created_at, Character.id, Character.updated_at)
+        .where(*_sitemap_filter())
+        .subquery()
+    )
     result = await db.execute(
-        select(Character.slug, Character.updated_at, Character.avatar_url, Character.name, Character.content_rating)
-        .where(
-            Character.is_public == True,
-            Character.slug.isnot(None),
-            (func.length(func.coalesce(Character.scenario, ""))
-             + func.length(func.coalesce(Character.personality, ""))) >= 100,
-        )
-        .order_by(Character.updated_at.desc())
+        select(ranked.c.rn // SITEMAP_SLICE, func.count(), func.max(ranked.c.updated_at))
+        .group_by(ranked.c.rn // SITEMAP_SLICE)
+        .order_by(ranked.c.rn // SITEMAP_SLICE)
+    )
+    aggregates = result.all()
+    total = sum(count for _, count, _ in aggregates)
+    # First and last row of every slice
+    result = await db.execute(
+        select(ranked.c.rn, ranked.c.created_at, ranked.c.id)
+        .where(or_(
+            ranked.c.rn % SITEMAP_SLICE == 0,
+            ranked.c.rn % SITEMAP_SLICE == SITEMAP_SLICE - 1,
+            ranked.c.rn == total - 1,
+        ))
+        .order_by(ranked.c.rn)
     )
-    characters = result.all()
+    bounds: dict[int, list[str]] = {}
+    for row_number, created_at, char_id in result.all():
+        bounds.setdefault(row_number // SITEMAP_SLICE, []).append(f"{created_at}/{char_id}")
+    slices = [(count, updated, "..".join(bounds.get(n, []))) for n, count, updated in aggregates]
+    _sitemap_meta = (time.monotonic(), slices)
+    return slices
+
+
+def _http_date(dt: datetime) -> str:
+    return format_datetime(dt.replace(tzinfo=timezone.utc, microsecond=0), usegmt=True)
+
+
+def _sitemap_headers(key: str, last_modified: datetime) -> dict:
+    etag = '"' + hashlib.sha1(f"{SITE_URL}|{key}".encode()).hexdigest()[:20] + '"'
+    return {"ETag": etag, "Last-Modified": _http_date(last_modified), "Cache-Control": "no-cache"}
+
+
+def _not_modified(request: Request, headers: dict, last_modified: datetime) -> bool:
+    """Conditional GET: If-None-Match wins over If-Modified-Since (RFC 9110)."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+        return "*" in tags or headers["ETag"] in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return since >= last_modified.replace(tzinfo=timezone.utc, microsecond=0)
+    return False
+
+
+def _sitemap_response(request: Request, key: str, last_modified: datetime, body):
+    """304, an empty HEAD response, or the body (a string or an async iterator of strings)."""
+    headers = _sitemap_headers(key, last_modified)
+    if _not_modified(request, headers, last_modified):
+        return Response(status_code=304, headers=headers)
+    if request.method == "HEAD":
+        return Response(media_type="application/xml", headers=headers)
+    if isinstance(body, str):
+        return Response(content=body, media_type="application/xml", headers=headers)
+    return StreamingResponse(body, media_type="application/xml", headers=headers)
+
+
+def _sitemap_alternates(path: str) -> str:
+    """xhtml:link alternates for all languages."""
+    links = []
+    for l in LANGS:
+        url = f"{SITE_URL}/{l}{path}" if path else f"{SITE_URL}/{l}"
+        links.append(f'  <xhtml:link rel="alternate" hreflang="{l}" href="{url}"/>')
+    links.append(f'  <xhtml:link rel="alternate" hreflang="x-default" href="{SITE_URL}/en{path}"/>')
+    return "\n".join(links)
 
-    now = datetime.utcnow().strftime("%Y-%m-%d")
 
-    def alternates(path: str) -> str:
-        """xhtml:link alternates for all languages."""
-        links = []
-        for l in LANGS:
-            url = f"{SITE_URL}/{l}{path}" if path else f"{SITE_URL}/{l}"
-            links.append(f'  <xhtml:link rel="alternate" hreflang="{l}" href="{url}"/>')
-        links.append(f'  <xhtml:link rel="alternate" hreflang="x-default" href="{SITE_URL}/en{path}"/>')
-        return "\n".join(links)
-
-    def image_tag(avatar_url: str | None, name: str) -> str:
-        if not avatar_url:
-            return ""
-        img_url = avatar_url if avatar_url.startswith("http") else f"{SITE_URL}{avatar_url}"
-        safe_name = name.replace("&", "&amp;").replace("<", "&lt;").replace('"', "&quot;")
-        return (
-            f'\n  <image:image>\n    <image:loc>{img_url}</image:loc>'
-            f'\n    <image:title>{safe_name}</image:title>\n  </image:image>'
-        )
+def _sitemap_image(avatar_url: str | None, name: str) -> str:
+    if not avatar_url:
+        return ""
+    img_url = avatar_url if avatar_url.startswith("http") else f"{SITE_URL}{avatar_url}"
+    safe_name = name.replace("&", "&amp;").replace("<", "&lt;").replace('"', "&quot;")
+    return (
+        f'\n  <image:image>\n    <image:loc>{img_url}</image:loc>'
+        f'\n    <image:title>{safe_name}</image:title>\n  </image:image>'
+    )
 
-    urls = []
 
+def _today() -> datetime:
+    return datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+@router.api_route("/sitemap.xml", methods=["GET", "HEAD"])
+async def sitemap(request: Request, db: AsyncSession = Depends(get_db)):
+    """Sitemap index: the pages sitemap plus one child sitemap per language and slice."""
+    slices = await _sitemap_slices(db)
+    today = _today()
+    entries = [(f"{SITE_URL}/sitemaps/pages.xml", today)]
+    for l in LANGS:
+        for n, (_, updated, _) in enumerate(slices):
+            entries.append((f"{SITE_URL}/sitemaps/{l}-{n}.xml", updated or today))
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">']
+    for loc, lastmod in entries:
+        parts.append(f"<sitemap>\n  <loc>{loc}</loc>\n  <lastmod>{lastmod.strftime('%Y-%m-%d')}</lastmod>\n</sitemap>")
+    parts.append("</sitemapindex>")
+    last_modified = max(lastmod for _, lastmod in entries)
+    key = f"index|{today.date()}|" + ",".join(f"{c}:{u}" for c, u, _ in slices)
+    return _sitemap_response(request, key, last_modified, "\n".join(parts))
+
+
+@router.api_route("/sitemaps/{name}.xml", methods=["GET", "HEAD"])
+async def child_sitemap(name: str, request: Request, db: AsyncSession = Depends(get_db)):
+    """Child sitemap: "pages" (static and tag pages) or "<lang>-<n>" (characters of slice n)."""
+    if name == "pages":
+        return _pages_sitemap(request)
+    lang, _, n = name.partition("-")
+    slices = await _sitemap_slices(db)
+    if lang not in LANGS or not n.isdigit() or int(n) >= len(slices):
+        return Response(status_code=404)
+    n = int(n)
+    count, updated, bounds = slices[n]
+    last_modified = updated or _today()
+    key = f"{lang}-{n}|{count}:{updated}:{bounds}"
+    return _sitemap_response(request, key, last_modified, _stream_character_urls(lang, n))
+
+
+def _pages_sitemap(request: Request):
+    today = _today()
+    now = today.strftime("%Y-%m-%d")
     # Root URL without language prefix
-    urls.append(
+    urls = [
         f'<url>\n  <loc>{SITE_URL}/</loc>\n  <lastmod>{now}</lastmod>'
         f'\n  <changefreq>daily</changefreq>\n  <priority>1.0</priority>\n</url>'
-    )
-
+    ]
     # Static pages × languages
     static_pages = [
-        ("", "daily", "1.0", now),
-        ("/about", "monthly", "0.3", now),
-        ("/terms", "monthly", "0.2", now),
-        ("/privacy", "monthly", "0.2", now),
-        ("/faq", "monthly", "0.3", now),
+        ("", "daily", "1.0"),
+        ("/about", "monthly", "0.3"),
+        ("/terms", "monthly", "0.2"),
+        ("/privacy", "monthly", "0.2"),
+        ("/faq", "monthly", "0.3"),
     ]
     # Campaigns page (fiction mode only)
     if settings.is_fiction_mode:
-        static_pages.append(("/campaigns", "weekly", "0.7", now))
+        static_pages.append(("/campaigns", "weekly", "0.7"))
     # Tag landing pages
     for tp in TAG_PAGES:
-        static_pages.append((f"/tags/{tp['slug']}", "weekly", "0.7", now))
-    for path, freq, prio, lastmod in static_pages:
+        static_pages.append((f"/tags/{tp['slug']}", "weekly", "0.7"))
+    for path, freq, prio in static_pages:
         for l in LANGS:
             loc = f"{SITE_URL}/{l}{path}" if path else f"{SITE_URL}/{l}"
             urls.append(
-                f"<url>\n  <loc>{loc}</loc>\n  <lastmod>{lastmod}</lastmod>"
+                f"<url>\n  <loc>{loc}</loc>\n  <lastmod>{now}</lastmod>"
                 f"\n  <changefreq>{freq}</changefreq>\n  <priority>{prio}</priority>"
-                f"\n{alternates(path)}\n</url>"
+                f"\n{_sitemap_alternates(path)}\n</url>"
             )
+    xml = _URLSET_OPEN + "\n".join(urls) + "\n</urlset>"
+    key = f"pages|{now}|{settings.is_fiction_mode}|{len(TAG_PAGES)}"
+    return _sitemap_response(request, key, today, xml)
 
-    # Character pages × languages (with image extension)
-    for slug, updated_at, avatar_url, name, content_rating in characters:
-        lastmod = updated_at.strftime("%Y-%m-%d") if updated_at else now
-        path = f"/c/{slug}"
-        img = image_tag(avatar_url, name)
-        _cr = getattr(content_rating, 'value', content_rating) or "sfw"
-        prio = "0.4" if _cr == "nsfw" else "0.7"
-        for l in LANGS:
-            urls.append(
-                f"<url>\n  <loc>{SITE_URL}/{l}{path}</loc>\n  <lastmod>{lastmod}</lastmod>"
-                f"\n  <changefreq>weekly</changefreq>\n  <priority>{prio}</priority>"
-                f"{img}\n{alternates(path)}\n</url>"
-            )
 
-    xml = f"""<?xml version="1.0" encoding="UTF-8"?>
-<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"
-        xmlns:xhtml="http://www.w3.org/1999/xhtml"
-        xmlns:image="http://www.google.com/schemas/sitemap-image/1.1">
-{chr(10).join(urls)}
-</urlset>"""
+async def _stream_character_urls(lang: str, n: int):
+    """Character pages of slice n in one language (with image extension), page by page."""
+    from app.db.session import async_session
 
-    _sitemap_cache = xml
-    _sitemap_cache_time = _time.monotonic()
-    return Response(content=xml, media_type="application/xml")
+    yield _URLSET_OPEN
+    columns = (Character.id, Character.created_at, Character.slug, Character.updated_at,
+               Character.avatar_url, Character.name, Character.content_rating)
+    order = (Character.created_at, Character.id)
+    now = datetime.utcnow().strftime("%Y-%m-%d")
+    remaining = SITEMAP_SLICE
+    cursor = None
+    # Own session: the response body is sent after the request's dependencies are closed
+    async with async_session() as db:
+        while remaining > 0:
+            q = select(*columns).where(*_sitemap_filter()).order_by(*order).limit(min(_SITEMAP_PAGE, remaining))
+            if cursor is None:
+                q = q.offset(n * SITEMAP_SLICE)
+            else:
+                created_at, char_id = cursor
+                q = q.where(or_(
+                    Character.created_at > created_at,
+                    and_(Character.created_at == created_at, Character.id > char_id),
+                ))
+            rows = (await db.execute(q)).all()
+            if not rows:
+                break
+            urls = []
+            for char_id, created_at, slug, updated_at, avatar_url, name, content_rating in rows:
+                lastmod = updated_at.strftime("%Y-%m-%d") if updated_at else now
+                path = f"/c/{slug}"
+                _cr = getattr(content_rating, 'value', content_rating) or "sfw"
+                prio = "0.4" if _cr == "nsfw" else "0.7"
+                urls.append(
+                    f"<url>\n  <loc>{SITE_URL}/{lang}{path}</loc>\n  <lastmod>{lastmod}</lastmod>"
+                    f"\n  <changefreq>weekly</changefreq>\n  <priority>{prio}</priority>"
+                    f"{_sitemap_image(avatar_url, name)}\n{_sitemap_alternates(path)}\n</url>\n"
+                )
+            yield "".join(urls)
+            remaining -= len(rows)
+            cursor = (rows[-1][1], rows[-1][0])
+    yield "</urlset>"
 
 
 @router.api_route("/feed.xml", methods=["GET", "HEAD"])
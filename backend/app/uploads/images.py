@@ -0,0 +1,136 @@
+"""Avatar image processing off the event loop.
+
+Decoding, resizing and WebP encoding are CPU-bound and hold the GIL, so
+they run in a small process pool instead of on the event loop (where
+they stalled every concurrent SSE stream):
+
+- process_avatar() validates an uploaded / generated image and writes all
+  AVATAR_SIZES in one worker call;
+- ensure_thumb() creates a missing thumbnail from the full-size avatar,
+  once per file however many requests ask for it at the same time;
+- at most MAX_PENDING jobs are queued or running; beyond that callers get
+  ImageBusy (HTTP 503) instead of piling up.
+
+Files are written to a temp name and renamed, so a reader never sees a
+partially written image.
+"""
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from pathlib import Path
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# (filename suffix, max dimension, WebP quality)
+AVATAR_SIZES = (("", 512, 85), ("_thumb", 160, 80))
+THUMB_SUFFIX = "_thumb"
+MAX_PENDING = max(1, settings.image_workers) * 8
+
+_pool: ProcessPoolExecutor | None = None
+_pending = 0
+_thumbs_inflight: dict[str, asyncio.Future] = {}
+
+
+class ImageBusy(Exception):
+    """The image queue is full."""
+
+
+def avatars_dir() -> Path:
+    d = Path(settings.upload_dir) / "avatars"
+    d.mkdir(parents=True, exist_ok=True)
+    return d
+
+
+# --- Worker-process functions (must be top-level for pickling) ---
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def _encode(img, size: int, quality: int) -> bytes:
+    from PIL import Image
+    out = img.copy()
+    out.thumbnail((size, size), Image.LANCZOS)
+    buf = BytesIO()
+    out.save(buf, format="WEBP", quality=quality)
+    return buf.getvalue()
+
+
+def _process_avatar(source: bytes | str, out_dir: str, filename: str) -> None:
+    """Decode (validates the image), normalize mode, write every AVATAR_SIZES variant as WebP."""
+    from PIL import Image
+    img = Image.open(BytesIO(source) if isinstance(source, bytes) else source)
+    img.load()  # Force decode to catch corrupted files
+    # Convert RGBA/P to RGB for WebP compatibility
+    if img.mode in ("RGBA", "P"):
+        img = img.convert("RGBA")
+    elif img.mode != "RGB":
+        img = img.convert("RGB")
+    stem = filename.removesuffix(".webp")
+    for suffix, size, quality in AVATAR_SIZES:
+        # WebP output strips all EXIF by default
+        _write_atomic(Path(out_dir) / f"{stem}{suffix}.webp", _encode(img, size, quality))
+
+
+def _make_thumb(full_path: str, thumb_path: str) -> None:
+    from PIL import Image
+    _, size, quality = AVATAR_SIZES[-1]
+    with Image.open(full_path) as img:
+        _write_atomic(Path(thumb_path), _encode(img, size, quality))
+
+
+# --- Event-loop side ---
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=max(1, settings.image_workers))
+    return _pool
+
+
+async def _run(fn, *args):
+    global _pending
+    if _pending >= MAX_PENDING:
+        raise ImageBusy()
+    _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_pool(), fn, *args)
+    finally:
+        _pending -= 1
+
+
+async def process_avatar(source: bytes | Path, filename: str) -> None:
+    """Write all avatar sizes for an image (raw bytes or a file path). Raises ImageBusy, or the decode error."""
+    await _run(_process_avatar, source if isinstance(source, bytes) else str(source), str(avatars_dir()), filename)
+
+
+async def ensure_thumb(filename: str) -> Path | None:
+    """Path of an avatar thumbnail, generated from the full-size file if missing (single-flight). None if no source."""
+    d = avatars_dir()
+    thumb = d / filename
+    if thumb.is_file():
+        return thumb
+    full = d / filename.replace(f"{THUMB_SUFFIX}.webp", ".webp")
+    if not full.is_file():
+        return None
+    fut = _thumbs_inflight.get(filename)
+    if fut is None:
+        fut = asyncio.ensure_future(_run(_make_thumb, str(full), str(thumb)))
+        _thumbs_inflight[filename] = fut
+        fut.add_done_callback(lambda _: _thumbs_inflight.pop(filename, None))
+    await asyncio.shield(fut)
+    return thumb
+
+
+def shutdown(wait: bool = False) -> None:
+    """Stop the worker processes (lifespan shutdown)."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=wait, cancel_futures=True)
+        _pool = None
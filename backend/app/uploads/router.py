@@ -1,16 +1,13 @@
 import base64
-import io
 import logging
 import uuid
-from io import BytesIO
-from pathlib import Path
 
 import httpx
 from fastapi import APIRouter, Body, Depends, HTTPException, UploadFile, File
-from PIL import Image
 
 from app.auth.middleware import get_current_user
 from app.config import settings
+from app.uploads import images
 
 logger = logging.getLogger(__name__)
 
@@ -30,9 +27,6 @@ _MAGIC = {
     b"GIF8": "image/gif",
 }
 
-MAX_DIMENSION = 512
-THUMB_DIMENSION = 160
-
 
 def _check_magic_bytes(data: bytes) -> str | None:
     """Return detected MIME type from magic bytes, or None."""
@@ -45,30 +39,6 @@ def _check_magic_bytes(data: bytes) -> str | None:
     return None
 
 
-def _get_avatars_dir() -> Path:
-    d = Path(settings.upload_dir) / "avatars"
-    d.mkdir(parents=True, exist_ok=True)
-    return d
-
-
-def _save_with_thumb(img: Image.Image, avatars_dir: Path, filename: str) -> None:
-    """Save full-size (512) and thumbnail (160) versions of avatar."""
-    # Full size
-    full = img.copy()
-    full.thumbnail((MAX_DIMENSION, MAX_DIMENSION), Image.LANCZOS)
-    buf = BytesIO()
-    full.save(buf, format="WEBP", quality=85)
-    (avatars_dir / filename).write_bytes(buf.getvalue())
-
-    # Thumbnail
-    thumb = img.copy()
-    thumb.thumbnail((THUMB_DIMENSION, THUMB_DIMENSION), Image.LANCZOS)
-    buf = BytesIO()
-    thumb.save(buf, format="WEBP", quality=80)
-    thumb_name = filename.replace(".webp", "_thumb.webp")
-    (avatars_dir / thumb_name).write_bytes(buf.getvalue())
-
-
 @router.post("/avatar")
 async def upload_avatar(
     file: UploadFile = File(...),
@@ -92,23 +62,15 @@ async def upload_avatar(
     if detected is None:
         raise HTTPException(status_code=400, detail="Invalid image file")
 
-    # Process with Pillow — validates the image is real
+    # Decode (validates the image is real), save full + thumb as WebP (strips all EXIF by default)
+    filename = f"{uuid.uuid4().hex}.webp"
     try:
-        img = Image.open(BytesIO(data))
-        img.load()  # Force decode to catch corrupted files
+        await images.process_avatar(data, filename)
+    except images.ImageBusy:
+        raise HTTPException(status_code=503, detail="Image processing busy, try again")
     except Exception:
         raise HTTPException(status_code=400, detail="Cannot read image file")
 
-    # Convert RGBA/P to RGB for WebP compatibility
-    if img.mode in ("RGBA", "P"):
-        img = img.convert("RGBA")
-    elif img.mode != "RGB":
-        img = img.convert("RGB")
-
-    # Save full + thumb as WebP (strips all EXIF by default)
-    filename = f"{uuid.uuid4().hex}.webp"
-    _save_with_thumb(img, _get_avatars_dir(), filename)
-
     return {"url": f"/api/uploads/avatars/{filename}"}
 
 
@@ -218,11 +180,11 @@ async def generate_avatar(
         raise HTTPException(status_code=502, detail=detail)
 
     try:
-        img = Image.open(io.BytesIO(img_bytes))
-        avatars_dir = _get_avatars_dir()
-        _save_with_thumb(img, avatars_dir, filename)
+        await images.process_avatar(img_bytes, filename)
+    except images.ImageBusy:
+        raise HTTPException(status_code=503, detail="Image processing busy, try again")
     except Exception:
         raise HTTPException(status_code=500, detail="Failed to process generated image")
 
-    logger.info("Avatar generated via %s: %s (%dKB)", provider, filename, (avatars_dir / filename).stat().st_size // 1024)
+    logger.info("Avatar generated via %s: %s (%dKB)", provider, filename, (images.avatars_dir() / filename).stat().st_size // 1024)
     return {"url": f"/api/uploads/avatars/{filename}"}
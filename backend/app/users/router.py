@@ -8,6 +8,7 @@ from app.db.session import get_db
 from sqlalchemy.orm import selectinload
 from app.db.models import User, Favorite, Vote, Character, Chat, Campaign, UserAchievement
 from app.characters.serializers import character_to_dict
+from app.chat import counters
 from app.utils.sanitize import strip_html_tags
 from app.users.xp import xp_for_level, calc_level
 
@@ -47,7 +48,7 @@ async def get_profile(user=Depends(get_current_user), db: AsyncSession = Depends
         "bio": u.bio,
         "language": u.language or "ru",
         "role": u.role or "user",
-        "message_count": u.message_count or 0,
+        "message_count": counters.user_message_count(u.id, u.message_count),
         "chat_count": actual_chat_count,
         "xp_total": u.xp_total or 0,
         "level": u.level or 1,
@@ -105,7 +106,7 @@ async def update_profile(
         "bio": u.bio,
         "language": u.language or "ru",
         "role": u.role or "user",
-        "message_count": u.message_count or 0,
+        "message_count": counters.user_message_count(u.id, u.message_count),
         "chat_count": actual_chat_count,
         "xp_total": u.xp_total or 0,
         "level": u.level or 1,
@@ -251,7 +252,7 @@ async def get_user_stats(user=Depends(get_current_user), db: AsyncSession = Depe
 
     return {
         "adventures_started": adventures_started,
-        "messages_sent": u.message_count or 0,
+        "messages_sent": counters.user_message_count(u.id, u.message_count),
         "adventures_rated": adventures_rated,
         "average_rating": average_rating,
         "achievements_unlocked": achievements_unlocked,
@@ -0,0 +1,224 @@
+"""Admin settings and prompt overrides, one in-memory registry per worker.
+
+Both live in prompt_templates: admin settings as setting.* rows, prompt
+overrides as <lang>.<key> rows (the same table also stores scheduler /
+model-monitor state, which is skipped here).
+
+- load() reads every relevant row in one query and swaps in fresh dicts;
+  readers (get(), prompt_overrides()) only look up a module dict — no
+  lock, no await, no DB on the request path.
+- publish() is called after an admin write: it bumps the version stamp
+  row (meta.settings_version), sends NOTIFY on Postgres and reloads this
+  worker right away.
+- watch() (lifespan task) keeps other workers in sync: LISTEN on Postgres
+  for instant reloads, plus a poll of the version stamp (every
+  POLL_INTERVAL, or WATCH_POLL_INTERVAL as a safety net while LISTEN is
+  up — a transaction pooler like pgbouncer drops notifications).
+- Without watch() (scripts, one-off tools) ensure_fresh() falls back to
+  reloading every FALLBACK_TTL.
+"""
+import asyncio
+import logging
+import time
+import uuid
+
+from sqlalchemy import text
+
+from app.db.session import engine
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "admin_settings"
+VERSION_KEY = "meta.settings_version"
+POLL_INTERVAL = 5  # seconds, version-stamp poll without LISTEN
+WATCH_POLL_INTERVAL = 30  # seconds, safety-net poll while LISTEN is up
+FALLBACK_TTL = 60  # seconds, reload interval when watch() isn't running
+
+# Short key (without "setting.") -> default; the default's type is the setting's type
+DEFAULTS: dict[str, bool | int | str] = {
+    "notify_registration": True,
+    "notify_errors": True,
+    "paid_mode": False,
+    "cost_mode": "quality",  # quality | balanced | economy
+    "daily_message_limit": 1000,
+    "max_personas": 5,
+    "anon_message_limit": 20,
+    "provider_enabled.openrouter": True,
+    "provider_enabled.groq": True,
+    "provider_enabled.cerebras": True,
+    "provider_enabled.together": True,
+    "provider_enabled.openai": True,
+    "provider_enabled.claude": True,
+    "provider_enabled.deepseek": True,
+    "provider_enabled.gemini": True,
+    "provider_enabled.qwen": True,
+}
+
+# prompt_templates rows that are neither settings nor prompt overrides
+_SKIP_PREFIXES = ("scheduler.", "model_override.", "models.", "meta.")
+
+_settings: dict[str, bool | int | str] = dict(DEFAULTS)
+_raw: dict[str, str] = {}  # setting.* rows as stored
+_prompts: dict[str, str] = {}
+_prompts_version = 0  # bumped whenever prompt overrides change
+_stamp: str | None = None  # meta.settings_version seen by the last load
+_loaded_at = 0.0
+_watching = False
+_loading: asyncio.Future | None = None
+
+
+def _parse(default, raw: str | None):
+    if raw is None or raw == "":
+        return default
+    if isinstance(default, bool):
+        return raw.strip().lower() == "true"
+    if isinstance(default, int):
+        try:
+            return int(raw)
+        except ValueError:
+            return default
+    return raw
+
+
+async def _load() -> None:
+    global _settings, _raw, _prompts, _prompts_version, _stamp, _loaded_at
+    skip = " AND ".join(f"key NOT LIKE '{p}%'" for p in _SKIP_PREFIXES)
+    async with engine.connect() as conn:
+        rows = (await conn.execute(
+            text(f"SELECT key, value FROM prompt_templates WHERE {skip} OR key = :v"),
+            {"v": VERSION_KEY},
+        )).all()
+    raw, prompts, stamp = {}, {}, None
+    for key, value in rows:
+        if key == VERSION_KEY:
+            stamp = value
+        elif key.startswith("setting."):
+            raw[key.removeprefix("setting.")] = value
+        else:
+            prompts[key] = value
+    _settings = {k: _parse(d, raw.get(k)) for k, d in DEFAULTS.items()}
+    _raw = raw
+    if prompts != _prompts:
+        _prompts = prompts
+        _prompts_version += 1
+    _stamp = stamp
+    _loaded_at = time.monotonic()
+    _apply_side_effects()
+
+
+def _apply_side_effects() -> None:
+    """Push settings that other modules hold in their own state."""
+    from app.llm import model_cooldown
+    model_cooldown.set_admin_disabled({
+        k.removeprefix("provider_enabled.") for k, v in _raw.items()
+        if k.startswith("provider_enabled.") and v != "true"
+    })
+
+
+async def load(fresh: bool = False) -> None:
+    """Reload from the DB; concurrent callers share one query (fresh=True: one that starts after the call)."""
+    global _loading, _loaded_at
+    while _loading is not None:
+        await asyncio.gather(asyncio.shield(_loading), return_exceptions=True)
+        if not fresh:
+            return
+    _loading = asyncio.ensure_future(_load())
+    try:
+        await asyncio.shield(_loading)
+    except Exception as e:
+        logger.warning("Failed to load admin settings: %s", str(e)[:200])
+        _loaded_at = time.monotonic()  # table might not exist yet: keep current values, retry later
+    finally:
+        _loading = None
+
+
+async def ensure_fresh() -> None:
+    """Load on first use; reload every FALLBACK_TTL only when watch() isn't keeping the registry current."""
+    if _loaded_at and (_watching or time.monotonic() - _loaded_at < FALLBACK_TTL):
+        return
+    await load()
+
+
+def get(key: str):
+    """Typed value of an admin setting (short key, e.g. "cost_mode")."""
+    return _settings[key]
+
+
+def all_raw() -> dict[str, str]:
+    """Every known setting as its string value (short key -> value), defaults filled in."""
+    return {k: _raw.get(k, str(d).lower() if isinstance(d, bool) else str(d)) for k, d in DEFAULTS.items()}
+
+
+def prompt_overrides() -> tuple[dict[str, str], int]:
+    """Prompt overrides and their version (changes whenever an override does)."""
+    return _prompts, _prompts_version
+
+
+async def publish() -> None:
+    """Announce an admin write to every worker, and reload this one."""
+    stamp = uuid.uuid4().hex
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(
+                text("""
+                    INSERT INTO prompt_templates (key, value, updated_at)
+                    VALUES (:k, :v, CURRENT_TIMESTAMP)
+                    ON CONFLICT (key) DO UPDATE SET value = :v, updated_at = CURRENT_TIMESTAMP
+                """),
+                {"k": VERSION_KEY, "v": stamp},
+            )
+            if engine.dialect.name == "postgresql":
+                await conn.execute(text("SELECT pg_notify(:c, :v)"), {"c": CHANNEL, "v": stamp})
+    except Exception as e:
+        logger.warning("Failed to publish admin settings change: %s", str(e)[:200])
+    await load(fresh=True)
+
+
+async def _poll_stamp() -> None:
+    async with engine.connect() as conn:
+        stamp = (await conn.execute(
+            text("SELECT value FROM prompt_templates WHERE key = :k"), {"k": VERSION_KEY}
+        )).scalar_one_or_none()
+    if stamp != _stamp:
+        await load(fresh=True)
+
+
+async def _listen(changed: asyncio.Event):
+    """Open a LISTEN connection (Postgres only). Returns the connection to keep open, or None."""
+    if engine.dialect.name != "postgresql":
+        return None
+    try:
+        conn = await engine.connect()
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.add_listener(CHANNEL, lambda *_: changed.set())
+        return conn
+    except Exception as e:
+        logger.warning("LISTEN %s unavailable, polling only: %s", CHANNEL, str(e)[:200])
+        return None
+
+
+async def watch() -> None:
+    """Keep this worker's registry current (lifespan task)."""
+    global _watching
+    await load()
+    changed = asyncio.Event()
+    conn = await _listen(changed)
+    _watching = True
+    try:
+        while True:
+            try:
+                await asyncio.wait_for(changed.wait(), WATCH_POLL_INTERVAL if conn else POLL_INTERVAL)
+                changed.clear()
+                await load(fresh=True)
+            except asyncio.TimeoutError:
+                try:
+                    await _poll_stamp()
+                except Exception as e:
+                    logger.warning("Admin settings poll failed: %s", str(e)[:200])
+    finally:
+        _watching = False
+        if conn is not None:
+            try:
+                await conn.close()
+            except Exception:
+                pass
@@ -109,20 +109,11 @@ class AdminEmailHandler(logging.Handler):
 
 async def _send_error_digest(errors: list[BufferedError]):
     """Check setting, format, and send error digest to all admins."""
-    from app.db.session import engine as db_engine
-    from sqlalchemy.ext.asyncio import AsyncSession
-    from sqlalchemy import text as sa_text
+    from app.utils import admin_settings
 
     # Check toggle
-    try:
-        async with AsyncSession(db_engine) as session:
-            result = await session.execute(
-                sa_text("SELECT value FROM prompt_templates WHERE key = 'setting.notify_errors'")
-            )
-            row = result.scalar_one_or_none()
-            enabled = (row or "true").lower() == "true"
-    except Exception:
-        enabled = True  # default to enabled
+    await admin_settings.ensure_fresh()
+    enabled = admin_settings.get("notify_errors")
 
     if not enabled:
         return
@@ -0,0 +1,112 @@
+"""Bounded background job queue with a fixed pool of worker tasks.
+
+- submit() waits for room when the queue is full, so producers slow down
+  instead of piling up unbounded tasks (back-pressure); offer() drops the
+  job instead, for work that is safe to skip.
+- A failing job is retried with exponential backoff; after the last
+  attempt the error is logged and set on the job's future.
+- Workers start lazily on the running event loop; drain() waits for
+  queued jobs to finish (lifespan shutdown).
+
+Jobs must be safe to retry: each should be a single transaction or
+otherwise idempotent.
+"""
+
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _consume(fut: asyncio.Future) -> None:
+    """Mark a job's exception as retrieved (it was logged already)."""
+    if not fut.cancelled():
+        fut.exception()
+
+
+class JobQueue:
+    def __init__(self, name: str, maxsize: int = 1000, workers: int = 4, retries: int = 2, retry_delay: float = 0.5):
+        self.name = name
+        self.maxsize = maxsize
+        self.workers = workers
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self.dropped = 0
+        self.failed = 0
+
+    def _ensure_started(self) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+            self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+        return self._queue
+
+    def _job(self, fn, args, kwargs) -> tuple:
+        fut = self._loop.create_future()
+        fut.add_done_callback(_consume)
+        return fn, args, kwargs, fut
+
+    async def submit(self, fn, *args, **kwargs) -> asyncio.Future:
+        """Queue fn(*args, **kwargs), waiting for room if full. Returns a future with its result."""
+        queue = self._ensure_started()
+        job = self._job(fn, args, kwargs)
+        await queue.put(job)
+        return job[3]
+
+    def offer(self, fn, *args, **kwargs) -> asyncio.Future | None:
+        """Queue fn(*args, **kwargs) if there is room, else drop it and return None."""
+        queue = self._ensure_started()
+        job = self._job(fn, args, kwargs)
+        try:
+            queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return None
+        return job[3]
+
+    async def _run(self, fn, args, kwargs, fut: asyncio.Future) -> None:
+        for attempt in range(self.retries + 1):
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                if attempt < self.retries:
+                    await asyncio.sleep(self.retry_delay * 2 ** attempt)
+                    continue
+                self.failed += 1
+                logger.warning("%s job %s failed after %d attempts: %s",
+                               self.name, getattr(fn, "__name__", fn), attempt + 1, e)
+                if not fut.done():
+                    fut.set_exception(e)
+                return
+            if not fut.done():
+                fut.set_result(result)
+            return
+
+    async def _worker(self) -> None:
+        queue = self._queue
+        while True:
+            fn, args, kwargs, fut = await queue.get()
+            try:
+                await self._run(fn, args, kwargs, fut)
+            finally:
+                queue.task_done()
+
+    def qsize(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def drain(self, timeout: float = 10.0) -> None:
+        """Wait up to timeout for queued jobs to finish, then stop the workers."""
+        if self._queue is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("%s queue: %d jobs left at shutdown", self.name, self._queue.qsize())
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self._queue = None
+        self._loop = None
@@ -0,0 +1,114 @@
+"""Context window loader benchmark.
+
+Seeds chats with 100 / 1k / 10k messages into a throwaway SQLite database and
+times the prompt-context load path: the old full-history load vs the bounded
+tail window (get_context_tail + cached get_message_count). The tail loader
+should stay flat as the chat grows.
+
+Usage:
+  cd backend
+  python scripts/benchmark_context_window.py
+  python scripts/benchmark_context_window.py --sizes 100,1000,10000,50000 --runs 50
+
+No API keys or Postgres needed.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+# Add parent to path so we can import app modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.ext.compiler import compiles
+
+from app.db.models import Base, User, Character, Chat, Message, MessageRole
+from app.chat import service
+from app.chat.service import get_context_tail, get_message_count, DEFAULT_CONTEXT_TOKENS, MAX_CONTEXT_MESSAGES
+
+
+@compiles(JSONB, "sqlite")
+def _jsonb_sqlite(_type, _compiler, **_kw):
+    return "JSON"
+
+
+async def _seed(session_factory, n_messages: int) -> str:
+    async with session_factory() as db:
+        user = User(email=f"bench{n_messages}@example.com", username=f"bench{n_messages}")
+        db.add(user)
+        await db.flush()
+        character = Character(creator_id=user.id, name="Bench", personality="-", greeting_message="-")
+        db.add(character)
+        await db.flush()
+        chat = Chat(user_id=user.id, character_id=character.id)
+        db.add(chat)
+        await db.flush()
+        start = datetime.utcnow() - timedelta(seconds=n_messages)
+        content = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 8
+        for i in range(n_messages):
+            db.add(Message(
+                chat_id=chat.id,
+                role=MessageRole.user if i % 2 else MessageRole.assistant,
+                content=content,
+                token_count=len(content) // 4,
+                created_at=start + timedelta(seconds=i),
+            ))
+        await db.commit()
+        return chat.id
+
+
+async def _time(session_factory, fn, runs: int) -> float:
+    samples = []
+    for _ in range(runs):
+        async with session_factory() as db:
+            t0 = time.perf_counter()
+            await fn(db)
+            samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark context window loading")
+    parser.add_argument("--sizes", default="100,1000,10000", help="Comma-separated messages-per-chat sizes")
+    parser.add_argument("--runs", type=int, default=20, help="Runs per measurement (median reported)")
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        # Same index init_db() creates for the tail window
+        await conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_messages_chat_created ON messages (chat_id, created_at DESC, id DESC)"
+        ))
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    print(f"{'messages':>10} {'full load (ms)':>16} {'tail window (ms)':>18} {'window size':>12}")
+    for n in sizes:
+        chat_id = await _seed(session_factory, n)
+
+        async def full_load(db):
+            await service.get_chat_messages(db, chat_id)
+
+        async def tail_load(db):
+            await get_context_tail(db, chat_id, DEFAULT_CONTEXT_TOKENS, MAX_CONTEXT_MESSAGES)
+            await get_message_count(db, chat_id)
+
+        full_ms = await _time(session_factory, full_load, args.runs)
+        tail_ms = await _time(session_factory, tail_load, args.runs)
+        async with session_factory() as db:
+            window, _ = await get_context_tail(db, chat_id, DEFAULT_CONTEXT_TOKENS, MAX_CONTEXT_MESSAGES)
+        print(f"{n:>10} {full_ms:>16.2f} {tail_ms:>18.2f} {len(window):>12}")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
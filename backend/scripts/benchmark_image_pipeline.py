@@ -0,0 +1,102 @@
+"""Avatar image pipeline benchmark: event-loop lag during an upload burst.
+
+Processes a burst of concurrent avatar uploads (random-noise 1024x1024 PNGs,
+the worst case for the encoders) while a ticker task measures how late the
+event loop wakes it up — the stall every concurrent SSE stream would see.
+
+- inline: the old path, decode + resize + WebP encode on the event loop;
+- pool:   uploads/images.py, the same work in the process pool.
+
+Usage:
+  cd backend
+  python scripts/benchmark_image_pipeline.py
+  python scripts/benchmark_image_pipeline.py --uploads 32 --workers 4
+
+No API keys or database needed; files go to a temp directory.
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+# Add parent to path so we can import app modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from app.config import settings
+
+TICK = 0.005  # seconds
+
+
+def _make_png() -> bytes:
+    img = Image.frombytes("RGB", (1024, 1024), os.urandom(1024 * 1024 * 3))
+    buf = BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+async def _ticker(lags: list[float], stop: asyncio.Event):
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append((time.perf_counter() - t0 - TICK) * 1000)
+
+
+async def _burst(process, payloads: list[bytes]) -> tuple[float, list[float]]:
+    lags: list[float] = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(_ticker(lags, stop))
+    await asyncio.sleep(TICK * 2)
+    t0 = time.perf_counter()
+    await asyncio.gather(*(process(data, f"bench{i}.webp") for i, data in enumerate(payloads)))
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await ticker
+    return elapsed, lags
+
+
+def _report(name: str, elapsed: float, lags: list[float]):
+    lags = sorted(lags)
+    p99 = lags[min(len(lags) - 1, int(len(lags) * 0.99))]
+    print(f"{name:8s} total {elapsed * 1000:8.0f} ms | loop lag median {statistics.median(lags):7.1f} ms"
+          f"  p99 {p99:7.1f} ms  max {lags[-1]:7.1f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Avatar pipeline event-loop lag benchmark")
+    parser.add_argument("--uploads", type=int, default=16, help="concurrent uploads in the burst")
+    parser.add_argument("--workers", type=int, default=2, help="image worker processes")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_images_")
+    settings.upload_dir = tmp
+    settings.image_workers = args.workers
+    from app.uploads import images
+    images.MAX_PENDING = max(images.MAX_PENDING, args.uploads)
+    out_dir = str(images.avatars_dir())
+
+    payloads = [_make_png() for _ in range(args.uploads)]
+    print(f"{args.uploads} uploads of {int(statistics.median(len(p) for p in payloads)) // 1024} KB PNG, "
+          f"{args.workers} workers\n")
+
+    async def inline(data: bytes, filename: str):
+        images._process_avatar(data, out_dir, filename)
+
+    # Warm the pool up so process start-up isn't counted
+    await images.process_avatar(payloads[0], "warmup.webp")
+
+    _report("inline", *await _burst(inline, payloads))
+    _report("pool", *await _burst(images.process_avatar, payloads))
+    images.shutdown(wait=True)
+    shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,100 @@
+"""Lorebook (World Info) matching benchmark.
+
+Builds synthetic lorebooks (default 50 / 500 entries, 3-5 keywords each, mixed
+English/Russian) and times one turn of keyword matching against ~10 recent
+messages of context: the old per-turn split + substring scan vs the cached
+Aho-Corasick matcher. Also reports the one-off compile cost.
+
+Usage:
+  cd backend
+  python scripts/benchmark_lore_matching.py
+  python scripts/benchmark_lore_matching.py --entries 50,500,2000 --runs 200
+
+No API keys or database needed.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+# Add parent to path so we can import app modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.chat.lore_matcher import LoreMatcher, get_matcher
+
+_SYLLABLES = ["ka", "ro", "mi", "tel", "dor", "an", "ve", "lis", "gra", "thu", "за", "мок", "ле", "сна", "вор", "ди"]
+_FILLER = ["she", "looked", "at", "the", "window", "and", "smiled", "он", "тихо", "сказал", "что", "пора", "идти", "night"]
+
+
+def _word(rng: random.Random) -> str:
+    return "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(3, 5)))
+
+
+def _lorebook(n: int, rng: random.Random) -> list[dict]:
+    return [
+        {
+            "id": f"e{i}",
+            "keywords": ", ".join(_word(rng) for _ in range(rng.randint(3, 5))),
+            "content": " ".join(_word(rng) for _ in range(60)),
+            "enabled": True,
+            "position": rng.randint(0, 10),
+        }
+        for i in range(n)
+    ]
+
+
+def _context(lore: list[dict], rng: random.Random) -> str:
+    # ~10 messages of ~150 words; a handful of real keywords mixed in
+    words = [rng.choice(_FILLER) for _ in range(1500)]
+    for entry in rng.sample(lore, min(8, len(lore))):
+        words[rng.randrange(len(words))] = entry["keywords"].split(",")[0].strip()
+    return " ".join(words)
+
+
+def _old_match(lore_entries: list[dict], context_text: str) -> list[str]:
+    """Pre-index implementation (split + lowercase + substring scan every turn)."""
+    context_lower = context_text.lower()
+    matched = []
+    for entry in lore_entries:
+        if not entry.get("enabled", True):
+            continue
+        keywords = [kw.strip().lower() for kw in entry.get("keywords", "").split(",") if kw.strip()]
+        if any(kw in context_lower for kw in keywords):
+            matched.append(entry["content"])
+    return matched
+
+
+def _time(fn, runs: int) -> float:
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark lorebook keyword matching")
+    parser.add_argument("--entries", default="50,500", help="Comma-separated lorebook sizes")
+    parser.add_argument("--runs", type=int, default=100, help="Runs per measurement (median reported)")
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.entries.split(",") if s.strip()]
+    rng = random.Random(42)
+
+    print(f"{'entries':>8} {'compile (ms)':>13} {'old scan (ms)':>14} {'indexed (ms)':>13} {'matched':>8}")
+    for n in sizes:
+        lore = _lorebook(n, rng)
+        context = _context(lore, rng)
+        compile_ms = _time(lambda: LoreMatcher(lore), max(3, args.runs // 20))
+        get_matcher(f"bench{n}", lore)  # warm the per-character cache
+        old_ms = _time(lambda: _old_match(lore, context), args.runs)
+        new_ms = _time(lambda: get_matcher(f"bench{n}", lore).match(context), args.runs)
+        matched = len(get_matcher(f"bench{n}", lore).match(context))
+        print(f"{n:>8} {compile_ms:>13.2f} {old_ms:>14.2f} {new_ms:>13.2f} {matched:>8}")
+
+
+if __name__ == "__main__":
+    main()
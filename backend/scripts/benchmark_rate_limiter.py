@@ -0,0 +1,127 @@
+"""Rate limiter benchmark.
+
+Hits a limiter with N distinct keys (default 100k, like a flood of anonymous
+sessions / IPs) and reports time per check and memory held afterwards for
+the old per-key timestamp-list limiter vs the GCRA memory store. Then lets
+the keys go idle and shows how many each implementation still keeps.
+
+With --db also times the shared database backend (SQLite file by default,
+or the DATABASE_URL you pass via env) on a smaller key count.
+
+Usage:
+  cd backend
+  python scripts/benchmark_rate_limiter.py
+  python scripts/benchmark_rate_limiter.py --keys 100000 --db --db-keys 2000
+
+No API keys needed.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+
+# Add parent to path so we can import app modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if "--db" in sys.argv and "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/ratelimit_bench.db"
+
+from app.auth import rate_limit  # noqa: E402
+
+
+class OldRateLimiter:
+    """Pre-GCRA implementation (timestamp list per key, never evicted)."""
+
+    def __init__(self, max_requests: int, window_seconds: float):
+        self.max_requests = max_requests
+        self.window = window_seconds
+        self._requests: dict[str, list[float]] = defaultdict(list)
+
+    def check(self, key: str) -> bool:
+        now = time.monotonic()
+        cutoff = now - self.window
+        self._requests[key] = [t for t in self._requests[key] if t > cutoff]
+        if len(self._requests[key]) >= self.max_requests:
+            return False
+        self._requests[key].append(now)
+        return True
+
+
+def _measure(fn, keys: list[str], rounds: int) -> tuple[float, float]:
+    """(median µs per check, MB held after the run)."""
+    tracemalloc.start()
+    samples = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        for key in keys:
+            fn(key)
+        samples.append((time.perf_counter() - t0) / len(keys) * 1e6)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(samples), current / 1024 / 1024
+
+
+async def _bench_db(n: int) -> None:
+    from app.db.session import engine
+    from app.db.models import Base, RateLimit  # noqa: F401
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    rate_limit.settings.rate_limit_backend = "database"
+    limiter = rate_limit.RateLimiter(max_requests=20, window_seconds=60)
+    keys = [f"msg:db{i}" for i in range(n)]
+    t0 = time.perf_counter()
+    for key in keys:
+        await limiter.check(key)
+    per_check = (time.perf_counter() - t0) / n * 1e3
+    # Same key over the limit: 20 allowed, then rejected
+    allowed = [await limiter.check("msg:burst") for _ in range(25)]
+    print(f"\ndatabase backend ({engine.url.get_backend_name()}): {per_check:.2f} ms/check over {n} keys, "
+          f"burst of 25 -> {sum(allowed)} allowed")
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark rate limiter backends")
+    parser.add_argument("--keys", type=int, default=100_000, help="Distinct keys")
+    parser.add_argument("--rounds", type=int, default=3, help="Passes over all keys (median reported)")
+    parser.add_argument("--db", action="store_true", help="Also time the shared database backend")
+    parser.add_argument("--db-keys", type=int, default=2000, help="Distinct keys for the database run")
+    args = parser.parse_args()
+    keys = [f"anon:{i:08x}" for i in range(args.keys)]
+
+    old = OldRateLimiter(max_requests=20, window_seconds=60)
+    new = rate_limit.RateLimiter(max_requests=20, window_seconds=60, shared=False)
+    old_us, old_mb = _measure(old.check, keys, args.rounds)
+    new_us, new_mb = _measure(lambda k: new._memory.acquire(k, new._interval, new._tolerance), keys, args.rounds)
+
+    print(f"{args.keys} distinct keys, {args.rounds} rounds")
+    print(f"{'':>10} {'µs/check':>10} {'MB held':>10}")
+    print(f"{'old list':>10} {old_us:>10.2f} {old_mb:>10.1f}")
+    print(f"{'gcra':>10} {new_us:>10.2f} {new_mb:>10.1f}")
+
+    # Idle eviction: short window so the keys expire quickly, then a few fresh keys arrive
+    window = 0.5
+    old = OldRateLimiter(max_requests=20, window_seconds=window)
+    new = rate_limit.RateLimiter(max_requests=20, window_seconds=window, shared=False)
+    for key in keys:
+        old.check(key)
+        new._memory.acquire(key, new._interval, new._tolerance)
+    time.sleep(window + 0.1)
+    for i in range(2000):
+        old.check(f"fresh:{i}")
+        new._memory.acquire(f"fresh:{i}", new._interval, new._tolerance)
+    print(f"\nkeys kept after {args.keys} went idle (+2000 fresh): "
+          f"old {len(old._requests)}, gcra {len(new._memory)}")
+
+    if args.db:
+        asyncio.run(_bench_db(args.db_keys))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Daily limit check benchmark: COUNT(*) over history vs usage counters.
+
+Seeds a throwaway SQLite database with a light user (10 messages) and a
+heavy user (--history messages, a few of them today), reconciles the
+usage counters from the messages table, then times the old per-message
+COUNT(*) over messages JOIN chats against the counter lookup (single-row
+read with the cache cleared, and a cache hit) for both users.
+
+Usage:
+  cd backend
+  python scripts/benchmark_usage_counters.py
+  python scripts/benchmark_usage_counters.py --history 100000 --runs 200
+
+No API keys needed.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+# Add parent to path so we can import app modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/usage_bench.db"
+
+from sqlalchemy import text as sa_text  # noqa: E402
+
+from app.chat import usage  # noqa: E402
+from app.db.models import Base, User, Character, Chat, Message, MessageRole  # noqa: E402
+from app.db.session import engine, async_session  # noqa: E402
+
+_OLD_COUNT_SQL = sa_text("""
+    SELECT COUNT(*) FROM messages m
+    JOIN chats c ON m.chat_id = c.id
+    WHERE c.user_id = :uid
+    AND m.role = 'user'
+    AND m.created_at >= :today
+""")
+
+
+async def _seed(user_id: str, total: int, today_count: int):
+    """One chat per 1000 messages; the last today_count messages are from today."""
+    now = datetime.utcnow()
+    old = now - timedelta(days=30)
+    async with async_session() as db:
+        db.add(User(id=user_id, email=f"{user_id}@bench", username=user_id, display_name="Bench"))
+        db.add(Character(id=f"char-{user_id}", creator_id=user_id, name="Bench", personality="", greeting_message="Hi"))
+        chat_ids = [str(uuid.uuid4()) for _ in range(0, total, 1000)]
+        for chat_id in chat_ids:
+            db.add(Chat(id=chat_id, user_id=user_id, character_id=f"char-{user_id}"))
+        await db.commit()
+    rows = [{
+        "id": str(uuid.uuid4()), "chat_id": chat_ids[i // 1000], "role": MessageRole.user, "content": "hi",
+        "created_at": now if i >= total - today_count else old,
+    } for i in range(total)]
+    async with engine.begin() as conn:
+        await conn.execute(Message.__table__.insert(), rows)
+
+
+async def _time(fn, runs: int) -> float:
+    """Median ms per call."""
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+async def run(history: int, runs: int):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(sa_text(
+            "CREATE INDEX IF NOT EXISTS idx_messages_chat_created ON messages (chat_id, created_at DESC, id DESC)"
+        ))
+    users = {"light (10 msgs)": ("light-user", 10, 5), f"heavy ({history} msgs)": ("heavy-user", history, 50)}
+    for user_id, total, today_count in users.values():
+        await _seed(user_id, total, today_count)
+
+    t0 = time.perf_counter()
+    await usage.reconcile()
+    print(f"reconcile: {(time.perf_counter() - t0) * 1000:.1f} ms\n")
+
+    today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    print(f"{'':>22} {'COUNT(*) ms':>12} {'row ms':>8} {'cached ms':>10} {'used':>6}")
+    for label, (user_id, _, today_count) in users.items():
+        async def old():
+            async with engine.connect() as conn:
+                return (await conn.execute(_OLD_COUNT_SQL, {"uid": user_id, "today": today_start})).scalar()
+
+        async def row():
+            usage._cache.clear()
+            return await usage.count_user_today(user_id)
+
+        async def cached():
+            return await usage.count_user_today(user_id)
+
+        assert await old() == await row() == today_count
+        print(f"{label:>22} {await _time(old, runs):>12.3f} {await _time(row, runs):>8.3f} "
+              f"{await _time(cached, runs):>10.4f} {today_count:>6}")
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark daily limit checks")
+    parser.add_argument("--history", type=int, default=100_000, help="Messages in the heavy user's history")
+    parser.add_argument("--runs", type=int, default=100, help="Timed checks per variant (median reported)")
+    args = parser.parse_args()
+    asyncio.run(run(args.history, args.runs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Hot-query plan check: fails when a hot query falls back to a sequential scan.
+
+Runs EXPLAIN for the query shapes on the chat hot path (get_chat_messages,
+the context tail, the summarizer keyset, list_user_chats,
+get_or_create_chat, the usage reconciler, achievement counts, group chat
+and lore lookups) and exits 1 if any plan scans a table sequentially.
+
+- Postgres (DATABASE_URL): EXPLAIN (FORMAT JSON) with enable_seqscan off,
+  so a small table can't hide a missing index — a Seq Scan left in the
+  plan means no usable index exists.
+- --sqlite: builds a throwaway SQLite schema with init_db (create_all +
+  migrations) and reads EXPLAIN QUERY PLAN.
+
+Usage:
+  cd backend
+  python scripts/check_query_plans.py --sqlite
+  DATABASE_URL=postgresql://... python scripts/check_query_plans.py
+
+Add a query here when a new hot path lands.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+# Add parent to path so we can import app modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_NOW = datetime.utcnow()
+_ID = "00000000-0000-0000-0000-000000000000"
+
+# name -> (sql, params)
+HOT_QUERIES: dict[str, tuple[str, dict]] = {
+    "get_chat_messages (page)": (
+        "SELECT * FROM messages WHERE chat_id = :chat_id AND created_at < :before"
+        " ORDER BY created_at DESC LIMIT 21",
+        {"chat_id": _ID, "before": _NOW},
+    ),
+    "context tail": (
+        "SELECT * FROM messages WHERE chat_id = :chat_id ORDER BY created_at DESC, id DESC LIMIT 60",
+        {"chat_id": _ID},
+    ),
+    "summarizer keyset": (
+        "SELECT * FROM messages WHERE chat_id = :chat_id"
+        " AND (created_at > :at OR (created_at = :at AND id > :id))"
+        " ORDER BY created_at, id LIMIT 55",
+        {"chat_id": _ID, "at": _NOW, "id": _ID},
+    ),
+    "list_user_chats": (
+        "SELECT * FROM chats WHERE user_id = :user_id ORDER BY updated_at DESC",
+        {"user_id": _ID},
+    ),
+    "get_or_create_chat": (
+        "SELECT * FROM chats WHERE character_id = :character_id AND user_id = :user_id",
+        {"character_id": _ID, "user_id": _ID},
+    ),
+    "get_or_create_chat (anon)": (
+        "SELECT * FROM chats WHERE character_id = :character_id AND anon_session_id = :sid",
+        {"character_id": _ID, "sid": _ID},
+    ),
+    "user chat count": (
+        "SELECT count(*) FROM chats WHERE user_id = :user_id",
+        {"user_id": _ID},
+    ),
+    "achievement message count": (
+        "SELECT count(*) FROM messages m JOIN chats c ON m.chat_id = c.id"
+        " WHERE c.user_id = :user_id AND m.role = 'user'",
+        {"user_id": _ID},
+    ),
+    "usage reconciler (today)": (
+        "SELECT c.user_id, count(*) FROM messages m JOIN chats c ON m.chat_id = c.id"
+        " WHERE c.anon_session_id IS NULL AND m.role = 'user' AND m.created_at >= :today"
+        " GROUP BY c.user_id",
+        {"today": _NOW - timedelta(hours=1)},
+    ),
+    "group chat list": (
+        "SELECT * FROM group_chats WHERE user_id = :user_id ORDER BY updated_at DESC",
+        {"user_id": _ID},
+    ),
+    "group chat messages": (
+        "SELECT * FROM group_messages WHERE group_chat_id = :gid ORDER BY created_at DESC LIMIT 50",
+        {"gid": _ID},
+    ),
+    "lore entries": (
+        "SELECT * FROM lore_entries WHERE character_id = :character_id ORDER BY position",
+        {"character_id": _ID},
+    ),
+}
+
+
+def _pg_seq_scans(plan: dict) -> list[str]:
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(f"Seq Scan on {plan.get('Relation Name')}")
+    for child in plan.get("Plans", []):
+        found.extend(_pg_seq_scans(child))
+    return found
+
+
+async def _explain_postgres(conn, sql: str, params: dict) -> tuple[list[str], str]:
+    from sqlalchemy import text
+    raw = (await conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"), params)).scalar()
+    plan = (json.loads(raw) if isinstance(raw, str) else raw)[0]["Plan"]
+    return _pg_seq_scans(plan), json.dumps(plan, indent=1)
+
+
+async def _explain_sqlite(conn, sql: str, params: dict) -> tuple[list[str], str]:
+    from sqlalchemy import text
+    rows = (await conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params)).all()
+    details = [r[-1] for r in rows]
+    # "SCAN m" is a full table scan; "SCAN m USING INDEX ..." / "SEARCH ..." use an index
+    scans = [d for d in details if re.match(r"SCAN \w+$", d)]
+    return scans, "\n".join(details)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="EXPLAIN check for hot queries")
+    parser.add_argument("--sqlite", action="store_true", help="check a throwaway SQLite schema instead of DATABASE_URL")
+    parser.add_argument("--verbose", action="store_true", help="print every plan")
+    args = parser.parse_args()
+
+    tmp = None
+    if args.sqlite:
+        tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False).name
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tmp}"
+
+    from sqlalchemy import text
+    from app.db.session import engine, init_db
+
+    if args.sqlite:
+        await init_db()
+    is_pg = engine.dialect.name == "postgresql"
+    if not is_pg and not args.sqlite:
+        print(f"Unsupported database {engine.dialect.name}; use Postgres or --sqlite")
+        sys.exit(2)
+
+    failures = 0
+    try:
+        async with engine.begin() as conn:
+            if is_pg:
+                await conn.execute(text("SET LOCAL enable_seqscan = off"))
+            for name, (sql, params) in HOT_QUERIES.items():
+                explain = _explain_postgres if is_pg else _explain_sqlite
+                scans, plan = await explain(conn, sql, params)
+                status = "FAIL" if scans else "ok"
+                failures += bool(scans)
+                print(f"{status:4s}  {name}" + (f"  ({'; '.join(scans)})" if scans else ""))
+                if args.verbose or scans:
+                    print("      " + plan.replace("\n", "\n      "))
+            await conn.rollback()
+    finally:
+        await engine.dispose()
+        if tmp:
+            os.unlink(tmp)
+
+    print(f"\n{len(HOT_QUERIES) - failures}/{len(HOT_QUERIES)} hot queries use an index")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
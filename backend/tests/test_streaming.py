@@ -0,0 +1,64 @@
+"""Frame timing of app.chat.streaming.stream_frames.
+
+Run: cd backend && python -m pytest tests/
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.chat.streaming import FLUSH_INTERVAL, stream_frames
+
+
+async def _stalled(script: list[tuple[float, str]]):
+    """Yield each chunk after its delay (seconds)."""
+    for delay, chunk in script:
+        await asyncio.sleep(delay)
+        yield chunk
+
+
+async def _frames(script: list[tuple[float, str]]) -> tuple[list[tuple[float, str]], list[str]]:
+    collected: list[str] = []
+    frames = []
+    start = time.monotonic()
+    async for frame in stream_frames(_stalled(script), [], collected):
+        frames.append((time.monotonic() - start, json.loads(frame[len("data: "):])["content"]))
+    return frames, collected
+
+
+def test_buffered_text_flushed_while_provider_stalls():
+    frames, collected = asyncio.run(_frames([(0, "The knight"), (0.01, " paused"), (0.5, " and spoke")]))
+    assert "".join(collected) == "The knight paused and spoke"
+    assert "".join(text for _, text in frames) == "The knight paused and spoke"
+    # " paused" is pending when the provider goes quiet: it must not wait for " and spoke"
+    sent_before_stall = "".join(text for at, text in frames if at < 0.4)
+    assert sent_before_stall == "The knight paused"
+    stalled_frame_at = next(at for at, text in frames if text.endswith("paused"))
+    assert stalled_frame_at < 0.01 + FLUSH_INTERVAL * 2
+
+
+def test_fast_chunks_are_coalesced():
+    frames, collected = asyncio.run(_frames([(0, "ab")] * 20))
+    assert "".join(collected) == "ab" * 20
+    assert len(frames) < 20
+
+
+def test_provider_error_propagates():
+    async def failing():
+        yield "partial"
+        raise RuntimeError("upstream reset")
+
+    async def run():
+        collected: list[str] = []
+        async for _ in stream_frames(failing(), [], collected):
+            pass
+
+    try:
+        asyncio.run(run())
+    except RuntimeError as e:
+        assert "upstream reset" in str(e)
+    else:
+        raise AssertionError("provider error was swallowed")
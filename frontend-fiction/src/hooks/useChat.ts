@@ -155,6 +155,10 @@ export function useChat(chatId: string, initialMessages: Message[] = []) {
                 setAnonLimitReached(true);
               }
             }
+            setIsStreaming(false);
+          }
+          // XP / achievements arrive after done (computed in the background)
+          if (data.type === 'rewards') {
             // Achievement unlock notifications
             if (data.new_achievements && Array.isArray(data.new_achievements)) {
               for (const achId of data.new_achievements) {
@@ -165,7 +169,6 @@ export function useChat(chatId: string, initialMessages: Message[] = []) {
             if (data.xp?.leveled_up) {
               toast.success(t('xp.levelUp', { level: data.xp.new_level }), { duration: 4000 });
             }
-            setIsStreaming(false);
           }
           if (data.type === 'error') {
             // Show error in the assistant message bubble